@@ -13,7 +13,7 @@ import torch
 
 from megatron.core.datasets.blended_megatron_dataset_config import BlendedMegatronDatasetConfig
 from megatron.core.datasets.megatron_dataset import MegatronDataset
-from megatron.core.datasets.utils import normalize
+from megatron.core.datasets.utils import atomic_open, normalize, validate_cache_description
 from megatron.core.utils import log_single_rank
 
 logger = logging.getLogger(__name__)
@@ -84,7 +84,17 @@ class BlendedDataset(torch.utils.data.Dataset):
 
         self.built_anew_on_cache_miss = False
 
-        self.dataset_index, self.dataset_sample_index = self._build_indices()
+        if self.size is not None and self.config.blend_index_block_size is not None:
+            blending_index = BlockedBlendingIndex(
+                self._build_blending_checkpoints(),
+                self.weights,
+                self.size,
+                self.config.blend_index_block_size,
+            )
+            self.dataset_index = BlockedBlendingIndexView(blending_index, 0)
+            self.dataset_sample_index = BlockedBlendingIndexView(blending_index, 1)
+        else:
+            self.dataset_index, self.dataset_sample_index = self._build_indices()
 
     def __len__(self) -> int:
         return self.dataset_index.shape[0]
@@ -97,6 +107,124 @@ class BlendedDataset(torch.utils.data.Dataset):
             **self.datasets[dataset_id][dataset_sample_id],
         }
 
+    def __getitems__(self, indices: List[int]) -> List[Dict[str, Union[int, numpy.ndarray]]]:
+        """Return the samples for a batch of indices
+
+        The indices are grouped by dataset so that each dataset can serve its share of the batch at
+        once, see GPTDataset.__getitems__.
+
+        Args:
+            indices (List[int]): The indices into the dataset
+
+        Returns:
+            List[Dict[str, Union[int, numpy.ndarray]]]: The samples in the order of the indices
+        """
+        dataset_ids = self.dataset_index[indices]
+        dataset_sample_ids = self.dataset_sample_index[indices]
+        samples = [None] * len(indices)
+        for dataset_id in numpy.unique(dataset_ids):
+            positions = numpy.flatnonzero(dataset_ids == dataset_id)
+            dataset = self.datasets[dataset_id]
+            sample_ids = dataset_sample_ids[positions].tolist()
+            if hasattr(dataset, "__getitems__"):
+                dataset_samples = dataset.__getitems__(sample_ids)
+            else:
+                dataset_samples = [dataset[sample_id] for sample_id in sample_ids]
+            for position, sample in zip(positions.tolist(), dataset_samples):
+                samples[position] = {"dataset_id": dataset_id, **sample}
+        return samples
+
+    def get_dataset_sample_counts(self) -> numpy.ndarray:
+        """Get the number of samples the blend draws from each dataset
+
+        Returns:
+            numpy.ndarray: The number of samples drawn from each dataset, in dataset order
+        """
+        if isinstance(self.dataset_index, BlockedBlendingIndexView):
+            return numpy.array(self.dataset_index.blending_index.checkpoints[-1])
+        return numpy.bincount(self.dataset_index, minlength=len(self.datasets))
+
+    def _get_path_to(self, suffix: str) -> str:
+        """Get the path to a cached index file
+
+        Args:
+            suffix (str): The file suffix
+
+        Returns:
+            str: The path to the file in the cache
+        """
+        return os.path.join(
+            self.config.path_to_cache,
+            f"{self.unique_description_hash}-{type(self).__name__}-{self.split.name}-{suffix}",
+        )
+
+    def _build_blending_checkpoints(self) -> numpy.ndarray:
+        """Build and optionally cache the blending checkpoints of a streaming index
+
+        The blending checkpoints are a 2-D mapping which determines the number of samples drawn
+        from each dataset before the first sample of each block, with a final row for the number
+        of samples drawn from each dataset in total. See BlockedBlendingIndex.
+
+        Returns:
+            numpy.ndarray: The blending checkpoints
+        """
+        path_to_cache = self.config.path_to_cache
+        block_size = self.config.blend_index_block_size
+
+        if path_to_cache:
+            path_to_description = self._get_path_to("description.txt")
+            path_to_checkpoints = self._get_path_to(f"blending_checkpoints_{block_size}.npy")
+            cache_hit = all(map(os.path.isfile, [path_to_description, path_to_checkpoints]))
+        else:
+            cache_hit = False
+
+        if not path_to_cache or (not cache_hit and torch.distributed.get_rank() == 0):
+            log_single_rank(
+                logger,
+                logging.INFO,
+                f"Build and save the {type(self).__name__} blending checkpoints",
+            )
+            self.built_anew_on_cache_miss = True
+
+            t_beg = time.time()
+            from megatron.core.datasets import helpers
+
+            checkpoints = helpers.build_blending_checkpoints(
+                numpy.array(self.weights, dtype=numpy.float64), self.size, block_size
+            )
+
+            if path_to_cache:
+                os.makedirs(path_to_cache, exist_ok=True)
+                with atomic_open(path_to_checkpoints) as writer:
+                    numpy.save(writer, checkpoints, allow_pickle=True)
+                # Write the description last, as its presence marks the cache complete
+                with atomic_open(path_to_description, "wt") as writer:
+                    writer.write(self.unique_description)
+            else:
+                log_single_rank(
+                    logger,
+                    logging.WARNING,
+                    f"Unable to save the {type(self).__name__} blending checkpoints because path_to_cache is None",
+                )
+
+            t_end = time.time()
+            log_single_rank(logger, logging.DEBUG, f"\t> time elapsed: {t_end - t_beg:4f} seconds")
+
+            if not path_to_cache:
+                return checkpoints
+
+            del checkpoints
+
+        if cache_hit:
+            validate_cache_description(path_to_description, self.unique_description)
+
+        log_single_rank(
+            logger,
+            logging.INFO,
+            f"Load the {type(self).__name__} blending checkpoints from {path_to_checkpoints}",
+        )
+        return numpy.load(path_to_checkpoints, allow_pickle=True, mmap_mode='r')
+
     def _build_indices(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
         """Build and optionally cache the dataset index and the dataset sample index
 
@@ -110,13 +238,9 @@ class BlendedDataset(torch.utils.data.Dataset):
         path_to_cache = self.config.path_to_cache
 
         if path_to_cache:
-            get_path_to = lambda suffix: os.path.join(
-                path_to_cache,
-                f"{self.unique_description_hash}-{type(self).__name__}-{self.split.name}-{suffix}",
-            )
-            path_to_description = get_path_to("description.txt")
-            path_to_dataset_index = get_path_to("dataset_index.npy")
-            path_to_dataset_sample_index = get_path_to("dataset_sample_index.npy")
+            path_to_description = self._get_path_to("description.txt")
+            path_to_dataset_index = self._get_path_to("dataset_index.npy")
+            path_to_dataset_sample_index = self._get_path_to("dataset_sample_index.npy")
             cache_hit = all(
                 map(
                     os.path.isfile,
@@ -160,14 +284,20 @@ class BlendedDataset(torch.utils.data.Dataset):
                     dataset_index, dataset_sample_index, self.weights, len(self.datasets)
                 )
 
+            # Compact the dataset sample index when the mid-level datasets permit
+            if dataset_sample_index.max(initial=0) <= numpy.iinfo(numpy.int32).max:
+                dataset_sample_index = dataset_sample_index.astype(numpy.int32)
+
             if path_to_cache:
                 os.makedirs(path_to_cache, exist_ok=True)
-                # Write the description
-                with open(path_to_description, "wt") as writer:
-                    writer.write(self.unique_description)
                 # Save the indexes
-                numpy.save(path_to_dataset_index, dataset_index, allow_pickle=True)
-                numpy.save(path_to_dataset_sample_index, dataset_sample_index, allow_pickle=True)
+                with atomic_open(path_to_dataset_index) as writer:
+                    numpy.save(writer, dataset_index, allow_pickle=True)
+                with atomic_open(path_to_dataset_sample_index) as writer:
+                    numpy.save(writer, dataset_sample_index, allow_pickle=True)
+                # Write the description last, as its presence marks the cache complete
+                with atomic_open(path_to_description, "wt") as writer:
+                    writer.write(self.unique_description)
             else:
                 log_single_rank(
                     logger,
@@ -178,10 +308,18 @@ class BlendedDataset(torch.utils.data.Dataset):
             t_end = time.time()
             log_single_rank(logger, logging.DEBUG, f"\t> time elapsed: {t_end - t_beg:4f} seconds")
 
-            return dataset_index, dataset_sample_index
+            if not path_to_cache:
+                return dataset_index, dataset_sample_index
+
+            # Release the built indices in favor of memory maps of the saved indices, whose pages
+            # are shared by all ranks on the node
+            del dataset_index, dataset_sample_index
 
         log_single_rank(logger, logging.INFO, f"Load the {type(self).__name__} indices")
 
+        if cache_hit:
+            validate_cache_description(path_to_description, self.unique_description)
+
         log_single_rank(
             logger, logging.INFO, f"\tLoad the dataset index from {path_to_dataset_index}"
         )
@@ -203,3 +341,143 @@ class BlendedDataset(torch.utils.data.Dataset):
         log_single_rank(logger, logging.DEBUG, f"\t> time elapsed: {t_end - t_beg:4f} seconds")
 
         return dataset_index, dataset_sample_index
+
+
+class BlockedBlendingIndex:
+    """A streaming form of the BlendedDataset dataset index and dataset sample index
+
+    The blend is split into blocks of block_size samples. Given the number of samples drawn from
+    each dataset before the first sample of a block, the greedy blending in
+    helpers.build_blending_indices reproduces that block exactly, so only those per-dataset counts
+    are kept, O(size / block_size * len(weights)) rather than O(size), and blocks are decoded on
+    demand. The most recently decoded blocks are kept, which suits the in-order access of the
+    pretraining samplers.
+
+    Args:
+        checkpoints (numpy.ndarray): The per-dataset sample counts at each block start, plus a final row for the per-dataset sample totals, see helpers.build_blending_checkpoints
+
+        weights (List[float]): The normalized blend weights
+
+        size (int): The number of samples in the blend
+
+        block_size (int): The number of samples per block
+
+        num_cached_blocks (int): The number of decoded blocks to keep
+    """
+
+    def __init__(
+        self,
+        checkpoints: numpy.ndarray,
+        weights: List[float],
+        size: int,
+        block_size: int,
+        num_cached_blocks: int = 8,
+    ) -> None:
+        assert checkpoints.shape == ((size + block_size - 1) // block_size + 1, len(weights))
+        self.checkpoints = checkpoints
+        self.weights = numpy.array(weights, dtype=numpy.float64)
+        self.size = size
+        self.block_size = block_size
+        self.num_cached_blocks = num_cached_blocks
+        self.cached_blocks = OrderedDict()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get_block(self, block_id: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Get the dataset index and the dataset sample index of a block
+
+        Args:
+            block_id (int): The block id
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The dataset index and the dataset sample index
+        """
+        if block_id in self.cached_blocks:
+            self.cached_blocks.move_to_end(block_id)
+            return self.cached_blocks[block_id]
+
+        from megatron.core.datasets import helpers
+
+        start = block_id * self.block_size
+        length = min(self.block_size, self.size - start)
+        dataset_index = numpy.zeros(length, dtype=numpy.int16)
+        dataset_sample_index = numpy.zeros(length, dtype=numpy.int64)
+        helpers.decode_blending_indices(
+            dataset_index,
+            dataset_sample_index,
+            self.weights,
+            numpy.ascontiguousarray(self.checkpoints[block_id], dtype=numpy.int64),
+            start,
+        )
+
+        self.cached_blocks[block_id] = (dataset_index, dataset_sample_index)
+        if len(self.cached_blocks) > self.num_cached_blocks:
+            self.cached_blocks.popitem(last=False)
+        return dataset_index, dataset_sample_index
+
+    def lookup(self, indices: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Get the dataset ids and the dataset sample ids at a set of indices
+
+        Args:
+            indices (numpy.ndarray): The 1-D array of non-negative indices into the blend
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The dataset ids and the dataset sample ids
+        """
+        if indices.size and (indices.min() < 0 or indices.max() >= self.size):
+            raise IndexError(f"index out of range for {type(self).__name__} of size {self.size}")
+        dataset_ids = numpy.empty(indices.shape, dtype=numpy.int16)
+        dataset_sample_ids = numpy.empty(indices.shape, dtype=numpy.int64)
+        block_ids = indices // self.block_size
+        for block_id in numpy.unique(block_ids).tolist():
+            positions = numpy.flatnonzero(block_ids == block_id)
+            dataset_index, dataset_sample_index = self.get_block(block_id)
+            offsets = indices[positions] - block_id * self.block_size
+            dataset_ids[positions] = dataset_index[offsets]
+            dataset_sample_ids[positions] = dataset_sample_index[offsets]
+        return dataset_ids, dataset_sample_ids
+
+
+class BlockedBlendingIndexView:
+    """A read-only, array-like view of either index of a BlockedBlendingIndex
+
+    Supports integer, slice, and integer array indexing, such that it stands in for the
+    BlendedDataset dataset index or dataset sample index.
+
+    Args:
+        blending_index (BlockedBlendingIndex): The streaming index
+
+        field (int): 0 for the dataset index, 1 for the dataset sample index
+    """
+
+    def __init__(self, blending_index: BlockedBlendingIndex, field: int) -> None:
+        assert field in (0, 1)
+        self.blending_index = blending_index
+        self.field = field
+        self.dtype = numpy.dtype(numpy.int16 if field == 0 else numpy.int64)
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return (len(self.blending_index),)
+
+    def __len__(self) -> int:
+        return len(self.blending_index)
+
+    def __getitem__(self, idx: Union[int, slice, List[int], numpy.ndarray]) -> numpy.ndarray:
+        size = len(self.blending_index)
+        if isinstance(idx, slice):
+            indices = numpy.arange(*idx.indices(size))
+        elif numpy.ndim(idx) == 0:
+            idx = int(idx)
+            if idx < 0:
+                idx += size
+            return self.blending_index.lookup(numpy.array([idx]))[self.field][0]
+        else:
+            indices = numpy.asarray(idx, dtype=numpy.int64)
+            indices = numpy.where(indices < 0, indices + size, indices)
+        return self.blending_index.lookup(indices)[self.field]
+
+    def __array__(self, dtype=None, copy=None) -> numpy.ndarray:
+        array = self[:]
+        return array if dtype is None else array.astype(dtype)
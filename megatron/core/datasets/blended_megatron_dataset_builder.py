@@ -2,8 +2,10 @@
 
 import logging
 import math
+import multiprocessing
+import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Callable, Iterable, List, Optional, Type, Union
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Type, Union
 
 import numpy
 import torch
@@ -11,7 +13,7 @@ import torch
 from megatron.core.datasets.blended_dataset import BlendedDataset
 from megatron.core.datasets.blended_megatron_dataset_config import BlendedMegatronDatasetConfig
 from megatron.core.datasets.megatron_dataset import LowLevelDataset, MegatronDataset
-from megatron.core.datasets.utils import Split, normalize
+from megatron.core.datasets.utils import Split, get_index_builder_rank, normalize
 from megatron.core.parallel_state import get_virtual_pipeline_model_parallel_rank
 from megatron.core.utils import log_single_rank
 
@@ -25,6 +27,9 @@ DistributedDataset = Union[
     TopLevelDataset, MidLevelDataset, LowLevelDataset, torch.utils.data.Dataset
 ]
 
+# The builder shared with the forked index builder processes, set for the lifetime of the pool
+_index_builder = None
+
 
 class BlendedMegatronDatasetBuilder(object):
     """Builder class for the BlendedDataset and MegatronDataset classes
@@ -146,7 +151,7 @@ class BlendedMegatronDatasetBuilder(object):
                     # Check blend size
                     assert dataset.size is None or dataset.size == dataset.dataset_index.shape[0]
                     # Check blend access of mid-level datasets
-                    _, sizes = numpy.unique(dataset.dataset_index, return_counts=True)
+                    sizes = dataset.get_dataset_sample_counts()
                     for i, dataset_and_size in enumerate(zip(dataset.datasets, sizes)):
                         if len(dataset_and_size[0]) < dataset_and_size[1]:
                             raise IndexError(
@@ -350,7 +355,18 @@ class BlendedMegatronDatasetBuilder(object):
         megatron_datasets = [[] for _ in range(len(Split))]
         num_dataset_builder_threads = self.config.num_dataset_builder_threads
 
-        if torch.distributed.is_initialized():
+        if self._build_indices_on_builder_ranks():
+            # First, build and cache the indices on their builder ranks
+            self._build_megatron_dataset_indices(prefixes, split, sizes_per_dataset)
+
+            if torch.distributed.is_initialized():
+                torch.distributed.barrier()
+
+            # Then, build on all ranks; guaranteed to be data_cache hit
+            _threading_helper(
+                megatron_datasets, num_dataset_builder_threads, prefixes, split, sizes_per_dataset
+            )
+        elif torch.distributed.is_initialized():
             rank = torch.distributed.get_rank()
             # First, build on rank 0
             if rank == 0:
@@ -391,6 +407,114 @@ class BlendedMegatronDatasetBuilder(object):
 
         return megatron_datasets
 
+    def _build_indices_on_builder_ranks(self) -> bool:
+        """Return whether the MegatronDataset indices are first built on their builder ranks
+
+        When True, the indices are built and cached by _build_megatron_dataset_indices, whose
+        builder rank need not be rank 0, and all ranks then load them from the cache.
+
+        Returns:
+            bool: True if config.num_dataset_builder_processes or config.distribute_dataset_builds is set and the datasets are not mock
+        """
+        return not self.config.mock and (
+            self.config.num_dataset_builder_processes > 0 or self.config.distribute_dataset_builds
+        )
+
+    def _build_megatron_dataset_indices(
+        self, prefixes: List[str], split: List[float], sizes_per_dataset: List[List[int]]
+    ) -> None:
+        """Build and cache the indices of the megatron datasets which belong to the current rank
+
+        Each MegatronDataset split belongs to the rank given by its unique description hash when
+        config.distribute_dataset_builds is True, and to rank 0 otherwise. The owned datasets are
+        built by config.num_dataset_builder_processes forked processes, or else by
+        config.num_dataset_builder_threads threads, and discarded once their indices are cached.
+        The cache files are written atomically, so the caller need only barrier before loading.
+
+        Args:
+            prefixes (List[str]): The list of prefix strings
+
+            split (List[float]): The dataset split ratios (must sum to 1.00)
+
+            sizes_per_dataset (List[List[int]]): The number of samples to request per MegatronDataset per spilt
+        """
+        rank = torch.distributed.get_rank() if torch.distributed.is_initialized() else 0
+
+        tasks = []
+        for i, prefix in enumerate(prefixes):
+            for j, _split in enumerate(Split):
+                if split[j] is None:
+                    continue
+                unique_description_hash = self.cls.build_unique_description_hash(
+                    prefix, sizes_per_dataset[i][j], _split, self.config
+                )
+                builder_rank = get_index_builder_rank(
+                    unique_description_hash, self.config.distribute_dataset_builds
+                )
+                if builder_rank == rank:
+                    tasks.append((prefix, split, sizes_per_dataset[i][j], _split))
+
+        log_single_rank(
+            logger,
+            logging.INFO,
+            f"Build the {self.cls.__name__} indices for {len(tasks)} splits of {len(prefixes)} datasets on rank {rank}",
+            rank=rank if self.config.distribute_dataset_builds else 0,
+        )
+
+        t_beg = time.time()
+        num_dataset_builder_processes = self.config.num_dataset_builder_processes
+        if num_dataset_builder_processes > 0 and len(tasks) > 1:
+            # Fork, rather than spawn, so that the builder need not be pickled
+            global _index_builder
+            _index_builder = self
+            try:
+                with multiprocessing.get_context("fork").Pool(
+                    min(num_dataset_builder_processes, len(tasks))
+                ) as pool:
+                    pool.map(_build_megatron_dataset_index_in_process, tasks, chunksize=1)
+            finally:
+                _index_builder = None
+        else:
+            with ThreadPoolExecutor(
+                max_workers=self.config.num_dataset_builder_threads
+            ) as executor:
+                list(executor.map(lambda task: self._build_megatron_dataset_index(*task), tasks))
+        t_end = time.time()
+
+        log_single_rank(
+            logger,
+            logging.DEBUG,
+            f"\t> time elapsed: {t_end - t_beg:4f} seconds",
+            rank=rank if self.config.distribute_dataset_builds else 0,
+        )
+
+    def _build_megatron_dataset_index(
+        self, dataset_path: str, split: List[float], size: Optional[int], index_split: Split
+    ) -> None:
+        """Build a single MidLevelDataset split, caching its indices on a cache miss
+
+        Args:
+            dataset_path (str): The path on disk which defines the underlying LowLevelDataset
+
+            split (List[Tuple[float, float]]): The dataset split matrix
+
+            size (Optional[int]): The number of total samples to draw from the split
+
+            index_split (Split): The split to build
+        """
+        low_level_dataset = self.cls.build_low_level_dataset(dataset_path, self.config)
+        split_indices = _get_split_indices(
+            split, self.cls.numel_low_level_dataset(low_level_dataset)
+        )
+        self.cls(
+            low_level_dataset,
+            dataset_path,
+            split_indices[index_split.value],
+            size,
+            index_split,
+            self.config,
+        )
+
     def _build_megatron_dataset_splits(
         self,
         dataset_path: Optional[str],
@@ -412,6 +536,16 @@ class BlendedMegatronDatasetBuilder(object):
         Returns:
             List[Optional[MidLevelDataset]]: The MidLevelDataset (or None) per split
         """
+        if synchronize_ranks and self._build_indices_on_builder_ranks():
+            # First, build and cache the indices on their builder ranks
+            self._build_megatron_dataset_indices([dataset_path], split, [sizes])
+
+            if torch.distributed.is_initialized():
+                torch.distributed.barrier()
+
+            # Then, build on all ranks; guaranteed to be data_cache hit
+            synchronize_ranks = False
+
         # short-cut if we are not building on this rank
         if torch.distributed.is_initialized() and not self.is_built_on_rank():
             for i in range(len(Split)):
@@ -423,15 +557,9 @@ class BlendedMegatronDatasetBuilder(object):
         low_level_dataset = self.cls.build_low_level_dataset(dataset_path, self.config)
 
         # Build the split indices for the low level dataset
-        num_elements = self.cls.numel_low_level_dataset(low_level_dataset)
-        split_indices = []
-        for i, _ in enumerate(Split):
-            if split[i] is not None:
-                beg = int(round(split[i][0] * float(num_elements)))
-                end = int(round(split[i][1] * float(num_elements)))
-                split_indices.append(numpy.arange(start=beg, stop=end, step=1, dtype=numpy.int32))
-            else:
-                split_indices.append(None)
+        split_indices = _get_split_indices(
+            split, self.cls.numel_low_level_dataset(low_level_dataset)
+        )
 
         # Build the mid level dataset
         mid_level_datasets = []
@@ -510,6 +638,41 @@ class BlendedMegatronDatasetBuilder(object):
         return cls(*args)
 
 
+def _build_megatron_dataset_index_in_process(
+    task: Tuple[str, List[float], Optional[int], Split]
+) -> None:
+    """Build a single MidLevelDataset split in a forked index builder process
+
+    Args:
+        task (Tuple[str, List[float], Optional[int], Split]): The arguments to BlendedMegatronDatasetBuilder._build_megatron_dataset_index
+    """
+    _index_builder._build_megatron_dataset_index(*task)
+
+
+def _get_split_indices(
+    split: List[Optional[Tuple[float, float]]], num_elements: int
+) -> List[Optional[numpy.ndarray]]:
+    """Build the indices of the low level dataset elements which belong to each split
+
+    Args:
+        split (List[Optional[Tuple[float, float]]]): The dataset split matrix
+
+        num_elements (int): The number of elements in the low level dataset
+
+    Returns:
+        List[Optional[numpy.ndarray]]: The element indices (or None) per split
+    """
+    split_indices = []
+    for i, _ in enumerate(Split):
+        if split[i] is not None:
+            beg = int(round(split[i][0] * float(num_elements)))
+            end = int(round(split[i][1] * float(num_elements)))
+            split_indices.append(numpy.arange(start=beg, stop=end, step=1, dtype=numpy.int32))
+        else:
+            split_indices.append(None)
+    return split_indices
+
+
 def _get_size_per_split_per_dataset(
     normalized_weights: List[float], target_size_per_split: List[int]
 ) -> List[List[int]]:
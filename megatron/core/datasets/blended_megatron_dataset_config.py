@@ -48,6 +48,28 @@ class BlendedMegatronDatasetConfig:
     num_dataset_builder_threads: int = 1
     """The number of threads to use for dataset building."""
 
+    num_dataset_builder_processes: int = 0
+    """The number of processes to fork per rank to build the mid-level dataset indices on a cache
+       miss. Index construction holds the GIL for most of its duration, so processes, unlike
+       threads, build several indices concurrently. Requires 'path_to_cache'. Defaults to 0, to
+       build in-process.
+    """
+
+    distribute_dataset_builds: bool = False
+    """Whether to spread the mid-level dataset index builds across all ranks, rather than build
+       every index on rank 0, by assigning each index to a rank by its unique description hash.
+       Requires 'path_to_cache' to be on a file system shared by all ranks.
+    """
+
+    blend_index_block_size: Optional[int] = None
+    """The number of samples per block of a streaming BlendedDataset index. When set, a
+       BlendedDataset of fixed size keeps only the per-dataset sample counts at every block
+       boundary and decodes the dataset index and the dataset sample index one block at a time, on
+       demand, rather than materialize them in full. Sampling is identical either way. Suits
+       in-order access, e.g. by the pretraining samplers. Defaults to None, to materialize the full
+       indices.
+    """
+
     path_to_cache: Optional[str] = None
     """Where all re-useable dataset indices are to be cached."""
 
@@ -66,6 +88,15 @@ class BlendedMegatronDatasetConfig:
     def __post_init__(self) -> None:
         """Do asserts and set fields post init
         """
+        assert self.num_dataset_builder_processes >= 0
+        if self.num_dataset_builder_processes > 0 or self.distribute_dataset_builds:
+            assert (
+                self.path_to_cache is not None
+            ), "path_to_cache must be provided to build the dataset indices in parallel"
+
+        if self.blend_index_block_size is not None:
+            assert self.blend_index_block_size > 0
+
         if self.blend_per_split is not None and any(self.blend_per_split):
             assert self.blend is None, "blend and blend_per_split are incompatible"
             assert self.split is None, "split and blend_per_split are incompatible"
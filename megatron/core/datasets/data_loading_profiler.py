@@ -0,0 +1,263 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import contextlib
+import logging
+import multiprocessing
+import os
+import time
+from typing import Any, ContextManager, Dict, List, Optional
+
+import numpy
+import torch
+
+from megatron.core.timers import Timers
+
+logger = logging.getLogger(__name__)
+
+_DATA_LOADING_PROFILER = None
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+_NUM_BUCKETS = 32
+
+
+class DataLoadingProfiler:
+    """An opt-in profiler for the stages of data loading
+
+    Each stage is timed per sample, or per batch, into a histogram of log2-spaced microsecond
+    buckets. Bucket b counts the durations in [2^(b-1), 2^b) microseconds. The histograms and the
+    total times live in shared memory with a row per process: row 0 for the main process, and the
+    next free row for each process forked after the profiler is enabled, e.g. the dataloader
+    workers, claimed when it first records. Each process therefore writes only its own row,
+    without locks, and the rows are summed when read. Should the rows run out, the processes
+    without a row share the last one, which they update under a lock.
+
+    Args:
+        num_workers (int): The number of dataloader workers per dataloader
+
+        num_dataloaders (int): The number of dataloaders whose workers record at the same time. Defaults to 3, i.e. the train, validation, and test dataloaders.
+    """
+
+    STAGES = ("bin-read", "masks-and-position-ids", "collate", "batch-wait", "broadcast")
+
+    def __init__(self, num_workers: int, num_dataloaders: int = 3) -> None:
+        self.num_workers = num_workers
+        self.stage_ids = {stage: i for i, stage in enumerate(self.STAGES)}
+
+        # A row per process, and a last row shared by the processes which find no free row
+        self.num_rows = num_workers * num_dataloaders + 2
+        self._counts = torch.zeros(
+            (self.num_rows, len(self.STAGES), _NUM_BUCKETS), dtype=torch.int64
+        ).share_memory_()
+        self._seconds = torch.zeros(
+            (self.num_rows, len(self.STAGES)), dtype=torch.float64
+        ).share_memory_()
+        self.counts = self._counts.numpy()
+        self.seconds = self._seconds.numpy()
+
+        self._next_row = torch.ones(1, dtype=torch.int64).share_memory_()
+        self._lock = multiprocessing.Lock()
+        self._pid = os.getpid()
+        self._row = 0
+
+        # The snapshots at the last report and at the last timer update, such that the main process
+        # never writes the worker rows
+        self.last_report_counts = numpy.zeros_like(self.counts)
+        self.last_report_seconds = numpy.zeros_like(self.seconds)
+        self.last_timers_seconds = numpy.zeros_like(self.seconds)
+
+    def record(self, stage: str, elapsed: float) -> None:
+        """Record a duration for a stage in the row of the calling process
+
+        Args:
+            stage (str): The stage name, one of DataLoadingProfiler.STAGES
+
+            elapsed (float): The duration in seconds
+        """
+        if self._pid != os.getpid():
+            self._claim_row()
+        stage_id = self.stage_ids[stage]
+        bucket = min(int(elapsed * 1e6).bit_length(), _NUM_BUCKETS - 1)
+        if self._row == self.num_rows - 1:
+            with self._lock:
+                self.counts[self._row, stage_id, bucket] += 1
+                self.seconds[self._row, stage_id] += elapsed
+        else:
+            self.counts[self._row, stage_id, bucket] += 1
+            self.seconds[self._row, stage_id] += elapsed
+
+    def _claim_row(self) -> None:
+        """Claim the next free row for the calling process, which was forked from the process
+        which enabled the profiler
+        """
+        with self._lock:
+            self._row = min(int(self._next_row[0]), self.num_rows - 1)
+            self._next_row[0] += 1
+        self._pid = os.getpid()
+
+    def time(self, stage: str) -> "_StageTimer":
+        """Time a stage in a with statement
+
+        Args:
+            stage (str): The stage name, one of DataLoadingProfiler.STAGES
+
+        Returns:
+            _StageTimer: The context manager
+        """
+        return _StageTimer(self, stage)
+
+    @staticmethod
+    def get_percentile(histogram: numpy.ndarray, q: float) -> int:
+        """Get the upper bound of the histogram bucket at a percentile
+
+        Args:
+            histogram (numpy.ndarray): The log2-spaced microsecond histogram
+
+            q (float): The percentile in [0, 100]
+
+        Returns:
+            int: The percentile upper bound in microseconds
+        """
+        cumulative = numpy.cumsum(histogram)
+        bucket = int(numpy.searchsorted(cumulative, cumulative[-1] * q / 100.0))
+        return 2**bucket
+
+    def get_statistics(self) -> Dict[str, Dict[str, Any]]:
+        """Get the statistics per stage since the last call
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The per stage count, seconds summed over the processes, seconds per process, and histogram summed over the processes
+        """
+        counts = self.counts.copy()
+        seconds = self.seconds.copy()
+        interval_counts = counts - self.last_report_counts
+        interval_seconds = seconds - self.last_report_seconds
+        self.last_report_counts = counts
+        self.last_report_seconds = seconds
+
+        statistics = {}
+        for stage, stage_id in self.stage_ids.items():
+            statistics[stage] = {
+                "count": int(interval_counts[:, stage_id].sum()),
+                "seconds": float(interval_seconds[:, stage_id].sum()),
+                "seconds_per_process": interval_seconds[:, stage_id],
+                "histogram": interval_counts[:, stage_id].sum(axis=0),
+            }
+        return statistics
+
+    def get_statistics_string(self) -> str:
+        """Summarize the histograms since the last call
+
+        Returns:
+            str: The count, mean, and percentiles per stage
+        """
+        output_string = 'data loading stages (us):'
+        for stage, stage_statistics in self.get_statistics().items():
+            if stage_statistics["count"] == 0:
+                continue
+            histogram = stage_statistics["histogram"]
+            output_string += '\n    {}: count {} | mean {:.1f} | p50 {} | p90 {} | p99 {}'.format(
+                (stage + ' ').ljust(32, '.'),
+                stage_statistics["count"],
+                stage_statistics["seconds"] / stage_statistics["count"] * 1e6,
+                self.get_percentile(histogram, 50),
+                self.get_percentile(histogram, 90),
+                self.get_percentile(histogram, 99),
+            )
+        return output_string
+
+    def add_to_timers(self, timers: Timers) -> None:
+        """Add the stage times since the last call to the timers
+
+        The time added to the timer 'data-loading/<stage>' is summed over the main process and the
+        dataloader workers.
+
+        Args:
+            timers (Timers): The timers
+        """
+        seconds = self.seconds.copy()
+        interval_seconds = (seconds - self.last_timers_seconds).sum(axis=0)
+        self.last_timers_seconds = seconds
+        for stage, stage_id in self.stage_ids.items():
+            timers(f'data-loading/{stage}', log_level=0).add_elapsed(interval_seconds[stage_id])
+
+    @classmethod
+    def get_timer_names(cls) -> List[str]:
+        """Get the names of the timers set by DataLoadingProfiler.add_to_timers
+
+        Returns:
+            List[str]: The timer names
+        """
+        return [f'data-loading/{stage}' for stage in cls.STAGES]
+
+
+class _StageTimer:
+    """Time a stage of data loading, see DataLoadingProfiler.time
+
+    Args:
+        profiler (DataLoadingProfiler): The profiler
+
+        stage (str): The stage name
+    """
+
+    def __init__(self, profiler: DataLoadingProfiler, stage: str) -> None:
+        self.profiler = profiler
+        self.stage = stage
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args: Any) -> None:
+        self.profiler.record(self.stage, time.perf_counter() - self.start)
+
+
+def enable_data_loading_profiler(num_workers: int, num_dataloaders: int = 3) -> DataLoadingProfiler:
+    """Enable the data loading profiler in this process and the processes it forks hereafter
+
+    Args:
+        num_workers (int): The number of dataloader workers per dataloader
+
+        num_dataloaders (int): The number of dataloaders whose workers record at the same time. Defaults to 3.
+
+    Returns:
+        DataLoadingProfiler: The profiler
+    """
+    global _DATA_LOADING_PROFILER
+    _DATA_LOADING_PROFILER = DataLoadingProfiler(num_workers, num_dataloaders)
+    return _DATA_LOADING_PROFILER
+
+
+def get_data_loading_profiler() -> Optional[DataLoadingProfiler]:
+    """Get the data loading profiler
+
+    Returns:
+        Optional[DataLoadingProfiler]: The profiler, or None if it is not enabled
+    """
+    return _DATA_LOADING_PROFILER
+
+
+def profile_data_loading_stage(stage: str) -> ContextManager:
+    """Time a stage of data loading in a with statement, if the profiler is enabled
+
+    Args:
+        stage (str): The stage name, one of DataLoadingProfiler.STAGES
+
+    Returns:
+        ContextManager: The stage timer, or a reusable no-op context when the profiler is disabled
+    """
+    if _DATA_LOADING_PROFILER is None:
+        return _NULL_CONTEXT
+    return _DATA_LOADING_PROFILER.time(stage)
+
+
+def profiled_collate(batch: List[Any]) -> Any:
+    """The default PyTorch collate function, timed as the 'collate' stage
+
+    Args:
+        batch (List[Any]): The samples
+
+    Returns:
+        Any: The collated batch
+    """
+    with profile_data_loading_stage("collate"):
+        return torch.utils.data.default_collate(batch)
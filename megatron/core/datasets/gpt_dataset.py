@@ -3,17 +3,24 @@
 import logging
 import os
 import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy
 import torch
 
 from megatron.core.datasets.blended_megatron_dataset_config import BlendedMegatronDatasetConfig
+from megatron.core.datasets.data_loading_profiler import profile_data_loading_stage
 from megatron.core.datasets.indexed_dataset import IndexedDataset
 from megatron.core.datasets.megatron_dataset import MegatronDataset
 from megatron.core.datasets.megatron_tokenizer import MegatronTokenizer
-from megatron.core.datasets.utils import Split
+from megatron.core.datasets.utils import (
+    Split,
+    atomic_open,
+    load_shared_memory_array,
+    validate_cache_description,
+)
 from megatron.core.datasets.utils_s3 import S3Config, is_s3_path
 from megatron.core.utils import log_single_rank
 
@@ -21,6 +28,8 @@ logger = logging.getLogger(__name__)
 
 _PAD_TOKEN_ID = -1
 
+_SEQUENCE_PACKING_ALGORITHMS = ("best_fit_decreasing", "first_fit")
+
 
 @dataclass
 class GPTDatasetConfig(BlendedMegatronDatasetConfig):
@@ -51,6 +60,50 @@ class GPTDatasetConfig(BlendedMegatronDatasetConfig):
     s3_cache_path: str = None
     """Path for caching indices for s3 dataloading."""
 
+    s3_bin_cache_nbytes: Optional[int] = None
+    """The maximum number of bytes of .bin data cached in memory per dataset for s3 dataloading.
+       When None, a single block is cached.
+    """
+
+    s3_prefetch_threads: int = 0
+    """The number of background threads per dataset which read .bin blocks ahead of time for s3
+       dataloading.
+    """
+
+    s3_prefetch_lookahead: int = 0
+    """The number of upcoming samples, in shuffled order, whose .bin blocks are read ahead of time
+       for s3 dataloading. Requires s3_prefetch_threads > 0.
+    """
+
+    s3_prefetch_micro_batch_size: int = 1
+    """The number of consecutive samples which the sampler assigns to a data parallel rank, i.e.
+       the micro batch size, so that only the upcoming samples of the rank are read ahead.
+    """
+
+    s3_prefetch_data_parallel_size: int = 1
+    """The number of data parallel ranks among which the sampler distributes the samples, in
+       blocks of s3_prefetch_micro_batch_size. The upcoming samples of other ranks are skipped
+       when reading ahead. This matches the layout of the 'single' dataloader, the read-ahead is
+       of no use when samples are drawn at random.
+    """
+
+    sequence_packing: bool = False
+    """Option to pack whole documents into each sample, rather than concatenate documents across
+       sample boundaries, and to return the 'cu_seqlens' of the documents in each sample so that
+       attention does not cross document boundaries. Documents longer than a sample are truncated.
+    """
+
+    sequence_packing_algorithm: str = "best_fit_decreasing"
+    """The bin packing algorithm for sequence packing, either 'best_fit_decreasing' or
+       'first_fit'.
+    """
+
+    shared_memory_indices: bool = False
+    """Option to read the IndexedDataset index (.idx) files and the cached GPTDataset indices from
+       shared memory files created once per node, to which every rank and dataloader worker on the
+       node attaches without copying, see get_shared_memory_buffer.
+    """
+
     def __post_init__(self) -> None:
         """Do asserts and set fields post init"""
         super().__post_init__()
@@ -61,6 +114,12 @@ class GPTDatasetConfig(BlendedMegatronDatasetConfig):
         assert self.reset_attention_mask is not None
         assert self.eod_mask_loss is not None
 
+        assert self.s3_prefetch_lookahead == 0 or self.s3_prefetch_threads > 0
+        assert self.s3_prefetch_micro_batch_size > 0
+        assert self.s3_prefetch_data_parallel_size > 0
+
+        assert self.sequence_packing_algorithm in _SEQUENCE_PACKING_ALGORITHMS
+
 
 class GPTDataset(MegatronDataset):
     """The base GPT dataset
@@ -96,6 +155,7 @@ class GPTDataset(MegatronDataset):
                 self.config.reset_position_ids,
                 self.config.reset_attention_mask,
                 self.config.eod_mask_loss,
+                self.config.sequence_packing,
             ]
         )
         self.masks_and_position_ids_are_cached = False
@@ -108,12 +168,71 @@ class GPTDataset(MegatronDataset):
         except Exception:
             self._pad_token_id = _PAD_TOKEN_ID
 
+        # The paths to the indices read from shared memory, by attribute, see __setstate__
+        self.shared_memory_index_paths = {}
+
         (
             self.document_index,
             self.sample_index,
             self.shuffle_index,
         ) = self._build_document_sample_shuffle_indices()
 
+        self.prefetch_cursor = None
+
+    def __getstate__(self) -> Dict:
+        """Get the state during pickling, without the indices read from shared memory
+
+        Returns:
+            Dict: The state dict
+        """
+        state = self.__dict__.copy()
+        for name in self.shared_memory_index_paths:
+            state[name] = None
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        """Set the state during un-pickling, attaching to the indices in shared memory
+
+        Args:
+            state (Dict): The state dict
+        """
+        self.__dict__.update(state)
+        for name, path in self.shared_memory_index_paths.items():
+            setattr(self, name, load_shared_memory_array(path))
+
+    @classmethod
+    def build_unique_identifiers(
+        cls,
+        dataset_path: Optional[str],
+        num_samples: Optional[int],
+        index_split: Split,
+        config: GPTDatasetConfig,
+    ) -> OrderedDict:
+        """Method override
+
+        The sequence packing attributes are only identifying when sequence packing is enabled, so
+        as to preserve the unique description hash of the unpacked indices.
+
+        Args:
+            dataset_path (Optional[str]): The real path on disk to the dataset
+
+            num_samples (Optional[int]): The minimum number of samples to build from the indexed dataset
+
+            index_split (Split): The indices Split
+
+            config (GPTDatasetConfig): The config
+
+        Returns:
+            OrderedDict: The unique identifiers
+        """
+        unique_identifiers = super().build_unique_identifiers(
+            dataset_path, num_samples, index_split, config
+        )
+        if config.sequence_packing:
+            unique_identifiers["sequence_packing"] = config.sequence_packing
+            unique_identifiers["sequence_packing_algorithm"] = config.sequence_packing_algorithm
+        return unique_identifiers
+
     @staticmethod
     def numel_low_level_dataset(low_level_dataset: IndexedDataset) -> int:
         """Abstract method implementation
@@ -146,9 +265,19 @@ class GPTDataset(MegatronDataset):
                 dataset_path,
                 multimodal=False,
                 mmap=config.mmap_bin_files,
-                s3_config=S3Config(path_to_idx_cache=config.s3_cache_path),
+                s3_config=S3Config(
+                    path_to_idx_cache=config.s3_cache_path,
+                    bin_cache_nbytes=config.s3_bin_cache_nbytes,
+                    bin_prefetch_threads=config.s3_prefetch_threads,
+                ),
+                shared_memory=config.shared_memory_indices,
             )
-        return IndexedDataset(dataset_path, multimodal=False, mmap=config.mmap_bin_files)
+        return IndexedDataset(
+            dataset_path,
+            multimodal=False,
+            mmap=config.mmap_bin_files,
+            shared_memory=config.shared_memory_indices,
+        )
 
     def __len__(self) -> int:
         """Abstract method implementation
@@ -172,7 +301,45 @@ class GPTDataset(MegatronDataset):
             text, _ = self._query_document_sample_shuffle_indices(0)
         else:
             text, _ = self._query_document_sample_shuffle_indices(idx)
+            if self.config.s3_prefetch_lookahead > 0:
+                self._prefetch_document_sample_shuffle_indices(idx)
+
+        return self._build_sample(text, idx)
+
+    def __getitems__(self, indices: List[Optional[int]]) -> List[Dict[str, torch.Tensor]]:
+        """Return the samples for a batch of indices
+
+        The PyTorch DataLoader calls this method in place of __getitem__ when it is defined. The
+        document spans which make up the whole batch are retrieved with a single call to
+        IndexedDataset.get_many.
 
+        Args:
+            indices (List[Optional[int]]): The indices into the dataset
+
+        Returns:
+            List[Dict[str, torch.Tensor]]: The sample information wrapped in a dictionary, for each index
+        """
+        texts = self._query_many_document_sample_shuffle_indices(
+            # Batch padding sequence so the index does not matter
+            [0 if idx is None else idx for idx in indices]
+        )
+        if self.config.s3_prefetch_lookahead > 0 and any(idx is not None for idx in indices):
+            self._prefetch_document_sample_shuffle_indices(
+                max(idx for idx in indices if idx is not None)
+            )
+        return [self._build_sample(text, idx) for text, idx in zip(texts, indices)]
+
+    def _build_sample(self, text: numpy.ndarray, idx: Optional[int]) -> Dict[str, torch.Tensor]:
+        """Build the sample information from the text (token ids) at an index
+
+        Args:
+            text (numpy.ndarray): The text ids
+
+            idx (Optional[int]): The index into the dataset, None for a batch padding sequence
+
+        Returns:
+            Dict[str, torch.Tensor]: The sample information wrapped in a dictionary
+        """
         text = torch.from_numpy(text).long()
         if self.config.add_extra_token_to_sequence:
             tokens = text[:-1].contiguous()
@@ -182,27 +349,40 @@ class GPTDataset(MegatronDataset):
             labels = torch.roll(text, shifts=-1, dims=0)
             labels[-1] = self._pad_token_id
 
-        if (
-            not self.masks_and_position_ids_are_cacheable
-            or not self.masks_and_position_ids_are_cached
-        ):
-            attention_mask, loss_mask, position_ids = _get_ltor_masks_and_position_ids(
-                tokens,
-                self.config.tokenizer.eod,
-                self.config.reset_position_ids,
-                self.config.reset_attention_mask,
-                self.config.eod_mask_loss,
-                self.config.create_attention_mask,
-            )
-            if self.masks_and_position_ids_are_cacheable:
-                self.cached_attention_mask = attention_mask
-                self.cached_loss_mask = loss_mask
-                self.cached_position_ids = position_ids
-                self.masks_and_position_ids_are_cached = True
-        else:
-            attention_mask = self.cached_attention_mask
-            loss_mask = self.cached_loss_mask
-            position_ids = self.cached_position_ids
+        with profile_data_loading_stage("masks-and-position-ids"):
+            cu_seqlens = None
+            if self.config.sequence_packing:
+                _, _, document_lengths = self._get_document_spans(0 if idx is None else idx)
+                attention_mask, loss_mask, position_ids, cu_seqlens = (
+                    _get_packed_masks_position_ids_and_cu_seqlens(
+                        tokens,
+                        document_lengths,
+                        self.config.tokenizer.eod,
+                        self.config.eod_mask_loss,
+                        self.config.create_attention_mask,
+                    )
+                )
+            elif (
+                not self.masks_and_position_ids_are_cacheable
+                or not self.masks_and_position_ids_are_cached
+            ):
+                attention_mask, loss_mask, position_ids = _get_ltor_masks_and_position_ids(
+                    tokens,
+                    self.config.tokenizer.eod,
+                    self.config.reset_position_ids,
+                    self.config.reset_attention_mask,
+                    self.config.eod_mask_loss,
+                    self.config.create_attention_mask,
+                )
+                if self.masks_and_position_ids_are_cacheable:
+                    self.cached_attention_mask = attention_mask
+                    self.cached_loss_mask = loss_mask
+                    self.cached_position_ids = position_ids
+                    self.masks_and_position_ids_are_cached = True
+            else:
+                attention_mask = self.cached_attention_mask
+                loss_mask = self.cached_loss_mask
+                position_ids = self.cached_position_ids
 
         # For padded sequences, mask the loss
         loss_mask[labels == self._pad_token_id] = 0.0
@@ -216,7 +396,7 @@ class GPTDataset(MegatronDataset):
             loss_mask = torch.zeros_like(loss_mask)
 
         if self.config.create_attention_mask:
-            return {
+            sample = {
                 "tokens": tokens,
                 "labels": labels,
                 "attention_mask": attention_mask,
@@ -224,83 +404,208 @@ class GPTDataset(MegatronDataset):
                 "position_ids": position_ids,
             }
         else:
-            return {
+            sample = {
                 "tokens": tokens,
                 "labels": labels,
                 "loss_mask": loss_mask,
                 "position_ids": position_ids,
             }
 
-    def _query_document_sample_shuffle_indices(
-        self, idx: int
-    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
-        """Get the text (token ids) and document ids for a given index
+        if cu_seqlens is not None:
+            # Pad to a fixed length so that samples collate, the maximum number of documents in a
+            # sample being the sequence length
+            sample["cu_seqlens"] = torch.nn.functional.pad(
+                cu_seqlens, (0, tokens.shape[0] + 1 - cu_seqlens.shape[0]), value=-1
+            )
+            sample["max_seqlen"] = (cu_seqlens[1:] - cu_seqlens[:-1]).max()
+
+        return sample
+
+    def _get_document_spans(self, idx: int) -> Tuple[List[int], List[int], List[Optional[int]]]:
+        """Get the document ids, token offsets, and token lengths which make up a given index
 
         Args:
             idx (int): The index into the dataset
 
         Returns:
-            Tuple[numpy.ndarray, numpy.ndarray]: The text ids and document ids
+            Tuple[List[int], List[int], List[Optional[int]]]: The document ids, the offsets into each document, and the lengths to read from each document, where None signifies the remainder of the document
         """
         # Do the shuffle mapping
         idx = self.shuffle_index[idx]
 
+        # Sample packs whole documents
+        if self.config.sequence_packing:
+            doc_index_beg, doc_index_end = self.sample_index[idx : idx + 2].tolist()
+            document_ids = self.document_index[doc_index_beg:doc_index_end]
+            # Truncate documents which exceed the sample
+            lengths = numpy.minimum(
+                self.dataset.sequence_lengths[document_ids],
+                self.config.sequence_length + self.config.add_extra_token_to_sequence,
+            )
+            return document_ids.tolist(), [0] * len(document_ids), lengths.tolist()
+
         # Get the beginning and end documents and offsets
-        doc_index_beg, doc_index_beg_offset = self.sample_index[idx]
-        doc_index_end, doc_index_end_offset = self.sample_index[idx + 1]
+        doc_index_beg, doc_index_beg_offset = self.sample_index[idx].tolist()
+        doc_index_end, doc_index_end_offset = self.sample_index[idx + 1].tolist()
 
         document_ids = []
-        sample_parts = []
+        offsets = []
+        lengths = []
 
         # Sample spans a single document
         if doc_index_beg == doc_index_end:
-            # Add the document id
-            document_ids.append(self.document_index[doc_index_beg])
-
             # Add the entire sample
-            sample_parts.append(
-                self.dataset.get(
-                    self.document_index[doc_index_beg],
-                    offset=doc_index_beg_offset,
-                    length=doc_index_end_offset
-                    - doc_index_beg_offset
-                    + self.config.add_extra_token_to_sequence,
-                )
+            document_ids.append(self.document_index[doc_index_beg])
+            offsets.append(doc_index_beg_offset)
+            lengths.append(
+                doc_index_end_offset
+                - doc_index_beg_offset
+                + self.config.add_extra_token_to_sequence
             )
 
         # Sample spans multiple documents
         else:
             for i in range(doc_index_beg, doc_index_end + 1):
-                # Add the document id
-                document_ids.append(self.document_index[i])
-
                 # Add the sample part
-                offset = 0 if i > doc_index_beg else doc_index_beg_offset
-                length = (
+                document_ids.append(self.document_index[i])
+                offsets.append(0 if i > doc_index_beg else doc_index_beg_offset)
+                lengths.append(
                     None
                     if i < doc_index_end
                     else doc_index_end_offset + self.config.add_extra_token_to_sequence
                 )
-                sample_parts.append(
-                    self.dataset.get(self.document_index[i], offset=offset, length=length)
-                )
+
+        return document_ids, offsets, lengths
+
+    def _query_document_sample_shuffle_indices(
+        self, idx: int
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Get the text (token ids) and document ids for a given index
+
+        Args:
+            idx (int): The index into the dataset
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The text ids and document ids
+        """
+        document_ids, offsets, lengths = self._get_document_spans(idx)
+
+        sample_parts = [
+            self.dataset.get(document_id, offset=offset, length=length)
+            for document_id, offset, length in zip(document_ids, offsets, lengths)
+        ]
         assert len(document_ids) == len(
             sample_parts
         ), f"len(document_ids) ({len(document_ids)}) != len(sample_parts) ({len(sample_parts)})"
 
+        return (
+            self._concatenate_sample_parts(sample_parts),
+            numpy.array(document_ids, dtype=numpy.int64),
+        )
+
+    def _query_many_document_sample_shuffle_indices(
+        self, indices: List[int]
+    ) -> List[numpy.ndarray]:
+        """Get the text (token ids) for a batch of indices
+
+        Args:
+            indices (List[int]): The indices into the dataset
+
+        Returns:
+            List[numpy.ndarray]: The text ids, for each index
+        """
+        document_ids = []
+        offsets = []
+        lengths = []
+        num_sample_parts = []
+        for idx in indices:
+            sample_document_ids, sample_offsets, sample_lengths = self._get_document_spans(idx)
+            document_ids.extend(sample_document_ids)
+            offsets.extend(sample_offsets)
+            lengths.extend(sample_lengths)
+            num_sample_parts.append(len(sample_document_ids))
+
+        all_sample_parts = self.dataset.get_many(document_ids, offsets, lengths)
+
+        texts = []
+        sample_parts_beg = 0
+        for num in num_sample_parts:
+            sample_parts = all_sample_parts[sample_parts_beg : sample_parts_beg + num]
+            sample_parts_beg += num
+            texts.append(self._concatenate_sample_parts(sample_parts))
+
+        return texts
+
+    def _concatenate_sample_parts(self, sample_parts: List[numpy.ndarray]) -> numpy.ndarray:
+        """Concatenate the token ids which make up a sample and pad the sample if necessary
+
+        Args:
+            sample_parts (List[numpy.ndarray]): The token ids of each document span of the sample
+
+        Returns:
+            numpy.ndarray: The text ids
+        """
         length = sum(map(len, sample_parts))
 
         # Pad the sample if necessary
         if length < (self.config.sequence_length + self.config.add_extra_token_to_sequence):
-            sample_parts.append(
+            sample_parts = sample_parts + [
                 [self._pad_token_id]
                 * (self.config.sequence_length + self.config.add_extra_token_to_sequence - length)
-            )
+            ]
 
-        return (
-            numpy.concatenate(sample_parts, dtype=numpy.int64),
-            numpy.array(document_ids, dtype=numpy.int64),
-        )
+        return numpy.concatenate(sample_parts, dtype=numpy.int64)
+
+    def _prefetch_document_sample_shuffle_indices(self, idx: int) -> None:
+        """Hint the low level dataset about the document spans of the samples following an index
+
+        The samples following the index in shuffled order are the ones most likely to be queried
+        next by the sampler. The sampler gives each data parallel rank s3_prefetch_micro_batch_size
+        consecutive samples out of every s3_prefetch_micro_batch_size *
+        s3_prefetch_data_parallel_size, so the samples of the other ranks are skipped. To avoid
+        repeating hints, we remember where the previous lookahead window ended and only hint the
+        samples beyond it.
+
+        Args:
+            idx (int): The index into the dataset which was just queried
+        """
+        if not isinstance(self.dataset, IndexedDataset):
+            return
+
+        # Number the samples of the rank which queried idx consecutively
+        block_size = self.config.s3_prefetch_micro_batch_size
+        period = block_size * self.config.s3_prefetch_data_parallel_size
+        block_offset = idx % period // block_size * block_size
+
+        def rank_position(i: int) -> int:
+            return i // period * block_size + i % period - block_offset
+
+        def sample_index(position: int) -> int:
+            return position // block_size * period + block_offset + position % block_size
+
+        beg = rank_position(idx) + 1
+        end = beg + self.config.s3_prefetch_lookahead
+        if self.prefetch_cursor is not None and beg <= self.prefetch_cursor <= end:
+            beg = self.prefetch_cursor
+        indices = [
+            sample_index(position)
+            for position in range(beg, end)
+            if sample_index(position) < len(self)
+        ]
+        if not indices:
+            return
+
+        document_ids = []
+        offsets = []
+        lengths = []
+        for i in indices:
+            sample_document_ids, sample_offsets, sample_lengths = self._get_document_spans(i)
+            document_ids.extend(sample_document_ids)
+            offsets.extend(sample_offsets)
+            lengths.extend(sample_lengths)
+        self.dataset.prefetch(document_ids, offsets, lengths)
+
+        self.prefetch_cursor = end
 
     def _build_document_sample_shuffle_indices(
         self,
@@ -314,6 +619,7 @@ class GPTDataset(MegatronDataset):
         The sample index:
             -- 2-D
             -- The document indices and offsets which mark the start of every sample
+            -- 1-D when sequence packing, the document indices which mark the start of every sample
 
         The shuffle index:
             -- 1-D
@@ -351,10 +657,23 @@ class GPTDataset(MegatronDataset):
         else:
             cache_hit = False
 
-        if not path_to_cache or (
-            not cache_hit
-            and (not torch.distributed.is_initialized() or torch.distributed.get_rank() == 0)
-        ):
+        build_indices = not path_to_cache or (not cache_hit and self.is_index_builder_rank())
+
+        if build_indices and self.config.sequence_packing:
+
+            log_single_rank(
+                logger,
+                logging.INFO,
+                f"Build and save the packed {type(self).__name__} {self.index_split.name} indices",
+            )
+            self.built_anew_on_cache_miss = True
+            t_beg = time.time()
+
+            document_index, sample_index, shuffle_index, num_epochs = (
+                self._build_packed_document_sample_shuffle_indices()
+            )
+
+        elif build_indices:
 
             log_single_rank(
                 logger,
@@ -447,6 +766,11 @@ class GPTDataset(MegatronDataset):
                 self.config.add_extra_token_to_sequence,
             )
 
+            # Compact the sample index when the document index permits. The document offsets are
+            # bounded by the int32 sequence lengths.
+            if document_index.shape[0] <= numpy.iinfo(numpy.int32).max:
+                sample_index = sample_index.astype(numpy.int32)
+
             # Build the shuffle index
             if separate_final_epoch:
                 shuffle_index = _build_shuffle_index(
@@ -457,14 +781,20 @@ class GPTDataset(MegatronDataset):
                     sample_index.shape[0] - 1, sample_index.shape[0] - 1, numpy_random_state
                 )
 
+        if build_indices:
             if path_to_cache:
                 os.makedirs(path_to_cache, exist_ok=True)
-                # Write the description
-                with open(path_to_description, "wt") as writer:
+                # Save the indices
+                for path, index in [
+                    (path_to_document_index, document_index),
+                    (path_to_sample_index, sample_index),
+                    (path_to_shuffle_index, shuffle_index),
+                ]:
+                    with atomic_open(path) as writer:
+                        numpy.save(writer, index, allow_pickle=True)
+                # Write the description last, as its presence marks the cache complete
+                with atomic_open(path_to_description, "wt") as writer:
                     writer.write(self.unique_description)
-                numpy.save(path_to_document_index, document_index, allow_pickle=True)
-                numpy.save(path_to_sample_index, sample_index, allow_pickle=True)
-                numpy.save(path_to_shuffle_index, shuffle_index, allow_pickle=True)
             else:
                 log_single_rank(
                     logger,
@@ -480,19 +810,37 @@ class GPTDataset(MegatronDataset):
             )
             log_single_rank(logger, logging.INFO, f"> total number of epochs: {num_epochs}")
 
-            return document_index, sample_index, shuffle_index
+            if not path_to_cache:
+                return document_index, sample_index, shuffle_index
+
+            # Release the built indices in favor of memory maps of the saved indices, whose pages
+            # are shared by all ranks on the node
+            del document_index, sample_index, shuffle_index
 
         log_single_rank(
             logger, logging.INFO, f"Load the {type(self).__name__} {self.index_split.name} indices"
         )
 
+        if cache_hit:
+            validate_cache_description(path_to_description, self.unique_description)
+
+        if self.config.shared_memory_indices:
+            load_index = load_shared_memory_array
+            self.shared_memory_index_paths = {
+                "document_index": path_to_document_index,
+                "sample_index": path_to_sample_index,
+                "shuffle_index": path_to_shuffle_index,
+            }
+        else:
+            load_index = lambda path: numpy.load(path, allow_pickle=True, mmap_mode='r')
+
         log_single_rank(
             logger,
             logging.INFO,
             f"\tLoad the document index from {os.path.basename(path_to_document_index)}",
         )
         t_beg = time.time()
-        document_index = numpy.load(path_to_document_index, allow_pickle=True, mmap_mode='r')
+        document_index = load_index(path_to_document_index)
         t_end = time.time()
         log_single_rank(logger, logging.DEBUG, f"\t> time elapsed: {t_end - t_beg:4f} seconds")
 
@@ -502,7 +850,7 @@ class GPTDataset(MegatronDataset):
             f"\tLoad the sample index from {os.path.basename(path_to_sample_index)}",
         )
         t_beg = time.time()
-        sample_index = numpy.load(path_to_sample_index, allow_pickle=True, mmap_mode='r')
+        sample_index = load_index(path_to_sample_index)
         t_end = time.time()
         log_single_rank(logger, logging.DEBUG, f"\t> time elapsed: {t_end - t_beg:4f} seconds")
 
@@ -512,7 +860,7 @@ class GPTDataset(MegatronDataset):
             f"\tLoad the shuffle index from {os.path.basename(path_to_shuffle_index)}",
         )
         t_beg = time.time()
-        shuffle_index = numpy.load(path_to_shuffle_index, allow_pickle=True, mmap_mode='r')
+        shuffle_index = load_index(path_to_shuffle_index)
         t_end = time.time()
         log_single_rank(logger, logging.DEBUG, f"\t> time elapsed: {t_end - t_beg:4f} seconds")
 
@@ -522,6 +870,79 @@ class GPTDataset(MegatronDataset):
 
         return document_index, sample_index, shuffle_index
 
+    def _build_packed_document_sample_shuffle_indices(
+        self,
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, int]:
+        """Build the document index, the sample index, and the shuffle index for sequence packing
+
+        Each epoch, the documents are shuffled and then packed whole into samples, or bins, of
+        sequence_length (+ 1) tokens. Best-fit-decreasing visits the documents longest first and
+        puts each into the fullest bin with room for it. First-fit visits the documents in
+        shuffled order and puts each into the earliest bin with room for it. The documents of
+        each bin are contiguous in the document index. Epochs are added until there are at least
+        num_samples bins.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, int]: The document index, the sample index, the shuffle index, and the number of epochs
+        """
+        from megatron.core.datasets import helpers
+
+        capacity = self.config.sequence_length + self.config.add_extra_token_to_sequence
+        best_fit = self.config.sequence_packing_algorithm == "best_fit_decreasing"
+
+        numpy_random_state = numpy.random.RandomState(self.config.random_seed)
+
+        document_lengths = numpy.minimum(
+            self.dataset.sequence_lengths[self.indices], capacity
+        ).astype(numpy.int32)
+        num_truncated = int(numpy.sum(self.dataset.sequence_lengths[self.indices] > capacity))
+
+        document_indices = []
+        bin_sizes = []
+        num_bins = 0
+        num_epochs = 0
+        while num_epochs == 0 or (
+            self.num_samples is not None and num_bins < self.num_samples and num_bins > 0
+        ):
+            order = numpy_random_state.permutation(len(self.indices))
+            if best_fit:
+                order = order[numpy.argsort(-document_lengths[order], kind="stable")]
+
+            bin_ids = helpers.build_packing_bins(document_lengths[order], capacity, best_fit)
+
+            # Make the documents of each bin contiguous
+            order = order[numpy.argsort(bin_ids, kind="stable")]
+            document_indices.append(self.indices[order].astype(numpy.int32))
+            bin_sizes.append(numpy.bincount(bin_ids))
+
+            num_bins += bin_sizes[-1].shape[0]
+            num_epochs += 1
+
+        document_index = numpy.concatenate(document_indices)
+        sample_index = numpy.zeros(num_bins + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.concatenate(bin_sizes), out=sample_index[1:])
+        if document_index.shape[0] <= numpy.iinfo(numpy.int32).max:
+            sample_index = sample_index.astype(numpy.int32)
+
+        shuffle_index = _build_shuffle_index(num_bins, num_bins, numpy_random_state)
+
+        num_tokens = int(numpy.sum(document_lengths)) * num_epochs
+        log_single_rank(
+            logger,
+            logging.INFO,
+            f"> packed {len(self.indices) * num_epochs} documents into {num_bins} samples with "
+            + f"{self.config.sequence_packing_algorithm}, packing efficiency: "
+            + f"{num_tokens / max(num_bins * capacity, 1):.2%}",
+        )
+        if num_truncated > 0:
+            log_single_rank(
+                logger,
+                logging.WARNING,
+                f"> truncated {num_truncated} documents longer than {capacity} tokens per epoch",
+            )
+
+        return document_index, sample_index, shuffle_index, num_epochs
+
     def _get_num_tokens_per_epoch(self) -> int:
         """Calculate the number of tokens in a single epoch
 
@@ -692,6 +1113,76 @@ def _get_ltor_masks_and_position_ids(
     return attention_mask, loss_mask, position_ids
 
 
+def _get_packed_masks_position_ids_and_cu_seqlens(
+    data: torch.Tensor,
+    document_lengths: List[int],
+    eod_token: int,
+    eod_mask_loss: bool,
+    create_attention_mask: bool,
+) -> Tuple[Optional[torch.Tensor], torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Build masks, position ids, and cumulative sequence lengths for a packed left to right sample
+
+    Args:
+        data (torch.Tensor): The data tenor that holds the tokens from the dataset
+
+        document_lengths (List[int]): The lengths of the packed documents, in order, which may exceed the data by the extra token
+
+        eod_token (int): ID of the token to that is considered the EOD
+
+        eod_mask_loss (bool): Switch to enable the EOD mask loss
+
+        create_attention_mask (bool): Switch to enable the attention masks generation. Can be disabled if attention kernel generates masks by itself.
+
+    Returns:
+        torch.Tensor: Attention mask needed to be used for Attention
+
+        torch.Tensor: The mask used for loss value during training
+
+        torch.Tensor: The position ID's of the token
+
+        torch.Tensor: The cumulative sequence lengths of the documents, followed by the padding if any, clipped to the data
+    """
+    seq_length = data.numel()
+
+    document_ends = torch.cumsum(torch.tensor(document_lengths, dtype=torch.int32), dim=0)
+
+    # Sequence boundaries, with any padding as a final sequence
+    cu_seqlens = torch.cat(
+        [
+            torch.zeros(1, dtype=torch.int32),
+            torch.clamp(document_ends, max=seq_length),
+            torch.tensor([seq_length], dtype=torch.int32),
+        ]
+    )
+    cu_seqlens = torch.unique_consecutive(cu_seqlens)
+
+    seqlens = cu_seqlens[1:] - cu_seqlens[:-1]
+    sequence_ids = torch.repeat_interleave(torch.arange(seqlens.numel()), seqlens)
+
+    if create_attention_mask:
+        attention_mask = torch.tril(
+            torch.ones((seq_length, seq_length), dtype=torch.bool, device=data.device)
+        )
+        attention_mask &= sequence_ids.unsqueeze(0) == sequence_ids.unsqueeze(1)
+        # Convert attention mask to binary:
+        attention_mask = ~attention_mask.unsqueeze(0)
+    else:
+        attention_mask = None
+
+    # Loss mask. The last token of a document must not predict the next document
+    loss_mask = torch.ones(seq_length, dtype=torch.float, device=data.device)
+    loss_mask[document_ends[document_ends <= seq_length].long() - 1] = 0.0
+    if eod_mask_loss:
+        loss_mask[data == eod_token] = 0.0
+
+    # Position ids.
+    position_ids = torch.arange(seq_length, dtype=torch.long) - torch.repeat_interleave(
+        cu_seqlens[:-1].long(), seqlens
+    )
+
+    return attention_mask, loss_mask, position_ids.to(data.device), cu_seqlens
+
+
 class MockGPTLowLevelDataset:
 
     seed: int = 0
@@ -720,6 +1211,21 @@ class MockGPTLowLevelDataset:
             length = self.sequence_lengths[idx] - offset
         return self[idx][offset : offset + length]
 
+    def get_many(
+        self,
+        indices: List[int],
+        offsets: Optional[List[int]] = None,
+        lengths: Optional[List[Optional[int]]] = None,
+    ) -> List[numpy.ndarray]:
+        if offsets is None:
+            offsets = [0] * len(indices)
+        if lengths is None:
+            lengths = [None] * len(indices)
+        return [
+            self.get(idx, offset=offset, length=length)
+            for idx, offset, length in zip(indices, offsets, lengths)
+        ]
+
 
 class MockGPTDataset(GPTDataset):
     """The mock GPT dataset
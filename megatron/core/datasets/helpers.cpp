@@ -11,6 +11,7 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/numpy.h>
 #include <random>
+#include <vector>
 
 namespace py = pybind11;
 using namespace std;
@@ -139,6 +140,103 @@ void build_blending_indices(py::array_t<int16_t> &dataset_index,
   }
 }
 
+inline int64_t get_blending_max_error_index(const double *weights,
+                                            const int64_t *current_samples,
+                                            const int64_t num_datasets,
+                                            const int64_t sample_idx)
+{
+  /* The dataset with the max error in sampling at a sample index. This must
+     stay identical to the selection in build_blending_indices.*/
+  auto sample_idx_double = std::max(static_cast<double>(sample_idx), 1.0);
+  int64_t max_error_index = 0;
+  double max_error = weights[0] * sample_idx_double -
+                     static_cast<double>(current_samples[0]);
+  for (int64_t dataset_idx = 1; dataset_idx < num_datasets; ++dataset_idx)
+  {
+    double error = weights[dataset_idx] * sample_idx_double -
+                   static_cast<double>(current_samples[dataset_idx]);
+    if (error > max_error)
+    {
+      max_error = error;
+      max_error_index = dataset_idx;
+    }
+  }
+  return max_error_index;
+}
+
+py::array build_blending_checkpoints(const py::array_t<double> &weights_,
+                                     const int64_t size,
+                                     const int64_t block_size)
+{
+  /* Run the build_blending_indices sampling without populating the indices
+     and record the number of samples drawn from each dataset before every
+     block_size-th sample, and after the last sample. Returns a 2-D array of
+     shape [ceil(size / block_size) + 1, num_datasets].*/
+
+  // Consistency checks.
+  assert(block_size > 0);
+
+  const int64_t num_datasets = weights_.shape(0);
+  const int64_t num_blocks = (size + block_size - 1) / block_size;
+  std::vector<double> weights(weights_.data(), weights_.data() + num_datasets);
+
+  int64_t *checkpoints = new int64_t[(num_blocks + 1) * num_datasets];
+  std::vector<int64_t> current_samples(num_datasets, 0);
+
+  for (int64_t sample_idx = 0; sample_idx < size; ++sample_idx)
+  {
+    if (sample_idx % block_size == 0)
+    {
+      std::copy(current_samples.begin(), current_samples.end(),
+                checkpoints + (sample_idx / block_size) * num_datasets);
+    }
+    current_samples[get_blending_max_error_index(
+        weights.data(), current_samples.data(), num_datasets, sample_idx)] += 1;
+  }
+  std::copy(current_samples.begin(), current_samples.end(),
+            checkpoints + num_blocks * num_datasets);
+
+  // Method to deallocate memory.
+  py::capsule free_when_done(checkpoints, [](void *mem_)
+                             {
+	int64_t *mem = reinterpret_cast<int64_t*>(mem_);
+	delete[] mem; });
+
+  // Return the numpy array.
+  const auto byte_size = sizeof(int64_t);
+  return py::array(std::vector<int64_t>{num_blocks + 1, num_datasets}, // shape
+                   {num_datasets * byte_size, byte_size},              // C-style contiguous strides
+                   checkpoints,                                        // the data pointer
+                   free_when_done);                                    // numpy array references
+}
+
+void decode_blending_indices(py::array_t<int16_t> &dataset_index,
+                             py::array_t<int64_t> &dataset_sample_index,
+                             const py::array_t<double> &weights_,
+                             const py::array_t<int64_t> &checkpoint,
+                             const int64_t start)
+{
+  /* Populate the build_blending_indices indices for the samples from start,
+     given the number of samples drawn from each dataset before start.*/
+
+  auto dataset_index_ptr = dataset_index.mutable_unchecked<1>();
+  auto dataset_sample_index_ptr = dataset_sample_index.mutable_unchecked<1>();
+
+  const int64_t num_datasets = weights_.shape(0);
+  const int64_t length = dataset_index.shape(0);
+  std::vector<double> weights(weights_.data(), weights_.data() + num_datasets);
+  std::vector<int64_t> current_samples(checkpoint.data(), checkpoint.data() + num_datasets);
+
+  for (int64_t i = 0; i < length; ++i)
+  {
+    int64_t max_error_index = get_blending_max_error_index(
+        weights.data(), current_samples.data(), num_datasets, start + i);
+    dataset_index_ptr[i] = static_cast<int16_t>(max_error_index);
+    dataset_sample_index_ptr[i] = current_samples[max_error_index];
+    current_samples[max_error_index] += 1;
+  }
+}
+
 py::array build_sample_idx(const py::array_t<int32_t> &sizes_,
                            const py::array_t<int32_t> &doc_idx_,
                            const int32_t seq_length,
@@ -239,6 +337,111 @@ py::array build_sample_idx(const py::array_t<int32_t> &sizes_,
                    free_when_done);                          // numpy array references
 }
 
+py::array build_packing_bins(const py::array_t<int32_t> &sizes_,
+                             const int32_t capacity,
+                             const bool best_fit)
+{
+  /* Assign each item, in order, to a bin of the given capacity. With
+     best_fit, an item goes to the bin with the least remaining capacity
+     which still fits it, otherwise to the first (lowest id) bin which fits
+     it. When no open bin fits the item, a new bin is opened. Items must not
+     exceed the capacity. Returns a 1-D array of the bin id of each item,
+     where bins are numbered in the order they are opened.*/
+
+  // Consistency checks.
+  assert(capacity > 0);
+
+  // Remove bound checks.
+  auto sizes = sizes_.unchecked<1>();
+  const int64_t num_items = sizes_.shape(0);
+
+  int32_t *bin_ids = new int32_t[num_items];
+  int32_t num_bins = 0;
+
+  if (best_fit)
+  {
+    // The open bins ordered by remaining capacity, then by bin id.
+    std::set<std::pair<int32_t, int32_t>> bins;
+    for (int64_t i = 0; i < num_items; ++i)
+    {
+      const int32_t size = sizes[i];
+      if (size > capacity)
+      {
+        throw std::invalid_argument("item size exceeds the bin capacity");
+      }
+      auto it = bins.lower_bound(std::make_pair(size, -1));
+      int32_t bin_id;
+      int32_t remaining;
+      if (it == bins.end())
+      {
+        bin_id = num_bins++;
+        remaining = capacity;
+      }
+      else
+      {
+        remaining = it->first;
+        bin_id = it->second;
+        bins.erase(it);
+      }
+      bin_ids[i] = bin_id;
+      remaining -= size;
+      // A full bin can take no further items.
+      if (remaining > 0)
+      {
+        bins.insert(std::make_pair(remaining, bin_id));
+      }
+    }
+  }
+  else
+  {
+    // A segment tree of the maximum remaining capacity over the bins, where
+    // there are at most as many bins as there are items and unopened bins
+    // have the full capacity.
+    int64_t num_leaves = 1;
+    while (num_leaves < num_items)
+    {
+      num_leaves *= 2;
+    }
+    std::vector<int32_t> tree(2 * num_leaves, capacity);
+    for (int64_t i = 0; i < num_items; ++i)
+    {
+      const int32_t size = sizes[i];
+      if (size > capacity)
+      {
+        throw std::invalid_argument("item size exceeds the bin capacity");
+      }
+      // Descend to the leftmost leaf which fits the item.
+      int64_t node = 1;
+      while (node < num_leaves)
+      {
+        node = tree[2 * node] >= size ? 2 * node : 2 * node + 1;
+      }
+      const int32_t bin_id = node - num_leaves;
+      bin_ids[i] = bin_id;
+      num_bins = std::max(num_bins, bin_id + 1);
+      // Update the remaining capacity up to the root.
+      tree[node] -= size;
+      for (node /= 2; node >= 1; node /= 2)
+      {
+        tree[node] = std::max(tree[2 * node], tree[2 * node + 1]);
+      }
+    }
+  }
+
+  // Method to deallocate memory.
+  py::capsule free_when_done(bin_ids, [](void *mem_)
+                             {
+	int32_t *mem = reinterpret_cast<int32_t*>(mem_);
+	delete[] mem; });
+
+  // Return the numpy array.
+  const auto byte_size = sizeof(int32_t);
+  return py::array(std::vector<int64_t>{num_items}, // shape
+                   {byte_size},                     // C-style contiguous strides
+                   bin_ids,                         // the data pointer
+                   free_when_done);                 // numpy array references
+}
+
 inline int32_t get_target_sample_len(const int32_t short_seq_ratio,
                                      const int32_t max_length,
                                      std::mt19937 &rand32_gen)
@@ -834,6 +1037,9 @@ PYBIND11_MODULE(helpers, m)
   m.def("build_mapping", &build_mapping);
   m.def("build_blocks_mapping", &build_blocks_mapping);
   m.def("build_sample_idx", &build_sample_idx);
+  m.def("build_packing_bins", &build_packing_bins);
   m.def("build_blending_indices", &build_blending_indices);
   m.def("build_exhaustive_blending_indices", &build_exhaustive_blending_indices);
+  m.def("build_blending_checkpoints", &build_blending_checkpoints);
+  m.def("decode_blending_indices", &decode_blending_indices);
 }
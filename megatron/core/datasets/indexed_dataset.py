@@ -9,13 +9,16 @@ import logging
 import os
 import shutil
 import struct
+import threading
 import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from functools import lru_cache
 from itertools import accumulate
 from types import TracebackType
-from typing import List, Optional, Tuple, Type, Union
+from typing import Iterable, List, Optional, Sequence, Tuple, Type, Union
 
 try:
     import boto3
@@ -24,6 +27,8 @@ except ModuleNotFoundError:
 import numpy
 import torch
 
+from megatron.core.datasets.data_loading_profiler import profile_data_loading_stage
+from megatron.core.datasets.utils import get_shared_memory_buffer
 from megatron.core.datasets.utils_s3 import (
     S3Config,
     is_s3_path,
@@ -228,9 +233,11 @@ class _IndexReader(object):
         idx_path (str): The path to the index file
 
         multimodal (bool): Whether the dataset is multimodal
+
+        shared_memory (bool): Whether to read the index from a shared memory file created once per node, see get_shared_memory_buffer. Defaults to False.
     """
 
-    def __init__(self, idx_path: str, multimodal: bool) -> None:
+    def __init__(self, idx_path: str, multimodal: bool, shared_memory: bool = False) -> None:
 
         log_single_rank(logger, logging.INFO, f"Load the {type(self).__name__} from {idx_path}")
 
@@ -250,8 +257,11 @@ class _IndexReader(object):
 
             offset = stream.tell()
 
-        self.bin_buffer_mmap = numpy.memmap(idx_path, mode="r", order="C")
-        self.bin_buffer = memoryview(self.bin_buffer_mmap)
+        if shared_memory:
+            self.bin_buffer = get_shared_memory_buffer(idx_path)
+        else:
+            self.bin_buffer_mmap = numpy.memmap(idx_path, mode="r", order="C")
+            self.bin_buffer = memoryview(self.bin_buffer_mmap)
 
         log_single_rank(logger, logging.INFO, f"\tExtract the sequence lengths")
         t_beg = time.time()
@@ -360,6 +370,40 @@ class _BinReader(ABC):
         """
         pass
 
+    def read_many(
+        self, dtype: Type[numpy.number], counts: numpy.ndarray, offsets: numpy.ndarray
+    ) -> numpy.ndarray:
+        """Read many spans of bytes into a single numpy array.
+
+        Args:
+            dtype (Type[numpy.number]): Data-type of the returned array.
+
+            counts (numpy.ndarray): Number of items to read from each span.
+
+            offsets (numpy.ndarray): Start reading each span from this offset (in bytes).
+
+        Returns:
+            numpy.ndarray: An array with `sum(counts)` items and data-type `dtype` constructed from concatenating the spans in order. When there is a single span, the array may be the one returned by `read`.
+        """
+        if len(counts) == 1:
+            return self.read(dtype=dtype, count=int(counts[0]), offset=int(offsets[0]))
+        sequence = numpy.empty(int(numpy.sum(counts)), dtype=dtype)
+        position = 0
+        for count, offset in zip(counts.tolist(), offsets.tolist()):
+            sequence[position : position + count] = self.read(
+                dtype=dtype, count=count, offset=offset
+            )
+            position += count
+        return sequence
+
+    def prefetch(self, ranges: Iterable[Tuple[int, int]]) -> None:
+        """Hint that the byte ranges will be read soon. Does nothing unless overridden.
+
+        Args:
+            ranges (Iterable[Tuple[int, int]]): The (offset, size) byte ranges expected to be read
+        """
+        pass
+
 
 class _MMapBinReader(_BinReader):
     """A _BinReader that memory maps the data (.bin) file
@@ -428,47 +472,209 @@ class _FileBinReader(_BinReader):
             bin_buffer_file.readinto(sequence)
         return sequence
 
+    def read_many(
+        self, dtype: Type[numpy.number], counts: numpy.ndarray, offsets: numpy.ndarray
+    ) -> numpy.ndarray:
+        """Read many spans of bytes into a single numpy array, opening the data file once.
+
+        Args:
+            dtype (Type[numpy.number]): Data-type of the returned array.
+
+            counts (numpy.ndarray): Number of items to read from each span.
+
+            offsets (numpy.ndarray): Start reading each span from this offset (in bytes).
+
+        Returns:
+            numpy.ndarray: An array with `sum(counts)` items and data-type `dtype` constructed from concatenating the spans in order.
+        """
+        sequence = numpy.empty(int(numpy.sum(counts)), dtype=dtype)
+        sequence_bytes = memoryview(sequence).cast("B")
+        dtype_size = DType.size(dtype)
+        position = 0
+        with open(self._bin_path, mode='rb', buffering=0) as bin_buffer_file:
+            for count, offset in zip(counts.tolist(), offsets.tolist()):
+                nbytes = count * dtype_size
+                bin_buffer_file.seek(offset)
+                bin_buffer_file.readinto(sequence_bytes[position : position + nbytes])
+                position += nbytes
+        return sequence
+
 
 class _S3BinReader(_BinReader):
     """A _BinReader that reads from the data (.bin) file from S3
 
+    The data file is divided into blocks of `bin_chunk_nbytes` bytes, where each block is assigned
+    an index starting from 0. Blocks are downloaded whole and kept in an in-memory LRU cache whose
+    total size is bounded by `bin_cache_nbytes`. Optionally, blocks may be downloaded ahead of time
+    on a pool of background threads, see `prefetch`.
+
     Args:
         bin_path (str): bin_path (str): The path to the data (.bin) file.
 
         bin_chunk_nbytes (int, optional): If not None, then maintain an in-memory cache to speed up calls to the `read` method. Furthermore, on a cache miss, download this number of bytes to refresh the cache. Otherwise (None), do not maintain an in-memory cache. A class that inherits from _BinReader may not implement caching in which case it should assert that `bin_chunk_nbytes` is None at initialization.
+
+        bin_cache_nbytes (Optional[int]): The maximum number of bytes held by the in-memory cache. The cache always holds at least one block. Defaults to None, i.e. a single block.
+
+        bin_prefetch_threads (int): The number of threads used to download blocks in the background. Defaults to 0, i.e. no prefetching.
     """
 
-    def __init__(self, bin_path: str, bin_chunk_nbytes: int) -> None:
+    def __init__(
+        self,
+        bin_path: str,
+        bin_chunk_nbytes: int,
+        bin_cache_nbytes: Optional[int] = None,
+        bin_prefetch_threads: int = 0,
+    ) -> None:
         assert bin_chunk_nbytes > 0
+        assert bin_cache_nbytes is None or bin_cache_nbytes > 0
+        assert bin_prefetch_threads >= 0
         self._client = boto3.client("s3")
         self._s3_bucket, self._s3_key = parse_s3_path(bin_path)
-        self._cache = None
-        self._cache_bytes_start = None
-        self._cache_bytes_end = None
-        self._cache_nbytes = bin_chunk_nbytes
-
-    def _extract_from_cache(self, offset: int, size: int) -> bytes:
-        """Extract `size` bytes starting at `offset` bytes into the cache"""
-        start = offset - self._cache_bytes_start
-        assert start >= 0
-        end = start + size
-        assert end <= len(self._cache)
-        return self._cache[start:end]
+        self._block_nbytes = bin_chunk_nbytes
+        self._cache_capacity_nbytes = max(bin_cache_nbytes or 0, bin_chunk_nbytes)
+        self._cache = OrderedDict()
+        self._cache_nbytes = 0
+        self._prefetch_threads = bin_prefetch_threads
+        self._max_blocks_in_flight = max(1, self._cache_capacity_nbytes // self._block_nbytes)
+        self._initialize_concurrency()
+
+    def _initialize_concurrency(self) -> None:
+        """Initialize the lock, the in-flight downloads, and the executor
+
+        These cannot be shared with a forked process, e.g. a dataloader worker, so we rebuild them
+        whenever we find ourselves in a new process
+        """
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._executor = None
+
+    def _maybe_reinitialize_concurrency(self) -> None:
+        """Rebuild the concurrency primitives if the object has crossed a fork"""
+        if self._pid != os.getpid():
+            self._initialize_concurrency()
+
+    def _download_block(self, block_index: int) -> bytes:
+        """Download the block at the index from S3
+
+        Args:
+            block_index (int): The block index
+
+        Returns:
+            bytes: The block, which is shorter than `bin_chunk_nbytes` at the end of the object
+        """
+        bytes_start = block_index * self._block_nbytes
+        bytes_end = bytes_start + self._block_nbytes
+        return self._client.get_object(
+            Bucket=self._s3_bucket,
+            Key=self._s3_key,
+            # Subtract 1, because the end of Range is inclusive.
+            Range=f'bytes={bytes_start}-{bytes_end-1}',
+        )['Body'].read()
+
+    def _insert_block(self, block_index: int, block: bytes) -> None:
+        """Insert a block into the cache and evict the least recently used blocks to fit
+
+        Must be called while holding the lock.
+
+        Args:
+            block_index (int): The block index
+
+            block (bytes): The block
+        """
+        if block_index in self._cache:
+            self._cache.move_to_end(block_index)
+            return
+        self._cache[block_index] = block
+        self._cache_nbytes += len(block)
+        while self._cache_nbytes > self._cache_capacity_nbytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_nbytes -= len(evicted)
+
+    def _prefetch_block(self, block_index: int) -> bytes:
+        """Download a block in the background and insert it into the cache
+
+        Args:
+            block_index (int): The block index
+
+        Returns:
+            bytes: The block
+        """
+        try:
+            block = self._download_block(block_index)
+            with self._lock:
+                self._insert_block(block_index, block)
+        finally:
+            with self._lock:
+                self._in_flight.pop(block_index, None)
+        return block
+
+    def _get_block(self, block_index: int) -> bytes:
+        """Get a block from the cache, from an in-flight download, or from S3 in that order
+
+        Args:
+            block_index (int): The block index
+
+        Returns:
+            bytes: The block
+        """
+        with self._lock:
+            block = self._cache.get(block_index)
+            if block is not None:
+                self._cache.move_to_end(block_index)
+                return block
+            future = self._in_flight.get(block_index)
+        if future is not None:
+            return future.result()
+        block = self._download_block(block_index)
+        with self._lock:
+            self._insert_block(block_index, block)
+        return block
+
+    def prefetch(self, ranges: Iterable[Tuple[int, int]]) -> None:
+        """Download the blocks covering the byte ranges in the background
+
+        The blocks are scheduled in the order given, skipping blocks which are cached or already
+        being downloaded. Cached blocks are marked as recently used so that they outlive blocks
+        which are not expected to be read again soon. At most as many blocks as fit in the cache
+        are downloaded at once, beyond which the remaining ranges are ignored.
+
+        Args:
+            ranges (Iterable[Tuple[int, int]]): The (offset, size) byte ranges expected to be read
+        """
+        if self._prefetch_threads == 0:
+            return
+        self._maybe_reinitialize_concurrency()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._prefetch_threads, thread_name_prefix="s3_bin_reader"
+                )
+            for offset, size in ranges:
+                if size <= 0:
+                    continue
+                block_index_beg = offset // self._block_nbytes
+                block_index_end = (offset + size - 1) // self._block_nbytes
+                for block_index in range(block_index_beg, block_index_end + 1):
+                    if block_index in self._cache:
+                        self._cache.move_to_end(block_index)
+                        continue
+                    if block_index in self._in_flight:
+                        continue
+                    if len(self._in_flight) >= self._max_blocks_in_flight:
+                        return
+                    self._in_flight[block_index] = self._executor.submit(
+                        self._prefetch_block, block_index
+                    )
 
     def read(self, dtype: Type[numpy.number], count: int, offset: int) -> numpy.ndarray:
         """Read bytes into a numpy array.
 
-        Let `size` be the `count` * `DType.size(dtype)`. If the requested span of bytes [`offset`,
-        `offset` + `size`) is covered by the in-memory cache maintained by this class, then this
-        function extracts the requested span from that cache and returns it. Otherwise, this
-        function first refreshes the cache and then extracts the requested span from the refreshed
-        cache and returns it.
-
-        The cache is refreshed based on `offset` and `size`. In particular, we divide all the bytes
-        in an S3 object into blocks, where each block contains `bin_chunk_nbytes` bytes. We assign
-        each block an index starting from 0. We take the block with index (`offset` //
-        `bin_chunk_nbytes`) to refresh the cache. If this new block still does not cover the
-        requested span, we extend it just enough to include `offset` + `size`.
+        Let `size` be the `count` * `DType.size(dtype)`. The requested span of bytes [`offset`,
+        `offset` + `size`) is covered by the blocks with indices (`offset` // `bin_chunk_nbytes`)
+        through ((`offset` + `size` - 1) // `bin_chunk_nbytes`). Each block is taken from the
+        cache if present, waited on if it is being prefetched, and downloaded otherwise. When the
+        span lies within a single block, the returned array is a view into the cached block.
 
         Args:
             dtype (Type[numpy.number]): Data-type of the returned array.
@@ -480,31 +686,37 @@ class _S3BinReader(_BinReader):
         Returns:
             numpy.ndarray: An array with `count` items and data-type `dtype` constructed from reading bytes from the data file starting at `offset`.
         """
+        self._maybe_reinitialize_concurrency()
         size = count * DType.size(dtype)
-        if (
-            self._cache is not None
-            and offset >= self._cache_bytes_start
-            and offset + size <= self._cache_bytes_end
-        ):
-            return numpy.frombuffer(self._extract_from_cache(offset, size), dtype=dtype)
-
-        bytes_start = (offset // self._cache_nbytes) * self._cache_nbytes
-        assert bytes_start >= 0
-        assert offset >= bytes_start
-        bytes_end = max(bytes_start + self._cache_nbytes, offset + size)
-        assert bytes_end >= 1
-        self._cache = self._client.get_object(
-            Bucket=self._s3_bucket,
-            Key=self._s3_key,
-            # Subtract 1, because the end of Range is inclusive.
-            Range=f'bytes={bytes_start}-{bytes_end-1}',
-        )['Body'].read()
-        self._cache_bytes_start = bytes_start
-        self._cache_bytes_end = bytes_end
-        return numpy.frombuffer(self._extract_from_cache(offset, size), dtype=dtype)
+        if size == 0:
+            return numpy.empty(0, dtype=dtype)
+
+        block_index_beg = offset // self._block_nbytes
+        block_index_end = (offset + size - 1) // self._block_nbytes
+        start = offset - block_index_beg * self._block_nbytes
+
+        if block_index_beg == block_index_end:
+            block = self._get_block(block_index_beg)
+            assert start + size <= len(block)
+            return numpy.frombuffer(memoryview(block)[start : start + size], dtype=dtype)
+
+        sequence = numpy.empty(count, dtype=dtype)
+        sequence_bytes = memoryview(sequence).cast("B")
+        written = 0
+        for block_index in range(block_index_beg, block_index_end + 1):
+            block = self._get_block(block_index)
+            chunk = memoryview(block)[start : start + size - written]
+            sequence_bytes[written : written + len(chunk)] = chunk
+            written += len(chunk)
+            start = 0
+        assert written == size
+        return sequence
 
     def __del__(self) -> None:
         """Clean up the object"""
+        executor = getattr(self, "_executor", None)
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=False)
         self._client.close()
 
 
@@ -518,7 +730,9 @@ class IndexedDataset(torch.utils.data.Dataset):
 
         mmap (bool): Whether to mmap the .bin files. Defaults to True.
 
-        s3_config (Optional[S3Config]): Supplied only for data stored on S3. IndexedDataset downloads the index (.idx) file to `s3_config.path_to_idx_cache` and streams data from the data (.bin) file in `s3_config.bin_chunk_nbytes` blocks. Note that `mmap` must be disabled for S3 data loading. Defaults to None.
+        s3_config (Optional[S3Config]): Supplied only for data stored on S3. IndexedDataset downloads the index (.idx) file to `s3_config.path_to_idx_cache` and streams data from the data (.bin) file in `s3_config.bin_chunk_nbytes` blocks, caching up to `s3_config.bin_cache_nbytes` bytes of blocks. Note that `mmap` must be disabled for S3 data loading. Defaults to None.
+
+        shared_memory (bool): Whether to read the index (.idx) file from a shared memory file created once per node under the MEGATRON_SHARED_MEMORY_DIR environment variable (default /dev/shm), such that every rank and dataloader worker on the node attaches to the same copy, including on un-pickling. Defaults to False.
     """
 
     def __init__(
@@ -527,12 +741,14 @@ class IndexedDataset(torch.utils.data.Dataset):
         multimodal: bool = False,
         mmap: bool = True,
         s3_config: Optional[S3Config] = None,
+        shared_memory: bool = False,
     ) -> None:
         super().__init__()
         self.path_prefix = None
         self.multimodal = None
         self.mmap = None
         self.s3_config = None
+        self.shared_memory = None
 
         self.index = None
         self.bin_reader = None
@@ -542,10 +758,15 @@ class IndexedDataset(torch.utils.data.Dataset):
             cache_idx_path = os.path.join(s3_config.path_to_idx_cache, os.path.basename(idx_path))
             maybe_download_file(idx_path, cache_idx_path)
 
-        self.initialize(path_prefix, multimodal, mmap, s3_config)
+        self.initialize(path_prefix, multimodal, mmap, s3_config, shared_memory)
 
     def initialize(
-        self, path_prefix: str, multimodal: bool, mmap: bool, s3_config: Optional[S3Config]
+        self,
+        path_prefix: str,
+        multimodal: bool,
+        mmap: bool,
+        s3_config: Optional[S3Config],
+        shared_memory: bool = False,
     ) -> None:
         """Initialize the dataset
 
@@ -560,6 +781,8 @@ class IndexedDataset(torch.utils.data.Dataset):
             mmap (bool): Whether to mmap the .bin file
 
             s3_config (Optional[S3Config]): See IndexedDataset docstring for details.
+
+            shared_memory (bool): See IndexedDataset docstring for details.
         """
         idx_path = get_idx_path(path_prefix)
         bin_path = get_bin_path(path_prefix)
@@ -571,35 +794,41 @@ class IndexedDataset(torch.utils.data.Dataset):
         self.multimodal = multimodal
         self.mmap = mmap
         self.s3_config = s3_config
+        self.shared_memory = shared_memory
         if mmap:
             assert not s3_config
             self.bin_reader = _MMapBinReader(bin_path)
         elif s3_config:
             assert not mmap
-            self.bin_reader = _S3BinReader(bin_path, s3_config.bin_chunk_nbytes)
+            self.bin_reader = _S3BinReader(
+                bin_path,
+                s3_config.bin_chunk_nbytes,
+                s3_config.bin_cache_nbytes,
+                s3_config.bin_prefetch_threads,
+            )
             idx_path = os.path.join(
                 s3_config.path_to_idx_cache, os.path.basename(get_idx_path(path_prefix))
             )
         else:
             self.bin_reader = _FileBinReader(bin_path)
-        self.index = _IndexReader(idx_path, self.multimodal)
+        self.index = _IndexReader(idx_path, self.multimodal, self.shared_memory)
 
-    def __getstate__(self) -> Tuple[str, bool, bool, Optional[S3Config]]:
+    def __getstate__(self) -> Tuple[str, bool, bool, Optional[S3Config], bool]:
         """Get the state during pickling
 
         Returns:
-            Tuple[str, bool, bool, Optional[S3Config]]: The state tuple
+            Tuple[str, bool, bool, Optional[S3Config], bool]: The state tuple
         """
-        return self.path_prefix, self.multimodal, self.mmap, self.s3_config
+        return self.path_prefix, self.multimodal, self.mmap, self.s3_config, self.shared_memory
 
-    def __setstate__(self, state: Tuple[str, bool, bool, Optional[S3Config]]) -> None:
+    def __setstate__(self, state: Tuple[str, bool, bool, Optional[S3Config], bool]) -> None:
         """Set the state during un-pickling
 
         Args:
-            state (Tuple[str, bool, bool, Optional[S3Config]]): The state tuple
+            state (Tuple[str, bool, bool, Optional[S3Config], bool]): The state tuple
         """
-        path_prefix, multimodal, mmap, s3_config = state
-        self.initialize(path_prefix, multimodal, mmap, s3_config)
+        path_prefix, multimodal, mmap, s3_config, shared_memory = state
+        self.initialize(path_prefix, multimodal, mmap, s3_config, shared_memory)
 
     def __del__(self) -> None:
         """Clean up the object"""
@@ -632,11 +861,12 @@ class IndexedDataset(torch.utils.data.Dataset):
         """
         if isinstance(idx, (int, numpy.integer)):
             sequence_pointer, sequence_length, sequence_mode = self.index[idx]
-            sequence = self.bin_reader.read(
-                dtype=self.index.dtype,
-                count=sequence_length,
-                offset=sequence_pointer,
-            )
+            with profile_data_loading_stage("bin-read"):
+                sequence = self.bin_reader.read(
+                    dtype=self.index.dtype,
+                    count=sequence_length,
+                    offset=sequence_pointer,
+                )
             return (sequence, sequence_mode) if sequence_mode is not None else sequence
         elif isinstance(idx, slice):
             start, stop, step = idx.indices(len(self))
@@ -645,14 +875,13 @@ class IndexedDataset(torch.utils.data.Dataset):
             sequence_lengths = self.index.sequence_lengths[idx]
             sequence_modes = self.index.sequence_modes[idx] if self.multimodal else None
             sequence_offsets = list(accumulate(sequence_lengths))
-            sequences = numpy.split(
-                self.bin_reader.read(
+            with profile_data_loading_stage("bin-read"):
+                sequence = self.bin_reader.read(
                     dtype=self.index.dtype,
                     count=sum(sequence_lengths),
                     offset=self.index.sequence_pointers[start],
-                ),
-                sequence_offsets[:-1],
-            )
+                )
+            sequences = numpy.split(sequence, sequence_offsets[:-1])
             return (sequences, sequence_modes) if sequence_modes is not None else sequences
         else:
             raise TypeError("Unexpected type received for idx: {}".format(type(idx)))
@@ -677,11 +906,126 @@ class IndexedDataset(torch.utils.data.Dataset):
         if length is None:
             length = sequence_length - offset
         sequence_pointer += offset * DType.size(self.index.dtype)
-        sequence = self.bin_reader.read(
-            dtype=self.index.dtype, count=length, offset=sequence_pointer
-        )
+        with profile_data_loading_stage("bin-read"):
+            sequence = self.bin_reader.read(
+                dtype=self.index.dtype, count=length, offset=sequence_pointer
+            )
         return (sequence, sequence_mode) if sequence_mode is not None else sequence
 
+    def get_many(
+        self,
+        indices: Sequence[int],
+        offsets: Optional[Sequence[int]] = None,
+        lengths: Optional[Sequence[Optional[int]]] = None,
+    ) -> Union[List[numpy.ndarray], Tuple[List[numpy.ndarray], numpy.ndarray]]:
+        """Retrieve many items from the dataset with the option to only return a portion of each
+        item, reading each region of the data file at most once.
+
+        get_many(indices, offsets, lengths) returns the same sequences as calling get() for each
+        index, offset, and length. The requested spans are sorted by position in the data file
+        and spans which overlap or abut are merged. The merged spans are read in a single call to
+        the bin reader into a single buffer, and the returned sequences are views into it.
+        Consequently, the sequences may share memory and should not be modified in place.
+
+        Args:
+            indices (Sequence[int]): The indices into the dataset
+
+            offsets (Optional[Sequence[int]]): The integer token offset in each sequence. Defaults to None, i.e. 0 for each sequence.
+
+            lengths (Optional[Sequence[Optional[int]]]): The number of tokens to grab from each sequence, where None signifies the remainder of the sequence. Defaults to None.
+
+        Returns:
+            Union[List[numpy.ndarray], Tuple[List[numpy.ndarray], numpy.ndarray]]: The sequence tokens and modes at the indices
+        """
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        sequence_modes = self.index.sequence_modes[indices] if self.multimodal else None
+        if indices.size == 0:
+            return ([], sequence_modes) if sequence_modes is not None else []
+
+        sequence_lengths = self.index.sequence_lengths[indices].astype(numpy.int64)
+        if offsets is None:
+            offsets = numpy.zeros_like(indices)
+        else:
+            offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        if lengths is None:
+            lengths = sequence_lengths - offsets
+        else:
+            lengths = numpy.array(
+                [
+                    sequence_length - offset if length is None else length
+                    for sequence_length, offset, length in zip(
+                        sequence_lengths.tolist(), offsets.tolist(), lengths
+                    )
+                ],
+                dtype=numpy.int64,
+            )
+
+        # The spans in units of tokens
+        dtype_size = DType.size(self.index.dtype)
+        starts = self.index.sequence_pointers[indices] // dtype_size + offsets
+        ends = starts + lengths
+
+        # Merge the spans which overlap or abut in sorted order
+        order = numpy.argsort(starts, kind="stable")
+        sorted_starts = starts[order]
+        sorted_ends = ends[order]
+        merged_ends_so_far = numpy.maximum.accumulate(sorted_ends)
+        is_merged_start = numpy.empty(indices.size, dtype=bool)
+        is_merged_start[0] = True
+        is_merged_start[1:] = sorted_starts[1:] > merged_ends_so_far[:-1]
+        merged_starts = sorted_starts[is_merged_start]
+        merged_ends = numpy.maximum.reduceat(sorted_ends, numpy.flatnonzero(is_merged_start))
+        merged_counts = merged_ends - merged_starts
+        merged_positions = numpy.cumsum(merged_counts) - merged_counts
+
+        with profile_data_loading_stage("bin-read"):
+            sequence = self.bin_reader.read_many(
+                dtype=self.index.dtype, counts=merged_counts, offsets=merged_starts * dtype_size
+            )
+
+        # Locate each span in the buffer
+        merged_ids = numpy.cumsum(is_merged_start) - 1
+        positions = numpy.empty_like(starts)
+        positions[order] = merged_positions[merged_ids] + sorted_starts - merged_starts[merged_ids]
+        sequences = [
+            sequence[position : position + length]
+            for position, length in zip(positions.tolist(), lengths.tolist())
+        ]
+        return (sequences, sequence_modes) if sequence_modes is not None else sequences
+
+    def prefetch(
+        self,
+        indices: Sequence[int],
+        offsets: Optional[Sequence[int]] = None,
+        lengths: Optional[Sequence[Optional[int]]] = None,
+    ) -> None:
+        """Hint that the (portions of the) items will be retrieved soon
+
+        The hint is forwarded to the bin reader as byte ranges. Only bin readers which fetch data
+        from remote storage act on it.
+
+        Args:
+            indices (Sequence[int]): The indices into the dataset, in the expected order of access
+
+            offsets (Optional[Sequence[int]]): The integer token offset in each sequence. Defaults to None, i.e. 0 for each sequence.
+
+            lengths (Optional[Sequence[Optional[int]]]): The number of tokens to grab from each sequence, where None signifies the remainder of the sequence. Defaults to None.
+        """
+        dtype_size = DType.size(self.index.dtype)
+        ranges = []
+        for i, idx in enumerate(indices):
+            offset = offsets[i] if offsets is not None else 0
+            length = lengths[i] if lengths is not None else None
+            if length is None:
+                length = self.index.sequence_lengths[idx] - offset
+            ranges.append(
+                (
+                    int(self.index.sequence_pointers[idx]) + int(offset) * dtype_size,
+                    int(length) * dtype_size,
+                )
+            )
+        self.bin_reader.prefetch(ranges)
+
     @property
     def sequence_lengths(self) -> numpy.ndarray:
         """Get the sequence lengths
@@ -829,6 +1173,50 @@ class IndexedDatasetBuilder(object):
         with open(get_bin_path(path_prefix), "rb") as f:
             shutil.copyfileobj(f, self.data_file)
 
+    def add_indices(self, path_prefixes: List[str], num_workers: int = 1) -> None:
+        """Add many entire IndexedDatasets to the dataset, in order
+
+        This is equivalent to calling add_index for each prefix, except that the data (.bin) files
+        are copied concurrently, each into its own region of the data file.
+
+        Args:
+            path_prefixes (List[str]): The index (.idx) and data (.bin) prefixes
+
+            num_workers (int, optional): The number of threads with which to copy the data files. Defaults to 1.
+        """
+        # Concatenate indices and assign each data file its region
+        self.data_file.flush()
+        position = self.data_file.tell()
+        regions = []
+        for path_prefix in path_prefixes:
+            index = _IndexReader(get_idx_path(path_prefix), multimodal=self.multimodal)
+            assert index.dtype == self.dtype
+
+            offset = len(self.sequence_lengths)
+            self.sequence_lengths.extend(index.sequence_lengths)
+            self.document_indices.extend((offset + index.document_indices)[1:])
+
+            if self.multimodal:
+                self.sequence_modes.extend(index.sequence_modes)
+
+            bin_path = get_bin_path(path_prefix)
+            regions.append((bin_path, position))
+            position += os.path.getsize(bin_path)
+
+        # Concatenate data
+        self.data_file.truncate(position)
+
+        def copy_to_region(region: Tuple[str, int]) -> None:
+            bin_path, offset = region
+            with open(bin_path, "rb") as src, open(self.data_file.name, "r+b") as dst:
+                dst.seek(offset)
+                shutil.copyfileobj(src, dst)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(copy_to_region, regions))
+
+        self.data_file.seek(position)
+
     def finalize(self, idx_path: str) -> None:
         """Clean up and write the index (.idx) file
 
@@ -13,7 +13,7 @@ import torch
 from megatron.core.datasets.blended_megatron_dataset_config import BlendedMegatronDatasetConfig
 from megatron.core.datasets.indexed_dataset import IndexedDataset
 from megatron.core.datasets.megatron_dataset import MegatronDataset
-from megatron.core.datasets.utils import Split
+from megatron.core.datasets.utils import Split, atomic_open
 from megatron.core.utils import log_single_rank
 
 logger = logging.getLogger(__name__)
@@ -169,7 +169,7 @@ class MaskedWordPieceDataset(MegatronDataset):
         else:
             num_epochs = 1
 
-        if not cache_hit and torch.distributed.get_rank() == 0:
+        if not cache_hit and self.is_index_builder_rank():
             log_single_rank(
                 logger,
                 logging.INFO,
@@ -179,10 +179,6 @@ class MaskedWordPieceDataset(MegatronDataset):
 
             os.makedirs(path_to_cache, exist_ok=True)
 
-            # Write the description
-            with open(path_to_description, "wt") as writer:
-                writer.write(self.unique_description)
-
             # Build the sample index
             log_single_rank(
                 logger,
@@ -206,7 +202,12 @@ class MaskedWordPieceDataset(MegatronDataset):
                 False,
                 min_sentences_per_sample,
             )
-            numpy.save(path_to_sample_index, sample_index, allow_pickle=True)
+            with atomic_open(path_to_sample_index) as writer:
+                numpy.save(writer, sample_index, allow_pickle=True)
+
+            # Write the description last, as its presence marks the cache complete
+            with atomic_open(path_to_description, "wt") as writer:
+                writer.write(self.unique_description)
             t_end = time.time()
             log_single_rank(logger, logging.DEBUG, f"\t> time elapsed: {t_end - t_beg:4f} seconds")
 
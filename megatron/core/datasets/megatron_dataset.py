@@ -11,7 +11,7 @@ import torch
 
 from megatron.core.datasets.blended_megatron_dataset_config import BlendedMegatronDatasetConfig
 from megatron.core.datasets.indexed_dataset import IndexedDataset
-from megatron.core.datasets.utils import Split
+from megatron.core.datasets.utils import Split, get_index_builder_rank
 
 LowLevelDataset = Union[IndexedDataset, Iterable]
 
@@ -49,14 +49,9 @@ class MegatronDataset(ABC, torch.utils.data.Dataset):
         self.index_split = index_split
         self.config = config
 
-        self.unique_identifiers = OrderedDict()
-
-        self.unique_identifiers["class"] = type(self).__name__
-        self.unique_identifiers["dataset_path"] = self.dataset_path
-        self.unique_identifiers["num_samples"] = self.num_samples
-        self.unique_identifiers["index_split"] = self.index_split.name
-        for attr in self._key_config_attributes():
-            self.unique_identifiers[attr] = getattr(self.config, attr)
+        self.unique_identifiers = self.build_unique_identifiers(
+            dataset_path, num_samples, index_split, config
+        )
 
         self.unique_description = json.dumps(
             self.unique_identifiers, indent=4, default=lambda obj: obj.unique_identifiers
@@ -67,6 +62,83 @@ class MegatronDataset(ABC, torch.utils.data.Dataset):
 
         self.built_anew_on_cache_miss = False
 
+    @classmethod
+    def build_unique_identifiers(
+        cls,
+        dataset_path: Optional[str],
+        num_samples: Optional[int],
+        index_split: Split,
+        config: BlendedMegatronDatasetConfig,
+    ) -> OrderedDict:
+        """Build the identifiers which uniquely describe a dataset instance
+
+        The identifiers depend on the constructor arguments only, so that the unique description
+        and its hash are known before the dataset is built.
+
+        Args:
+            dataset_path (Optional[str]): The real path on disk to the dataset
+
+            num_samples (Optional[int]): The minimum number of samples to build from the indexed dataset
+
+            index_split (Split): The indices Split
+
+            config (BlendedMegatronDatasetConfig): The config
+
+        Returns:
+            OrderedDict: The unique identifiers
+        """
+        unique_identifiers = OrderedDict()
+
+        unique_identifiers["class"] = cls.__name__
+        unique_identifiers["dataset_path"] = dataset_path
+        unique_identifiers["num_samples"] = num_samples
+        unique_identifiers["index_split"] = index_split.name
+        for attr in cls._key_config_attributes():
+            unique_identifiers[attr] = getattr(config, attr)
+
+        return unique_identifiers
+
+    @classmethod
+    def build_unique_description_hash(
+        cls,
+        dataset_path: Optional[str],
+        num_samples: Optional[int],
+        index_split: Split,
+        config: BlendedMegatronDatasetConfig,
+    ) -> str:
+        """Build the MD5 hash of the unique description without building the dataset
+
+        Args:
+            dataset_path (Optional[str]): The real path on disk to the dataset
+
+            num_samples (Optional[int]): The minimum number of samples to build from the indexed dataset
+
+            index_split (Split): The indices Split
+
+            config (BlendedMegatronDatasetConfig): The config
+
+        Returns:
+            str: The hash, equal to the unique_description_hash attribute of the dataset
+        """
+        unique_description = json.dumps(
+            cls.build_unique_identifiers(dataset_path, num_samples, index_split, config),
+            indent=4,
+            default=lambda obj: obj.unique_identifiers,
+        )
+        return hashlib.md5(unique_description.encode("utf-8")).hexdigest()
+
+    def is_index_builder_rank(self) -> bool:
+        """Return whether the current rank builds and caches the indices on a cache miss
+
+        Returns:
+            bool: True if the current rank is the builder rank or torch.distributed is not initialized
+        """
+        if not torch.distributed.is_initialized():
+            return True
+        return torch.distributed.get_rank() == get_index_builder_rank(
+            self.unique_description_hash, self.config.distribute_dataset_builds
+        )
+
     @staticmethod
     def numel_low_level_dataset(low_level_dataset: LowLevelDataset) -> int:
         """Return the number of elements in the underlying low level dataset for the purpose of
@@ -1,8 +1,16 @@
 # Copyright (c) 2022, NVIDIA CORPORATION. All rights reserved.
 
+import atexit
+import fcntl
+import glob
+import hashlib
+import io
 import logging
+import os
+import shutil
+from contextlib import contextmanager
 from enum import Enum
-from typing import List, Optional, Tuple
+from typing import IO, Dict, Iterator, List, Optional, Tuple
 
 import numpy
 import torch
@@ -11,6 +19,24 @@ from ..utils import log_single_rank
 
 logger = logging.getLogger(__name__)
 
+# The environment variable setting the directory of the shared memory files, e.g. a tmpfs mount
+SHARED_MEMORY_DIR_ENV_VAR = "MEGATRON_SHARED_MEMORY_DIR"
+
+# The environment variables identifying the job of a process, in order of precedence
+SHARED_MEMORY_JOB_ID_ENV_VARS = (
+    "MEGATRON_SHARED_MEMORY_JOB_ID",
+    "SLURM_JOB_ID",
+    "TORCHELASTIC_RUN_ID",
+)
+
+_SHARED_MEMORY_JOB_DIR_PREFIX = "megatron_shm_"
+
+# The shared memory mappings of this process, kept open for the process lifetime
+_SHARED_MEMORY: Dict[str, numpy.memmap] = {}
+
+# The job directory of this process, the descriptor of its lock file, and the attaching process id
+_SHARED_MEMORY_JOB: Optional[Tuple[str, int, int]] = None
+
 
 class Split(Enum):
     train = 0
@@ -32,6 +58,253 @@ def compile_helpers():
         sys.exit(1)
 
 
+def get_local_rank() -> int:
+    """Get the rank of the current process among the processes on its node
+
+    Prefer the LOCAL_RANK environment variable set by the launcher, and otherwise assume one
+    process per device.
+
+    Returns:
+        int: The local rank, 0 when torch.distributed is not initialized
+    """
+    if not torch.distributed.is_initialized():
+        return 0
+    if "LOCAL_RANK" in os.environ:
+        return int(os.environ["LOCAL_RANK"])
+    rank = torch.distributed.get_rank()
+    num_devices = torch.cuda.device_count()
+    return rank % num_devices if num_devices > 0 else rank
+
+
+def get_index_builder_rank(unique_description_hash: str, distribute: bool) -> int:
+    """Get the rank which builds and caches the dataset indices on a cache miss
+
+    Args:
+        unique_description_hash (str): The unique description hash of the dataset
+
+        distribute (bool): Whether to spread the dataset index builds across all ranks
+
+    Returns:
+        int: The rank chosen by the hash when distributing, otherwise rank 0
+    """
+    if not distribute or not torch.distributed.is_initialized():
+        return 0
+    return int(unique_description_hash, 16) % torch.distributed.get_world_size()
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = "wb") -> Iterator[IO]:
+    """Open a temporary file for writing which replaces the file at the path when closed
+
+    Readers of the path see either nothing, the previous file, or the complete new file, never a
+    partial write, even when several processes write the same path concurrently.
+
+    Args:
+        path (str): The path
+
+        mode (str): The mode in which to open the temporary file. Defaults to "wb".
+
+    Yields:
+        IO: The temporary file
+    """
+    path_to_temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(path_to_temporary, mode) as writer:
+            yield writer
+        os.replace(path_to_temporary, path)
+    finally:
+        if os.path.exists(path_to_temporary):
+            os.remove(path_to_temporary)
+
+
+def validate_cache_description(path_to_description: str, description: str) -> None:
+    """Validate a cached description against the expected description on one rank per node
+
+    The cached resources are identified by the hash of their description. Verifying the full
+    description guards against hash collisions and incomplete writes. It suffices for the first
+    rank on each node to do so, sparing the file system a read per rank.
+
+    Args:
+        path_to_description (str): The path to the cached description
+
+        description (str): The expected description
+
+    Raises:
+        RuntimeError: When the cached description does not match the expected description
+    """
+    if get_local_rank() != 0:
+        return
+    with open(path_to_description, "rt") as reader:
+        cached_description = reader.read()
+    if cached_description != description:
+        raise RuntimeError(
+            f"The cached description at {path_to_description} does not match the expected "
+            f"description. Remove the cached files sharing its prefix and retry."
+        )
+
+
+def _get_shared_memory_job_id() -> str:
+    """Get the identifier of the job of this process, equal for all its ranks on a node
+
+    Taken from the first set environment variable of SHARED_MEMORY_JOB_ID_ENV_VARS, then from the
+    address of the rendezvous, and otherwise the process id. The result is exported as the first of
+    SHARED_MEMORY_JOB_ID_ENV_VARS, such that spawned dataloader workers share it.
+
+    Returns:
+        str: The job identifier
+    """
+    for env_var in SHARED_MEMORY_JOB_ID_ENV_VARS:
+        if os.environ.get(env_var) not in (None, "", "none"):
+            job_id = os.environ[env_var]
+            break
+    else:
+        if "MASTER_ADDR" in os.environ and "MASTER_PORT" in os.environ:
+            job_id = f"{os.environ['MASTER_ADDR']}:{os.environ['MASTER_PORT']}"
+        else:
+            job_id = str(os.getpid())
+    os.environ.setdefault(SHARED_MEMORY_JOB_ID_ENV_VARS[0], job_id)
+    return job_id
+
+
+def _remove_stale_shared_memory(shared_memory_dir: str, job_dir: str) -> None:
+    """Remove the job directories to which no process remains attached
+
+    These are left behind by jobs which crashed or whose last process exited without running its
+    exit handlers.
+
+    Args:
+        shared_memory_dir (str): The directory holding the job directories
+
+        job_dir (str): The job directory of this process, which is kept
+    """
+    for path in glob.glob(os.path.join(shared_memory_dir, f"{_SHARED_MEMORY_JOB_DIR_PREFIX}*")):
+        if path == job_dir:
+            continue
+        try:
+            fd = os.open(os.path.join(path, ".lock"), os.O_RDONLY)
+        except OSError:
+            # The directory is being created or removed
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            log_single_rank(logger, logging.INFO, f"Remove stale shared memory {path}")
+            shutil.rmtree(path, ignore_errors=True)
+        except BlockingIOError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def _remove_shared_memory_job_dir() -> None:
+    """Remove the job directory at exit when no other process remains attached to it"""
+    job_dir, fd, pid = _SHARED_MEMORY_JOB
+    # Forked processes share the lock of their parent, which owns the removal
+    if pid != os.getpid():
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return
+    shutil.rmtree(job_dir, ignore_errors=True)
+    os.close(fd)
+
+
+def get_shared_memory_job_dir() -> str:
+    """Get the directory holding the shared memory files of this job, attaching to it once
+
+    The directory is created under the MEGATRON_SHARED_MEMORY_DIR environment variable, by default
+    /dev/shm, and named for the job, see _get_shared_memory_job_id. Every attached process holds a
+    shared lock on its lock file. At exit, the process which attached removes the directory if no
+    other process holds the lock. On attaching, the directories of other jobs whose locks are free
+    are removed, such that a crashed job leaks its files only until the next job starts on the node.
+
+    Returns:
+        str: The job directory
+    """
+    global _SHARED_MEMORY_JOB
+
+    if _SHARED_MEMORY_JOB is not None:
+        return _SHARED_MEMORY_JOB[0]
+
+    shared_memory_dir = os.environ.get(SHARED_MEMORY_DIR_ENV_VAR, "/dev/shm")
+    job_hash = hashlib.md5(_get_shared_memory_job_id().encode("utf-8")).hexdigest()[:16]
+    job_dir = os.path.join(shared_memory_dir, f"{_SHARED_MEMORY_JOB_DIR_PREFIX}{job_hash}")
+    _remove_stale_shared_memory(shared_memory_dir, job_dir)
+
+    path_to_lock = os.path.join(job_dir, ".lock")
+    while True:
+        os.makedirs(job_dir, exist_ok=True)
+        fd = os.open(path_to_lock, os.O_RDONLY | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        # Retry should another job have removed the directory before the lock was taken
+        try:
+            if os.stat(path_to_lock).st_ino == os.fstat(fd).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+    _SHARED_MEMORY_JOB = (job_dir, fd, os.getpid())
+    atexit.register(_remove_shared_memory_job_dir)
+    return job_dir
+
+
+def get_shared_memory_buffer(path: str) -> memoryview:
+    """Get the contents of a file from a shared memory file created once per node and job
+
+    The shared memory file is named for the path, size, and modification time of the file and
+    created in get_shared_memory_job_dir. The first process on the node to request the file copies
+    it, under an exclusive lock on which the other processes wait. Every process, on any rank or
+    dataloader worker, then maps the shared memory file read-only, without copying.
+
+    Args:
+        path (str): The path to the file
+
+    Returns:
+        memoryview: The read-only file contents
+    """
+    stat = os.stat(path)
+    key = f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    name = hashlib.md5(key.encode("utf-8")).hexdigest()
+
+    if name not in _SHARED_MEMORY:
+        path_to_shared_memory = os.path.join(get_shared_memory_job_dir(), name)
+        with open(f"{path_to_shared_memory}.lock", "wb") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            if not os.path.exists(path_to_shared_memory):
+                log_single_rank(
+                    logger, logging.DEBUG, f"Copy {path} to shared memory {path_to_shared_memory}"
+                )
+                with open(path, "rb") as reader, atomic_open(path_to_shared_memory) as writer:
+                    shutil.copyfileobj(reader, writer)
+        _SHARED_MEMORY[name] = numpy.memmap(path_to_shared_memory, dtype=numpy.uint8, mode="r")
+
+    return memoryview(_SHARED_MEMORY[name]).toreadonly()
+
+
+def load_shared_memory_array(path: str) -> numpy.ndarray:
+    """Load a NumPy array (.npy) file through get_shared_memory_buffer
+
+    Args:
+        path (str): The path to the array file
+
+    Returns:
+        numpy.ndarray: The read-only array, a view into the shared memory segment
+    """
+    buffer = get_shared_memory_buffer(path)
+    header = io.BytesIO(buffer[:4096])
+    version = numpy.lib.format.read_magic(header)
+    if version == (1, 0):
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(header)
+    assert not dtype.hasobject, f"cannot load an object array into shared memory: {path}"
+    array = numpy.frombuffer(
+        buffer, dtype=dtype, count=int(numpy.prod(shape)), offset=header.tell()
+    )
+    return array.reshape(shape, order="F" if fortran_order else "C")
+
+
 def normalize(weights: List[float]) -> List[float]:
     """Do non-exponentiated normalization
 
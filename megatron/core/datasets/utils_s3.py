@@ -1,9 +1,11 @@
 # Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
 import os
-from typing import Any, Dict, NamedTuple, Protocol, Tuple
+from typing import Any, Dict, NamedTuple, Optional, Protocol, Tuple
 
 import torch
 
+from megatron.core.datasets.utils import get_local_rank
+
 try:
     import boto3
     import botocore.exceptions as exceptions
@@ -24,12 +26,20 @@ class S3Config(NamedTuple):
         path_to_idx_cache (str): The local directory where we will store the index (.idx) file
 
         bin_chunk_nbytes (int): If the number of bytes is too small, then we send a request to S3 at each call of the `read` method in _S3BinReader, which is slow, because each request has a fixed cost independent of the size of the byte range requested. If the number of bytes is too large, then we only rarely have to send requests to S3, but it takes a lot of time to complete the request when we do, which can block training. We've found that 256 * 1024 * 1024 (i.e., 256 MiB) has worked well (though we have not put that much effort into tuning it), so we default to it.
+
+        bin_cache_nbytes (Optional[int]): The maximum number of bytes of the data (.bin) file which _S3BinReader keeps in its in-memory LRU cache of `bin_chunk_nbytes` blocks. The least recently used blocks are evicted first. When None, the cache holds a single block.
+
+        bin_prefetch_threads (int): The number of background threads which _S3BinReader uses to download blocks ahead of time when asked to prefetch byte ranges. When 0, prefetch requests are ignored and every cache miss is served by a synchronous request.
     """
 
     path_to_idx_cache: str
 
     bin_chunk_nbytes: int = 256 * 1024 * 1024
 
+    bin_cache_nbytes: Optional[int] = None
+
+    bin_prefetch_threads: int = 0
+
 
 class S3Client(Protocol):
     """The protocol which all s3 clients should abide by"""
@@ -131,10 +141,9 @@ def maybe_download_file(s3_path: str, local_path: str) -> None:
 
     if torch.distributed.is_initialized():
         rank = torch.distributed.get_rank()
-        local_rank = rank % torch.cuda.device_count()
     else:
         rank = 0
-        local_rank = 0
+    local_rank = get_local_rank()
 
     s3_client = boto3.client("s3")
 
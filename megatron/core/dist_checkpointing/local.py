@@ -0,0 +1,333 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+
+""" Node-local checkpoints replicated to a buddy rank.
+
+A local checkpoint stores the state of each rank separately, in the layout of the
+sharded state dict of that rank, instead of resharding it into a global checkpoint.
+Saving and loading is therefore only possible with an unchanged parallel configuration,
+but requires no access to a shared filesystem. The state of each rank is written to a
+node-local directory (e.g. on an SSD or in /dev/shm to keep it in host RAM) and replicated
+over torch.distributed to a buddy rank on another node, such that the checkpoint survives
+the loss of any single node.
+"""
+
+import io
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import torch
+
+from .dict_utils import dict_list_map_inplace, extract_matching_values, merge, nested_values
+from .mapping import (
+    CheckpointingException,
+    ShardedObject,
+    ShardedStateDict,
+    ShardedTensor,
+    ShardedTensorFactory,
+    StateDict,
+    apply_factories,
+    apply_factory_merges,
+)
+from .utils import extract_nonpersistent, extract_sharded_base
+
+logger = logging.getLogger(__name__)
+
+LocalShardKey = Union[str, Tuple[str, Tuple[int, ...], Optional[Tuple[int, int]]]]
+
+
+def _get_local_shard_key(sh_base: Union[ShardedTensor, ShardedObject]) -> LocalShardKey:
+    """Identify a shard of a given rank, independently of its position in the state dict."""
+    if isinstance(sh_base, ShardedObject):
+        return sh_base.unique_key
+    flattened_range = sh_base.flattened_range
+    if flattened_range is not None:
+        flattened_range = (flattened_range.start, flattened_range.stop)
+    return sh_base.key, tuple(sh_base.global_offset), flattened_range
+
+
+def get_local_state_dict(sharded_state_dict: ShardedStateDict) -> StateDict:
+    """Convert a sharded state dict to the state dict stored in a local checkpoint.
+
+    Follows the same steps as `dist_checkpointing.save`: factories are applied,
+    LocalNonpersistentObjects are discarded and all ShardedBase objects are extracted.
+    The shards are stored (regardless of their replica_id) on CPU by their local shard key,
+    all other objects as the common state dict.
+
+    Args:
+        sharded_state_dict (ShardedStateDict): sharded state dict of this rank. Modified in-place.
+
+    Returns:
+        StateDict: a state dict with the 'common' and the 'shards' keys
+    """
+    apply_factories(sharded_state_dict)
+    _, sharded_state_dict = extract_nonpersistent(sharded_state_dict)
+    sharded_state_dict, common_state_dict = extract_sharded_base(sharded_state_dict)
+
+    shards = {}
+    for sh_base in nested_values(sharded_state_dict):
+        data = sh_base.data
+        if isinstance(data, torch.Tensor):
+            data = data.detach().to('cpu', copy=True)
+        shards[_get_local_shard_key(sh_base)] = data
+    return {'common': common_state_dict, 'shards': shards}
+
+
+def load_local_state_dict(
+    sharded_state_dict: ShardedStateDict, local_state_dict: StateDict
+) -> StateDict:
+    """Load a sharded state dict from the state dict stored in a local checkpoint.
+
+    The counterpart of `get_local_state_dict`, returning the same state dict as
+    `dist_checkpointing.load` would for the same sharded state dict.
+
+    Args:
+        sharded_state_dict (ShardedStateDict): sharded state dict of this rank, with the same
+            sharding as the sharded state dict the local checkpoint was created from
+        local_state_dict (StateDict): the state dict returned by `get_local_state_dict`
+
+    Returns:
+        StateDict: the loaded state dict
+    """
+    # Copy the structure of the common state dict as it is merged with the loaded objects below
+    common_state_dict, _ = extract_matching_values(local_state_dict['common'], lambda x: True)
+    if not sharded_state_dict:
+        return common_state_dict
+
+    sharded_state_dict, _ = extract_matching_values(sharded_state_dict, lambda x: True)
+    sh_ten_factories, _ = extract_matching_values(
+        sharded_state_dict,
+        lambda x: isinstance(x, ShardedTensorFactory),
+        return_lists_as_dicts=True,
+    )
+    apply_factories(sharded_state_dict)
+    dict_list_map_inplace(ShardedTensorFactory.without_data, sh_ten_factories)
+
+    nonpersistent_state_dict, sharded_state_dict = extract_nonpersistent(sharded_state_dict)
+    dict_list_map_inplace(lambda o: o.unwrap(), nonpersistent_state_dict)
+    merge(common_state_dict, nonpersistent_state_dict)
+
+    sharded_state_dict, _ = extract_sharded_base(sharded_state_dict)
+    shards = local_state_dict['shards']
+
+    def load_shard(sh_base):
+        shard_key = _get_local_shard_key(sh_base)
+        if shard_key not in shards:
+            raise CheckpointingException(
+                f'Shard {shard_key} not found in the local checkpoint. Local checkpoints can only be'
+                f' loaded with the parallel configuration they were saved with.'
+            )
+        data = shards[shard_key]
+        if isinstance(sh_base, ShardedTensor) and sh_base.data is not None:
+            data = data.to(sh_base.data.device)
+        return data
+
+    dict_list_map_inplace(load_shard, sharded_state_dict)
+    loaded_state_dict = apply_factory_merges(sharded_state_dict, sh_ten_factories)
+    merge(common_state_dict, loaded_state_dict)
+    return common_state_dict
+
+
+class LocalCheckpointManager:
+    """Saves and loads local checkpoints in a node-local directory.
+
+    The state of rank `r` is written to `<root_dir>/iter_<iteration>/rank_<r>.pt` and sent to
+    the buddy rank `(r + ranks_per_node) % world_size`, which writes it to its own `root_dir`.
+    With the ranks of a node numbered consecutively, the buddy is on the next node. Only the
+    latest iteration is kept.
+
+    On load, the ranks agree on the latest iteration for which a copy of the state of every
+    rank survived on some node, and the ranks which lost their own copy receive it from the
+    holder of a replica.
+
+    Args:
+        root_dir (str): node-local directory for the checkpoints. A directory in /dev/shm keeps
+            the checkpoints in host RAM.
+        ranks_per_node (int): number of ranks per node. If the job spans a single node,
+            the checkpoints are not replicated.
+        group (ProcessGroup, optional): a process group over all ranks which supports
+            point-to-point communication of CPU tensors, e.g. a gloo group. Defaults to None
+            (the default process group).
+    """
+
+    def __init__(
+        self,
+        root_dir: str,
+        ranks_per_node: int,
+        group: Optional[torch.distributed.ProcessGroup] = None,
+    ):
+        assert ranks_per_node > 0, ranks_per_node
+        self.root_dir = Path(root_dir)
+        self.group = group
+        self.rank = torch.distributed.get_rank()
+        self.world_size = torch.distributed.get_world_size()
+        # The rank holding the replica of the state of this rank
+        self.replica_rank = (self.rank + ranks_per_node) % self.world_size
+        # The rank whose state is replicated to this rank
+        self.source_rank = (self.rank - ranks_per_node) % self.world_size
+
+        self._holders: Optional[Tuple[int, List[int]]] = None
+        self._loaded: Optional[Tuple[int, StateDict]] = None
+
+    def get_checkpoint_path(self, iteration: int, rank: int) -> Path:
+        """Get the path to the local checkpoint of a rank at an iteration.
+
+        Args:
+            iteration (int): iteration of the checkpoint
+            rank (int): rank whose state is stored in the checkpoint
+
+        Returns:
+            Path: the path, relative to the root directory of this rank
+        """
+        return self.root_dir / f'iter_{iteration:07d}' / f'rank_{rank:05d}.pt'
+
+    def save(self, local_state_dict: StateDict, iteration: int) -> None:
+        """Save and replicate the local checkpoint of this rank.
+
+        Must be called by all ranks. The checkpoints of older iterations are removed once
+        all ranks stored the checkpoint of this iteration.
+
+        Args:
+            local_state_dict (StateDict): the state dict returned by `get_local_state_dict`
+            iteration (int): the iteration of the checkpoint
+        """
+        buffer = io.BytesIO()
+        torch.save(local_state_dict, buffer)
+        payload = buffer.getbuffer()
+        self._write(iteration, self.rank, payload)
+
+        if self.replica_rank != self.rank:
+            (replica_payload,) = self._exchange(
+                sends=[(self.replica_rank, payload)], recvs=[self.source_rank]
+            )
+            self._write(iteration, self.source_rank, replica_payload)
+
+        torch.distributed.barrier(group=self.group)
+        self._remove_older_than(iteration)
+        self._holders = None
+        self._loaded = None
+
+    def find_latest(self) -> int:
+        """Find the latest iteration recoverable from the local checkpoints of all ranks.
+
+        Must be called by all ranks.
+
+        Returns:
+            int: the iteration, or -1 if no local checkpoint can be recovered
+        """
+        available = {}
+        if self.root_dir.is_dir():
+            for iter_dir in self.root_dir.glob('iter_*'):
+                ranks = [int(path.stem[len('rank_') :]) for path in iter_dir.glob('rank_*.pt')]
+                available[int(iter_dir.name[len('iter_') :])] = ranks
+        all_available = [None] * self.world_size
+        torch.distributed.all_gather_object(all_available, available, group=self.group)
+
+        iterations = sorted(set().union(*all_available), reverse=True)
+        for iteration in iterations:
+            holders = []
+            for rank in range(self.world_size):
+                rank_holders = [
+                    holder
+                    for holder, holder_available in enumerate(all_available)
+                    if rank in holder_available.get(iteration, [])
+                ]
+                if not rank_holders:
+                    break
+                holders.append(rank if rank in rank_holders else rank_holders[0])
+            else:
+                self._holders = (iteration, holders)
+                return iteration
+        self._holders = (-1, [])
+        return -1
+
+    def load(self) -> Tuple[int, StateDict]:
+        """Load the local checkpoint of this rank found by `find_latest`.
+
+        Must be called by all ranks. The ranks which lost their own copy receive it from a holder
+        of a replica. The loaded checkpoint is cached until the next save.
+
+        Returns:
+            Tuple[int, StateDict]: the iteration and the state dict of this rank
+        """
+        if self._holders is None:
+            self.find_latest()
+        iteration, holders = self._holders
+        if iteration == -1:
+            raise CheckpointingException(f'No recoverable local checkpoint in {self.root_dir}')
+        if self._loaded is not None and self._loaded[0] == iteration:
+            return self._loaded
+
+        sends = [
+            (rank, self.get_checkpoint_path(iteration, rank).read_bytes())
+            for rank, holder in enumerate(holders)
+            if holder == self.rank and rank != self.rank
+        ]
+        recvs = [] if holders[self.rank] == self.rank else [holders[self.rank]]
+        received = self._exchange(sends, recvs)
+        if recvs:
+            logger.info(
+                f'Rank {self.rank} received its local checkpoint from rank {holders[self.rank]}'
+            )
+            payload = received[0]
+        else:
+            payload = self.get_checkpoint_path(iteration, self.rank).read_bytes()
+
+        local_state_dict = torch.load(io.BytesIO(payload), map_location='cpu', weights_only=False)
+        self._loaded = (iteration, local_state_dict)
+        return self._loaded
+
+    def _write(self, iteration: int, rank: int, payload: Any) -> None:
+        path = self.get_checkpoint_path(iteration, rank)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, such that only complete checkpoints are found
+        tmp_path = path.with_name(f'{path.name}.tmp{self.rank}')
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def _remove_older_than(self, iteration: int) -> None:
+        # The root directory may be shared by the ranks of a node, each removes its own files
+        for iter_dir in self.root_dir.glob('iter_*'):
+            if int(iter_dir.name[len('iter_') :]) >= iteration:
+                continue
+            for rank in (self.rank, self.source_rank):
+                self.get_checkpoint_path(int(iter_dir.name[len('iter_') :]), rank).unlink(
+                    missing_ok=True
+                )
+            try:
+                iter_dir.rmdir()
+            except OSError:
+                pass
+
+    def _exchange(self, sends: List[Tuple[int, Any]], recvs: List[int]) -> List[bytes]:
+        """Send and receive byte payloads with non-blocking point-to-point communication."""
+        send_tensors = [
+            torch.frombuffer(bytearray(payload), dtype=torch.uint8) for _, payload in sends
+        ]
+        send_sizes = [torch.tensor([t.numel()], dtype=torch.int64) for t in send_tensors]
+        recv_sizes = [torch.empty(1, dtype=torch.int64) for _ in recvs]
+        works = [
+            torch.distributed.isend(size, dst, group=self.group)
+            for size, (dst, _) in zip(send_sizes, sends)
+        ]
+        works += [
+            torch.distributed.irecv(size, src, group=self.group)
+            for size, src in zip(recv_sizes, recvs)
+        ]
+        for work in works:
+            work.wait()
+
+        recv_tensors = [torch.empty(int(size.item()), dtype=torch.uint8) for size in recv_sizes]
+        works = [
+            torch.distributed.isend(tensor, dst, group=self.group)
+            for tensor, (dst, _) in zip(send_tensors, sends)
+        ]
+        works += [
+            torch.distributed.irecv(tensor, src, group=self.group)
+            for tensor, src in zip(recv_tensors, recvs)
+        ]
+        for work in works:
+            work.wait()
+        return [tensor.numpy().tobytes() for tensor in recv_tensors]
@@ -35,6 +35,7 @@ from .strategies.base import (
     StrategyAction,
     get_default_strategy,
 )
+from .strategies.load_plan_cache import get_structure_key
 from .utils import extract_nonpersistent, extract_sharded_base
 from .validation import (
     StrictHandling,
@@ -134,6 +135,17 @@ def load(
         ckpt_sharded_metadata = load_sharded_metadata(
             str(checkpoint_dir), sharded_strategy, common_strategy
         )
+    validation_cache, validation_key = sharded_strategy.validation_cache, None
+    if (
+        validate_access_integrity
+        and validation_cache is not None
+        and not StrictHandling.requires_global_app_metadata(strict)
+    ):
+        # The same structure has already been validated on all ranks
+        validation_key = ('validation', get_structure_key(sharded_state_dict))
+        if validation_cache.get(validation_key) is not None:
+            validate_access_integrity = False
+            validation_key = None
     if validate_access_integrity or StrictHandling.requires_global_app_metadata(strict):
         local_metadata, global_metadata = determine_global_metadata(sharded_state_dict)
 
@@ -145,6 +157,8 @@ def load(
         global_metadata,
         ckpt_sharded_metadata,
     )
+    if validation_key is not None:
+        validation_cache.put(validation_key, True)
 
     # ShardedBase loading
     if not sharded_strategy.can_handle_sharded_objects:
@@ -100,6 +100,15 @@ class LoadCommonStrategy(LoadStrategyBase):
 class LoadShardedStrategy(LoadStrategyBase):
     """Load strategy for sharded tensors"""
 
+    @property
+    def validation_cache(self):
+        """Cache (LoadPlanCache) of the validated sharded state dict structures or None.
+
+        If not None, the sharding integrity validation is skipped for
+        the sharded state dicts already validated on all ranks.
+        """
+        return None
+
     @abstractmethod
     def load(self, sharded_state_dict: ShardedStateDict, checkpoint_dir: Path):
         raise NotImplementedError
@@ -0,0 +1,472 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+
+""" Compression and quantization of the tensors stored in the PyT Distributed format.
+
+An encoded tensor is stored as the raw tensor bytes, split into chunks which are byte-shuffled
+(grouping the n-th bytes of all elements, which makes floating point data more compressible)
+and compressed independently (and in parallel) with zstd, lz4 or zlib.
+Optionally, the tensors with keys matching a pattern (e.g. Adam moments) are quantized
+to int8 with a scale per block of elements before compression. The non-negative tensors
+(e.g. Adam second moments) are quantized as square roots to uint8, rounded up (see
+`quantize_sqrt_blockwise`). This is lossy, the maximum absolute error of each stored item
+is recorded in the metadata.
+
+The encoding parameters are stored in the checkpoint metadata, in the storage info of each
+encoded item (see `EncodedStorageInfo`). `DecodingFileSystemReader` decodes the items while
+loading, so the encoded checkpoints are loaded (and resharded) as any other checkpoint.
+"""
+
+import io
+import logging
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import torch
+from torch.distributed.checkpoint import FileSystemReader, Metadata
+from torch.distributed.checkpoint.filesystem import _StorageInfo
+from torch.distributed.checkpoint.planner import LoadPlan, LoadPlanner, WriteItem
+from torch.distributed.checkpoint.storage import WriteResult
+from torch.futures import Future
+
+from .integrity import ChecksummedStorageInfo, verify_item_checksum
+from .profiling import timed_phase
+
+try:
+    import zstandard
+
+    HAVE_ZSTD = True
+except ImportError:
+    HAVE_ZSTD = False
+
+try:
+    import lz4.frame
+
+    HAVE_LZ4 = True
+except ImportError:
+    HAVE_LZ4 = False
+
+logger = logging.getLogger(__name__)
+
+CODECS = ('zstd', 'lz4', 'zlib', 'none')
+
+# Matches the Adam moments in the optimizer state dict (see `make_sharded_optimizer_tensor`)
+ADAM_MOMENTS_PATTERN = r'^optimizer\.state\.exp_avg(_sq)?\.'
+# Matches the Adam second moments, which are non-negative
+ADAM_SECOND_MOMENTS_PATTERN = r'^optimizer\.state\.exp_avg_sq\.'
+
+
+@dataclass
+class CompressionConfig:
+    """Parameters of the checkpoint tensors encoding.
+
+    Args:
+        codec (str): lossless compression codec, one of `CODECS`. Defaults to 'zstd'.
+        level (int, optional): compression level, codec default if None.
+        shuffle (bool): apply byte-shuffle before compression. Defaults to True.
+        chunk_size (int): size (in bytes) of the independently compressed chunks.
+        num_threads (int): number of threads compressing (and decompressing) the chunks
+            of a single tensor.
+        min_size (int): tensors smaller than this (in bytes) are stored without encoding.
+        quantize_pattern (str, optional): tensors with keys matching this regex (e.g.
+            `ADAM_MOMENTS_PATTERN`) are quantized to int8 (lossy). Only floating point
+            tensors are quantized. Defaults to None (no quantization).
+        quantize_sqrt_pattern (str, optional): the quantized tensors with keys matching this
+            regex are non-negative and quantized as square roots (see `quantize_sqrt_blockwise`).
+            Defaults to `ADAM_SECOND_MOMENTS_PATTERN`.
+        quantize_block_size (int): number of elements sharing a single quantization scale.
+    """
+
+    codec: str = 'zstd'
+    level: Optional[int] = None
+    shuffle: bool = True
+    chunk_size: int = 4 * 1024 * 1024
+    num_threads: int = 4
+    min_size: int = 4096
+    quantize_pattern: Optional[str] = None
+    quantize_sqrt_pattern: Optional[str] = ADAM_SECOND_MOMENTS_PATTERN
+    quantize_block_size: int = 256
+
+    def __post_init__(self):
+        if self.codec not in CODECS:
+            raise ValueError(
+                f'Unknown checkpoint compression codec {self.codec} (use one of {CODECS})'
+            )
+        if self.codec == 'zstd' and not HAVE_ZSTD:
+            raise ImportError('zstd checkpoint compression requires the `zstandard` package')
+        if self.codec == 'lz4' and not HAVE_LZ4:
+            raise ImportError('lz4 checkpoint compression requires the `lz4` package')
+        assert self.chunk_size > 0 and self.quantize_block_size > 0
+
+    def should_quantize(self, key: str, dtype: torch.dtype) -> bool:
+        """Whether the tensor with a given key should be quantized."""
+        return (
+            self.quantize_pattern is not None
+            and dtype.is_floating_point
+            and re.search(self.quantize_pattern, key) is not None
+        )
+
+    def should_quantize_sqrt(self, key: str) -> bool:
+        """Whether the quantized tensor with a given key should be quantized as square roots."""
+        return self.quantize_sqrt_pattern is not None and (
+            re.search(self.quantize_sqrt_pattern, key) is not None
+        )
+
+
+@dataclass
+class EncodedStorageInfo(ChecksummedStorageInfo):
+    """Storage info of an encoded item.
+
+    `codec_info` holds all parameters needed to decode the item: the codec,
+    the shuffle flag, the original dtype and shape and, for quantized items,
+    the quantization block size and the maximum absolute error.
+    The checksum (if any) is computed over the encoded bytes.
+    """
+
+    codec_info: Optional[dict] = None
+
+
+def _compress(codec: str, level: Optional[int], data: memoryview) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    if codec == 'lz4':
+        return lz4.frame.compress(data, compression_level=0 if level is None else level)
+    if codec == 'zlib':
+        return zlib.compress(data, 6 if level is None else level)
+    return bytes(data)
+
+
+def _decompress(codec: str, data: memoryview, raw_size: int) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_size)
+    if codec == 'lz4':
+        return lz4.frame.decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    return bytes(data)
+
+
+def _numel(shape) -> int:
+    numel = 1
+    for size in shape:
+        numel *= size
+    return numel
+
+
+def _shuffle(data: np.ndarray, itemsize: int) -> np.ndarray:
+    """Groups the n-th bytes of all elements (`data` is a uint8 array of whole elements)."""
+    return np.ascontiguousarray(data.reshape(-1, itemsize).T).reshape(-1)
+
+
+def _unshuffle(data: np.ndarray, itemsize: int) -> np.ndarray:
+    return np.ascontiguousarray(data.reshape(itemsize, -1).T).reshape(-1)
+
+
+def _to_blocks(flat: torch.Tensor, block_size: int) -> torch.Tensor:
+    """Pads a flat tensor with zeros and reshapes it to blocks of `block_size` elements."""
+    num_blocks = -(-flat.numel() // block_size)
+    padded = torch.nn.functional.pad(flat, (0, num_blocks * block_size - flat.numel()))
+    return padded.reshape(num_blocks, block_size)
+
+
+def quantize_blockwise(tensor: torch.Tensor, block_size: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Symmetric int8 quantization with a float32 scale per block of `block_size` elements.
+
+    Args:
+        tensor (torch.Tensor): floating point tensor to quantize
+        block_size (int): number of (flattened) elements sharing a scale
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: flat int8 values and float32 scales
+    """
+    flat = tensor.detach().reshape(-1).float()
+    blocks = _to_blocks(flat, block_size)
+    scales = blocks.abs().amax(dim=1) / 127
+    inv_scales = torch.where(scales > 0, 1 / scales, torch.zeros_like(scales))
+    values = torch.round(blocks * inv_scales[:, None]).clamp_(-127, 127).to(torch.int8)
+    return values.reshape(-1)[: flat.numel()], scales
+
+
+def dequantize_blockwise(
+    values: torch.Tensor, scales: torch.Tensor, block_size: int, dtype: torch.dtype
+) -> torch.Tensor:
+    """Inverse of `quantize_blockwise`, returns a flat tensor of a given dtype."""
+    dequantized = _to_blocks(values.float(), block_size) * scales[:, None]
+    return dequantized.reshape(-1)[: values.numel()].to(dtype)
+
+
+def quantize_sqrt_blockwise(
+    tensor: torch.Tensor, block_size: int
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Quantization of the square roots of a non-negative tensor to uint8, rounded up,
+    with a float32 scale per block of `block_size` elements.
+
+    Meant for the Adam second moments `v`, which span many orders of magnitude within
+    a block. With `quantize_blockwise`, the small values of a block are rounded to zero
+    while the corresponding first moments are not, so the Adam update `m / (sqrt(v) + eps)`
+    of the loaded state explodes. Here the square root halves the dynamic range and
+    rounding up ensures that a non-zero value is never decoded as zero, nor `sqrt(v)`
+    as a smaller value, so the updates computed from the decoded state can only shrink.
+
+    Args:
+        tensor (torch.Tensor): non-negative floating point tensor to quantize
+        block_size (int): number of (flattened) elements sharing a scale
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: flat uint8 values and float32 scales
+    """
+    flat = tensor.detach().reshape(-1).float().clamp(min=0).sqrt()
+    blocks = _to_blocks(flat, block_size)
+    scales = blocks.amax(dim=1) / 255
+    inv_scales = torch.where(scales > 0, 1 / scales, torch.zeros_like(scales))
+    values = torch.ceil(blocks * inv_scales[:, None]).clamp_(0, 255).to(torch.uint8)
+    return values.reshape(-1)[: flat.numel()], scales
+
+
+def dequantize_sqrt_blockwise(
+    values: torch.Tensor, scales: torch.Tensor, block_size: int, dtype: torch.dtype
+) -> torch.Tensor:
+    """Inverse of `quantize_sqrt_blockwise`, returns a flat tensor of a given dtype."""
+    dequantized = (_to_blocks(values.float(), block_size) * scales[:, None]).square()
+    return dequantized.reshape(-1)[: values.numel()].to(dtype)
+
+
+def encode_tensor(
+    tensor: torch.Tensor, key: str, config: CompressionConfig, executor: ThreadPoolExecutor
+) -> Tuple[bytes, dict]:
+    """Encode a CPU tensor according to the compression config.
+
+    The encoded payload is a uint64 header with the number of chunks and their
+    compressed sizes, followed by the compressed chunks.
+
+    Args:
+        tensor (torch.Tensor): CPU tensor to encode
+        key (str): tensor key, used to decide about quantization
+        config (CompressionConfig): encoding parameters
+        executor (ThreadPoolExecutor): executor compressing the chunks in parallel
+
+    Returns:
+        Tuple[bytes, dict]: encoded payload and the codec info needed for decoding
+    """
+    codec_info = dict(
+        codec=config.codec,
+        level=config.level,
+        dtype=str(tensor.dtype).split('.')[-1],
+        shape=list(tensor.shape),
+    )
+    tensor = tensor.detach().contiguous()
+    if config.should_quantize(key, tensor.dtype):
+        if config.should_quantize_sqrt(key):
+            quantization = 'uint8_sqrt'
+            quantize_fn, dequantize_fn = quantize_sqrt_blockwise, dequantize_sqrt_blockwise
+        else:
+            quantization = 'int8'
+            quantize_fn, dequantize_fn = quantize_blockwise, dequantize_blockwise
+        values, scales = quantize_fn(tensor, config.quantize_block_size)
+        dequantized = dequantize_fn(values, scales, config.quantize_block_size, tensor.dtype)
+        max_abs_error = (dequantized.float() - tensor.reshape(-1).float()).abs().max().item()
+        codec_info.update(
+            quantization=quantization,
+            block_size=config.quantize_block_size,
+            max_abs_error=max_abs_error,
+        )
+        raw = np.concatenate(
+            [values.view(torch.uint8).numpy(), scales.reshape(-1).view(torch.uint8).numpy()]
+        )
+        itemsize = 1
+    else:
+        raw = tensor.reshape(-1).view(torch.uint8).numpy()
+        itemsize = tensor.element_size()
+    shuffle = config.shuffle and itemsize > 1
+    # Chunks contain whole elements, so that they can be shuffled independently
+    chunk_size = max(config.chunk_size // itemsize, 1) * itemsize
+    codec_info.update(shuffle=shuffle, itemsize=itemsize, raw_size=raw.size, chunk_size=chunk_size)
+
+    def _encode_chunk(offset):
+        chunk = raw[offset : offset + chunk_size]
+        if shuffle:
+            chunk = _shuffle(chunk, itemsize)
+        return _compress(config.codec, config.level, chunk.data)
+
+    chunks = list(executor.map(_encode_chunk, range(0, raw.size, chunk_size)))
+    header = np.array([len(chunks)] + [len(chunk) for chunk in chunks], dtype=np.uint64)
+    return b''.join([header.tobytes(), *chunks]), codec_info
+
+
+def decode_tensor(payload: bytes, codec_info: dict, executor: ThreadPoolExecutor) -> torch.Tensor:
+    """Decode a tensor encoded with `encode_tensor`.
+
+    Args:
+        payload (bytes): encoded payload
+        codec_info (dict): codec info returned by `encode_tensor`
+        executor (ThreadPoolExecutor): executor decompressing the chunks in parallel
+
+    Returns:
+        torch.Tensor: decoded CPU tensor
+    """
+    payload = memoryview(payload)
+    num_chunks = int(np.frombuffer(payload[:8], dtype=np.uint64)[0])
+    header_size = 8 * (num_chunks + 1)
+    chunk_sizes = np.frombuffer(payload[8:header_size], dtype=np.uint64).tolist()
+    chunk_offsets = np.cumsum([header_size] + chunk_sizes).tolist()
+
+    raw_size, chunk_size = codec_info['raw_size'], codec_info['chunk_size']
+    itemsize, shuffle = codec_info['itemsize'], codec_info['shuffle']
+    raw = np.empty(raw_size, dtype=np.uint8)
+
+    def _decode_chunk(chunk_idx):
+        chunk = payload[chunk_offsets[chunk_idx] : chunk_offsets[chunk_idx + 1]]
+        raw_offset = chunk_idx * chunk_size
+        raw_chunk_size = min(chunk_size, raw_size - raw_offset)
+        chunk = np.frombuffer(
+            _decompress(codec_info['codec'], chunk, raw_chunk_size), dtype=np.uint8
+        )
+        if shuffle:
+            chunk = _unshuffle(chunk, itemsize)
+        raw[raw_offset : raw_offset + raw_chunk_size] = chunk
+
+    list(executor.map(_decode_chunk, range(num_chunks)))
+
+    dtype = getattr(torch, codec_info['dtype'])
+    shape = codec_info['shape']
+    raw = torch.from_numpy(raw)
+    if codec_info.get('quantization') == 'int8':
+        numel = _numel(shape)
+        values = raw[:numel].view(torch.int8)
+        scales = raw[numel:].view(torch.float32)
+        return dequantize_blockwise(values, scales, codec_info['block_size'], dtype).reshape(shape)
+    if codec_info.get('quantization') == 'uint8_sqrt':
+        numel = _numel(shape)
+        values = raw[:numel]
+        scales = raw[numel:].view(torch.float32)
+        return dequantize_sqrt_blockwise(values, scales, codec_info['block_size'], dtype).reshape(
+            shape
+        )
+    return raw.view(dtype).reshape(shape)
+
+
+def write_encoded_item(
+    stream: io.IOBase,
+    tensor: torch.Tensor,
+    write_item: WriteItem,
+    storage_key: str,
+    config: CompressionConfig,
+    executor: ThreadPoolExecutor,
+) -> WriteResult:
+    """Encode and write a tensor write item, equivalent of PyT `_write_item`.
+
+    Args:
+        stream (io.IOBase): file to write to
+        tensor (torch.Tensor): CPU tensor to write
+        write_item (WriteItem): tensor write item
+        storage_key (str): name of the file
+        config (CompressionConfig): encoding parameters
+        executor (ThreadPoolExecutor): executor compressing the chunks in parallel
+
+    Returns:
+        WriteResult: write result with an `EncodedStorageInfo`
+    """
+    offset = stream.tell()
+    payload, codec_info = encode_tensor(tensor, write_item.index.fqn, config, executor)
+    stream.write(payload)
+    length = stream.tell() - offset
+    return WriteResult(
+        index=write_item.index,
+        size_in_bytes=length,
+        storage_data=EncodedStorageInfo(storage_key, offset, length, codec_info=codec_info),
+    )
+
+
+def should_encode(tensor: torch.Tensor, config: Optional[CompressionConfig]) -> bool:
+    """Whether a tensor should be encoded (it's not worth it for small tensors)."""
+    return config is not None and tensor.numel() * tensor.element_size() >= config.min_size
+
+
+class DecodingFileSystemReader(FileSystemReader):
+    """FileSystemReader which decodes the items encoded with `write_encoded_item`.
+
+    Items without the codec info are read as usual, so this reader can be used
+    for any checkpoint.
+
+    Args:
+        path (str, Path): checkpoint directory
+        num_threads (int): number of threads decompressing the chunks of a single item
+        metadata (Metadata, optional): already read checkpoint metadata.
+            If given, `read_metadata` returns it instead of reading the metadata file.
+        verify_checksums (bool): whether to check the items with a checksum in the metadata
+            (see the `integrity` module) before deserializing them. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        path,
+        num_threads: int = 4,
+        metadata: Optional[Metadata] = None,
+        verify_checksums: bool = False,
+    ):
+        super().__init__(path)
+        self.num_threads = num_threads
+        self.metadata = metadata
+        self.verify_checksums = verify_checksums
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def read_metadata(self) -> Metadata:
+        if self.metadata is not None:
+            return self.metadata
+        with timed_phase('metadata_read'):
+            return super().read_metadata()
+
+    def read_data(self, plan: LoadPlan, planner: LoadPlanner) -> Future[None]:
+        with timed_phase('read'):
+            return super().read_data(plan, planner)
+
+    def _slice_file(self, file, sinfo: _StorageInfo):
+        file_slice = super()._slice_file(file, sinfo)
+        codec_info = getattr(sinfo, 'codec_info', None)
+        verify = self.verify_checksums and getattr(sinfo, 'checksum', None) is not None
+        if codec_info is None and not verify:
+            return file_slice
+        payload = file_slice.read(sinfo.length)
+        if verify:
+            verify_item_checksum(payload, sinfo)
+        if codec_info is None:
+            return io.BytesIO(payload)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.num_threads)
+        tensor = decode_tensor(payload, codec_info, self._executor)
+        # The PyT reader expects a serialized tensor
+        buffer = io.BytesIO()
+        torch.save(tensor, buffer)
+        buffer.seek(0)
+        return buffer
+
+
+def get_encoding_summary(storage_data: Dict[object, _StorageInfo]) -> dict:
+    """Summarize the encoding of the checkpoint items.
+
+    Args:
+        storage_data (Dict[MetadataIndex, _StorageInfo]): storage data from the checkpoint metadata
+
+    Returns:
+        dict: the number of encoded and quantized items, the stored and raw bytes
+            of the encoded items and the maximum quantization error
+    """
+    summary = dict(
+        encoded_items=0, quantized_items=0, stored_bytes=0, raw_bytes=0, max_abs_error=0.0
+    )
+    for storage_info in storage_data.values():
+        codec_info = getattr(storage_info, 'codec_info', None)
+        if codec_info is None:
+            continue
+        summary['encoded_items'] += 1
+        summary['stored_bytes'] += storage_info.length
+        summary['raw_bytes'] += _numel(codec_info['shape']) * torch._utils._element_size(
+            getattr(torch, codec_info['dtype'])
+        )
+        if codec_info.get('quantization') is not None:
+            summary['quantized_items'] += 1
+            summary['max_abs_error'] = max(summary['max_abs_error'], codec_info['max_abs_error'])
+    return summary
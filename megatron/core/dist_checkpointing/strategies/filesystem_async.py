@@ -2,10 +2,14 @@
 
 """ Storage writer for PyT Distributed format allowing asynchronous save. """
 import gc
+import io
 import logging
 import os
 import queue
-from contextlib import contextmanager
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from itertools import chain
 from pathlib import Path
 from time import time
@@ -20,12 +24,29 @@ from torch.distributed.checkpoint.planner import SavePlan, SavePlanner, WriteIte
 from torch.distributed.checkpoint.storage import WriteResult
 from torch.futures import Future
 
+from .compression import CompressionConfig, should_encode, write_encoded_item
+from .incremental import BaseItems, get_base_items, get_digest
+from .integrity import write_item_with_checksum
+from .profiling import record_phase
+
 logger = logging.getLogger(__name__)
 
 WriteBucket = Tuple[Path, str, Tuple[list, list]]  # represents writes to a single file
 
 _results_queue = None
 
+DEFAULT_HOST_BUFFER_SIZE = 256 * 1024 * 1024
+# Seconds for the pipelined D2H copy to wait for the writer processes to return a host buffer
+DEFAULT_FREE_BUFFER_TIMEOUT = 600.0
+# Maximum number of host buffer pools kept for reuse. Overlapping saves beyond it use pools
+# which are freed when the save is finalized.
+MAX_CACHED_HOST_BUFFER_POOLS = 2
+
+# Host buffer pools reused across the pipelined saves
+_host_buffer_pools: List['HostBufferPool'] = []
+# Pipelined D2H copies which might still be reading the state dict tensors
+_active_d2h_copies: List['PipelinedD2HCopy'] = []
+
 
 def _get_write_results_queue():
     global _results_queue
@@ -48,6 +69,253 @@ def _disable_gc():
             gc.enable()
 
 
+class HostBufferPool:
+    """A bounded pool of reusable host buffers shared with the forked writer processes.
+
+    The buffers are allocated in shared memory (so that the writes of the training process
+    are visible to the writer processes forked before the copy) and pinned if CUDA is
+    available. The indices of the free buffers are passed around with `free_queue`,
+    along with the error message of a failed writer process (see `PipelinedD2HCopy.abort`).
+
+    Args:
+        num_buffers (int): number of buffers in the pool
+        buffer_size (int): size of each buffer in bytes
+    """
+
+    def __init__(self, num_buffers: int, buffer_size: int):
+        assert num_buffers > 0 and buffer_size > 0, (num_buffers, buffer_size)
+        self.num_buffers = num_buffers
+        self.buffer_size = buffer_size
+        self.buffers = [
+            torch.empty(buffer_size, dtype=torch.uint8).share_memory_() for _ in range(num_buffers)
+        ]
+        self.pinned = torch.cuda.is_available()
+        if self.pinned:
+            cudart = torch.cuda.cudart()
+            for buffer in self.buffers:
+                torch.cuda.check_error(cudart.cudaHostRegister(buffer.data_ptr(), buffer_size, 0))
+        self.in_use = False
+        self.free_queue: Optional[mp.Queue] = None
+
+    def acquire(self) -> None:
+        """Marks the pool as used by a save, with all buffers free."""
+        assert not self.in_use
+        self.in_use = True
+        self.free_queue = mp.get_context('fork').Queue()
+        for buffer_idx in range(self.num_buffers):
+            self.free_queue.put(buffer_idx)
+
+    def release(self) -> None:
+        """Returns the pool after the save is finalized, freeing it if it is not kept for reuse."""
+        self.in_use = False
+        self.free_queue = None
+        if self not in _host_buffer_pools:
+            self.free()
+
+    def free(self) -> None:
+        """Unpins and drops the buffers."""
+        assert not self.in_use
+        if self.pinned:
+            cudart = torch.cuda.cudart()
+            for buffer in self.buffers:
+                torch.cuda.check_error(cudart.cudaHostUnregister(buffer.data_ptr()))
+            self.pinned = False
+        self.buffers = []
+
+
+def _get_host_buffer_pool(num_buffers: int, buffer_size: int) -> HostBufferPool:
+    """Get a free pool of host buffers with the given shape, allocating it if needed.
+
+    At most `MAX_CACHED_HOST_BUFFER_POOLS` pools are kept for reuse. The idle pools of
+    other shapes are freed when a new pool is allocated.
+    """
+    for pool in _host_buffer_pools:
+        if not pool.in_use and (pool.num_buffers, pool.buffer_size) == (num_buffers, buffer_size):
+            break
+    else:
+        for pool in [pool for pool in _host_buffer_pools if not pool.in_use]:
+            _host_buffer_pools.remove(pool)
+            pool.free()
+        pool = HostBufferPool(num_buffers, buffer_size)
+        if len(_host_buffer_pools) < MAX_CACHED_HOST_BUFFER_POOLS:
+            _host_buffer_pools.append(pool)
+    pool.acquire()
+    return pool
+
+
+class PipelinedD2HCopy:
+    """Copies the tensors to save into a pool of host buffers in a background thread.
+
+    The tensors are copied bucket by bucket, in the order of the items in each bucket.
+    Each buffer holds a tensor or a chunk of a tensor larger than the buffer size.
+    The buffer index is sent to the writer process of the bucket, which writes the data
+    and returns the buffer to the pool. This way the writers start writing bucket N while
+    bucket N+1 is still being copied, and the host memory used for the copies is bounded
+    by the pool size (plus a single tensor per writer for tensors larger than a buffer).
+
+    The copy thread reads the state dict tensors after the save call returns, so they must
+    not be modified before `wait` (see `wait_for_pipelined_d2h_copies`). The copy fails
+    if a writer process aborts it or no buffer is returned to the pool within `timeout`
+    (e.g. when a writer process died), see `retrieve_write_results`.
+
+    Args:
+        sources (List[List[torch.Tensor]]): tensors to copy for each write bucket
+        pool (HostBufferPool): acquired pool of host buffers
+        timeout (float): seconds to wait for a free buffer
+    """
+
+    def __init__(
+        self,
+        sources: List[List[torch.Tensor]],
+        pool: HostBufferPool,
+        timeout: float = DEFAULT_FREE_BUFFER_TIMEOUT,
+    ):
+        self.sources = sources
+        self.pool = pool
+        self.timeout = timeout
+        ctx = mp.get_context('fork')
+        self.data_queues = [ctx.Queue() for _ in sources]
+        self.thread: Optional[threading.Thread] = None
+        self.exception: Optional[Exception] = None
+
+        # Metrics
+        self.copied_bytes = 0
+        self.background_time = 0.0
+        self.wait_time = 0.0
+
+    def start(self) -> None:
+        """Starts the background copy (in the training process)."""
+        stream = None
+        if torch.cuda.is_available():
+            stream = torch.cuda.Stream()
+            # The copies must see the results of the computation scheduled so far
+            stream.wait_stream(torch.cuda.current_stream())
+        self.thread = threading.Thread(target=self._copy, args=(stream,), daemon=True)
+        self.thread.start()
+
+    def _copy(self, stream: Optional['torch.cuda.Stream']) -> None:
+        start = time()
+        try:
+            with torch.cuda.stream(stream) if stream is not None else nullcontext():
+                for data_queue, tensors in zip(self.data_queues, self.sources):
+                    for tensor in tensors:
+                        self._copy_tensor(tensor, data_queue, stream)
+        except Exception as e:
+            logger.error(f'Pipelined D2H copy failed: {e}')
+            self.exception = e
+            # Unblock the writers waiting for the data
+            for data_queue in self.data_queues:
+                data_queue.put((None, 0))
+        self.background_time = time() - start
+
+    def _copy_tensor(
+        self, tensor: torch.Tensor, data_queue: mp.Queue, stream: Optional['torch.cuda.Stream']
+    ) -> None:
+        flat_data = tensor.detach().contiguous().reshape(-1).view(torch.uint8)
+        for offset in range(0, flat_data.numel(), self.pool.buffer_size):
+            try:
+                buffer_idx = self.pool.free_queue.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(
+                    f'Pipelined D2H copy got no free host buffer within {self.timeout}s'
+                )
+            if isinstance(buffer_idx, str):
+                raise RuntimeError(f'Pipelined D2H copy aborted by a writer process: {buffer_idx}')
+            chunk = flat_data[offset : offset + self.pool.buffer_size]
+            self.pool.buffers[buffer_idx][: chunk.numel()].copy_(chunk, non_blocking=True)
+            if stream is not None:
+                stream.synchronize()
+            data_queue.put((buffer_idx, chunk.numel()))
+            self.copied_bytes += chunk.numel()
+
+    def wait(self) -> None:
+        """Waits for the copy to finish (in the training process).
+
+        After this call the state dict tensors can be safely modified.
+        A copy failure is stored in `self.exception` and raised by `retrieve_write_results`.
+        """
+        if self.thread is not None:
+            start = time()
+            self.thread.join()
+            self.thread = None
+            self.wait_time += time() - start
+            # Don't hold the references to the state dict tensors
+            self.sources = []
+
+    def receive_tensor(self, bucket_idx: int, write_item: WriteItem) -> Tuple[torch.Tensor, list]:
+        """Gets the copied data of a write item (in the writer process).
+
+        Args:
+            bucket_idx (int): index of the write bucket the item belongs to
+            write_item (WriteItem): the tensor write item to receive
+
+        Returns:
+            Tuple[torch.Tensor, list]: CPU tensor with the item data and the indices
+                of the buffers to return to the pool once the data is written
+        """
+        dtype = write_item.tensor_data.properties.dtype
+        sizes = write_item.tensor_data.chunk.sizes
+        num_bytes = _item_size(write_item)
+        if num_bytes == 0:
+            return torch.empty(sizes, dtype=dtype), []
+
+        buffer_idx, chunk_size = self.data_queues[bucket_idx].get()
+        if buffer_idx is None:
+            raise RuntimeError('Pipelined D2H copy failed in the training process')
+        if chunk_size == num_bytes:
+            # The tensor fits in a single buffer, write directly from the buffer
+            data = self.pool.buffers[buffer_idx][:num_bytes]
+            return data.view(dtype).reshape(sizes), [buffer_idx]
+
+        data = torch.empty(num_bytes, dtype=torch.uint8)
+        offset = 0
+        while True:
+            data[offset : offset + chunk_size].copy_(self.pool.buffers[buffer_idx][:chunk_size])
+            self.release_buffers([buffer_idx])
+            offset += chunk_size
+            if offset == num_bytes:
+                break
+            buffer_idx, chunk_size = self.data_queues[bucket_idx].get()
+            if buffer_idx is None:
+                raise RuntimeError('Pipelined D2H copy failed in the training process')
+        return data.view(dtype).reshape(sizes), []
+
+    def release_buffers(self, buffer_indices: List[int]) -> None:
+        """Returns the buffers to the pool (in the writer process)."""
+        for buffer_idx in buffer_indices:
+            self.pool.free_queue.put(buffer_idx)
+
+    def abort(self, error: Exception) -> None:
+        """Stops the copy thread after a writer process failure (in the writer process)."""
+        self.pool.free_queue.put(repr(error))
+
+    def get_stats(self) -> Dict[str, float]:
+        """Returns the copy metrics: copied bytes, background copy time and training stall time."""
+        return dict(
+            copied_bytes=self.copied_bytes,
+            background_time=self.background_time,
+            wait_time=self.wait_time,
+        )
+
+
+def wait_for_pipelined_d2h_copies() -> float:
+    """Waits for the pipelined D2H copies of the scheduled saves.
+
+    Must be called before the tensors of the saved state dicts are modified in-place
+    (e.g. by the optimizer step).
+
+    Returns:
+        float: time spent waiting (training stall time)
+    """
+    wait_time = 0.0
+    while _active_d2h_copies:
+        d2h_copy = _active_d2h_copies.pop(0)
+        start = time()
+        d2h_copy.wait()
+        wait_time += time() - start
+    return wait_time
+
+
 class FileSystemWriterAsync(FileSystemWriter):
     """
     Async-enabled implementation of FileSystemWriter using file IO.
@@ -67,22 +335,66 @@ class FileSystemWriterAsync(FileSystemWriter):
 
     Currently, it's assumed that a separate writer is created for each ckpt save
     (intermediate state is stored as writer attributes).
+
+    If `incremental` is True, the writer processes compute a digest of each write item
+    (retrieved with the write results) and skip writing the items with the same digest
+    as in the base checkpoint, referencing the base checkpoint storage instead.
+    See the `incremental` module for details.
+
+    If `pipelined_d2h` is True, `prepare_write_data` doesn't copy the tensors to CPU.
+    Instead, a background thread copies them into a bounded pool of reusable host buffers
+    while the writer processes write the already copied data (see `PipelinedD2HCopy`).
+    The saved tensors must not be modified until `wait_for_pipelined_d2h_copies` is called.
+    The time spent blocking the training (`stall_time`) and copying in the background
+    (`background_time`) is available in `self.d2h_stats` after `retrieve_write_results`.
+
+    If `compression` is given, the writer processes encode the tensors (see the `compression`
+    module), which must be loaded with the `DecodingFileSystemReader`.
+
+    If `checksum_algorithm` is given, the writer processes compute the checksum of each
+    written item while writing it and store it in the item storage info
+    (see the `integrity` module).
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        incremental: bool = False,
+        base_checkpoint_dir: Optional[Union[str, Path]] = None,
+        pipelined_d2h: bool = False,
+        host_buffer_size: int = DEFAULT_HOST_BUFFER_SIZE,
+        num_host_buffers: Optional[int] = None,
+        compression: Optional[CompressionConfig] = None,
+        checksum_algorithm: Optional[str] = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         if not self.single_file_per_rank:
             raise NotImplementedError(
                 'single_file_per_rank flag not supported for FileSystemWriterAsync'
             )
+        self.incremental = incremental
+        self.base_checkpoint_dir = base_checkpoint_dir
+        self.pipelined_d2h = pipelined_d2h
+        self.host_buffer_size = host_buffer_size
+        # Two buffers per writer process allow copying while writing
+        self.num_host_buffers = num_host_buffers or 2 * self.thread_count
+        self.compression = compression
+        self.checksum_algorithm = checksum_algorithm
 
         # Intermediate state between preparation and finalization
         self.write_buckets: Optional[List[WriteBucket]] = None
         self.results_queue: Optional[mp.Queue] = None
+        self.base_items: Optional[BaseItems] = None
+        self.write_digests: Optional[dict] = None
+        self.d2h_copy: Optional[PipelinedD2HCopy] = None
+        self.d2h_stats: Optional[Dict[str, float]] = None
+        self.prepare_time: Optional[float] = None
 
     def prepare_write_data(self, plan: SavePlan, planner: SavePlanner) -> None:
         """
-        First stage of async saving. Copy data to CPU and plan the local saving.
+        First stage of async saving. Copy data to CPU (or start the pipelined copy)
+        and plan the local saving.
 
         Args:
             plan (SavePlan): save plan generated by the PyT Distributed compatible planner
@@ -91,11 +403,22 @@ class FileSystemWriterAsync(FileSystemWriter):
         Returns: None, but stores the save plan in `self.write_buckets`
         """
         storage_plan: _StoragePrefix = plan.storage_data
-        start = time()
+        prepare_start = start = time()
         logger.debug(f"thread_count: {self.thread_count}, time: {start}")
         item_buckets = _split_by_size_and_type(self.thread_count, plan.items)
         logger.debug(f"bucket_prep, time: {time() - start}")
 
+        if self.incremental:
+            base_items = {}
+            if self.base_checkpoint_dir is not None:
+                base_items = get_base_items(self.base_checkpoint_dir, self.path)
+            # Keep only the local items, the worker processes get a copy
+            self.base_items = {
+                item.index: base_items[item.index]
+                for item in plan.items
+                if item.index in base_items
+            }
+
         start = time()
         # move tensors from GPU to CPU before starting async writing
         # We do D2H synchronously for now
@@ -109,22 +432,36 @@ class FileSystemWriterAsync(FileSystemWriter):
 
         # Prepare bytes / tensor data in each bucket, which will be assigned to each writer process
         self.write_buckets = []
+        d2h_sources = []
         for bucket in item_buckets:
             bytes_data = [
                 (item, planner.resolve_data(item))
                 for item in bucket
                 if item.type == WriteItemType.BYTE_IO
             ]
-            tensor_data = [
-                (item, planner.resolve_data(item).detach().to("cpu", non_blocking=True))
-                for item in bucket
-                if item.type != WriteItemType.BYTE_IO
-            ]
+            if self.pipelined_d2h:
+                # The data will be received from the copy thread
+                tensors = [
+                    planner.resolve_data(item)
+                    for item in bucket
+                    if item.type != WriteItemType.BYTE_IO
+                ]
+                tensor_data = [
+                    (item, None) for item in bucket if item.type != WriteItemType.BYTE_IO
+                ]
+            else:
+                tensor_data = [
+                    (item, planner.resolve_data(item).detach().to("cpu", non_blocking=True))
+                    for item in bucket
+                    if item.type != WriteItemType.BYTE_IO
+                ]
             if len(bytes_data) > 0 or len(tensor_data) > 0:
                 file_name = gen_file()
                 self.write_buckets.append(
                     (self.path / file_name, file_name, (bytes_data, tensor_data))
                 )
+                if self.pipelined_d2h:
+                    d2h_sources.append(tensors)
 
         # Check if there is anything to write on this rank
         if len(self.write_buckets) > 0:
@@ -133,9 +470,15 @@ class FileSystemWriterAsync(FileSystemWriter):
                 self.thread_count,
             )
             self.results_queue = _get_write_results_queue()
+            if self.pipelined_d2h:
+                pool = _get_host_buffer_pool(self.num_host_buffers, self.host_buffer_size)
+                self.d2h_copy = PipelinedD2HCopy(d2h_sources, pool)
+                self.d2h_copy.start()
+                _active_d2h_copies.append(self.d2h_copy)
         else:
             self.results_queue = None
         end = time()
+        self.prepare_time = end - prepare_start
         logger.debug(f"D2H and push, time: {end - start}")
 
     def get_save_function_and_args(self) -> Tuple[Optional[Callable], Tuple]:
@@ -149,12 +492,27 @@ class FileSystemWriterAsync(FileSystemWriter):
         """
         if not self.write_buckets:
             return None, ()
-        return (self.write_preloaded_data_multiproc, (self.write_buckets, self.results_queue))
+        return (
+            self.write_preloaded_data_multiproc,
+            (
+                self.write_buckets,
+                self.results_queue,
+                self.base_items,
+                self.d2h_copy,
+                self.compression,
+                self.checksum_algorithm,
+            ),
+        )
 
     @staticmethod
     @_disable_gc()
     def write_preloaded_data_multiproc(
-        write_buckets: List[WriteBucket], global_results_queue: mp.Queue
+        write_buckets: List[WriteBucket],
+        global_results_queue: mp.Queue,
+        base_items: Optional[BaseItems] = None,
+        d2h_copy: Optional[PipelinedD2HCopy] = None,
+        compression: Optional[CompressionConfig] = None,
+        checksum_algorithm: Optional[str] = None,
     ) -> None:
         """
         Performs saving data to storage with multiple processes.
@@ -173,12 +531,22 @@ class FileSystemWriterAsync(FileSystemWriter):
 
         Args:
             write_buckets (List[WriteBucket]): write plan
-            global_results_queue (mp.Queue): mp.Queue to collect Dict[List[WriteResults]] (or an Exception)
+            global_results_queue (mp.Queue): mp.Queue to collect Dict[List[WriteResults]] (or an Exception),
+                the write item digests and the write and fsync times (max over the workers)
                 from parallel write processes to the main training process
+            base_items (BaseItems, optional): if not None, compute the digests of the write items
+                and skip writing the items with the same digest in the base checkpoint
+            d2h_copy (PipelinedD2HCopy, optional): if not None, the tensor data is received
+                from the pipelined D2H copy
+            compression (CompressionConfig, optional): if not None, the tensors are encoded
+            checksum_algorithm (str, optional): if not None, the checksums of the written
+                items are stored in their storage info
         Returns: None
         """
         w_start = time()
         write_results_or_exc: Union[dict, Exception] = dict()
+        write_digests = {}
+        write_times = dict(write=0.0, fsync=0.0)
         ctx = mp.get_context('fork')
         local_results_queue = ctx.Queue()
         count_queue = ctx.JoinableQueue()
@@ -189,7 +557,17 @@ class FileSystemWriterAsync(FileSystemWriter):
                 p_list.append(
                     ctx.Process(
                         target=FileSystemWriterAsync.write_preloaded_data,
-                        args=(i, write_bucket, local_results_queue, count_queue, True),
+                        args=(
+                            i,
+                            write_bucket,
+                            local_results_queue,
+                            count_queue,
+                            True,
+                            base_items,
+                            d2h_copy,
+                            compression,
+                            checksum_algorithm,
+                        ),
                     )
                 )
             except Exception as e:
@@ -208,7 +586,9 @@ class FileSystemWriterAsync(FileSystemWriter):
             # At this point, all workers completed, so the queue should have exactly `len(write_buckets)` items
             for proc_idx in range(len(write_buckets)):
                 try:
-                    local_proc_idx, local_results_or_exc = local_results_queue.get()
+                    local_proc_idx, local_results_or_exc, local_digests, local_times = (
+                        local_results_queue.get()
+                    )
                 except queue.Empty:
                     write_results_or_exc = RuntimeError(
                         f'Unexpected empty `local_results_queue` (got only {proc_idx}/{len(write_buckets)} items)'
@@ -223,11 +603,14 @@ class FileSystemWriterAsync(FileSystemWriter):
                     else:
                         assert isinstance(local_results_or_exc, list), type(local_results_or_exc)
                         write_results_or_exc[local_proc_idx] = local_results_or_exc
+                        write_digests.update(local_digests)
+                        for phase, phase_time in local_times.items():
+                            write_times[phase] = max(write_times[phase], phase_time)
                         p_list[local_proc_idx].join()
 
             logger.debug('FileSystemWriterAsync: collected worker results successfully')
 
-        global_results_queue.put(write_results_or_exc)
+        global_results_queue.put((write_results_or_exc, write_digests, write_times))
 
         w_end = time()
         logger.debug(
@@ -242,6 +625,10 @@ class FileSystemWriterAsync(FileSystemWriter):
         results_queue: mp.SimpleQueue,
         count_queue: mp.JoinableQueue,
         use_fsync: bool,
+        base_items: Optional[BaseItems] = None,
+        d2h_copy: Optional[PipelinedD2HCopy] = None,
+        compression: Optional[CompressionConfig] = None,
+        checksum_algorithm: Optional[str] = None,
     ) -> None:
         """
         Performs actual data saving to storage.
@@ -252,27 +639,81 @@ class FileSystemWriterAsync(FileSystemWriter):
             results_queue (mp.Queue): queue to return the write results to the proxy checkpoint process.
             count_queue (mp.JoinableQueue): queue to marks worker task as completed
             use_fsync (bool): if True, calls os.fsync at the end of saving
-
-        Returns: None, the write result are put into the `queue`
+            base_items (BaseItems, optional): if not None, compute the digests of the write items
+                and skip writing the items with the same digest in the base checkpoint
+            d2h_copy (PipelinedD2HCopy, optional): if not None, the tensor data is received
+                from the pipelined D2H copy (items with None data)
+            compression (CompressionConfig, optional): if not None, the tensors are encoded
+            checksum_algorithm (str, optional): if not None, the checksums of the written
+                items are computed while writing and stored in their storage info
+
+        Returns: None, the write results, digests and times are put into the `queue`
         """
         mem_before = _process_memory()
 
         local_results = []
+        local_digests = {}
+        executor = None
         try:
+            write_start = time()
+            fsync_time = 0.0
             file_name, storage_key, (bytes_data, tensor_data) = write_bucket
+            if compression is not None:
+                executor = ThreadPoolExecutor(compression.num_threads)
             with open(file_name, "wb") as stream:
-                for write_item, data in bytes_data:
-                    local_results.append(_write_item(stream, data, write_item, storage_key))
-
-                for write_item, tensor in tensor_data:
-                    assert tensor.is_cpu
-                    local_results.append(_write_item(stream, tensor, write_item, storage_key))
+                for write_item, data in _iter_write_data(
+                    local_proc_idx, bytes_data, tensor_data, d2h_copy
+                ):
+                    assert isinstance(data, io.BytesIO) or data.is_cpu
+                    if base_items is not None:
+                        digest = get_digest(data)
+                        local_digests[write_item.index] = digest
+                        base_digest, base_storage_info = base_items.get(
+                            write_item.index, (None, None)
+                        )
+                        if digest == base_digest:
+                            local_results.append(
+                                WriteResult(
+                                    index=write_item.index,
+                                    size_in_bytes=base_storage_info.length,
+                                    storage_data=base_storage_info,
+                                )
+                            )
+                            continue
+                    if isinstance(data, torch.Tensor) and should_encode(data, compression):
+                        write_fn = partial(
+                            write_encoded_item,
+                            tensor=data,
+                            write_item=write_item,
+                            storage_key=storage_key,
+                            config=compression,
+                            executor=executor,
+                        )
+                    else:
+                        write_fn = partial(
+                            _write_item, data=data, write_item=write_item, storage_key=storage_key
+                        )
+                    if checksum_algorithm is None:
+                        write_result = write_fn(stream)
+                    else:
+                        write_result = write_item_with_checksum(
+                            stream, write_fn, checksum_algorithm
+                        )
+                    local_results.append(write_result)
 
                 if use_fsync:
+                    fsync_start = time()
                     os.fsync(stream.fileno())
-            local_output = (local_proc_idx, local_results)
+                    fsync_time = time() - fsync_start
+            local_times = dict(write=time() - write_start - fsync_time, fsync=fsync_time)
+            local_output = (local_proc_idx, local_results, local_digests, local_times)
         except Exception as e:
-            local_output = (local_proc_idx, e)
+            if d2h_copy is not None:
+                d2h_copy.abort(e)
+            local_output = (local_proc_idx, e, None, None)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
         results_queue.put(local_output)
         # Signal this process is done.
@@ -294,19 +735,50 @@ class FileSystemWriterAsync(FileSystemWriter):
     def retrieve_write_results(self) -> List[WriteResult]:
         """
         Turn the latest dict including write results from `self.results_queue` into a single results lists. Includes error check.
+        The write item digests (empty if not `incremental`) are stored in `self.write_digests`
+        and the write and fsync times are recorded as checkpointing phases.
 
         Returns (List[WriteResult]): the list of write results from all local processes performing the save.
 
         """
         assert self.write_buckets is not None
 
+        if self.d2h_copy is not None:
+            self.d2h_copy.wait()
+            self.d2h_copy.pool.release()
+            if self.d2h_copy in _active_d2h_copies:
+                _active_d2h_copies.remove(self.d2h_copy)
+            self.d2h_stats = dict(
+                self.d2h_copy.get_stats(),
+                stall_time=self.prepare_time + self.d2h_copy.wait_time,
+            )
+            # The copy overlaps with the write, only the wait for it stalls the caller
+            record_phase('d2h', self.d2h_copy.wait_time)
+            if self.d2h_copy.exception is not None:
+                raise RuntimeError(
+                    f'Pipelined D2H copy failure: {self.d2h_copy.exception}'
+                ) from self.d2h_copy.exception
+            logger.info(
+                f'Pipelined D2H copy of {self.d2h_stats["copied_bytes"] / 2**20:.1f} MiB,'
+                f' training stall: {self.d2h_stats["stall_time"]:.3f}s,'
+                f' background copy: {self.d2h_stats["background_time"]:.3f}s'
+            )
+        else:
+            self.d2h_stats = dict(
+                background_time=0.0, wait_time=0.0, stall_time=self.prepare_time or 0.0
+            )
+
         if self.results_queue is None:
-            write_results_or_exc = {}
+            write_results_or_exc, self.write_digests, write_times = {}, {}, {}
         else:
             try:
-                write_results_or_exc = self.results_queue.get_nowait()
+                write_results_or_exc, self.write_digests, write_times = (
+                    self.results_queue.get_nowait()
+                )
             except queue.Empty:
                 raise RuntimeError(f'results_queue should not be empty')
+        for phase, phase_time in write_times.items():
+            record_phase(phase, phase_time)
 
         if isinstance(write_results_or_exc, Exception):
             raise RuntimeError(f'Worker failure: {write_results_or_exc}') from write_results_or_exc
@@ -319,6 +791,27 @@ class FileSystemWriterAsync(FileSystemWriter):
         return list(chain.from_iterable(write_results.values()))
 
 
+def _iter_write_data(
+    bucket_idx: int,
+    bytes_data: list,
+    tensor_data: list,
+    d2h_copy: Optional[PipelinedD2HCopy],
+):
+    """Iterates over the write items data, receiving the pipelined D2H copies if needed.
+
+    The host buffers of a received tensor are returned to the pool once the caller
+    requests the next item (i.e. after the tensor is written).
+    """
+    yield from bytes_data
+    for write_item, data in tensor_data:
+        if data is not None:
+            yield write_item, data
+            continue
+        data, buffer_indices = d2h_copy.receive_tensor(bucket_idx, write_item)
+        yield write_item, data
+        d2h_copy.release_buffers(buffer_indices)
+
+
 def _split_by_size_and_type(bins: int, items: List[WriteItem]) -> List[List[WriteItem]]:
     """
     Splits write items according to item size into close to uniform bins.
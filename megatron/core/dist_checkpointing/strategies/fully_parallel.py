@@ -25,6 +25,11 @@ from megatron.core.dist_checkpointing.strategies.base import (
     LoadShardedStrategy,
     SaveShardedStrategy,
 )
+from megatron.core.dist_checkpointing.strategies.load_plan_cache import (
+    LoadPlanCache,
+    get_structure_key,
+)
+from megatron.core.dist_checkpointing.strategies.profiling import record_phase
 from megatron.core.dist_checkpointing.validation import (
     determine_global_metadata,
     validate_sharding_integrity,
@@ -152,6 +157,7 @@ class FullyParallelSaveStrategyWrapper(AsyncSaveShardedStrategy):
             self.cached_distribution = precomputed_distribution
         end = time()
         logger.debug(f"parallel save sharding, time: {end - start}")
+        record_phase('metadata_exchange', end - start)
 
     @property
     def can_handle_sharded_objects(self):
@@ -171,9 +177,10 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
             to maximize performance. Defaults to the whole world.
             In most cases, it's recommended to set it to the DP group.
         do_cache_distribution (bool, optional): whether to cache the load distribution
-            from previous calls. Should be set to True only if the state dict
-            structure between the calls is always the same. Defaults to False,
-            since the loading in general happens only once during training.
+            from previous calls. The distributions are cached by the state dict
+            structure and reused only if the structure matches on all ranks of
+            the parallelization group. Defaults to False, since the loading
+            in general happens only once during training.
             Note that the load distribution *cannot* be reused as a save distribution,
             because save/load is not fully symmetrical.
         exchange_algo (str): algorithm to use for exchanging the data.
@@ -182,6 +189,11 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
             - gather_object (default) - ranks all_gather_object the whole loaded state dicts
             - gather_rounds (default) - ranks all gather individual tensors in rounds
             See method docs for more details.
+        topology_aware (bool, optional): whether to distribute the load within each node
+            separately. Each shard is then read once per node (instead of once
+            in the parallelization group) and exchanged only between the ranks
+            of the same node. Must be used by all ranks. See `topology` module docs
+            for details. Defaults to False.
     """
 
     def __init__(
@@ -190,6 +202,7 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
         parallelization_group: Optional[torch.distributed.ProcessGroup] = None,
         do_cache_distribution: bool = False,
         exchange_algo: str = 'broadcast',
+        topology_aware: bool = False,
     ):
         super().__init__()
         self.base_strategy = strategy
@@ -200,8 +213,14 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
         self.parallelization_group = parallelization_group
         self.do_cache_distribution = do_cache_distribution
         self.exchange_algo = exchange_algo
+        self.topology_aware = topology_aware
+        self._is_intra_node_group = False
 
-        self.cached_distribution: Optional[SaveLoadDistribution] = None
+        self.distribution_cache = LoadPlanCache(parallelization_group)
+
+    @property
+    def validation_cache(self) -> Optional[LoadPlanCache]:
+        return self.base_strategy.validation_cache
 
     def load(self, sharded_state_dict: ShardedStateDict, checkpoint_dir: Path) -> StateDict:
         """Distributes the load and calls underlying strategy only for parts of the state dict.
@@ -232,6 +251,8 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
             a state dict that would be loaded with the underlying strategy
             without this wrapper.
         """
+        if self.topology_aware and not self._is_intra_node_group:
+            self.apply_topology()
         if torch.distributed.get_world_size(self.parallelization_group) <= 1:
             return self.base_strategy.load(sharded_state_dict, checkpoint_dir)
 
@@ -243,6 +264,7 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
         ), 'Expecting non-trivial distribution for non-trivial parallelization group'
         end = time()
         logger.debug(f'self.apply_loading_parallelization took {end - start}s')
+        record_phase('metadata_exchange', end - start)
         start = end
 
         # Step 3: load part of the checkpoint.
@@ -295,6 +317,7 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
         end = time()
         logger.debug(f'torch.cuda.synchronize took {end - sync_start}s')
         logger.debug(f'self.exchange_loaded_tensors took {end - start}s')
+        record_phase('exchange', end - start)
 
         self.fill_in_deferred_sharded_tensors(sharded_tensors, all_loaded_tensors)
         merge(loaded_state_dict, sharded_tensors)
@@ -343,6 +366,20 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
         dict_list_map_inplace(wrap_non_main_replicas, sharded_tensors)
         return sharded_tensors, sharded_state_dict, to_load_shards, unloaded_shards
 
+    def apply_topology(self) -> None:
+        """Restricts the parallelization group to the ranks on the same node as this rank.
+
+        Called on the first load if `self.topology_aware` is True.
+        Must be called on all ranks of the default process group.
+
+        Returns: None
+        """
+        from .topology import get_intra_node_group
+
+        self.parallelization_group = get_intra_node_group(self.parallelization_group)
+        self.distribution_cache = LoadPlanCache(self.parallelization_group)
+        self._is_intra_node_group = True
+
     def apply_loading_parallelization(
         self, sharded_state_dict: ShardedStateDict
     ) -> Optional[SaveLoadDistribution]:
@@ -354,8 +391,8 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
         (and others with non 0 values).
 
         If `self.do_cache_distribution` is True, caches the distribution between
-        the calls and subsequent distributions happen without any inter-rank
-        communication.
+        the calls and subsequent distributions of the same state dict structure
+        happen with a single all-reduce instead of the metadata exchange.
 
         Args:
             sharded_state_dict (ShardedStateDict): state dict to distribute the loading
@@ -363,20 +400,24 @@ class FullyParallelLoadStrategyWrapper(LoadShardedStrategy):
         Returns:
             SaveLoadDistribution (optional): the computed loading distribution
         """
-        if self.do_cache_distribution and self.cached_distribution is not None:
+        precomputed_distribution = None
+        if self.do_cache_distribution:
+            # Must be computed before the replica ids are modified
+            cache_key = get_structure_key(sharded_state_dict)
+            precomputed_distribution = self.distribution_cache.get(cache_key)
+        if precomputed_distribution is not None:
             logger.debug(f'Apply *cached* load parallelization')
-            precomputed_distribution = self.cached_distribution
         else:
             logger.debug(f'Apply load parallelization')
             precomputed_distribution = determine_main_replica_uniform_distribution(
                 sharded_state_dict, self.parallelization_group, True
             )
+            if self.do_cache_distribution and precomputed_distribution is not None:
+                self.distribution_cache.put(cache_key, precomputed_distribution)
 
         distribute_main_replicas_with_precomputed_distribution(
             sharded_state_dict, self.parallelization_group, precomputed_distribution
         )
-        if self.do_cache_distribution:
-            self.cached_distribution = precomputed_distribution
 
         return precomputed_distribution
 
@@ -701,7 +742,7 @@ def _sharded_tensor_shard_id(sharded_tensor: ShardedTensor) -> _ShardId:
 def _shard_size(sh_ten: ShardedTensor):
     """Returns size in bytes of a given sharded tensor."""
     if sh_ten.flattened_range is None:
-        numel = np.product(sh_ten.local_shape)
+        numel = np.prod(sh_ten.local_shape)
     else:
         numel = sh_ten.flattened_range.stop - sh_ten.flattened_range.start
     return numel * torch._utils._element_size(sh_ten.dtype)
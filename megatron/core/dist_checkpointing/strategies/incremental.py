@@ -0,0 +1,168 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+
+""" Incremental checkpoints for the PyT Distributed format.
+
+An incremental checkpoint stores a content digest for each write item in the checkpoint metadata
+(as `Metadata.mcore_digests`). When saving incrementally on top of a base checkpoint, the write
+items with the same digest as in the base checkpoint are not written. Instead, their storage
+metadata points to the base checkpoint files, with a path relative to the new checkpoint
+directory. Such checkpoints can be loaded without any changes to the loading logic, but the
+base checkpoints must not be removed. `compact_incremental_checkpoint` folds the referenced data
+into a single, self-contained checkpoint.
+"""
+
+import dataclasses
+import hashlib
+import io
+import logging
+import os
+import pickle
+import shutil
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Set, Tuple, Union
+
+import torch
+from torch.distributed.checkpoint import FileSystemReader, Metadata
+from torch.distributed.checkpoint.filesystem import DEFAULT_SUFFIX, _metadata_fn
+from torch.distributed.checkpoint.metadata import MetadataIndex
+
+logger = logging.getLogger(__name__)
+
+# Digest and storage info (relative to the new checkpoint) of a write item of the base checkpoint
+BaseItems = Dict[MetadataIndex, Tuple[str, object]]
+
+
+def get_digest(data: Union[io.BytesIO, torch.Tensor]) -> str:
+    """Compute the content digest of a write item.
+
+    Args:
+        data (io.BytesIO, torch.Tensor): serialized object or CPU tensor to write
+
+    Returns:
+        str: hex digest of the data (including the tensor dtype and shape)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(data, torch.Tensor):
+        digest.update(f'{data.dtype}{tuple(data.shape)}'.encode())
+        digest.update(data.contiguous().reshape(-1).view(torch.uint8).numpy().data)
+    else:
+        digest.update(data.getbuffer())
+    return digest.hexdigest()
+
+
+def _is_external(relative_path: str) -> bool:
+    return os.path.isabs(relative_path) or os.path.dirname(relative_path) != ''
+
+
+def get_base_items(
+    base_checkpoint_dir: Union[str, Path], checkpoint_dir: Union[str, Path]
+) -> BaseItems:
+    """Collect the digests and storage of the write items of a base checkpoint.
+
+    Args:
+        base_checkpoint_dir (str, Path): the base checkpoint, saved incrementally
+        checkpoint_dir (str, Path): the new checkpoint which references the base checkpoint
+
+    Returns:
+        BaseItems: the digest and the storage info of the items of the base checkpoint,
+            with paths relative to `checkpoint_dir`. Empty if the base checkpoint metadata
+            doesn't exist (e.g. the base checkpoint is not finalized yet) or doesn't
+            contain digests.
+    """
+    try:
+        metadata = FileSystemReader(base_checkpoint_dir).read_metadata()
+    except FileNotFoundError:
+        logger.warning(
+            f'Base checkpoint {base_checkpoint_dir} metadata not found, saving a full checkpoint'
+        )
+        return {}
+    base_digests = getattr(metadata, 'mcore_digests', None)
+    if base_digests is None:
+        logger.warning(
+            f'Base checkpoint {base_checkpoint_dir} was not saved incrementally,'
+            f' saving a full checkpoint'
+        )
+        return {}
+
+    base_items = {}
+    for index, digest in base_digests.items():
+        storage_info = metadata.storage_data[index]
+        relative_path = os.path.relpath(
+            os.path.join(base_checkpoint_dir, storage_info.relative_path), checkpoint_dir
+        )
+        base_items[index] = (digest, dataclasses.replace(storage_info, relative_path=relative_path))
+    return base_items
+
+
+def get_referenced_checkpoints(checkpoint_dir: Union[str, Path]) -> Set[Path]:
+    """Find the checkpoints referenced by an incremental checkpoint.
+
+    Args:
+        checkpoint_dir (str, Path): the incremental checkpoint
+
+    Returns:
+        Set[Path]: the (normalized) directories of the referenced checkpoints
+    """
+    metadata = FileSystemReader(checkpoint_dir).read_metadata()
+    return {
+        Path(os.path.normpath(os.path.join(checkpoint_dir, os.path.dirname(info.relative_path))))
+        for info in metadata.storage_data.values()
+        if _is_external(info.relative_path)
+    }
+
+
+def compact_incremental_checkpoint(
+    checkpoint_dir: Union[str, Path], output_dir: Union[str, Path]
+) -> None:
+    """Fold an incremental checkpoint and the data it references into a full checkpoint.
+
+    The files of the checkpoint are copied, the items referenced from the base checkpoints
+    are copied into new files. The digests are kept, so the output can serve as a base
+    checkpoint for further incremental saves.
+
+    Args:
+        checkpoint_dir (str, Path): the incremental checkpoint
+        output_dir (str, Path): the directory of the full checkpoint, must not exist
+    """
+    checkpoint_dir, output_dir = Path(checkpoint_dir), Path(output_dir)
+    output_dir.mkdir(parents=True)
+    metadata: Metadata = FileSystemReader(checkpoint_dir).read_metadata()
+
+    items_by_file = defaultdict(list)
+    for index, storage_info in metadata.storage_data.items():
+        items_by_file[storage_info.relative_path].append((index, storage_info))
+
+    storage_data = {}
+    num_compacted_files = 0
+    for relative_path, items in sorted(items_by_file.items()):
+        if not _is_external(relative_path):
+            storage_data.update(items)
+            continue
+        # Copy the referenced byte ranges of an external file into a new file
+        file_name = f'__compacted_{num_compacted_files}{DEFAULT_SUFFIX}'
+        num_compacted_files += 1
+        with open(checkpoint_dir / relative_path, 'rb') as src, open(
+            output_dir / file_name, 'wb'
+        ) as dst:
+            for index, storage_info in sorted(items, key=lambda item: item[1].offset):
+                src.seek(storage_info.offset)
+                offset = dst.tell()
+                dst.write(src.read(storage_info.length))
+                storage_data[index] = dataclasses.replace(
+                    storage_info, relative_path=file_name, offset=offset
+                )
+            os.fsync(dst.fileno())
+
+    # The local data files, common state dict, metadata.json, etc.
+    for path in checkpoint_dir.iterdir():
+        if path.is_file() and path.name != _metadata_fn:
+            shutil.copy2(path, output_dir / path.name)
+
+    metadata.storage_data = storage_data
+    with open(output_dir / _metadata_fn, 'wb') as f:
+        pickle.dump(metadata, f)
+    logger.info(
+        f'Compacted {checkpoint_dir} into {output_dir}'
+        f' ({num_compacted_files} files copied from the referenced checkpoints)'
+    )
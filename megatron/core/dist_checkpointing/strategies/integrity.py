@@ -0,0 +1,301 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+
+""" Integrity checksums of the items stored in the PyT Distributed format.
+
+The writers compute a checksum of the bytes of each item while streaming them to the data
+file (see `ChecksumStream`), so the data is not read again. The checksum is stored
+in the checkpoint metadata, in the storage info of the item (see `ChecksummedStorageInfo`),
+which is preserved when the item is referenced by an incremental checkpoint.
+
+A checkpoint can be verified without loading it with `verify_checkpoint` (which detects
+missing and truncated files and corrupted items) or while loading with
+`DecodingFileSystemReader(verify_checksums=True)`. The checksum is xxh3_64 if `xxhash`
+is installed, crc32 otherwise. The algorithm is stored with each checksum.
+"""
+
+import dataclasses
+import logging
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import torch
+from torch.distributed.checkpoint import FileSystemReader, Metadata
+from torch.distributed.checkpoint.filesystem import _StorageInfo
+from torch.distributed.checkpoint.storage import WriteResult
+
+from ..core import CheckpointingException
+
+try:
+    import xxhash
+
+    HAVE_XXHASH = True
+except ImportError:
+    HAVE_XXHASH = False
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_ALGORITHMS = ('xxh3_64', 'crc32')
+DEFAULT_CHECKSUM_ALGORITHM = 'xxh3_64' if HAVE_XXHASH else 'crc32'
+
+# Size of the reads when verifying the items
+_VERIFY_READ_SIZE = 64 * 1024 * 1024
+
+
+@dataclass
+class ChecksummedStorageInfo(_StorageInfo):
+    """Storage info of an item with the checksum of the stored bytes.
+
+    `checksum` is a string '<algorithm>:<hex digest>'.
+    """
+
+    checksum: Optional[str] = None
+
+
+class _Crc32:
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data) -> None:
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self) -> str:
+        return f'{self.value:08x}'
+
+
+def _new_hasher(algorithm: str):
+    if algorithm == 'crc32':
+        return _Crc32()
+    if algorithm == 'xxh3_64':
+        if not HAVE_XXHASH:
+            raise CheckpointingException(
+                'xxhash is required for the xxh3_64 checksums, install it with `pip install xxhash`'
+            )
+        return xxhash.xxh3_64()
+    raise ValueError(
+        f'Unknown checksum algorithm: {algorithm}, expected one of {CHECKSUM_ALGORITHMS}'
+    )
+
+
+def compute_checksum(data, algorithm: str = DEFAULT_CHECKSUM_ALGORITHM) -> str:
+    """Checksum of a bytes-like object in the '<algorithm>:<hex digest>' format."""
+    hasher = _new_hasher(algorithm)
+    hasher.update(data)
+    return f'{algorithm}:{hasher.hexdigest()}'
+
+
+class ChecksumStream:
+    """Write-only file wrapper computing the checksum of the written bytes.
+
+    Args:
+        stream: binary file object to write to
+        algorithm (str): checksum algorithm, one of CHECKSUM_ALGORITHMS
+    """
+
+    def __init__(self, stream, algorithm: str = DEFAULT_CHECKSUM_ALGORITHM):
+        self.stream = stream
+        self.algorithm = algorithm
+        self._hasher = _new_hasher(algorithm)
+
+    def write(self, data) -> int:
+        self._hasher.update(data)
+        return self.stream.write(data)
+
+    def tell(self) -> int:
+        return self.stream.tell()
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        # The checksum would be invalidated by seeking
+        return False
+
+    def checksum(self) -> str:
+        """Checksum of the bytes written so far."""
+        return f'{self.algorithm}:{self._hasher.hexdigest()}'
+
+
+def with_checksum(storage_info: _StorageInfo, checksum: str) -> ChecksummedStorageInfo:
+    """Copy of `storage_info` with the given checksum, preserving the storage info subclass."""
+    if isinstance(storage_info, ChecksummedStorageInfo):
+        return dataclasses.replace(storage_info, checksum=checksum)
+    fields = {
+        field.name: getattr(storage_info, field.name) for field in dataclasses.fields(storage_info)
+    }
+    return ChecksummedStorageInfo(**fields, checksum=checksum)
+
+
+def write_item_with_checksum(
+    stream, write_fn: Callable[..., WriteResult], algorithm: str = DEFAULT_CHECKSUM_ALGORITHM
+) -> WriteResult:
+    """Writes an item with `write_fn(stream)` and adds the checksum to its storage info.
+
+    Args:
+        stream: binary file object to write to
+        write_fn (Callable): function writing the item to the given stream
+            (e.g. a partial of `_write_item`) and returning the WriteResult
+        algorithm (str): checksum algorithm
+
+    Returns:
+        WriteResult: write result with a ChecksummedStorageInfo storage data
+    """
+    checksum_stream = ChecksumStream(stream, algorithm)
+    write_result = write_fn(checksum_stream)
+    return dataclasses.replace(
+        write_result,
+        storage_data=with_checksum(write_result.storage_data, checksum_stream.checksum()),
+    )
+
+
+def verify_item_checksum(payload, storage_info: _StorageInfo) -> None:
+    """Checks the bytes of an item against the checksum in its storage info.
+
+    Items without a checksum are not checked.
+
+    Args:
+        payload (bytes-like): stored bytes of the item
+        storage_info (_StorageInfo): storage info of the item from the checkpoint metadata
+
+    Raises:
+        CheckpointingException: if the checksum doesn't match
+    """
+    expected = getattr(storage_info, 'checksum', None)
+    if expected is None:
+        return
+    actual = compute_checksum(payload, expected.split(':', 1)[0])
+    if actual != expected:
+        raise CheckpointingException(
+            f'Checksum mismatch of the item at offset {storage_info.offset}'
+            f' of {storage_info.relative_path} (expected {expected}, got {actual}).'
+            f' The checkpoint is corrupted'
+        )
+
+
+class VerificationReport(NamedTuple):
+    """Result of a checkpoint verification.
+
+    Args:
+        verified_items (int): number of items with a matching checksum
+        unchecked_items (int): number of items without a checksum (only the file size is checked)
+        verified_bytes (int): number of checked bytes
+        errors (List[str]): description of the missing files, truncated and corrupted items
+    """
+
+    verified_items: int
+    unchecked_items: int
+    verified_bytes: int
+    errors: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _verify_file(path: Path, storage_infos: List[_StorageInfo]) -> Tuple[int, int, int, List[str]]:
+    """Verifies the items of a single data file, in order of the offsets."""
+    verified_items, unchecked_items, verified_bytes, errors = 0, 0, 0, []
+    if not path.is_file():
+        return 0, 0, 0, [f'{path}: missing file with {len(storage_infos)} items']
+    file_size = path.stat().st_size
+    with open(path, 'rb') as f:
+        for storage_info in sorted(storage_infos, key=lambda si: si.offset):
+            end = storage_info.offset + storage_info.length
+            if end > file_size:
+                errors.append(
+                    f'{path}: truncated file ({file_size} bytes),'
+                    f' item at offset {storage_info.offset} ends at {end}'
+                )
+                continue
+            expected = getattr(storage_info, 'checksum', None)
+            if expected is None:
+                unchecked_items += 1
+                continue
+            algorithm = expected.split(':', 1)[0]
+            hasher = _new_hasher(algorithm)
+            f.seek(storage_info.offset)
+            remaining = storage_info.length
+            while remaining > 0:
+                chunk = f.read(min(remaining, _VERIFY_READ_SIZE))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                remaining -= len(chunk)
+            actual = f'{algorithm}:{hasher.hexdigest()}'
+            if actual != expected:
+                errors.append(
+                    f'{path}: checksum mismatch of the item at offset {storage_info.offset}'
+                    f' (expected {expected}, got {actual})'
+                )
+                continue
+            verified_items += 1
+            verified_bytes += storage_info.length
+    return verified_items, unchecked_items, verified_bytes, errors
+
+
+def _merge_reports(reports: List[Tuple[int, int, int, List[str]]]) -> VerificationReport:
+    verified_items, unchecked_items, verified_bytes, errors = zip(*reports)
+    return VerificationReport(
+        sum(verified_items), sum(unchecked_items), sum(verified_bytes), sum(errors, [])
+    )
+
+
+def verify_checkpoint(
+    checkpoint_dir: Union[str, Path],
+    num_threads: int = 8,
+    metadata: Optional[Metadata] = None,
+    group: Optional[torch.distributed.ProcessGroup] = None,
+) -> VerificationReport:
+    """Verifies the data files of a torch_dist checkpoint against the checksums in the metadata.
+
+    The data files are verified in parallel with a thread pool. If torch.distributed
+    is initialized, the files are additionally split between the ranks of `group`
+    and the reports are gathered, so the function must be called on all ranks of the group.
+
+    Args:
+        checkpoint_dir (str, Path): checkpoint directory
+        num_threads (int): number of files verified in parallel by each rank
+        metadata (Metadata, optional): checkpoint metadata, read from the checkpoint if None
+        group (ProcessGroup, optional): process group verifying the checkpoint
+            if torch.distributed is initialized. Defaults to the default process group.
+
+    Returns:
+        VerificationReport: summary of the whole checkpoint verification
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    rank, world_size = 0, 1
+    if torch.distributed.is_initialized():
+        rank = torch.distributed.get_rank(group)
+        world_size = torch.distributed.get_world_size(group)
+
+    items_by_file: Dict[Path, List[_StorageInfo]] = defaultdict(list)
+    errors = []
+    if metadata is None:
+        try:
+            metadata = FileSystemReader(checkpoint_dir).read_metadata()
+        except Exception as e:
+            errors.append(f'{checkpoint_dir}: cannot read the metadata: {e}')
+    if metadata is not None:
+        for storage_info in metadata.storage_data.values():
+            items_by_file[checkpoint_dir / storage_info.relative_path].append(storage_info)
+
+    local_files = sorted(items_by_file)[rank::world_size]
+    with ThreadPoolExecutor(max(1, num_threads)) as executor:
+        file_reports = list(
+            executor.map(lambda path: _verify_file(path, items_by_file[path]), local_files)
+        )
+    report = _merge_reports([(0, 0, 0, errors if rank == 0 else []), *file_reports])
+
+    if world_size > 1:
+        all_reports = [None] * world_size
+        torch.distributed.all_gather_object(all_reports, tuple(report), group=group)
+        report = _merge_reports(all_reports)
+    for error in report.errors:
+        logger.warning(error)
+    return report
@@ -0,0 +1,287 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+
+""" Lazy, on-demand loading of tensors from PyT Distributed checkpoints.
+
+`LazyCheckpointLoader` reads only the checkpoint items overlapping the requested shards,
+so a single tensor can be inspected without loading the whole checkpoint.
+`LazyCheckpointLoader.load` returns `LazyTensor` placeholders instead of tensors. The reads are
+issued in the order of the sharded state dict (the execution order for M-Core models) by
+a pool of threads and each placeholder waits only for its own read.
+`LazyCheckpointLoader.attach` loads the weights of a model in place in the background,
+with forward pre-hooks waiting for the weights of each module, so that the first layers
+can compute while the next ones are being read.
+"""
+
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+import torch
+from torch.distributed.checkpoint import Metadata, TensorStorageMetadata
+from torch.distributed.checkpoint.metadata import MetadataIndex
+
+from ..core import CheckpointingException
+from ..dict_utils import dict_list_map_inplace, dict_list_map_outplace
+from ..mapping import (
+    ShardedObject,
+    ShardedStateDict,
+    ShardedTensor,
+    ShardedTensorFactory,
+    StateDict,
+)
+from .compression import DecodingFileSystemReader
+
+logger = logging.getLogger(__name__)
+
+
+class LazyTensor:
+    """Placeholder of a tensor which is being read from a checkpoint.
+
+    Args:
+        future (Future): future of the read tensor
+        sh_ten (ShardedTensor, ShardedTensorFactory): the requested shard
+    """
+
+    def __init__(self, future: Future, sh_ten: Union[ShardedTensor, ShardedTensorFactory]):
+        self.future = future
+        self.sh_ten = sh_ten
+
+    @property
+    def key(self) -> str:
+        return self.sh_ten.key
+
+    def done(self) -> bool:
+        """Whether the tensor is already read."""
+        return self.future.done()
+
+    def materialize(self) -> torch.Tensor:
+        """Wait for the tensor to be read and return it."""
+        return self.future.result()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(key={self.key!r}, done={self.done()})'
+
+
+def materialize(state_dict: StateDict) -> StateDict:
+    """Replace the LazyTensors in a state dict with the read tensors (in place).
+
+    Args:
+        state_dict (StateDict): state dict returned by `LazyCheckpointLoader.load`
+
+    Returns:
+        StateDict: the same state dict, with tensors instead of placeholders
+    """
+    dict_list_map_inplace(lambda x: x.materialize() if isinstance(x, LazyTensor) else x, state_dict)
+    return state_dict
+
+
+class LazyCheckpointLoader:
+    """Reads shards of tensors from a torch_dist checkpoint on demand.
+
+    Only the checkpoint items overlapping the requested shard are read. Compressed checkpoints
+    are supported. N-D flattened tensors (of the distributed optimizer) are not.
+
+    Args:
+        checkpoint_dir (str, Path): checkpoint directory
+        num_threads (int): number of threads reading in the background
+    """
+
+    def __init__(self, checkpoint_dir: Union[str, Path], num_threads: int = 2):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.reader = DecodingFileSystemReader(self.checkpoint_dir)
+        self.metadata: Metadata = self.reader.read_metadata()
+        self.num_threads = num_threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._hooks = []
+
+    def keys(self) -> List[str]:
+        """Keys of the tensors in the checkpoint."""
+        return [
+            key
+            for key, md in self.metadata.state_dict_metadata.items()
+            if isinstance(md, TensorStorageMetadata)
+        ]
+
+    def _read_item(self, index: MetadataIndex, is_tensor: bool = True) -> Any:
+        storage_info = self.metadata.storage_data[index]
+        with open(self.checkpoint_dir / storage_info.relative_path, 'rb') as f:
+            # Non-tensor items are pickled objects (BYTE_IO)
+            item = torch.load(
+                self.reader._slice_file(f, storage_info), map_location='cpu', weights_only=False
+            )
+        return item if is_tensor else item[0]
+
+    def read_shard(self, sh_ten: ShardedTensor) -> torch.Tensor:
+        """Read a shard of a tensor synchronously.
+
+        Args:
+            sh_ten (ShardedTensor): the shard to read. If its data is not None,
+                the shard is read in place.
+
+        Returns:
+            torch.Tensor: the shard with the local shape
+        """
+        if sh_ten.flattened_range is not None:
+            raise CheckpointingException(
+                f'Lazy loading of flattened tensors is not supported: {sh_ten}'
+            )
+        tensor_md = self.metadata.state_dict_metadata.get(sh_ten.key)
+        if not isinstance(tensor_md, TensorStorageMetadata):
+            raise CheckpointingException(f'Tensor {sh_ten.key} not found in {self.checkpoint_dir}')
+        if tuple(tensor_md.size) != tuple(sh_ten.global_shape) and not sh_ten.allow_shape_mismatch:
+            raise CheckpointingException(
+                f'Global shape mismatch for {sh_ten.key}: {tuple(tensor_md.size)}'
+                f' in the checkpoint, {tuple(sh_ten.global_shape)} requested'
+            )
+
+        data = sh_ten.data
+        if data is None:
+            data = torch.empty(sh_ten.local_shape, dtype=sh_ten.dtype)
+        # Non-contiguous params (e.g. transposed views) are read through a contiguous buffer
+        if data.is_contiguous():
+            buffer = data.detach()
+        else:
+            buffer = torch.empty(data.shape, dtype=data.dtype, device=data.device)
+        if sh_ten.allow_shape_mismatch:
+            buffer.zero_()
+        # With the prepended axes, the shard and the stored chunks have the same number of dims
+        offsets = sh_ten.global_offset
+        sizes = (1,) * sh_ten.prepend_axis_num + tuple(sh_ten.local_shape)
+        target = buffer.view(sizes)
+
+        num_read = 0
+        for chunk in tensor_md.chunks:
+            lower = np.maximum(offsets, chunk.offsets)
+            upper = np.minimum(np.add(offsets, sizes), np.add(chunk.offsets, chunk.sizes))
+            if np.any(lower >= upper):
+                continue
+            chunk_tensor = self._read_item(MetadataIndex(sh_ten.key, chunk.offsets))
+            src = chunk_tensor[tuple(map(slice, lower - chunk.offsets, upper - chunk.offsets))]
+            target[tuple(map(slice, lower - offsets, upper - offsets))].copy_(src)
+            num_read += int(np.prod(upper - lower))
+        if num_read != int(np.prod(sizes)) and not sh_ten.allow_shape_mismatch:
+            raise CheckpointingException(
+                f'Shard {sh_ten} is not fully covered by the checkpoint'
+                f' ({num_read} of {int(np.prod(sizes))} elements)'
+            )
+        if not data.is_contiguous():
+            data.detach().copy_(buffer)
+        return data
+
+    def read_object(self, sh_obj: ShardedObject) -> Any:
+        """Read a ShardedObject synchronously."""
+        return self._read_item(MetadataIndex(sh_obj.unique_key), is_tensor=False)
+
+    def load_tensor(self, key: str) -> torch.Tensor:
+        """Read a whole tensor, e.g. for inspection.
+
+        Args:
+            key (str): key of the tensor in the checkpoint
+
+        Returns:
+            torch.Tensor: the tensor with the global shape
+        """
+        tensor_md = self.metadata.state_dict_metadata[key]
+        return self.read_shard(
+            ShardedTensor.from_rank_offsets(
+                key, torch.empty(tensor_md.size, dtype=tensor_md.properties.dtype)
+            )
+        )
+
+    def _read_factory(self, factory: ShardedTensorFactory) -> torch.Tensor:
+        sub_state_dict = factory.build()
+        sub_state_dict = dict_list_map_outplace(self.read_shard, sub_state_dict)
+        return factory.merge_fn(sub_state_dict)
+
+    def _read_factory_in_place(self, factory: ShardedTensorFactory) -> torch.Tensor:
+        return factory.data.detach().copy_(self._read_factory(factory))
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.num_threads)
+        return self._executor.submit(fn, *args)
+
+    def load(self, sharded_state_dict: ShardedStateDict) -> StateDict:
+        """Start reading the ShardedTensors in the background, in the order of the state dict.
+
+        ShardedObjects are read synchronously, other values are kept as they are.
+
+        Args:
+            sharded_state_dict (ShardedStateDict): the shards to read
+
+        Returns:
+            StateDict: the state dict with LazyTensor placeholders
+        """
+
+        def _load(x):
+            if isinstance(x, ShardedTensor):
+                return LazyTensor(self._submit(self.read_shard, x), x)
+            if isinstance(x, ShardedTensorFactory):
+                return LazyTensor(self._submit(self._read_factory, x), x)
+            if isinstance(x, ShardedObject):
+                return self.read_object(x)
+            return x
+
+        return dict_list_map_outplace(_load, sharded_state_dict)
+
+    def attach(self, model: torch.nn.Module) -> Dict[str, LazyTensor]:
+        """Load the weights of a model in place, in the background.
+
+        Forward pre-hooks make each module wait for its own weights, so the model can be
+        used right away. The extra states (ShardedObjects) are loaded synchronously.
+
+        Args:
+            model (torch.nn.Module): model with a `sharded_state_dict` method
+
+        Returns:
+            Dict[str, LazyTensor]: placeholders of the model weights by state dict key,
+                can be used to wait for the whole model
+        """
+        sharded_state_dict = model.sharded_state_dict()
+        extra_states = {k: v for k, v in sharded_state_dict.items() if isinstance(v, ShardedObject)}
+        for k, sh_obj in extra_states.items():
+            module_name, _ = k.rsplit('.', 1) if '.' in k else ('', k)
+            model.get_submodule(module_name).set_extra_state(self.read_object(sh_obj))
+
+        lazy_tensors = {}
+        for k, sh_ten in sharded_state_dict.items():
+            if isinstance(sh_ten, ShardedObject):
+                continue
+            if isinstance(sh_ten, ShardedTensorFactory):
+                future = self._submit(self._read_factory_in_place, sh_ten)
+            else:
+                future = self._submit(self.read_shard, sh_ten)
+            lazy_tensors[k] = LazyTensor(future, sh_ten)
+
+        waits_by_module = {}
+        for k, lazy_tensor in lazy_tensors.items():
+            module_name = k.rsplit('.', 1)[0] if '.' in k else ''
+            waits_by_module.setdefault(module_name, []).append(lazy_tensor)
+
+        def _make_hook(module_lazy_tensors):
+            def _wait_for_weights(module, args):
+                for lazy_tensor in module_lazy_tensors:
+                    lazy_tensor.materialize()
+
+            return _wait_for_weights
+
+        for module_name, module_lazy_tensors in waits_by_module.items():
+            module = model.get_submodule(module_name)
+            self._hooks.append(module.register_forward_pre_hook(_make_hook(module_lazy_tensors)))
+        logger.debug(
+            f'Started lazy loading of {len(lazy_tensors)} tensors from {self.checkpoint_dir}'
+        )
+        return lazy_tensors
+
+    def close(self):
+        """Wait for the pending reads and remove the model hooks."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+        if self.reader._executor is not None:
+            self.reader._executor.shutdown()
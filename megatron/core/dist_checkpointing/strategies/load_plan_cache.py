@@ -0,0 +1,149 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+
+""" Cache of the load plans for repeated loads of checkpoints with the same structure.
+
+Computing a load plan requires exchanging the sharded state dict metadata between the ranks
+(e.g. the PyT Distributed planning, the fully parallel load distribution or the sharding
+validation). When the same sharded state dict structure is loaded from checkpoints with the
+same tensors layout (e.g. in an evaluation loop), the plan is the same and can be reused.
+
+The cache is keyed by a hash of the local sharded state dict structure (and of the checkpoint
+metadata if the plan depends on it). A cached plan is reused only if the key matches on all
+ranks of the process group, which requires a single integer all-reduce instead of
+the all-gather of the whole metadata.
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import torch
+from torch.distributed.checkpoint import Metadata, TensorStorageMetadata
+
+from ..dict_utils import nested_values
+from ..mapping import ShardedObject, ShardedStateDict, ShardedTensor
+
+logger = logging.getLogger(__name__)
+
+
+def get_structure_key(sharded_state_dict: ShardedStateDict) -> str:
+    """Hash of the sharding of the ShardedTensors and ShardedObjects in a sharded state dict.
+
+    The tensors data is not taken into account, the order of the state dict is.
+
+    Args:
+        sharded_state_dict (ShardedStateDict): local sharded state dict
+
+    Returns:
+        str: hex digest of the local structure
+    """
+    structure = []
+    for sh_base in nested_values(sharded_state_dict):
+        if isinstance(sh_base, ShardedTensor):
+            flattened_range = sh_base.flattened_range
+            structure.append(
+                (
+                    sh_base.key,
+                    str(sh_base.dtype),
+                    tuple(sh_base.local_shape),
+                    tuple(sh_base.global_shape),
+                    tuple(sh_base.global_offset),
+                    tuple(sh_base.axis_fragmentations or ()),
+                    sh_base.replica_id,
+                    sh_base.prepend_axis_num,
+                    sh_base.allow_shape_mismatch,
+                    (
+                        None
+                        if flattened_range is None
+                        else (flattened_range.start, flattened_range.stop)
+                    ),
+                )
+            )
+        elif isinstance(sh_base, ShardedObject):
+            structure.append(
+                (
+                    sh_base.key,
+                    tuple(sh_base.global_shape),
+                    tuple(sh_base.global_offset),
+                    sh_base.replica_id,
+                )
+            )
+        else:
+            structure.append((type(sh_base).__name__, getattr(sh_base, 'key', None)))
+    return hashlib.sha256(repr(structure).encode()).hexdigest()
+
+
+def get_metadata_key(metadata: Metadata) -> str:
+    """Hash of the tensors layout in the PyT Distributed checkpoint metadata.
+
+    Only the keys, dtypes, global shapes and chunk offsets and sizes are digested (instead of
+    pickling the whole metadata on every load). The storage info is not taken into account,
+    so checkpoints of the same model saved at different iterations have the same key.
+
+    Args:
+        metadata (Metadata): checkpoint metadata
+
+    Returns:
+        str: hex digest of the checkpoint layout
+    """
+    digest = hashlib.sha256()
+    for key, md in sorted(metadata.state_dict_metadata.items()):
+        digest.update(key.encode())
+        if isinstance(md, TensorStorageMetadata):
+            digest.update(f'{md.properties.dtype}{tuple(md.size)}'.encode())
+            for chunk in md.chunks:
+                digest.update(f'{tuple(chunk.offsets)}{tuple(chunk.sizes)}'.encode())
+        digest.update(b';')
+    mcore_data = getattr(metadata, 'mcore_data', None) or {}
+    digest.update(repr(sorted(mcore_data.items())).encode())
+    return digest.hexdigest()
+
+
+class LoadPlanCache:
+    """Load plans (or any value computed collectively) for the last used keys.
+
+    Args:
+        group (ProcessGroup, optional): process group which must agree on a cache hit.
+            Defaults to the default process group.
+        max_size (int): number of cached plans
+    """
+
+    def __init__(self, group: Optional[torch.distributed.ProcessGroup] = None, max_size: int = 4):
+        self.group = group
+        self.max_size = max_size
+        self.plans: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the plan cached for `key` if the key is cached on all ranks of the group.
+
+        Must be called on all ranks of the group.
+
+        Args:
+            key (Hashable): local key of the plan
+
+        Returns:
+            Any, optional: the cached plan or None on a cache miss
+        """
+        local_hit = key in self.plans
+        backend = torch.distributed.get_backend(self.group)
+        device = torch.cuda.current_device() if backend == 'nccl' else 'cpu'
+        all_hit = torch.tensor([int(local_hit)], dtype=torch.int, device=device)
+        torch.distributed.all_reduce(all_hit, op=torch.distributed.ReduceOp.MIN, group=self.group)
+        if not all_hit.item():
+            self.misses += 1
+            if local_hit:
+                logger.debug('Load plan cached on this rank, but not on all ranks')
+            return None
+        self.hits += 1
+        self.plans.move_to_end(key)
+        return self.plans[key]
+
+    def put(self, key: Hashable, plan: Any) -> None:
+        """Cache `plan` for `key`, evicting the least recently used plan if needed."""
+        self.plans[key] = plan
+        self.plans.move_to_end(key)
+        while len(self.plans) > self.max_size:
+            self.plans.popitem(last=False)
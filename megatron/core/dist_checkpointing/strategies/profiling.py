@@ -0,0 +1,49 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+
+""" Per-phase timings of checkpoint save and load.
+
+The strategies report the time spent in each phase of a save or load (e.g. planning,
+metadata exchange, D2H, write, fsync, finalize) with `record_phase` or `timed_phase`.
+The timings are collected only within a `profile_phases` context, so the instrumentation
+has no cost otherwise. Phases that happen in the writer processes are measured there
+and recorded by the main process.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from time import time
+from typing import Dict, Iterator, Optional
+
+_phase_timings: Optional[Dict[str, float]] = None
+
+
+@contextmanager
+def profile_phases() -> Iterator[Dict[str, float]]:
+    """Collect the time spent in each checkpointing phase within the context.
+
+    Yields:
+        Dict[str, float]: total time in seconds by phase name, filled in during the context
+    """
+    global _phase_timings
+    outer_timings = _phase_timings
+    _phase_timings = defaultdict(float)
+    try:
+        yield _phase_timings
+    finally:
+        _phase_timings = outer_timings
+
+
+def record_phase(name: str, duration: float) -> None:
+    """Add `duration` seconds to the phase `name` if the phases are profiled."""
+    if _phase_timings is not None:
+        _phase_timings[name] += duration
+
+
+@contextmanager
+def timed_phase(name: str) -> Iterator[None]:
+    """Record the time spent within the context as the phase `name`."""
+    start = time()
+    try:
+        yield
+    finally:
+        record_phase(name, time() - start)
@@ -2,6 +2,7 @@
 
 """ State dict saver for PyT Distributed format allowing asynchronous save. """
 
+from collections import ChainMap
 from logging import getLogger
 from time import time
 from typing import TYPE_CHECKING, Optional, Tuple, cast
@@ -14,6 +15,8 @@ from torch.distributed.checkpoint.metadata import STATE_DICT_TYPE, Metadata
 from torch.distributed.checkpoint.planner import SavePlan, SavePlanner
 from torch.distributed.checkpoint.utils import _DistWrapper, _get_failure_dict
 
+from .profiling import record_phase
+
 if TYPE_CHECKING:
     from .filesystem_async import FileSystemWriterAsync
 
@@ -80,22 +83,27 @@ def save_state_dict_async_plan(
     global_metadata = None
     logger.debug(f"rank: {rank}, starting state dict save")
     local_plan = cached_local_plan
+    planning_time = 0.0
 
     def local_step():
-        nonlocal local_plan
+        nonlocal local_plan, planning_time
+        start = time()
         assert planner is not None
         planner.set_up_planner(state_dict, dist_wrapper.is_coordinator)
         storage_writer.set_up_storage_writer(dist_wrapper.is_coordinator)
         if not validated_cache_reuse and local_plan is None:
             local_plan = planner.create_local_plan()
         local_plan = storage_writer.prepare_local_plan(local_plan)
+        planning_time += time() - start
         return local_plan
 
     def global_step(all_local_plans):
-        nonlocal global_metadata
+        nonlocal global_metadata, planning_time
+        start = time()
         assert planner is not None
         all_local_plans, global_metadata = planner.create_global_plan(all_local_plans)
         all_local_plans = storage_writer.prepare_global_plan(all_local_plans)
+        planning_time += time() - start
         return all_local_plans
 
     # Execute local and global planning
@@ -109,12 +117,16 @@ def save_state_dict_async_plan(
     central_plan = planner.finish_plan(central_plan)
     end_plan = time()
     logger.debug(f"rank: {rank}, plan time: {end_plan - start_plan}")
+    # The rest of the planning time is spent exchanging the plans
+    record_phase('planning', planning_time)
+    record_phase('metadata_exchange', end_plan - start_plan - planning_time)
     # Prepare async writing of tensors.
     # The `storage_writer` will store the information about tensors it needs to save
     start = time()
     storage_writer.prepare_write_data(central_plan, planner)
     end = time()
     logger.debug(f"{time()} rank: {rank}, write(async) time: {end - start}")
+    record_phase('d2h', end - start)
     return (
         (storage_writer, cast(Metadata, global_metadata), dist_wrapper),
         central_plan,
@@ -132,7 +144,8 @@ def save_state_dict_async_finalize(
     Finalization of save_state_dict_async_plan.
 
     The input arguments are the same as the save_state_dict_async_plan output,
-    the `write_results` are retrieved from the storage_writer.
+    the `write_results` are retrieved from the storage_writer. For an incremental
+    storage_writer, the write item digests are stored in the metadata as `mcore_digests`.
 
     Args:
         storage_writer (FileSystemWriterAsync): storage writer used for planning
@@ -146,17 +159,23 @@ def save_state_dict_async_finalize(
     # Gather the write results that will be saved to the metadata file.
     gather_start = time()
     all_results = dist_wrapper.gather_object(write_results)
+    if storage_writer.incremental:
+        all_digests = dist_wrapper.gather_object(storage_writer.write_digests)
     gather_end = time()
     logger.debug(f"{gather_end}, {torch.distributed.get_rank()}, gather: {gather_end-gather_start}")
+    record_phase('metadata_exchange', gather_end - gather_start)
 
     # Store the metadata on coordinator rank
     if dist_wrapper.is_coordinator:
         node_failures = _get_failure_dict(all_results)
         if len(node_failures) == 0:
             assert global_metadata is not None
+            if storage_writer.incremental:
+                global_metadata.mcore_digests = dict(ChainMap(*all_digests))
             write_start = time()
             storage_writer.finish(global_metadata, all_results)
             write_end = time()
             logger.debug(f"{write_end}, metadata_write: {write_end - write_start}")
+            record_phase('finalize', write_end - write_start)
         else:
             raise CheckpointException("write", node_failures)
@@ -0,0 +1,281 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+
+""" Streaming writer of PyT Distributed checkpoints.
+
+`StreamingCheckpointWriter` writes a torch_dist checkpoint from a single process without
+materializing the whole sharded state dict. The caller passes the ShardedTensors and
+ShardedObjects in groups (e.g. one transformer layer at a time) and a pool of writer processes
+appends each group to its own data file. The number of groups waiting for a writer is bounded,
+so the memory usage is bounded by a few groups. The checkpoint metadata is assembled from the
+storage info reported by the writers once all groups are written.
+
+The result is a regular torch_dist checkpoint, so it can be loaded with any sharding
+(e.g. other TP/PP/EP sizes) - the resharding happens during loading.
+"""
+
+import bisect
+import io
+import logging
+import os
+import pickle
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from torch.distributed.checkpoint import (
+    BytesStorageMetadata,
+    ChunkStorageMetadata,
+    Metadata,
+    TensorStorageMetadata,
+)
+from torch.distributed.checkpoint.filesystem import DEFAULT_SUFFIX, _metadata_fn, _StorageInfo
+from torch.distributed.checkpoint.metadata import MetadataIndex, TensorProperties
+
+from ..core import CheckpointingConfig, CheckpointingException, save_config
+from ..mapping import ShardedObject, ShardedTensor, StateDict, is_main_replica
+from .common import COMMON_STATE_FNAME
+from .integrity import ChecksumStream, with_checksum
+
+logger = logging.getLogger(__name__)
+
+# Key, global offset of the chunk (None for objects) and data of an item to write
+_WriteItem = Tuple[str, Optional[Tuple[int, ...]], Union[torch.Tensor, bytes]]
+
+
+def _writer_loop(
+    worker_idx: int,
+    checkpoint_dir: Path,
+    task_queue: mp.Queue,
+    result_queue: mp.Queue,
+    checksum_algorithm: Optional[str] = None,
+) -> None:
+    """Append the items of the groups from `task_queue` to a data file until None is received.
+
+    Reports a list of (key, chunk offset, storage info) of the written items or the exception
+    that stopped the writer. After an error, the remaining groups are consumed without writing,
+    so that the producer is never blocked. If `checksum_algorithm` is given, the checksum
+    of each item is computed while writing and added to its storage info.
+    """
+    relative_path = f'__{worker_idx}_0{DEFAULT_SUFFIX}'
+    results = []
+    error = None
+    items = []
+    try:
+        with open(checkpoint_dir / relative_path, 'wb') as f:
+            while True:
+                items: List[_WriteItem] = task_queue.get()
+                if items is None:
+                    break
+                for key, chunk_offset, data in items:
+                    offset = f.tell()
+                    stream = (
+                        f if checksum_algorithm is None else ChecksumStream(f, checksum_algorithm)
+                    )
+                    if isinstance(data, torch.Tensor):
+                        if data.untyped_storage().nbytes() != data.numel() * data.element_size():
+                            # Don't serialize the whole storage of a view
+                            data = data.clone()
+                        torch.save(data, stream)
+                    else:
+                        stream.write(data)
+                    storage_info = _StorageInfo(relative_path, offset, f.tell() - offset)
+                    if checksum_algorithm is not None:
+                        storage_info = with_checksum(storage_info, stream.checksum())
+                    results.append((key, chunk_offset, storage_info))
+                del items
+            f.flush()
+            os.fsync(f.fileno())
+    except Exception as e:
+        logger.exception(f'Checkpoint writer {worker_idx} failed')
+        error = e
+        while items is not None:
+            items = task_queue.get()
+    result_queue.put((worker_idx, results if error is None else error))
+
+
+def _validate_chunks_coverage(
+    key: str, global_shape: Tuple[int, ...], chunks: List[Tuple[Tuple[int, ...], Tuple[int, ...]]]
+) -> None:
+    """Check that the chunks (offsets and sizes) of a key cover its global shape exactly once.
+
+    The chunk boundaries split each axis into intervals, so that every chunk covers a box
+    of the grid of intervals. Each grid cell must be covered by exactly one chunk.
+    """
+    bounds = []
+    for axis, axis_size in enumerate(global_shape):
+        axis_bounds = {0, axis_size}
+        for offsets, sizes in chunks:
+            axis_bounds.update((offsets[axis], offsets[axis] + sizes[axis]))
+        if min(axis_bounds) < 0 or max(axis_bounds) > axis_size:
+            raise CheckpointingException(
+                f'Chunks of {key} exceed its global shape {global_shape} along axis {axis}: {chunks}'
+            )
+        bounds.append(sorted(axis_bounds))
+
+    access_count = np.zeros([len(axis_bounds) - 1 for axis_bounds in bounds], dtype=np.int64)
+    for offsets, sizes in chunks:
+        access_count[
+            tuple(
+                slice(bisect.bisect_left(b, offset), bisect.bisect_left(b, offset + size))
+                for b, offset, size in zip(bounds, offsets, sizes)
+            )
+        ] += 1
+    if (access_count != 1).any():
+        raise CheckpointingException(
+            f'Chunks of {key} overlap or do not cover its global shape {global_shape}: {chunks}'
+        )
+
+
+class StreamingCheckpointWriter:
+    """Writes a torch_dist checkpoint group by group with a pool of writer processes.
+
+    Items that are not the main replica are skipped, like in a regular save. The chunks of each
+    ShardedTensor key must cover its global shape exactly once when all groups are written,
+    which is checked in `finalize`.
+
+    Args:
+        checkpoint_dir (str, Path): checkpoint directory, must be empty or not exist
+        num_workers (int): number of writer processes, each writing its own data file
+        max_pending_groups (int, optional): number of groups that can wait for a writer
+            before `write` blocks. Defaults to `num_workers`.
+        checksum_algorithm (str, optional): stores the checksum of each item in the metadata
+            (see the `integrity` module). Defaults to None (no checksums).
+    """
+
+    def __init__(
+        self,
+        checkpoint_dir: Union[str, Path],
+        num_workers: int = 4,
+        max_pending_groups: Optional[int] = None,
+        checksum_algorithm: Optional[str] = None,
+    ):
+        assert num_workers > 0, num_workers
+        self.checkpoint_dir = Path(checkpoint_dir)
+        if self.checkpoint_dir.exists() and next(self.checkpoint_dir.iterdir(), None) is not None:
+            raise CheckpointingException(
+                f'Checkpoint destination directory ({self.checkpoint_dir}) is not empty'
+            )
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+        ctx = mp.get_context('fork')
+        self.task_queue = ctx.Queue(maxsize=max_pending_groups or num_workers)
+        self.result_queue = ctx.Queue()
+        self.workers = [
+            ctx.Process(
+                target=_writer_loop,
+                args=(
+                    i,
+                    self.checkpoint_dir,
+                    self.task_queue,
+                    self.result_queue,
+                    checksum_algorithm,
+                ),
+                daemon=True,
+            )
+            for i in range(num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+        # Global shape, dtype and chunks (offsets and sizes) of each ShardedTensor key
+        self.tensors_metadata: Dict[str, Tuple[Tuple[int, ...], torch.dtype]] = {}
+        self.chunks: Dict[str, List[Tuple[Tuple[int, ...], Tuple[int, ...]]]] = defaultdict(list)
+        self.object_keys = set()
+        self.written_bytes = 0
+
+    def write(self, sharded_items: Iterable[Union[ShardedTensor, ShardedObject]]) -> None:
+        """Schedule writing a group of ShardedTensors and ShardedObjects.
+
+        Blocks if `max_pending_groups` groups are already waiting for a writer.
+        The tensors must not be modified until the group is written.
+
+        Args:
+            sharded_items (Iterable[ShardedTensor, ShardedObject]): items to write
+        """
+        items = []
+        for sh_base in sharded_items:
+            if not is_main_replica(sh_base.replica_id):
+                continue
+            if isinstance(sh_base, ShardedObject):
+                if sh_base.unique_key in self.object_keys:
+                    raise CheckpointingException(f'Duplicated ShardedObject {sh_base.unique_key}')
+                self.object_keys.add(sh_base.unique_key)
+                serialized_data = io.BytesIO()
+                torch.save([sh_base.data], serialized_data)
+                items.append((sh_base.unique_key, None, serialized_data.getvalue()))
+                continue
+
+            if not isinstance(sh_base, ShardedTensor) or sh_base.flattened_range is not None:
+                raise CheckpointingException(f'Unsupported item {sh_base}')
+            tensor_metadata = (tuple(sh_base.global_shape), sh_base.dtype)
+            if self.tensors_metadata.setdefault(sh_base.key, tensor_metadata) != tensor_metadata:
+                raise CheckpointingException(
+                    f'Global shape or dtype of {sh_base} does not match the previous chunks'
+                    f' of the key: {self.tensors_metadata[sh_base.key]}'
+                )
+            chunk_sizes = (1,) * sh_base.prepend_axis_num + tuple(sh_base.local_shape)
+            self.chunks[sh_base.key].append((tuple(sh_base.global_offset), chunk_sizes))
+            data = sh_base.data.detach().cpu().reshape(chunk_sizes)
+            items.append((sh_base.key, tuple(sh_base.global_offset), data))
+            self.written_bytes += data.numel() * data.element_size()
+        self.task_queue.put(items)
+
+    def finalize(self, common_state_dict: Optional[StateDict] = None) -> Metadata:
+        """Wait for the writers and write the checkpoint metadata and the common state dict.
+
+        Args:
+            common_state_dict (StateDict, optional): non-sharded part of the checkpoint
+
+        Returns:
+            Metadata: metadata of the written checkpoint
+        """
+        for _ in self.workers:
+            self.task_queue.put(None)
+        results = dict(self.result_queue.get() for _ in self.workers)
+        for worker in self.workers:
+            worker.join()
+        errors = {i: result for i, result in results.items() if isinstance(result, Exception)}
+        if errors:
+            raise CheckpointingException(f'Checkpoint writers failed: {errors}')
+
+        state_dict_metadata: Dict[str, Any] = {}
+        for key, (global_shape, dtype) in self.tensors_metadata.items():
+            chunks = self.chunks[key]
+            _validate_chunks_coverage(key, global_shape, chunks)
+            state_dict_metadata[key] = TensorStorageMetadata(
+                properties=TensorProperties(dtype=dtype),
+                size=torch.Size(global_shape),
+                chunks=[
+                    ChunkStorageMetadata(offsets=torch.Size(offsets), sizes=torch.Size(sizes))
+                    for offsets, sizes in chunks
+                ],
+            )
+        for key in self.object_keys:
+            state_dict_metadata[key] = BytesStorageMetadata()
+
+        storage_data = {}
+        for worker_results in results.values():
+            for key, chunk_offset, storage_info in worker_results:
+                index = MetadataIndex(
+                    key, None if chunk_offset is None else torch.Size(chunk_offset)
+                )
+                storage_data[index] = storage_info
+
+        metadata = Metadata(
+            state_dict_metadata=state_dict_metadata,
+            planner_data={key: (key,) for key in state_dict_metadata},
+            storage_data=storage_data,
+        )
+        with open(self.checkpoint_dir / _metadata_fn, 'wb') as f:
+            pickle.dump(metadata, f)
+        torch.save(common_state_dict or {}, self.checkpoint_dir / COMMON_STATE_FNAME)
+        save_config(CheckpointingConfig('torch_dist', 1), self.checkpoint_dir)
+        logger.info(
+            f'Written {self.written_bytes / 2**30:.2f} GiB of tensors'
+            f' ({len(self.tensors_metadata)} keys, {len(self.object_keys)} objects)'
+            f' to {self.checkpoint_dir} with {len(self.workers)} writers'
+        )
+        return metadata
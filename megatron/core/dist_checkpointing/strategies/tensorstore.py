@@ -14,6 +14,7 @@ from ..core import CheckpointingException
 from ..dict_utils import dict_list_map_inplace
 from ..mapping import ShardedStateDict, ShardedTensor
 from .base import LoadShardedStrategy, StrategyAction, default_strategies
+from .profiling import timed_phase
 from .zarr import (
     load_zarr_based_sharded_metadata,
     numpy_to_torch_dtype_dict,
@@ -40,7 +41,8 @@ class TensorStoreLoadShardedStrategy(LoadShardedStrategy):
             checkpoint_dir=checkpoint_dir,
             load_directly_on_device=self.load_directly_on_device,
         )
-        dict_list_map_inplace(load_fn, sharded_state_dict)
+        with timed_phase('read'):
+            dict_list_map_inplace(load_fn, sharded_state_dict)
         return sharded_state_dict
 
     def load_tensors_metadata(self, checkpoint_dir: Path):
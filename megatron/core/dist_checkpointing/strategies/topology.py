@@ -0,0 +1,179 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+""" Topology-aware distribution of the fully parallel load.
+
+The uniform load distribution (`distribute_shards_to_ranks`) balances the read sizes
+across the whole parallelization group, so most of the loaded shards are then exchanged
+between nodes. With the topology-aware distribution, each shard is read once per node
+which needs it (by one of the node ranks) and exchanged only within the node,
+where the communication goes through NVLink or shared memory instead of the network.
+This trades cross-node exchange for more (parallel) storage reads.
+
+The node of each rank is determined from the environment, see `get_node_id`.
+"""
+
+import logging
+import os
+import socket
+from collections import defaultdict
+from typing import Dict, List, Optional, TypeVar
+
+import torch
+
+from .fully_parallel import distribute_shards_to_ranks
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Environment variables identifying the node of a process, in order of precedence
+NODE_ID_ENV_VARS = ('MCORE_NODE_ID', 'GROUP_RANK', 'SLURM_NODEID')
+
+
+def get_node_id() -> str:
+    """Identifier of the node of this process.
+
+    Taken from the first set environment variable of `NODE_ID_ENV_VARS`
+    (`MCORE_NODE_ID` can be used to override the topology, `GROUP_RANK`
+    is set by torchrun and `SLURM_NODEID` by SLURM). Defaults to the hostname.
+
+    Returns:
+        str: node identifier, equal for all processes of a node
+    """
+    for env_var in NODE_ID_ENV_VARS:
+        if os.environ.get(env_var) is not None:
+            return f'{env_var}={os.environ[env_var]}'
+    return socket.gethostname()
+
+
+def get_node_map(group: Optional[torch.distributed.ProcessGroup] = None) -> List[int]:
+    """Exchanges the node ids between the ranks of the group.
+
+    Args:
+        group (ProcessGroup, optional): process group to get the node map for.
+            Defaults to the default process group.
+
+    Returns:
+        List[int]: node index (in order of the first rank on each node) for each rank of the group
+    """
+    node_ids = [None] * torch.distributed.get_world_size(group)
+    torch.distributed.all_gather_object(node_ids, get_node_id(), group=group)
+    return _node_ids_to_indices(node_ids)
+
+
+def _node_ids_to_indices(node_ids: List[str]) -> List[int]:
+    node_indices = {}
+    return [node_indices.setdefault(node_id, len(node_indices)) for node_id in node_ids]
+
+
+def get_intra_node_group(
+    group: Optional[torch.distributed.ProcessGroup] = None,
+) -> torch.distributed.ProcessGroup:
+    """Creates subgroups of `group` with the ranks on the same node.
+
+    Must be called on all ranks of the default process group
+    (`group` can be different on different ranks, e.g. the DP groups).
+
+    Args:
+        group (ProcessGroup, optional): process group to split. Defaults to the whole world.
+
+    Returns:
+        ProcessGroup: the subgroup of `group` with the ranks on the same node as this rank
+    """
+    if group is None:
+        group = torch.distributed.GroupMember.WORLD
+    group_ranks = tuple(torch.distributed.get_process_group_ranks(group))
+    all_ranks_info = [None] * torch.distributed.get_world_size()
+    torch.distributed.all_gather_object(all_ranks_info, (group_ranks, get_node_id()))
+
+    subgroups_ranks = defaultdict(list)
+    for global_rank, (rank_group_ranks, node_id) in enumerate(all_ranks_info):
+        subgroups_ranks[rank_group_ranks, node_id].append(global_rank)
+
+    # All ranks must create all the groups in the same order
+    this_rank_subgroup = None
+    for subgroup_key in sorted(subgroups_ranks):
+        subgroup_ranks = subgroups_ranks[subgroup_key]
+        subgroup = torch.distributed.new_group(subgroup_ranks)
+        if torch.distributed.get_rank() in subgroup_ranks:
+            this_rank_subgroup = subgroup
+    assert this_rank_subgroup is not None
+    logger.debug(
+        f'Split group of size {len(group_ranks)} into {len(subgroups_ranks)} intra-node groups'
+    )
+    return this_rank_subgroup
+
+
+def distribute_shards_to_ranks_by_node(
+    shard_to_ranks: Dict[T, List[int]], shard_to_size: Dict[T, int], rank_to_node: List[int]
+) -> Dict[int, Dict[T, int]]:
+    """Computes the topology-aware distribution of the workload.
+
+    Each shard is assigned to one rank on each node with a rank which has access to the shard.
+    The workload is balanced within each node with `distribute_shards_to_ranks`.
+
+    Args:
+        shard_to_ranks (Dict[T, List[int]]): mapping which tells which rank have access to which shards
+        shard_to_size (Dict[T, int]): sizes of each shard
+        rank_to_node (List[int]): node of each rank in the parallelization group
+
+    Returns:
+        Dict[int, Dict[T, int]]: assignment of shard to rank for each node
+    """
+    node_to_shard_ranks = defaultdict(dict)
+    for shard_id, shard_ranks in shard_to_ranks.items():
+        ranks_by_node = defaultdict(list)
+        for rank in shard_ranks:
+            ranks_by_node[rank_to_node[rank]].append(rank)
+        for node, node_ranks in ranks_by_node.items():
+            node_to_shard_ranks[node][shard_id] = node_ranks
+    return {
+        node: distribute_shards_to_ranks(node_shard_to_ranks, shard_to_size, len(rank_to_node))
+        for node, node_shard_to_ranks in sorted(node_to_shard_ranks.items())
+    }
+
+
+def simulate_load_exchange(
+    shard_to_ranks: Dict[T, List[int]], shard_to_size: Dict[T, int], rank_to_node: List[int]
+) -> Dict[str, Dict[str, int]]:
+    """Estimates the storage reads and the exchange traffic of the fully parallel load.
+
+    Compares the uniform distribution (each shard read once in the parallelization group
+    and broadcast to the whole group) with the topology-aware one (each shard read once
+    per node and broadcast within the node). A broadcast is assumed to send the shard
+    to each other node once and then to each other rank within the node.
+
+    Args:
+        shard_to_ranks (Dict[T, List[int]]): mapping which tells which rank have access to which shards
+        shard_to_size (Dict[T, int]): sizes of each shard
+        rank_to_node (List[int]): node of each rank in the parallelization group
+
+    Returns:
+        Dict[str, Dict[str, int]]: number of bytes read from the storage ('read'),
+            sent between the nodes ('cross_node') and within the nodes ('intra_node'),
+            for the 'uniform' and the 'topology_aware' distributions
+    """
+    node_sizes = defaultdict(int)
+    for node in rank_to_node:
+        node_sizes[node] += 1
+    num_ranks = len(rank_to_node)
+
+    uniform = dict(read=0, cross_node=0, intra_node=0)
+    for shard_id, rank in distribute_shards_to_ranks(
+        shard_to_ranks, shard_to_size, num_ranks
+    ).items():
+        size = shard_to_size[shard_id]
+        uniform['read'] += size
+        uniform['cross_node'] += size * (len(node_sizes) - 1)
+        uniform['intra_node'] += size * (num_ranks - len(node_sizes))
+
+    topology_aware = dict(read=0, cross_node=0, intra_node=0)
+    for node, node_distribution in distribute_shards_to_ranks_by_node(
+        shard_to_ranks, shard_to_size, rank_to_node
+    ).items():
+        for shard_id in node_distribution:
+            size = shard_to_size[shard_id]
+            topology_aware['read'] += size
+            topology_aware['intra_node'] += size * (node_sizes[node] - 1)
+
+    return dict(uniform=uniform, topology_aware=topology_aware)
@@ -39,6 +39,7 @@ from torch.distributed.checkpoint.default_planner import create_default_local_sa
 from torch.distributed.checkpoint.metadata import Metadata
 from torch.distributed.checkpoint.planner import LoadItemType
 from torch.distributed.checkpoint.planner_helpers import _create_write_items
+from torch.distributed.checkpoint.utils import _DistWrapper
 from torch.futures import Future
 
 from ..core import CheckpointingException
@@ -56,7 +57,10 @@ from ..mapping import (
 )
 from .async_utils import AsyncRequest
 from .base import AsyncSaveShardedStrategy, LoadShardedStrategy, StrategyAction, default_strategies
-from .filesystem_async import FileSystemWriterAsync
+from .compression import CompressionConfig, DecodingFileSystemReader
+from .filesystem_async import DEFAULT_HOST_BUFFER_SIZE, FileSystemWriterAsync
+from .load_plan_cache import LoadPlanCache, get_metadata_key, get_structure_key
+from .profiling import timed_phase
 from .resharding import (
     TensorReformulationMetadata,
     apply_nd_flattened_tensors_reformulation,
@@ -486,6 +490,8 @@ class MCoreLoadPlanner(DefaultLoadPlanner):
         super().__init__(*args, **kwargs)
         self.shapes_validation_sharded_tensors = shapes_validation_sharded_tensors
         self._intermediate_read_item_and_target: Optional[Tuple[ReadItem, torch.Tensor]] = None
+        # Plan of this rank after the global planning, can be cached by the load strategy
+        self.central_plan: Optional[LoadPlan] = None
 
     def _validate_global_shapes(self, metadata, sharded_tensors):
         for sh_ten in sharded_tensors:
@@ -503,8 +509,17 @@ class MCoreLoadPlanner(DefaultLoadPlanner):
                 raise CheckpointingException(_msg)
 
     def create_local_plan(self) -> LoadPlan:
-        self._validate_global_shapes(self.metadata, self.shapes_validation_sharded_tensors)
-        return super().create_local_plan()
+        with timed_phase('planning'):
+            self._validate_global_shapes(self.metadata, self.shapes_validation_sharded_tensors)
+            return super().create_local_plan()
+
+    def create_global_plan(self, global_plan: List[LoadPlan]) -> List[LoadPlan]:
+        with timed_phase('planning'):
+            return super().create_global_plan(global_plan)
+
+    def finish_plan(self, central_plan: LoadPlan) -> LoadPlan:
+        self.central_plan = central_plan
+        return super().finish_plan(central_plan)
 
     def resolve_tensor(self, read_item: ReadItem):
         """Override to add FP8 support.
@@ -557,6 +572,11 @@ class TorchDistSaveShardedStrategy(AsyncSaveShardedStrategy):
         keep_only_main_replica: bool = True,
         thread_count: int = 2,
         cached_metadata: bool = False,
+        incremental: bool = False,
+        pipelined_d2h: bool = False,
+        host_buffer_size: int = DEFAULT_HOST_BUFFER_SIZE,
+        compression: Optional[CompressionConfig] = None,
+        checksum_algorithm: Optional[str] = None,
     ):
         """Adds parameters specific to PyT Distributed format
         Args:
@@ -569,6 +589,23 @@ class TorchDistSaveShardedStrategy(AsyncSaveShardedStrategy):
                 Affects the number of files in the checkpoint (saving ranks * num_threads).
             cached_metadata (bool, optional): Enables using cached global metadata to avoid
                 gathering local metadata every checkpointing invocation
+            incremental (bool, optional): Stores the digests of the written shards in the metadata
+                and, if `base_checkpoint_dir` is set, writes only the shards which changed since
+                the base checkpoint, referencing the unchanged ones from the base checkpoint files.
+                Defaults to False.
+            pipelined_d2h (bool, optional): Copies the tensors to host in the background, through
+                a bounded pool of reusable host buffers, while the already copied data is written.
+                The saved tensors must not be modified before `wait_for_pipelined_d2h_copies`
+                is called. Defaults to False.
+            host_buffer_size (int, optional): size of a single host buffer (in bytes) used
+                with `pipelined_d2h`. The pool has two buffers per thread.
+            compression (CompressionConfig, optional): compresses (and optionally quantizes)
+                the saved tensors. The checkpoints are decoded transparently on load.
+                Defaults to None (no compression).
+            checksum_algorithm (str, optional): stores a checksum (computed while writing)
+                of each written item in the metadata, e.g. 'crc32' or 'xxh3_64'. The checkpoint
+                can then be verified with `integrity.verify_checkpoint` or on load.
+                Defaults to None (no checksums).
         """
         super().__init__(backend, version)
         self.keep_only_main_replica = keep_only_main_replica
@@ -587,6 +624,15 @@ class TorchDistSaveShardedStrategy(AsyncSaveShardedStrategy):
         # The knob to enable cached metadata communication in saving
         self.use_cached_ckpt_structure: bool = cached_metadata
 
+        self.incremental = incremental
+        # The checkpoint referenced by the next incremental save, must be set on all ranks
+        self.base_checkpoint_dir: Optional[Path] = None
+
+        self.pipelined_d2h = pipelined_d2h
+        self.host_buffer_size = host_buffer_size
+        self.compression = compression
+        self.checksum_algorithm = checksum_algorithm
+
     def async_save(
         self,
         sharded_state_dict: ShardedStateDict,
@@ -610,7 +656,16 @@ class TorchDistSaveShardedStrategy(AsyncSaveShardedStrategy):
         )
         pyt_state_dict = mcore_to_pyt_state_dict(sharded_state_dict, False)
         # Use PyT saving mechanism
-        writer = FileSystemWriterAsync(checkpoint_dir, thread_count=self.thread_count)
+        writer = FileSystemWriterAsync(
+            checkpoint_dir,
+            thread_count=self.thread_count,
+            incremental=self.incremental,
+            base_checkpoint_dir=self.base_checkpoint_dir,
+            pipelined_d2h=self.pipelined_d2h,
+            host_buffer_size=self.host_buffer_size,
+            compression=self.compression,
+            checksum_algorithm=self.checksum_algorithm,
+        )
         # This should be set differently if we run in a smaller process group than the default
         coordinator = 0
         # Try twice to validate the generated `central_plan` is the same across iterations
@@ -668,9 +723,10 @@ class TorchDistSaveShardedStrategy(AsyncSaveShardedStrategy):
 
 
 def get_reformulation_metadata(
-    sharded_state_dict: ShardedStateDict, checkpoint_dir: Path
+    sharded_state_dict: ShardedStateDict, checkpoint_dir: Path, ckpt_metadata: Metadata = None
 ) -> Dict[str, TensorReformulationMetadata]:
-    ckpt_metadata = FileSystemReader(checkpoint_dir).read_metadata()
+    if ckpt_metadata is None:
+        ckpt_metadata = FileSystemReader(checkpoint_dir).read_metadata()
     reformulation_metadata = {}
     for sh_ten in nested_values(sharded_state_dict):
         if not is_nd_flattened_tensor(sh_ten):
@@ -690,8 +746,52 @@ def get_reformulation_metadata(
     return reformulation_metadata
 
 
+def _load_state_dict_with_cached_plan(
+    state_dict: Dict[str, Any],
+    storage_reader: DecodingFileSystemReader,
+    planner: MCoreLoadPlanner,
+    metadata: Metadata,
+    central_plan: LoadPlan,
+) -> None:
+    """Same as `checkpoint.load_state_dict`, but without the planning and the plans exchange.
+
+    `central_plan` must be the plan of this rank computed for a state dict
+    with the same structure and a checkpoint with the same metadata.
+    """
+    dist_wrapper = _DistWrapper(None, True, 0)
+    planner.set_up_planner(state_dict, metadata, dist_wrapper.is_coordinator)
+    storage_reader.set_up_storage_reader(metadata, dist_wrapper.is_coordinator)
+
+    def read_data():
+        final_local_plan = planner.finish_plan(central_plan)
+        storage_reader.read_data(final_local_plan, planner).wait()
+
+    # Gathers the read errors, like `checkpoint.load_state_dict`
+    dist_wrapper.all_gather('read', read_data)
+
+
 class TorchDistLoadShardedStrategy(LoadShardedStrategy):
-    """Basic load strategy for the PyT Distributed format."""
+    """Basic load strategy for the PyT Distributed format.
+
+    Args:
+        cached_metadata (bool, optional): Enables caching the load plans, keyed by the sharded
+            state dict structure and the checkpoint tensors layout. Subsequent loads with
+            the same keys on all ranks skip the planning and the plans exchange
+            (and the sharding validation). Defaults to False.
+        verify_checksums (bool, optional): Checks the loaded items against the checksums
+            stored in the metadata (if any) and raises a CheckpointingException
+            for corrupted items. Defaults to False.
+    """
+
+    def __init__(self, cached_metadata: bool = False, verify_checksums: bool = False):
+        super().__init__()
+        self.use_cached_ckpt_structure = cached_metadata
+        self.verify_checksums = verify_checksums
+        self.load_plan_cache = LoadPlanCache()
+
+    @property
+    def validation_cache(self) -> Optional[LoadPlanCache]:
+        return self.load_plan_cache if self.use_cached_ckpt_structure else None
 
     def load(self, sharded_state_dict: ShardedStateDict, checkpoint_dir: Path) -> StateDict:
         """Translates MCore ShardedTensors to PyT ShardedTensors and loads from PyT Distributed format.
@@ -703,9 +803,20 @@ class TorchDistLoadShardedStrategy(LoadShardedStrategy):
 
         Returns: loaded state dict
         """
+        # The metadata is read once and reused by the reader
+        ckpt_metadata = DecodingFileSystemReader(checkpoint_dir).read_metadata()
+        reader = DecodingFileSystemReader(
+            checkpoint_dir, metadata=ckpt_metadata, verify_checksums=self.verify_checksums
+        )
+        cache_key, cached_plan = None, None
+        if self.use_cached_ckpt_structure:
+            cache_key = (get_structure_key(sharded_state_dict), get_metadata_key(ckpt_metadata))
+            cached_plan = self.load_plan_cache.get(cache_key)
+
         # Apply N-D tensors resharding
         sharded_state_dict, formulation_restore_data = apply_nd_flattened_tensors_reformulation(
-            sharded_state_dict, get_reformulation_metadata(sharded_state_dict, checkpoint_dir)
+            sharded_state_dict,
+            get_reformulation_metadata(sharded_state_dict, checkpoint_dir, ckpt_metadata),
         )
 
         flexible_shape_sharded_tensors = [
@@ -723,13 +834,16 @@ class TorchDistLoadShardedStrategy(LoadShardedStrategy):
         ) = _replace_state_dict_keys_with_sharded_keys(sharded_state_dict)
         pyt_state_dict = mcore_to_pyt_state_dict(sharded_state_dict, True)
         # Load PyT Distributed format
-        checkpoint.load_state_dict(
-            pyt_state_dict,
-            FileSystemReader(checkpoint_dir),
-            planner=MCoreLoadPlanner(
-                shapes_validation_sharded_tensors=flexible_shape_sharded_tensors
-            ),
-        )
+        planner = MCoreLoadPlanner(shapes_validation_sharded_tensors=flexible_shape_sharded_tensors)
+        if cached_plan is not None:
+            logger.debug('Using a cached load plan')
+            _load_state_dict_with_cached_plan(
+                pyt_state_dict, reader, planner, ckpt_metadata, cached_plan
+            )
+        else:
+            checkpoint.load_state_dict(pyt_state_dict, reader, planner=planner)
+            if cache_key is not None:
+                self.load_plan_cache.put(cache_key, planner.central_plan)
         pyt_state_dict = cast(
             Dict[str, Union[TorchShardedTensor, List[io.BytesIO]]], pyt_state_dict
         )
@@ -17,6 +17,7 @@ import torch
 from ..dict_utils import dict_list_map_inplace, map_reduce, nested_values
 from ..mapping import ShardedStateDict, ShardedTensor, StateDict
 from .base import LoadShardedStrategy
+from .profiling import record_phase
 from .tensorstore import TensorStoreLoadShardedStrategy, _load_from_array, open_ts_array
 from .zarr import flatten_range, load_zarr_based_sharded_metadata
 
@@ -42,6 +43,7 @@ def timed(verbose=True):
             if verbose:
                 logger.debug(f'{name} took {took}s')
             timers[name].append(took)
+            record_phase(name, took)
             return ret
 
         return wrapped
@@ -17,6 +17,8 @@ from ..core import CheckpointingException
 from ..dict_utils import dict_list_map_inplace, nested_values
 from ..mapping import ShardedStateDict, ShardedTensor, is_main_replica
 from .base import LoadShardedStrategy, SaveShardedStrategy, StrategyAction, default_strategies
+from .compression import CompressionConfig
+from .profiling import timed_phase
 
 logger = logging.getLogger(__name__)
 
@@ -52,23 +54,52 @@ logger = getLogger(__name__)
 
 
 class ZarrSaveShardedStrategy(SaveShardedStrategy):
-    def __init__(self, backend: str, version: int):
+    def __init__(self, backend: str, version: int, compression: Optional[CompressionConfig] = None):
+        """Save strategy for the Zarr format.
+
+        Args:
+            backend (str): format backend string
+            version (int): format version
+            compression (CompressionConfig, optional): if given, the arrays are compressed
+                with Blosc (byte-shuffle and multithreaded zstd/lz4/zlib). Zarr decompresses
+                the arrays transparently on load. Quantization is not supported.
+        """
         super().__init__(backend, version)
         logger.warning(
             f'`zarr` distributed checkpoint backend is deprecated.'
             ' Please switch to PyTorch Distributed format (`torch_dist`).'
         )
+        self.compressor = _get_blosc_compressor(compression) if compression is not None else None
 
     def save(self, sharded_state_dict: ShardedStateDict, checkpoint_dir: Path):
         sharded_tensors = list(nested_values(sharded_state_dict))
-        arrays = _create_or_open_zarr_arrays(sharded_tensors, checkpoint_dir)
-        for ten, arr in zip(sharded_tensors, arrays):
-            _save_to_existing_array(ten, arr)
-        torch.distributed.barrier()
+        with timed_phase('metadata_exchange'):
+            arrays = _create_or_open_zarr_arrays(sharded_tensors, checkpoint_dir, self.compressor)
+        with timed_phase('write'):
+            for ten, arr in zip(sharded_tensors, arrays):
+                _save_to_existing_array(ten, arr)
+        with timed_phase('finalize'):
+            torch.distributed.barrier()
+
+
+def _get_blosc_compressor(compression: CompressionConfig):
+    """Blosc compressor equivalent to the given compression config."""
+    from numcodecs import Blosc, blosc
+
+    if compression.quantize_pattern is not None:
+        raise CheckpointingException('Quantization is not supported with the `zarr` backend')
+    if compression.codec == 'none':
+        return None
+    blosc.set_nthreads(compression.num_threads)
+    return Blosc(
+        cname=compression.codec,
+        clevel=5 if compression.level is None else compression.level,
+        shuffle=Blosc.SHUFFLE if compression.shuffle else Blosc.NOSHUFFLE,
+    )
 
 
 def _create_or_open_zarr_arrays(
-    sharded_tensors: List[ShardedTensor], checkpoint_dir: Path
+    sharded_tensors: List[ShardedTensor], checkpoint_dir: Path, compressor=None
 ) -> List[Optional[zarr.Array]]:
     """Returns list of zarr arrays corresponding to given tensors.
 
@@ -80,10 +111,15 @@ def _create_or_open_zarr_arrays(
     Args:
         sharded_tensors (List[ShardedTensor]): sharded tensors from a given rank that will be saved to checkpoint
         checkpoint_dir (Path): checkpoint in which the arrays will be created
+        compressor (numcodecs.abc.Codec, optional): compressor of the created arrays
     """
     arrays = []
     for ten in sharded_tensors:
-        arr = _create_zarr_array(ten, checkpoint_dir) if _should_create_array(ten) else None
+        arr = (
+            _create_zarr_array(ten, checkpoint_dir, compressor)
+            if _should_create_array(ten)
+            else None
+        )
         arrays.append(arr)
 
     torch.distributed.barrier()
@@ -119,7 +155,8 @@ def _save_to_existing_array(sharded_tensor: ShardedTensor, arr: Optional[zarr.Ar
     assert arr is not None
     x = sharded_tensor.data
     x = x.detach().cpu()
-    torch.cuda.synchronize()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
     if x.dtype == torch.bfloat16:
         x = x.float()
         x = x.numpy()
@@ -133,7 +170,7 @@ def _save_to_existing_array(sharded_tensor: ShardedTensor, arr: Optional[zarr.Ar
         arr.set_coordinate_selection(sharded_tensor.global_coordinates(), x)
 
 
-def _create_zarr_array(sharded_tensor: ShardedTensor, checkpoint_dir: Path):
+def _create_zarr_array(sharded_tensor: ShardedTensor, checkpoint_dir: Path, compressor=None):
     np_dtype = torch_to_numpy_dtype_dict[sharded_tensor.dtype]
     try:
         arr = zarr.create(
@@ -141,7 +178,7 @@ def _create_zarr_array(sharded_tensor: ShardedTensor, checkpoint_dir: Path):
             dtype=np_dtype,
             store=checkpoint_dir / sharded_tensor.key,
             chunks=sharded_tensor.max_allowed_chunks(),
-            compressor=None,
+            compressor=compressor,
             fill_value=None,
             write_empty_chunks=True,
         )
@@ -160,9 +197,10 @@ def _create_zarr_array(sharded_tensor: ShardedTensor, checkpoint_dir: Path):
 
 class ZarrLoadShardedStrategy(LoadShardedStrategy):
     def load(self, sharded_state_dict: ShardedStateDict, checkpoint_dir: Path):
-        dict_list_map_inplace(
-            partial(_load_from_array, checkpoint_dir=checkpoint_dir), sharded_state_dict
-        )
+        with timed_phase('read'):
+            dict_list_map_inplace(
+                partial(_load_from_array, checkpoint_dir=checkpoint_dir), sharded_state_dict
+            )
         return sharded_state_dict
 
     def load_tensors_metadata(self, checkpoint_dir: Path):
@@ -1,11 +1,15 @@
 # Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
-from typing import Dict, List
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import AsyncGenerator, Dict, List, Tuple
 
 import torch
 
 from megatron.core.inference.common_inference_params import CommonInferenceParams
 from megatron.core.inference.engines.abstract_engine import AbstractEngine
-from megatron.core.inference.inference_request import InferenceRequest
+from megatron.core.inference.inference_request import InferenceRequest, Status
 from megatron.core.inference.scheduler import Scheduler
 from megatron.core.inference.text_generation_controllers.simple_text_generation_controller import (
     SimpleTextGenerationController,
@@ -18,6 +22,11 @@ class MCoreEngine(AbstractEngine):
         text_generation_controller: SimpleTextGenerationController,
         max_batch_size,
         random_seed: int = None,
+        max_sequence_length: int = None,
+        num_kv_cache_blocks: int = None,
+        kv_cache_block_size: int = 16,
+        enable_prefix_caching: bool = False,
+        prefix_cache_max_blocks: int = None,
     ):
         """The Megatron core backend constructor
 
@@ -27,13 +36,39 @@ class MCoreEngine(AbstractEngine):
             text_generation_controller (SimpleTextGenerationController): A text generation controller that will be used to define how to preprocess prompts, generate outputs and detokenizer the output tokens.
             max_batch_size : The maxinum number of requests to process at once
             random_seed (int, optional): Use a random seed if you want deterministic results. Defaults to None.
+            max_sequence_length (int, optional): The maximum prompt length plus number of tokens to generate of a request with dynamic batching. Determines the size of the KV cache. Defaults to None, in which case it is the maximum of the pending requests.
+            num_kv_cache_blocks (int, optional): The number of blocks of the paged KV cache used with dynamic batching. The KV cache memory grows with the number of tokens of the requests, so a max_batch_size larger than the number of requests of max_sequence_length tokens that fit in the cache can be used. Defaults to None, in which case max_batch_size requests of max_sequence_length tokens fit in the cache.
+            kv_cache_block_size (int, optional): The number of tokens of a KV cache block. With a multiple of 256 and flash-attn installed, the decode steps read the KV cache through the block tables instead of gathering the blocks. Defaults to 16.
+            enable_prefix_caching (bool, optional): With dynamic batching, keep the KV cache blocks of the requests so that the requests sharing a prefix (e.g. a system prompt) skip its prefill. The statistics are returned by text_generation_controller.get_prefix_cache_stats(). Defaults to False.
+            prefix_cache_max_blocks (int, optional): The maximum number of KV cache blocks kept for prefix caching. Defaults to None, in which case the cached blocks are evicted (least recently used first) only when the KV cache is full.
         """
 
         self.text_generation_controller = text_generation_controller
         self.random_seed = random_seed
+        self.max_sequence_length = max_sequence_length
+        self.num_kv_cache_blocks = num_kv_cache_blocks
+        self.kv_cache_block_size = kv_cache_block_size
+        self.enable_prefix_caching = enable_prefix_caching
+        self.prefix_cache_max_blocks = prefix_cache_max_blocks
         self.scheduler = Scheduler(max_batch_size=max_batch_size)
 
-    def generate(self, prompts: List[str], common_inference_params: CommonInferenceParams) -> dict:
+        # The token queue and the number of streamed tokens of each streamed request
+        self.stream_queues: Dict[str, asyncio.Queue] = {}
+        self.num_streamed_tokens: Dict[str, int] = {}
+        self.engine_loop_task: asyncio.Task = None
+        # The forward steps of the engine loop run in a worker thread so that the event loop keeps
+        # serving the streams. The request pools and the streams are only modified in the event loop.
+        self.step_executor: ThreadPoolExecutor = None
+        self.step_running = False
+        # The requests cancelled during a step, their KV cache blocks are freed after the step
+        self.requests_cancelled_during_step: Dict[str, InferenceRequest] = {}
+
+    def generate(
+        self,
+        prompts: List[str],
+        common_inference_params: CommonInferenceParams,
+        dynamic_generation: bool = False,
+    ) -> List[InferenceRequest]:
         """The megatron core inference backend generate function
 
         This backend returns the output generations as a dictionary. It returns the prompt tokens along with the generated tokens, the prompt plus the generated string and the output log probabilities if requested
@@ -41,35 +76,46 @@ class MCoreEngine(AbstractEngine):
         Args:
             prompts (List[str]): All the prompts as a list of strings
             common_inference_params (CommonInferenceParams): The inference parameters
+            dynamic_generation (bool, optional): Set this to True to use dynamic (continuous) batching. Defaults to False.
 
         Returns:
-            List[InferenceRequest]: The output is list of inference requests containing the generated tokens, texts and log probs if required
+            List[InferenceRequest]: The output is list of inference requests containing the generated tokens, texts and log probs if required, in the order of the prompts
         """
         # TODO :M core- get rng state tracker
         if self.random_seed:
             torch.random.manual_seed(self.random_seed)
 
+        request_ids = []
         for prompt in prompts:
             prompt_tokens = self.text_generation_controller.tokenize_prompt(prompt)
-            self.scheduler.add_request(
+            request_id = self.scheduler.add_request(
                 prompt=prompt,
                 prompt_tokens=prompt_tokens,
                 inference_parameters=common_inference_params,
             )
+            request_ids.append(request_id)
 
-        self.run_engine()
+        self.run_engine(dynamic_generation=dynamic_generation)
 
-        result: List[InferenceRequest] = self.scheduler.completed_request_pool.values()
+        result: List[InferenceRequest] = [
+            self.scheduler.completed_request_pool[request_id] for request_id in request_ids
+        ]
         return result
 
-    def run_engine(self):
+    def run_engine(self, dynamic_generation: bool = False):
         """Main functionality to run inference
 
         Runs the engine until there are no requests in the queue.
 
+        With static batching the active requests are run until all of them complete. With dynamic batching the engine runs one forward step at a time: after every step the completed requests leave the batch and the waiting requests join it, so their prefill runs in the next step together with the decoding of the other requests.
+
         Args:
             dynamic_generation (bool, optional): Set this to True, if you want to enable dynamic batching. Mainly used with an inference server. Defaults to False.
         """
+        if dynamic_generation:
+            self.run_engine_dynamic_batch()
+            return
+
         while self.scheduler.have_requests_pending():
             active_requests: Dict[int, InferenceRequest] = self.scheduler.active_request_pool.copy()
             result_dict: Dict[int, InferenceRequest] = (
@@ -80,13 +126,175 @@ class MCoreEngine(AbstractEngine):
 
             self.scheduler.update_requests_pools(result_dict=result_dict)
 
-        # TODO: Later for dynamic batching we will do something like this
-        """ 
-            if dynamic_batching:
-                result_dict: Dict[
-                    int, InferenceRequest
-                ] = self.text_generation_controller.generate_output_tokens_one_step_dynamic_batch(
-                    active_requests
+    def run_engine_dynamic_batch(self):
+        """Runs the engine with dynamic batching until there are no requests in the queue."""
+        if not self.scheduler.have_requests_pending():
+            return
+        self.prep_model_for_dynamic_batch()
+        while self.scheduler.have_requests_pending():
+            self.run_dynamic_batch_step()
+
+    def prep_model_for_dynamic_batch(self):
+        """Prepares the model and the KV cache of the text generation controller for dynamic batching"""
+        max_sequence_length = self.max_sequence_length
+        if max_sequence_length is None:
+            max_sequence_length = max(
+                len(request.prompt_tokens) + request.inference_parameters.num_tokens_to_generate
+                for request in chain(
+                    self.scheduler.active_request_pool.values(),
+                    self.scheduler.waiting_request_pool.values(),
                 )
-            self.scheduler.update_requests_pools(result_dict=result_dict)         
+            )
+        self.text_generation_controller.prep_model_for_dynamic_batch(
+            max_batch_size=self.scheduler.max_batch_size,
+            max_sequence_length=max_sequence_length,
+            num_kv_cache_blocks=self.num_kv_cache_blocks,
+            kv_cache_block_size=self.kv_cache_block_size,
+            enable_prefix_caching=self.enable_prefix_caching,
+            prefix_cache_max_blocks=self.prefix_cache_max_blocks,
+        )
+
+    def run_dynamic_batch_step(self) -> Dict[int, InferenceRequest]:
+        """Runs one forward step of the active requests and updates the request pools
+
+        Returns:
+            Dict[int, InferenceRequest]: The requests of the step, including the completed ones
+        """
+        active_requests: Dict[int, InferenceRequest] = self.scheduler.active_request_pool.copy()
+        result_dict: Dict[int, InferenceRequest] = (
+            self.text_generation_controller.generate_output_tokens_dynamic_batch(active_requests)
+        )
+
+        self.scheduler.update_requests_pools(result_dict=result_dict)
+        return result_dict
+
+    async def generate_stream(
+        self, prompt: str, common_inference_params: CommonInferenceParams
+    ) -> AsyncGenerator[Tuple[InferenceRequest, int], None]:
+        """Generates the tokens of a prompt with dynamic batching and yields them as they are sampled
+
+        The request joins the dynamic batch of the engine loop, an asyncio task started by the first stream and running while there are requests pending. Other streams can start at any time, their requests join the batch in the next forward step. The forward steps run in a worker thread, so the event loop keeps running the other coroutines during a step.
+
+        Closing the stream (e.g. breaking out of the async for loop or cancelling the task iterating over it) before the request completes cancels the request and frees its KV cache blocks.
+
+        Args:
+            prompt (str): The input prompt
+            common_inference_params (CommonInferenceParams): The inference parameters
+
+        Yields:
+            Tuple[InferenceRequest, int]: The request and each generated token. The request has the time to first token and the inter token latencies, it is completed with the generated text after the last token.
         """
+        assert self.max_sequence_length is not None, (
+            'Streaming needs the max_sequence_length of the engine, the KV cache is allocated'
+            ' before all the requests arrive'
+        )
+        prompt_tokens = self.text_generation_controller.tokenize_prompt(prompt)
+        assert (
+            len(prompt_tokens) + common_inference_params.num_tokens_to_generate
+            <= self.max_sequence_length
+        ), f'The request is longer than the max sequence length {self.max_sequence_length}'
+        request_id = self.scheduler.add_request(
+            prompt=prompt,
+            prompt_tokens=prompt_tokens,
+            inference_parameters=common_inference_params,
+        )
+        request = self.scheduler.active_request_pool.get(
+            request_id
+        ) or self.scheduler.waiting_request_pool.get(request_id)
+        stream_queue = asyncio.Queue()
+        self.stream_queues[request_id] = stream_queue
+        self.num_streamed_tokens[request_id] = 0
+        if self.engine_loop_task is None or self.engine_loop_task.done():
+            self.engine_loop_task = asyncio.get_running_loop().create_task(self.run_engine_loop())
+
+        try:
+            while True:
+                token = await stream_queue.get()
+                if token is None:
+                    return
+                if isinstance(token, Exception):
+                    raise token
+                yield request, token
+        finally:
+            del self.stream_queues[request_id]
+            del self.num_streamed_tokens[request_id]
+            if self.scheduler.cancel_request(request_id) is not None:
+                if self.step_running:
+                    # The request may be in the running step, which still writes its KV cache
+                    self.requests_cancelled_during_step[request_id] = request
+                else:
+                    self.text_generation_controller.cancel_dynamic_batch_request(
+                        request_id, request
+                    )
+            self.scheduler.completed_request_pool.pop(request_id, None)
+
+    async def run_engine_loop(self):
+        """Runs the dynamic batching steps of the streamed requests until there are no requests pending
+
+        The forward steps run in a single worker thread while the event loop waits for them, the request pools are updated and the tokens streamed in the event loop after each step.
+        """
+        loop = asyncio.get_running_loop()
+        if self.step_executor is None:
+            self.step_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='mcore_engine_step'
+            )
+        try:
+            self.prep_model_for_dynamic_batch()
+            while self.scheduler.have_requests_pending():
+                active_requests: Dict[int, InferenceRequest] = (
+                    self.scheduler.active_request_pool.copy()
+                )
+                self.step_running = True
+                try:
+                    result_dict = await loop.run_in_executor(
+                        self.step_executor,
+                        self.text_generation_controller.generate_output_tokens_dynamic_batch,
+                        active_requests,
+                    )
+                finally:
+                    self.step_running = False
+                    self._free_requests_cancelled_during_step()
+                # The requests cancelled during the step have left the request pools
+                result_dict = OrderedDict(
+                    (request_id, request)
+                    for request_id, request in result_dict.items()
+                    if request_id in self.scheduler.active_request_pool
+                )
+                self.scheduler.update_requests_pools(result_dict=result_dict)
+                self._stream_generated_tokens(result_dict)
+        except Exception as e:
+            # The requests can't make progress anymore, so their KV cache blocks are freed right away
+            self._cancel_pending_requests()
+            for stream_queue in self.stream_queues.values():
+                stream_queue.put_nowait(e)
+
+    def _free_requests_cancelled_during_step(self):
+        """Frees the KV cache blocks of the requests cancelled while a step was running"""
+        for request_id, request in self.requests_cancelled_during_step.items():
+            # The step may have updated the status of the request
+            request.status = Status.CANCELLED
+            self.text_generation_controller.cancel_dynamic_batch_request(request_id, request)
+        self.requests_cancelled_during_step.clear()
+
+    def _cancel_pending_requests(self):
+        """Cancels the active and waiting requests and frees their KV cache blocks"""
+        for request_id in list(
+            chain(self.scheduler.active_request_pool, self.scheduler.waiting_request_pool)
+        ):
+            request = self.scheduler.cancel_request(request_id)
+            if request is not None:
+                self.text_generation_controller.cancel_dynamic_batch_request(request_id, request)
+
+    def _stream_generated_tokens(self, result_dict: Dict[int, InferenceRequest]):
+        for request_id, request in result_dict.items():
+            stream_queue = self.stream_queues.get(request_id)
+            if stream_queue is None:
+                continue
+            generated_tokens = request.generated_tokens
+            if torch.is_tensor(generated_tokens):
+                generated_tokens = generated_tokens.tolist()
+            for token in generated_tokens[self.num_streamed_tokens[request_id] :]:
+                stream_queue.put_nowait(token)
+            self.num_streamed_tokens[request_id] = len(generated_tokens)
+            if request.status == Status.COMPLETED:
+                stream_queue.put_nowait(None)
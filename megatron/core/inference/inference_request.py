@@ -14,6 +14,7 @@ class Status(Enum):
     ACTIVE_AND_GENERATING_TOKENS = 2
     ACTIVE_BUT_NOT_GENERATING_TOKENS = 3
     COMPLETED = 4
+    CANCELLED = 5
 
 
 @dataclass
@@ -28,3 +29,24 @@ class InferenceRequest:
     generated_tokens: torch.Tensor = None
     generated_log_probs: torch.Tensor = None
     generated_length: int = 0
+    completion_time: float = None
+    generated_token_times: List[float] = None
+
+    @property
+    def time_to_first_token(self) -> float:
+        """The time from the arrival of the request to its first generated token (dynamic batching only)"""
+        if not self.generated_token_times:
+            return None
+        return self.generated_token_times[0] - self.arrival_time
+
+    @property
+    def inter_token_latencies(self) -> List[float]:
+        """The time between each generated token and the previous one (dynamic batching only)"""
+        if self.generated_token_times is None:
+            return None
+        return [
+            token_time - previous_token_time
+            for previous_token_time, token_time in zip(
+                self.generated_token_times, self.generated_token_times[1:]
+            )
+        ]
@@ -15,6 +15,7 @@ from megatron.core.inference.communication_utils import (
 from megatron.core.inference.model_inference_wrappers.inference_wrapper_config import (
     InferenceWrapperConfig,
 )
+from megatron.core.inference.paged_kv_cache import PagedKVCache
 from megatron.core.inference_params import InferenceParams
 from megatron.core.models.gpt.gpt_model import GPTModel
 
@@ -63,6 +64,48 @@ class AbstractModelInferenceWrapper(abc.ABC):
         batch_size, max_sequence_length = self.prompts_tokens.shape
         self.inference_params = InferenceParams(batch_size, max_sequence_length)
 
+    def prep_model_for_dynamic_inference(
+        self, max_batch_size: int, max_sequence_length: int, paged_kv_cache: PagedKVCache
+    ):
+        """A utility function for preparing model for inference with dynamic batching
+
+        The function gets called once before the dynamic batching loop. In dynamic batching the requests join and leave the batch between the forward steps, so the keys and values are stored in a paged KV cache and each step provides its own inputs (See get_batch_for_dynamic_step)
+
+        Args:
+            max_batch_size (int): The maximum number of requests processed at once
+            max_sequence_length (int): The maximum of the prompt length plus the number of tokens to generate of the requests
+            paged_kv_cache (PagedKVCache): The KV cache with the blocks of the requests
+        """
+        self.model.eval()
+
+        # For TP only model both is_pp_first_stage and _is_pp_last_stage returns True
+        self.model_is_pipeline_parallel = not (
+            parallel_state.is_pipeline_first_stage() and parallel_state.is_pipeline_last_stage()
+        )
+        self.prompts_tokens = None
+        self.inference_params = InferenceParams(
+            max_batch_size, max_sequence_length, paged_kv_cache=paged_kv_cache
+        )
+
+    def get_batch_for_dynamic_step(
+        self,
+        tokens: torch.Tensor,
+        block_tables: torch.Tensor,
+        sequence_len_offsets: torch.Tensor,
+        num_new_tokens: torch.Tensor,
+    ) -> List:
+        """Returns the input data for a dynamic batching step
+
+        This function gets called for every forward step of dynamic batching. Extend this to build position ids, attention mask etc. for the given tokens.
+
+        Args:
+            tokens (torch.Tensor): The input tokens of shape [batch_size, num_tokens]. Each row is padded after its num_new_tokens tokens
+            block_tables (torch.Tensor): The paged KV cache block table of each request of the batch
+            sequence_len_offsets (torch.Tensor): The number of tokens of each request that are already in the KV cache
+            num_new_tokens (torch.Tensor): The number of input tokens of each request
+        """
+        raise NotImplementedError(f'{type(self).__name__} does not support dynamic batching')
+
     @abc.abstractmethod
     def get_batch_for_context_window(self) -> List:
         """Returns the input data for inference
@@ -184,9 +227,17 @@ class AbstractModelInferenceWrapper(abc.ABC):
             if not parallel_state.is_pipeline_first_stage():
                 recv_from_prev_pipeline_rank_(recv_buffer)
 
+            # Dynamic batching uses a separate attention mask for each request
+            attention_mask2use = (
+                attention_mask[start:end, ...] if attention_mask.size(0) > 1 else attention_mask
+            )
+
             self.model.set_input_tensor(recv_buffer)
             output_tensor = self.model(
-                tokens2use, position_ids2use, attention_mask, inference_params=self.inference_params
+                tokens2use,
+                position_ids2use,
+                attention_mask2use,
+                inference_params=self.inference_params,
             )
 
             if not parallel_state.is_pipeline_last_stage():
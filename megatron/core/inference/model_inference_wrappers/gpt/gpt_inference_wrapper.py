@@ -83,3 +83,38 @@ class GPTInferenceWrapper(AbstractModelInferenceWrapper):
         ]
         data_at_step_idx = [tokens2use, positions2use, attention_mask2use]
         return data_at_step_idx
+
+    def get_batch_for_dynamic_step(
+        self,
+        tokens: torch.Tensor,
+        block_tables: torch.Tensor,
+        sequence_len_offsets: torch.Tensor,
+        num_new_tokens: torch.Tensor,
+    ) -> List:
+        """Returns the inference data for a dynamic batching step
+
+        The position ids of each request start at its sequence length offset. The attention mask of shape [batch_size, 1, num_tokens, max_sequence_end] is causal for each request and masks the keys past the end of the request. The block tables and offsets are set in the inference params for the attention layers.
+
+        Args:
+            tokens (torch.Tensor): The input tokens of shape [batch_size, num_tokens]. Each row is padded after its num_new_tokens tokens
+            block_tables (torch.Tensor): The paged KV cache block table of each request of the batch
+            sequence_len_offsets (torch.Tensor): The number of tokens of each request that are already in the KV cache
+            num_new_tokens (torch.Tensor): The number of input tokens of each request
+
+        Returns:
+            List: A list of inputs that will be used by your model in the forward step
+        """
+        self.inference_params.set_paged_batch(block_tables, sequence_len_offsets, num_new_tokens)
+
+        num_tokens = tokens.size(1)
+        sequence_end = int((sequence_len_offsets + num_new_tokens).max())
+        position_ids = sequence_len_offsets.unsqueeze(1) + torch.arange(
+            num_tokens, device=tokens.device
+        )
+        # Keys past the query position are masked (True), padding queries are discarded anyway
+        key_positions = torch.arange(sequence_end, device=tokens.device)
+        attention_mask = key_positions.view(1, 1, 1, -1) > position_ids.view(-1, 1, num_tokens, 1)
+        # Padding positions could exceed the position embeddings
+        position_ids = position_ids.clamp(max=self.inference_params.max_sequence_length - 1)
+
+        return [tokens, position_ids, attention_mask]
@@ -0,0 +1,343 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+import math
+from collections import OrderedDict, deque
+from typing import Dict, Hashable, List
+
+import torch
+
+
+class BlockAllocator:
+    def __init__(self, num_blocks: int):
+        """Free list allocator of the KV cache blocks
+
+        The blocks are reference counted, so that they can be shared by several sequences (e.g. beams or parallel samples of the same prompt). A block returns to the free list when its last reference is freed.
+
+        Args:
+            num_blocks (int): The total number of blocks
+        """
+        self.num_blocks = num_blocks
+        self.free_blocks = deque(range(num_blocks))
+        self.ref_counts = [0] * num_blocks
+
+    @property
+    def num_free_blocks(self) -> int:
+        return len(self.free_blocks)
+
+    def allocate(self) -> int:
+        """Allocates a block with a single reference
+
+        Returns:
+            int: The index of the allocated block
+        """
+        if not self.free_blocks:
+            raise RuntimeError(f'Out of KV cache blocks (all {self.num_blocks} blocks are in use)')
+        block = self.free_blocks.popleft()
+        self.ref_counts[block] = 1
+        return block
+
+    def incref(self, block: int):
+        """Adds a reference to an allocated block"""
+        assert self.ref_counts[block] > 0, f'Block {block} is not allocated'
+        self.ref_counts[block] += 1
+
+    def free(self, block: int):
+        """Removes a reference to the block and frees it if it was the last one"""
+        assert self.ref_counts[block] > 0, f'Block {block} is not allocated'
+        self.ref_counts[block] -= 1
+        if self.ref_counts[block] == 0:
+            self.free_blocks.append(block)
+
+
+class PagedKVCache:
+    def __init__(
+        self,
+        num_blocks: int,
+        block_size: int = 16,
+        enable_prefix_caching: bool = False,
+        max_cached_blocks: int = None,
+    ):
+        """Block based (paged) KV cache
+
+        The keys and values of each attention layer are stored in num_blocks blocks of block_size tokens, allocated lazily by the attention layers in key_value_memory_dict with shape [num_blocks, block_size, num_query_groups, head_dim]. Each sequence (request) has a block table, the list of the blocks holding its tokens in order, so the memory used by a sequence grows with its number of tokens instead of being reserved for the maximum sequence length.
+
+        Sequences can share blocks (See fork and reorder). A shared block is copied before a sequence appends tokens to it (copy-on-write), so beams and parallel samples share the KV cache of their common prefix.
+
+        With prefix caching, the full blocks of the sequences appended with their token ids are kept after the sequences are freed, keyed by a hash of their tokens chained with the hash of the previous block. A new sequence starting with the same tokens reuses these blocks (See match_prefix) instead of computing their keys and values again. The cached blocks which are not used by any sequence are evicted in least recently used order when blocks are allocated and there are no free blocks, or when there are more than max_cached_blocks cached blocks.
+
+        Args:
+            num_blocks (int): The number of blocks of each layer
+            block_size (int, optional): The number of tokens of a block. Defaults to 16.
+            enable_prefix_caching (bool, optional): Cache the blocks of the sequences for the next sequences with the same prefix. Defaults to False.
+            max_cached_blocks (int, optional): The maximum number of cached blocks. Defaults to None, in which case all the blocks can be cached.
+        """
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self.allocator = BlockAllocator(num_blocks)
+        self.block_tables: Dict[Hashable, List[int]] = {}
+        self.sequence_lengths: Dict[Hashable, int] = {}
+        self.key_value_memory_dict = {}
+
+        self.enable_prefix_caching = enable_prefix_caching
+        self.max_cached_blocks = max_cached_blocks
+        # The hash of the tokens of each cached block and the cached block of each hash
+        self.block_hashes: Dict[int, int] = {}
+        self.cached_blocks: Dict[int, int] = {}
+        # The cached blocks which are not used by any sequence, least recently used first
+        self.evictable_blocks: OrderedDict[int, None] = OrderedDict()
+        # The hashes of the full blocks and the tokens of the last block which is not full, of
+        # the sequences appended with their token ids
+        self.sequence_block_hashes: Dict[Hashable, List[int]] = {}
+        self.sequence_tail_tokens: Dict[Hashable, List[int]] = {}
+
+    @property
+    def num_free_blocks(self) -> int:
+        """The number of blocks which can be allocated, including the evictable cached blocks"""
+        return self.allocator.num_free_blocks + len(self.evictable_blocks)
+
+    @property
+    def num_used_blocks(self) -> int:
+        """The number of blocks used by the sequences"""
+        return self.num_blocks - self.num_free_blocks
+
+    @property
+    def num_cached_blocks(self) -> int:
+        return len(self.cached_blocks)
+
+    def sequence_length(self, sequence_id: Hashable) -> int:
+        """The number of tokens of the sequence in the cache"""
+        return self.sequence_lengths.get(sequence_id, 0)
+
+    def num_blocks_to_append(self, sequence_id: Hashable, num_tokens: int) -> int:
+        """The number of blocks to allocate to append num_tokens tokens to the sequence
+
+        Includes the copy of the last block of the sequence if it is shared and not full.
+        """
+        sequence_length = self.sequence_length(sequence_id)
+        block_table = self.block_tables.get(sequence_id, [])
+        num_blocks = math.ceil((sequence_length + num_tokens) / self.block_size) - len(block_table)
+        if (
+            num_tokens > 0
+            and sequence_length % self.block_size != 0
+            and self.allocator.ref_counts[block_table[-1]] > 1
+        ):
+            num_blocks += 1
+        return num_blocks
+
+    def can_append(self, sequence_id: Hashable, num_tokens: int) -> bool:
+        """Whether there are enough free blocks to append num_tokens tokens to the sequence"""
+        return self.num_blocks_to_append(sequence_id, num_tokens) <= self.num_free_blocks
+
+    def append(self, sequence_id: Hashable, num_tokens: int, token_ids: List[int] = None):
+        """Reserves the cache for num_tokens more tokens of the sequence
+
+        Adds the sequence if it does not exist. The tokens are written by the attention layers in the next forward step at the positions following the current sequence length.
+
+        With prefix caching, the blocks filled by the tokens are cached if the token ids of the whole sequence are known. They can be reused by the sequences appended in the same step, because the attention layers write the keys and values of all the sequences of a step before reading them.
+
+        Args:
+            sequence_id (Hashable): The sequence (request) id
+            num_tokens (int): The number of tokens to append
+            token_ids (List[int], optional): The ids of the tokens, used for prefix caching. Defaults to None.
+        """
+        if not self.can_append(sequence_id, num_tokens):
+            raise RuntimeError(
+                f'Out of KV cache blocks: {self.num_blocks_to_append(sequence_id, num_tokens)}'
+                f' blocks are needed for sequence {sequence_id} but {self.num_free_blocks} are free'
+            )
+        sequence_length = self.sequence_length(sequence_id)
+        block_table = self.block_tables.setdefault(sequence_id, [])
+        if num_tokens > 0 and sequence_length % self.block_size != 0:
+            last_block = block_table[-1]
+            if self.allocator.ref_counts[last_block] > 1:
+                block_table[-1] = self._copy_block(last_block)
+                self._free_block(last_block)
+        while len(block_table) * self.block_size < sequence_length + num_tokens:
+            block_table.append(self._allocate_block())
+        self.sequence_lengths[sequence_id] = sequence_length + num_tokens
+
+        if self.enable_prefix_caching:
+            if token_ids is None or (
+                sequence_length > 0 and sequence_id not in self.sequence_block_hashes
+            ):
+                # The tokens of the sequence are unknown
+                self._free_prefix_state(sequence_id)
+            else:
+                assert len(token_ids) == num_tokens
+                self._cache_full_blocks(sequence_id, token_ids)
+
+    def _allocate_block(self) -> int:
+        if self.allocator.num_free_blocks == 0 and self.evictable_blocks:
+            self._evict_block()
+        return self.allocator.allocate()
+
+    def _incref_block(self, block: int):
+        self.allocator.incref(block)
+        self.evictable_blocks.pop(block, None)
+
+    def _free_block(self, block: int):
+        self.allocator.free(block)
+        if block in self.block_hashes and self.allocator.ref_counts[block] == 1:
+            # Only the prefix cache holds the block
+            self.evictable_blocks[block] = None
+            self._evict_blocks_over_budget()
+
+    def _evict_block(self):
+        block, _ = self.evictable_blocks.popitem(last=False)
+        del self.cached_blocks[self.block_hashes.pop(block)]
+        self.allocator.free(block)
+
+    def _evict_blocks_over_budget(self):
+        if self.max_cached_blocks is None:
+            return
+        while len(self.cached_blocks) > self.max_cached_blocks and self.evictable_blocks:
+            self._evict_block()
+
+    @staticmethod
+    def _hash_block(parent_hash: int, token_ids: List[int]) -> int:
+        return hash((parent_hash, tuple(token_ids)))
+
+    def _cache_full_blocks(self, sequence_id: Hashable, token_ids: List[int]):
+        block_hashes = self.sequence_block_hashes.setdefault(sequence_id, [])
+        tail_tokens = self.sequence_tail_tokens.setdefault(sequence_id, [])
+        tail_tokens.extend(token_ids)
+        block_table = self.block_tables[sequence_id]
+        while len(tail_tokens) >= self.block_size:
+            parent_hash = block_hashes[-1] if block_hashes else 0
+            block_hash = self._hash_block(parent_hash, tail_tokens[: self.block_size])
+            del tail_tokens[: self.block_size]
+            block = block_table[len(block_hashes)]
+            block_hashes.append(block_hash)
+            if block_hash in self.cached_blocks or block in self.block_hashes:
+                continue
+            # The prefix cache holds a reference to the block
+            self.allocator.incref(block)
+            self.block_hashes[block] = block_hash
+            self.cached_blocks[block_hash] = block
+        self._evict_blocks_over_budget()
+
+    def _free_prefix_state(self, sequence_id: Hashable):
+        self.sequence_block_hashes.pop(sequence_id, None)
+        self.sequence_tail_tokens.pop(sequence_id, None)
+
+    def match_prefix(self, sequence_id: Hashable, token_ids: List[int]) -> int:
+        """Adds a sequence starting with the longest cached prefix of its tokens
+
+        The sequence shares the cached blocks of the prefix, so only the following tokens need to be appended and computed. At least the last token is not matched, so that the forward step of the sequence computes its logits.
+
+        Args:
+            sequence_id (Hashable): The id of the new sequence
+            token_ids (List[int]): The tokens of the sequence
+
+        Returns:
+            int: The number of tokens of the sequence in the cache, a multiple of the block size. Always 0 without prefix caching.
+        """
+        assert sequence_id not in self.block_tables, f'Sequence {sequence_id} already exists'
+        if not self.enable_prefix_caching:
+            return 0
+        block_table, block_hashes = [], []
+        parent_hash = 0
+        for start in range(0, len(token_ids) - self.block_size, self.block_size):
+            block_hash = self._hash_block(parent_hash, token_ids[start : start + self.block_size])
+            block = self.cached_blocks.get(block_hash)
+            if block is None:
+                break
+            self._incref_block(block)
+            block_table.append(block)
+            block_hashes.append(block_hash)
+            parent_hash = block_hash
+        self.block_tables[sequence_id] = block_table
+        self.sequence_lengths[sequence_id] = len(block_table) * self.block_size
+        self.sequence_block_hashes[sequence_id] = block_hashes
+        self.sequence_tail_tokens[sequence_id] = []
+        return len(block_table) * self.block_size
+
+    def _copy_block(self, block: int) -> int:
+        new_block = self._allocate_block()
+        for key_blocks, value_blocks in self.key_value_memory_dict.values():
+            key_blocks[new_block].copy_(key_blocks[block])
+            value_blocks[new_block].copy_(value_blocks[block])
+        return new_block
+
+    def fork(self, parent_sequence_id: Hashable, child_sequence_id: Hashable):
+        """Creates a sequence sharing all the blocks of the parent sequence
+
+        Used for parallel samples and beams, the blocks are copied only when written to.
+
+        Args:
+            parent_sequence_id (Hashable): The sequence to fork
+            child_sequence_id (Hashable): The id of the new sequence, replaced if it exists
+        """
+        parent_block_table = self.block_tables.get(parent_sequence_id, [])
+        for block in parent_block_table:
+            self._incref_block(block)
+        parent_prefix_state = self._get_prefix_state(parent_sequence_id)
+        self.free(child_sequence_id)
+        self.block_tables[child_sequence_id] = list(parent_block_table)
+        self.sequence_lengths[child_sequence_id] = self.sequence_length(parent_sequence_id)
+        self._set_prefix_state(child_sequence_id, parent_prefix_state)
+
+    def _get_prefix_state(self, sequence_id: Hashable):
+        if sequence_id not in self.sequence_block_hashes:
+            return None
+        return (
+            list(self.sequence_block_hashes[sequence_id]),
+            list(self.sequence_tail_tokens[sequence_id]),
+        )
+
+    def _set_prefix_state(self, sequence_id: Hashable, prefix_state):
+        if prefix_state is not None:
+            self.sequence_block_hashes[sequence_id], self.sequence_tail_tokens[sequence_id] = (
+                prefix_state
+            )
+
+    def reorder(self, sequence_ids: List[Hashable], parent_sequence_ids: List[Hashable]):
+        """Replaces each sequence by a fork of the corresponding parent sequence
+
+        Used to reorder the beams without copying the cache.
+
+        Args:
+            sequence_ids (List[Hashable]): The sequences to replace
+            parent_sequence_ids (List[Hashable]): The parent of each sequence, from the sequences before the reordering
+        """
+        parent_block_tables = [list(self.block_tables.get(p, [])) for p in parent_sequence_ids]
+        parent_sequence_lengths = [self.sequence_length(p) for p in parent_sequence_ids]
+        parent_prefix_states = [self._get_prefix_state(p) for p in parent_sequence_ids]
+        for block_table in parent_block_tables:
+            for block in block_table:
+                self._incref_block(block)
+        for sequence_id, block_table, sequence_length, prefix_state in zip(
+            sequence_ids, parent_block_tables, parent_sequence_lengths, parent_prefix_states
+        ):
+            self.free(sequence_id)
+            self.block_tables[sequence_id] = block_table
+            self.sequence_lengths[sequence_id] = sequence_length
+            self._set_prefix_state(sequence_id, prefix_state)
+
+    def free(self, sequence_id: Hashable):
+        """Removes the sequence and frees its blocks which are not shared or cached"""
+        # The last blocks of the sequence are evicted first
+        for block in reversed(self.block_tables.pop(sequence_id, [])):
+            self._free_block(block)
+        self.sequence_lengths.pop(sequence_id, None)
+        self._free_prefix_state(sequence_id)
+
+    def get_block_tables(self, sequence_ids: List[Hashable], device=None) -> torch.Tensor:
+        """Returns the block tables of the sequences as a tensor
+
+        Args:
+            sequence_ids (List[Hashable]): The sequences of the batch
+            device (optional): The device of the tensor
+
+        Returns:
+            torch.Tensor: A tensor of shape [batch_size, max_num_blocks], the shorter block tables are padded with block 0
+        """
+        block_tables = [self.block_tables.get(sequence_id, []) for sequence_id in sequence_ids]
+        max_num_blocks = max(1, max(len(block_table) for block_table in block_tables))
+        return torch.tensor(
+            [
+                block_table + [0] * (max_num_blocks - len(block_table))
+                for block_table in block_tables
+            ],
+            dtype=torch.long,
+            device=device,
+        )
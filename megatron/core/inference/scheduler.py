@@ -42,6 +42,9 @@ class Scheduler:
             prompt_tokens (torch.Tensor): A torch tensor having the input prompts tokenized
             inference_parameters (CommonInferenceParams): The inference parameters
             arrival_time (float, optional): The incoming request time. Defaults to None.
+
+        Returns:
+            str: The request id of the added request
         """
         request_id = str(next(self.request_counter))
 
@@ -68,6 +71,8 @@ class Scheduler:
         else:
             self.waiting_request_pool[request_id] = inference_request
 
+        return request_id
+
     def have_requests_pending(self) -> bool:
         """Method to check if there are requests pending
 
@@ -107,6 +112,7 @@ class Scheduler:
             # If a request has completed put it into the completed request pool.
             if active_request.status == Status.COMPLETED:
                 completed_request = self.active_request_pool.pop(result_request_id)
+                completed_request.completion_time = time.time()
                 self.completed_request_pool[result_request_id] = completed_request
 
         # If the active request pool is not full, add waiting requests in FIFO order
@@ -115,3 +121,28 @@ class Scheduler:
             and len(self.waiting_request_pool) > 0
         ):
             self.add_earliest_waiting_request_to_active_pool()
+
+    def cancel_request(self, request_id: str) -> InferenceRequest:
+        """Cancel an active or waiting request
+
+        The cancelled request is removed from its pool and the waiting requests fill the active request pool in FIFO order.
+
+        Args:
+            request_id (str): The id of the request to cancel
+
+        Returns:
+            InferenceRequest: The cancelled request, or None if the request is not active or waiting (e.g. it has completed)
+        """
+        request = self.active_request_pool.pop(request_id, None)
+        if request is None:
+            request = self.waiting_request_pool.pop(request_id, None)
+        if request is None:
+            return None
+        request.status = Status.CANCELLED
+
+        while (
+            len(self.active_request_pool) < self.max_batch_size
+            and len(self.waiting_request_pool) > 0
+        ):
+            self.add_earliest_waiting_request_to_active_pool()
+        return request
@@ -1,8 +1,9 @@
 # Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+import math
+import time
 from typing import List, OrderedDict, Tuple
 
 import torch
-import torch.nn.functional as F
 
 from megatron.core import parallel_state
 from megatron.core.inference.common_inference_params import CommonInferenceParams
@@ -11,6 +12,9 @@ from megatron.core.inference.inference_request import InferenceRequest, Status
 from megatron.core.inference.model_inference_wrappers.abstract_model_inference_wrapper import (
     AbstractModelInferenceWrapper,
 )
+from megatron.core.inference.paged_kv_cache import PagedKVCache
+from megatron.core.inference.utils import num_prefill_floating_point_operations
+from megatron.core.tensor_parallel import target_log_probs
 
 
 class SimpleTextGenerationController:
@@ -31,6 +35,9 @@ class SimpleTextGenerationController:
             parallel_state.is_pipeline_first_stage() and parallel_state.is_pipeline_last_stage()
         )
 
+        self.paged_kv_cache = None
+        self.reset_prefix_cache_stats()
+
     def tokenize_prompt(self, prompt: str) -> Tuple[torch.Tensor, torch.Tensor]:
         """Utility to tokenize the input prompts
 
@@ -188,6 +195,160 @@ class SimpleTextGenerationController:
 
         return torch.tensor(batch_prompt_tokens_list).cuda()
 
+    def prep_model_for_dynamic_batch(
+        self,
+        max_batch_size: int,
+        max_sequence_length: int,
+        num_kv_cache_blocks: int = None,
+        kv_cache_block_size: int = 16,
+        enable_prefix_caching: bool = False,
+        prefix_cache_max_blocks: int = None,
+    ):
+        """Prepare the model and the paged KV cache for dynamic batching
+
+        Needs to be called before the first call to generate_output_tokens_dynamic_batch when no requests are in flight. The paged KV cache of the previous call is kept if it has enough blocks of the same size, so that the cached prefixes are reused across calls.
+
+        Args:
+            max_batch_size (int): The maximum number of requests in a dynamic batch
+            max_sequence_length (int): The maximum of the prompt length plus the number of tokens to generate of the requests
+            num_kv_cache_blocks (int, optional): The number of blocks of the paged KV cache. Defaults to None, in which case max_batch_size requests of max_sequence_length tokens fit in the cache.
+            kv_cache_block_size (int, optional): The number of tokens of a KV cache block. Defaults to 16.
+            enable_prefix_caching (bool, optional): Reuse the KV cache blocks of the previous requests with the same prefix (See PagedKVCache). Defaults to False.
+            prefix_cache_max_blocks (int, optional): The maximum number of KV cache blocks kept for prefix caching. Defaults to None, in which case the cached blocks are evicted only when the KV cache is full.
+        """
+        if num_kv_cache_blocks is None:
+            num_kv_cache_blocks = max_batch_size * math.ceil(
+                max_sequence_length / kv_cache_block_size
+            )
+        paged_kv_cache = self.paged_kv_cache
+        if (
+            paged_kv_cache is None
+            or paged_kv_cache.num_blocks < num_kv_cache_blocks
+            or paged_kv_cache.block_size != kv_cache_block_size
+            or paged_kv_cache.enable_prefix_caching != enable_prefix_caching
+        ):
+            self.paged_kv_cache = PagedKVCache(
+                num_kv_cache_blocks,
+                kv_cache_block_size,
+                enable_prefix_caching=enable_prefix_caching,
+                max_cached_blocks=prefix_cache_max_blocks,
+            )
+        else:
+            paged_kv_cache.max_cached_blocks = prefix_cache_max_blocks
+        self.inference_wrapped_model.prep_model_for_dynamic_inference(
+            max_batch_size=max_batch_size,
+            max_sequence_length=max_sequence_length,
+            paged_kv_cache=self.paged_kv_cache,
+        )
+        self.max_sequence_length = max_sequence_length
+
+    def reset_prefix_cache_stats(self):
+        """Resets the prefix caching statistics (See get_prefix_cache_stats)"""
+        self.num_prefill_tokens = 0
+        self.num_prefix_cache_hit_tokens = 0
+        self.prefix_cache_saved_flops = 0
+
+    def get_prefix_cache_stats(self) -> dict:
+        """Returns the prefix caching statistics of the dynamic batching since the last reset
+
+        Returns:
+            dict: The number of prefill tokens (prompt tokens and generated tokens of the preempted requests), the number of them found in the prefix cache, the hit rate, the number of forward floating point operations saved by the prefix cache and the number of cached KV cache blocks
+        """
+        return {
+            'num_prefill_tokens': self.num_prefill_tokens,
+            'num_hit_tokens': self.num_prefix_cache_hit_tokens,
+            'hit_rate': self.num_prefix_cache_hit_tokens / max(1, self.num_prefill_tokens),
+            'saved_flops': self.prefix_cache_saved_flops,
+            'num_cached_blocks': (
+                self.paged_kv_cache.num_cached_blocks if self.paged_kv_cache is not None else 0
+            ),
+        }
+
+    def _schedule_dynamic_batch_step(
+        self, active_requests: OrderedDict[int, InferenceRequest]
+    ) -> Tuple[List[int], List[List[int]], List[int]]:
+        """Selects the requests of the next dynamic batching step and reserves their KV cache
+
+        Each running request appends its last generated token to the KV cache. When the KV cache is full, the latest running requests are preempted: their blocks are freed and they run their prefill again (prompt and generated tokens) once there are free blocks. The new requests join the step in FIFO order while their prompt fits in the free blocks. With prefix caching, the prefill of a request starts after the longest prefix of its tokens found in the KV cache.
+
+        Args:
+            active_requests (OrderedDict[int, InferenceRequest]): The input active requests.
+
+        Returns:
+            Tuple[List[int], List[List[int]], List[int]]: The ids, input tokens and sequence length offsets of the requests of the step
+        """
+        paged_kv_cache = self.paged_kv_cache
+        running_request_ids = [
+            request_id
+            for request_id, request in active_requests.items()
+            if request.status == Status.ACTIVE_AND_GENERATING_TOKENS
+        ]
+        preempted_request_ids = set()
+        while (
+            sum(
+                paged_kv_cache.num_blocks_to_append(request_id, 1)
+                for request_id in running_request_ids
+            )
+            > paged_kv_cache.num_free_blocks
+        ):
+            preempted_request_id = running_request_ids.pop()
+            paged_kv_cache.free(preempted_request_id)
+            active_requests[preempted_request_id].status = Status.ACTIVE_BUT_NOT_GENERATING_TOKENS
+            preempted_request_ids.add(preempted_request_id)
+
+        step_request_ids, batch_input_tokens, sequence_len_offsets = [], [], []
+        for request_id in running_request_ids:
+            # The last generated token is not in the KV cache yet
+            step_request_ids.append(request_id)
+            input_tokens = [active_requests[request_id].generated_tokens[-1]]
+            batch_input_tokens.append(input_tokens)
+            sequence_len_offsets.append(paged_kv_cache.sequence_length(request_id))
+            paged_kv_cache.append(request_id, 1, input_tokens)
+
+        for request_id, request in active_requests.items():
+            if (
+                request.status != Status.ACTIVE_BUT_NOT_GENERATING_TOKENS
+                or request_id in preempted_request_ids
+            ):
+                continue
+            if request.generated_tokens is None:
+                assert (
+                    len(request.prompt_tokens) + request.inference_parameters.num_tokens_to_generate
+                    <= self.max_sequence_length
+                ), f'Request {request_id} is longer than the max sequence length {self.max_sequence_length}'
+                request.generated_length = 0
+                request.generated_tokens = []
+                request.generated_token_times = []
+                request.generated_log_probs = (
+                    [] if request.inference_parameters.return_log_probs else None
+                )
+            input_tokens = list(request.prompt_tokens) + request.generated_tokens
+            num_cached_tokens = paged_kv_cache.match_prefix(request_id, input_tokens)
+            input_tokens = input_tokens[num_cached_tokens:]
+            if not paged_kv_cache.can_append(request_id, len(input_tokens)):
+                paged_kv_cache.free(request_id)
+                break
+            paged_kv_cache.append(request_id, len(input_tokens), input_tokens)
+            request.status = Status.ACTIVE_AND_GENERATING_TOKENS
+            step_request_ids.append(request_id)
+            batch_input_tokens.append(input_tokens)
+            sequence_len_offsets.append(num_cached_tokens)
+
+            self.num_prefill_tokens += num_cached_tokens + len(input_tokens)
+            if num_cached_tokens > 0:
+                self.num_prefix_cache_hit_tokens += num_cached_tokens
+                self.prefix_cache_saved_flops += num_prefill_floating_point_operations(
+                    self.inference_wrapped_model.model.config,
+                    self.tokenizer.vocab_size,
+                    num_cached_tokens,
+                )
+
+        assert step_request_ids, (
+            f'The KV cache ({paged_kv_cache.num_blocks} blocks of {paged_kv_cache.block_size}'
+            f' tokens) is too small for a single request'
+        )
+        return step_request_ids, batch_input_tokens, sequence_len_offsets
+
     def generate_output_tokens_dynamic_batch(
         self,
         active_requests: OrderedDict[int, InferenceRequest],
@@ -196,13 +357,101 @@ class SimpleTextGenerationController:
 
         This utility generates the output tokens for a dynamic batch. It will run one forward step at a time, and pass control back to the engine, which will update the request pool and call this method again.
 
+        The keys and values of the requests are stored in the paged KV cache, which grows with their number of tokens. The new requests run their prefill (the whole prompt) in the same forward step as the decoding of the other requests, which only pass their last generated token. The requests which don't fit in the KV cache wait in the active pool (See _schedule_dynamic_batch_step). The generated tokens and log probs are lists until the request completes, when they are converted to tensors, the text is detokenized and the KV cache blocks are freed.
+
         Args:
             active_requests (OrderedDict[int, InferenceRequest]): The input active requests.
 
         Returns:
             OrderedDict[int, InferenceRequest]: The result for each of the incoming requests after running one forward step.
         """
-        raise Exception("Not implemented yet")
+        device = torch.cuda.current_device()
+        step_request_ids, batch_input_tokens, sequence_len_offsets = (
+            self._schedule_dynamic_batch_step(active_requests)
+        )
+        block_tables = self.paged_kv_cache.get_block_tables(step_request_ids, device=device)
+
+        batch_size = len(batch_input_tokens)
+        num_new_tokens = [len(input_tokens) for input_tokens in batch_input_tokens]
+        num_tokens = max(num_new_tokens)
+        for input_tokens in batch_input_tokens:
+            input_tokens.extend([self.tokenizer.eod] * (num_tokens - len(input_tokens)))
+        batch_input_tokens = torch.tensor(batch_input_tokens, device=device)
+        sequence_len_offsets = torch.tensor(sequence_len_offsets, device=device)
+        num_new_tokens = torch.tensor(num_new_tokens, device=device)
+
+        with torch.no_grad():
+            inference_input = self.inference_wrapped_model.get_batch_for_dynamic_step(
+                batch_input_tokens, block_tables, sequence_len_offsets, num_new_tokens
+            )
+            # Returns the final logits of shape [batch_size, num_tokens, vocab_size]
+            logits = self.inference_wrapped_model.run_one_forward_step(inference_input)
+            if self.model_is_pipeline_parallel:
+                logits = broadcast_from_last_pipeline_stage(
+                    [batch_size, num_tokens, self.tokenizer.vocab_size],
+                    dtype=torch.float32,
+                    tensor=logits,
+                )
+            last_token_logits = logits[torch.arange(batch_size, device=device), num_new_tokens - 1]
+
+            # The requests of a dynamic batch can have different inference parameters
+            requests = [active_requests[request_id] for request_id in step_request_ids]
+            indices_by_inference_params = {}
+            for idx, request in enumerate(requests):
+                indices_by_inference_params.setdefault(
+                    id(request.inference_parameters), (request.inference_parameters, [])
+                )[1].append(idx)
+            sampled_tokens = torch.empty(batch_size, dtype=torch.long, device=device)
+            for common_inference_params, indices in indices_by_inference_params.values():
+                sampled_tokens[indices] = self.sample_from_logits(
+                    last_token_logits[indices], common_inference_params, self.tokenizer.vocab_size
+                )
+
+            log_probs = None
+            if any(request.inference_parameters.return_log_probs for request in requests):
+                log_probs = target_log_probs(last_token_logits, sampled_tokens).tolist()
+
+        sampling_time = time.time()
+        for idx, (request_id, request) in enumerate(zip(step_request_ids, requests)):
+            sampled_token = int(sampled_tokens[idx])
+            reached_eod = sampled_token == self.tokenizer.eod
+            if not reached_eod:
+                request.generated_tokens.append(sampled_token)
+                request.generated_token_times.append(sampling_time)
+                if request.generated_log_probs is not None:
+                    request.generated_log_probs.append(log_probs[idx])
+                request.generated_length += 1
+            if (
+                reached_eod
+                or request.generated_length >= request.inference_parameters.num_tokens_to_generate
+            ):
+                self._complete_dynamic_batch_request(request_id, request)
+
+        return active_requests
+
+    def _complete_dynamic_batch_request(self, request_id: str, request: InferenceRequest):
+        """Frees the KV cache blocks of the request and converts its generations to tensors"""
+        self.paged_kv_cache.free(request_id)
+        device = torch.cuda.current_device()
+        request.generated_tokens = torch.tensor(
+            request.generated_tokens, dtype=torch.long, device=device
+        )
+        if request.generated_log_probs is not None:
+            request.generated_log_probs = torch.tensor(
+                request.generated_log_probs, dtype=torch.float32, device=device
+            )
+        request.status = Status.COMPLETED
+        request.generated_text = self.detokenize_generations(request.generated_tokens)
+
+    def cancel_dynamic_batch_request(self, request_id: str, request: InferenceRequest):
+        """Frees the KV cache blocks of a request removed from the dynamic batch before its completion
+
+        Args:
+            request_id (str): The id of the request
+            request (InferenceRequest): The cancelled request
+        """
+        if self.paged_kv_cache is not None:
+            self.paged_kv_cache.free(request_id)
 
     def generate_all_output_tokens_static_batch(
         self,
@@ -227,16 +476,21 @@ class SimpleTextGenerationController:
         max_prompt_length_in_batch = max(prompt_lengths_in_batch)
         min_prompt_length_in_batch = min(prompt_lengths_in_batch)
 
-        # For batch inference the inference params are the same for all request
+        # For batch inference the sampling params are the same for all request
         common_inference_params: CommonInferenceParams = list(active_requests.values())[
             0
         ].inference_parameters
+        # The batch runs until the request with the most tokens to generate completes
+        max_tokens_to_generate = max(
+            request.inference_parameters.num_tokens_to_generate
+            for request in active_requests.values()
+        )
 
         # max_seq_len = max_prompt_length_in_batch + num_tokens_to_generate
         batch_prompt_tokens = self.pad_input_prompt_tokens(
             batch_prompt_tokens_list,
             max_prompt_length_in_batch=max_prompt_length_in_batch,
-            num_tokens_to_generate=common_inference_params.num_tokens_to_generate,
+            num_tokens_to_generate=max_tokens_to_generate,
         )
         batch_size, max_sequence_length = batch_prompt_tokens.shape
 
@@ -290,17 +544,14 @@ class SimpleTextGenerationController:
                 ]
 
                 if common_inference_params.return_log_probs:
-                    log_probs = F.log_softmax(logits, dim=2)
-                    indices = torch.unsqueeze(
-                        batch_prompt_tokens[
-                            :, (context_start_position + 1) : (context_end_position + 1)
-                        ],
-                        2,
+                    indices = batch_prompt_tokens[
+                        :, (context_start_position + 1) : (context_end_position + 1)
+                    ]
+                    # Get the log probabilities for only the prompt tokens, without computing the
+                    # log softmax of the whole vocabulary
+                    output_log_probs[:, context_start_position:context_end_position] = (
+                        target_log_probs(logits, indices)
                     )
-                    # Get the log probabilities for only the prompt tokens
-                    output_log_probs[:, context_start_position:context_end_position] = torch.gather(
-                        log_probs, 2, indices
-                    ).squeeze(2)
 
                 context_start_position = context_end_position
 
@@ -325,15 +576,18 @@ class SimpleTextGenerationController:
         if common_inference_params.return_log_probs:
             output_log_probs = output_log_probs[:, :context_end_position]
 
-        generated_sequence_lengths[
-            generated_sequence_lengths > common_inference_params.num_tokens_to_generate
-        ] = common_inference_params.num_tokens_to_generate
+        generated_sequence_lengths[generated_sequence_lengths > max_tokens_to_generate] = (
+            max_tokens_to_generate
+        )
 
         for idx, request in enumerate(active_requests.values()):
             input_prompt_length = int(prompt_lengths_in_batch[idx])
             # Shorter prompts might have generated more than required tokens. So we trim them down
             required_sequence_length = int(
-                min(generated_sequence_lengths[idx], common_inference_params.num_tokens_to_generate)
+                min(
+                    generated_sequence_lengths[idx],
+                    request.inference_parameters.num_tokens_to_generate,
+                )
             )
             # Extract only the generated tokens
             required_result_tokens = batch_prompt_tokens_with_generations[
@@ -1,4 +1,7 @@
 # Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+from megatron.core.transformer.transformer_config import TransformerConfig
+
+
 class Counter:
     """A simple counter class
 
@@ -15,3 +18,42 @@ class Counter:
 
     def reset(self) -> None:
         self.counter = 0
+
+
+def num_prefill_floating_point_operations(
+    config: TransformerConfig, vocab_size: int, num_tokens: int
+) -> int:
+    """The number of floating point operations of the forward step of a GPT model over the first num_tokens tokens of a sequence
+
+    Counts the matrix multiplications (2 operations per multiply-add) of the linear layers, the causal attention and the output layer of all the tokens, as in the training FLOPs estimate without the backward pass. Used to report the compute saved by the prefix cache.
+
+    Args:
+        config (TransformerConfig): The transformer config of the model
+        vocab_size (int): The vocabulary size of the output layer
+        num_tokens (int): The number of tokens of the prefill
+
+    Returns:
+        int: The number of floating point operations
+    """
+    query_projection_size = config.kv_channels * config.num_attention_heads
+    key_value_projection_size = 2 * config.kv_channels * config.num_query_groups
+    num_experts_routed_to = 1 if config.num_moe_experts is None else config.moe_router_topk
+    # The first MLP layer of the gated linear units has two outputs
+    mlp_size = config.ffn_hidden_size * (3 if config.gated_linear_unit else 2)
+    linear_flops_per_token = (
+        2
+        * config.hidden_size
+        * (
+            query_projection_size
+            + key_value_projection_size
+            + query_projection_size
+            + mlp_size * num_experts_routed_to
+        )
+    )
+    # The token at position i attends to i + 1 tokens, with the query-key and attention-value products
+    attention_flops = 2 * 2 * query_projection_size * num_tokens * (num_tokens + 1) // 2
+    output_layer_flops = 2 * config.hidden_size * vocab_size * num_tokens
+    return (
+        config.num_layers * (linear_flops_per_token * num_tokens + attention_flops)
+        + output_layer_flops
+    )
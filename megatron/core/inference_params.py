@@ -1,20 +1,70 @@
 # Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+import torch
+
+
 class InferenceParams:
     """Inference parameters that are passed to the main model in order
     to efficienly calculate and store the context during inference."""
 
-    def __init__(self, max_batch_size, max_sequence_length):
+    def __init__(self, max_batch_size, max_sequence_length, paged_kv_cache=None):
         self.max_sequence_length = max_sequence_length
         self.max_batch_size = max_batch_size
         self.sequence_len_offset = 0
         self.batch_size_offset = 0
         self.key_value_memory_dict = {}
+        # With a paged KV cache (megatron.core.inference.paged_kv_cache.PagedKVCache) the keys
+        # and values are stored in blocks, read and written through the block tables
+        self.paged_kv_cache = paged_kv_cache
+        if paged_kv_cache is not None:
+            self.key_value_memory_dict = paged_kv_cache.key_value_memory_dict
+        # Set for every step with the paged KV cache, see `set_paged_batch`
+        self.block_tables = None
+        self.sequence_len_offsets = None
+        self.num_new_tokens = None
+
+    def set_paged_batch(self, block_tables, sequence_len_offsets=None, num_new_tokens=None):
+        """Set the paged KV cache layout of the batch for the next forward step.
+
+        With static batching (no offsets) all the requests continue from `sequence_len_offset`.
+        In dynamic batching every request of the batch continues from its own position.
+        The inputs of a step are then [batch_size, num_tokens], padded to the largest
+        number of new tokens.
+
+        Args:
+            block_tables (torch.Tensor): [batch_size, max_num_blocks] KV cache blocks
+                of each request of the batch
+            sequence_len_offsets (torch.Tensor, optional): number of tokens of each request
+                already in the KV cache (position of its first input token)
+            num_new_tokens (torch.Tensor, optional): number of (not padding) input tokens
+                of each request
+        """
+        self.block_tables = block_tables
+        self.sequence_len_offsets = sequence_len_offsets
+        self.num_new_tokens = num_new_tokens
+
+    def prepare_paged_step(self, num_tokens):
+        """Reserve the paged KV cache for a static batching step of num_tokens tokens.
+
+        The rows of the batch are the sequences 0..max_batch_size-1 of the paged KV cache.
+        Must be called once before each forward step (not for each micro batch).
+        """
+        sequence_ids = list(range(self.max_batch_size))
+        for sequence_id in sequence_ids:
+            self.paged_kv_cache.append(sequence_id, num_tokens)
+        self.set_paged_batch(
+            self.paged_kv_cache.get_block_tables(sequence_ids, device=torch.cuda.current_device())
+        )
 
     def swap_key_value_dict(self, batch_idx):
         "swap between batches"
         if len(self.key_value_memory_dict) == 0:
             raise ValueError("should not swap when dict in empty")
 
+        if self.paged_kv_cache is not None:
+            # The sequences share the blocks of their new beam instead of copying the cache
+            self.paged_kv_cache.reorder(list(range(len(batch_idx))), batch_idx.tolist())
+            return
+
         for layer_number in self.key_value_memory_dict.keys():
             inference_key_memory, inference_value_memory = self.key_value_memory_dict[layer_number]
             assert (
@@ -230,3 +230,38 @@ def vocab_parallel_cross_entropy(vocab_parallel_logits, target, label_smoothing=
                          default is no smoothing (=0.0)
     """
     return _VocabParallelCrossEntropy.apply(vocab_parallel_logits, target, label_smoothing)
+
+
+def target_log_probs(
+    logits: torch.Tensor, target: torch.Tensor, max_chunk_numel: int = 2**24
+) -> torch.Tensor:
+    """
+    Computes the log probabilities of the target tokens from the logits of the whole vocabulary,
+    equal to torch.gather(F.log_softmax(logits, dim=-1), -1, target.unsqueeze(-1)).squeeze(-1)
+
+    The log_softmax is computed in chunks of rows and only the target values are kept, so the
+    temporary memory is bounded by max_chunk_numel fp32 values instead of a log_softmax output
+    of the size of the logits.
+
+    Args:
+        logits: logits of dimension [..., vocab_size]
+
+        target: vocab ids of dimension [...]
+
+        max_chunk_numel: maximum number of logits of a chunk
+
+    Returns:
+        The fp32 log probabilities of dimension [...]
+    """
+    vocab_size = logits.size(-1)
+    logits_2d = logits.reshape(-1, vocab_size)
+    target_2d = target.reshape(-1, 1)
+    log_probs = torch.empty(target_2d.size(0), dtype=torch.float32, device=logits.device)
+    chunk_size = max(1, max_chunk_numel // vocab_size)
+    for start in range(0, logits_2d.size(0), chunk_size):
+        end = min(start + chunk_size, logits_2d.size(0))
+        log_probs_chunk = torch.log_softmax(logits_2d[start:end].float(), dim=-1)
+        log_probs[start:end] = torch.gather(log_probs_chunk, -1, target_2d[start:end]).squeeze(-1)
+        # Frees the chunk before the next one is allocated
+        del log_probs_chunk
+    return log_probs.view_as(target)
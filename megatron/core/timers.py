@@ -46,6 +46,9 @@ class DummyTimer(TimerBase):
     def elapsed(self, reset=True, barrier=False):
         raise Exception('dummy timer should not be used to calculate elapsed time')
 
+    def add_elapsed(self, elapsed):
+        return
+
 
 class Timer(TimerBase):
     """
@@ -109,6 +112,15 @@ class Timer(TimerBase):
         self._active_time += elapsed
         self._started = False
 
+    def add_elapsed(self, elapsed):
+        """Add time measured outside of the timer, e.g. in another process.
+
+        Args:
+            elapsed (float): Elapsed time in seconds.
+        """
+        self._elapsed += elapsed
+        self._active_time += elapsed
+
     def reset(self):
         """Reset timer.
         """
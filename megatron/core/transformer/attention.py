@@ -39,6 +39,11 @@ if HAVE_TE:
 else:
     SplitAlongDim = None
 
+try:
+    from flash_attn import flash_attn_with_kvcache
+except ImportError:
+    flash_attn_with_kvcache = None
+
 
 @dataclass
 class SelfAttentionSubmodules:
@@ -186,6 +191,11 @@ class Attention(MegatronModule, ABC):
         if inference_params is None:
             return key, value, rotary_pos_emb, attn_mask_type
 
+        if inference_params.paged_kv_cache is not None:
+            return self._adjust_key_value_for_paged_inference(
+                inference_params, key, value, rotary_pos_emb
+            )
+
         # =================================================
         # Pre-allocate memory for key-values for inference.
         # =================================================
@@ -236,6 +246,140 @@ class Attention(MegatronModule, ABC):
 
         return key, value, rotary_pos_emb, attn_mask_type
 
+    def _adjust_key_value_for_paged_inference(self, inference_params, key, value, rotary_pos_emb):
+        """
+        Paged KV cache version of `_adjust_key_value_for_inference`.
+
+        The keys and values are stored in the blocks of the paged KV cache, in the blocks
+        of the block table of each request (see `InferenceParams.set_paged_batch`).
+        With dynamic batching each request writes its new tokens at its own sequence offset
+        and the padding tokens are not written. The keys are stored rotated, so the returned
+        rotary_pos_emb has no key embedding.
+
+        In the decode steps, if flash-attn is installed (and the block size is a multiple of
+        256, which it requires) the attention reads the blocks through the block tables (see
+        `_paged_attention`) and the returned key and value are None. Otherwise the keys and
+        values are gathered through the block tables and span the longest request of the batch,
+        so the attention mask must cover both the causality and the padding.
+
+        Returns a tuple: (key, value, rotary_pos_emb, attn_mask_type)
+        """
+        paged_kv_cache = inference_params.paged_kv_cache
+        block_size = paged_kv_cache.block_size
+        if self.layer_number not in inference_params.key_value_memory_dict:
+            # [num_blocks, block_size, ng, hn]. The blocks past the end of the shorter requests
+            # are masked in the attention, but must not contain NaNs
+            key_blocks = self._allocate_memory(paged_kv_cache.num_blocks, block_size, key.dtype)
+            value_blocks = self._allocate_memory(paged_kv_cache.num_blocks, block_size, value.dtype)
+            key_blocks.zero_()
+            value_blocks.zero_()
+            inference_params.key_value_memory_dict[self.layer_number] = (key_blocks, value_blocks)
+        else:
+            key_blocks, value_blocks = inference_params.key_value_memory_dict[self.layer_number]
+
+        batch_start = inference_params.batch_size_offset
+        batch_end = batch_start + key.size(1)
+        block_tables = inference_params.block_tables[batch_start:batch_end]
+        offsets, sequence_ends = self._get_paged_sequence_ends(inference_params, key)
+        if inference_params.sequence_len_offsets is None:
+            # Static batching, all the requests continue from the same offset
+            attn_mask_type = self.attn_mask_type
+            if inference_params.sequence_len_offset > 0:
+                attn_mask_type = AttnMaskType.no_mask
+            sequence_end = inference_params.sequence_len_offset + key.size(0)
+        else:
+            attn_mask_type = AttnMaskType.arbitrary
+            sequence_end = None
+
+        # [sq, b] positions of the input tokens
+        positions = offsets + torch.arange(key.size(0), device=offsets.device).unsqueeze(1)
+        is_new_token = positions < sequence_ends
+        if rotary_pos_emb is not None:
+            # The keys are rotated by their positions before they are stored and the queries
+            # by the positions of each request: [s, 1, 1, d] -> [sq, b, 1, d]
+            q_pos_emb, k_pos_emb = rotary_pos_emb
+            key = apply_rotary_pos_emb(
+                key, k_pos_emb[:, 0][positions.clamp(max=k_pos_emb.size(0) - 1)], config=self.config
+            )
+            if inference_params.sequence_len_offsets is None:
+                q_pos_emb = q_pos_emb[inference_params.sequence_len_offset : sequence_end, :, :, :]
+            else:
+                q_pos_emb = q_pos_emb[:, 0][positions.clamp(max=q_pos_emb.size(0) - 1)]
+            rotary_pos_emb = (q_pos_emb, None)
+        new_positions = positions[is_new_token]
+        new_rows = torch.arange(key.size(1), device=offsets.device).expand_as(positions)[
+            is_new_token
+        ]
+        new_blocks = block_tables[new_rows, new_positions // block_size]
+        key_blocks[new_blocks, new_positions % block_size] = key[is_new_token]
+        value_blocks[new_blocks, new_positions % block_size] = value[is_new_token]
+
+        if self._can_use_paged_attention(inference_params, key):
+            return None, None, rotary_pos_emb, attn_mask_type
+
+        # Gather the tokens of the block tables in a single copy:
+        # [num_blocks * block_size, ng, hn] -> [sequence_end, b, ng, hn]
+        if sequence_end is None:
+            sequence_end = int(sequence_ends.max())
+        assert (sequence_end + block_size - 1) // block_size <= block_tables.size(1)
+        token_positions = torch.arange(sequence_end, device=block_tables.device)
+        # [sequence_end, b] indices of the tokens in the flattened blocks
+        slots = block_tables.t()[token_positions // block_size] * block_size + (
+            token_positions % block_size
+        ).unsqueeze(1)
+        key = key_blocks.flatten(0, 1)[slots]
+        value = value_blocks.flatten(0, 1)[slots]
+
+        return key, value, rotary_pos_emb, attn_mask_type
+
+    def _get_paged_sequence_ends(self, inference_params, key):
+        """Returns the offsets and the number of tokens (with the new ones) of the requests"""
+        batch_start = inference_params.batch_size_offset
+        batch_end = batch_start + key.size(1)
+        if inference_params.sequence_len_offsets is None:
+            offsets = torch.full(
+                (key.size(1),),
+                inference_params.sequence_len_offset,
+                device=inference_params.block_tables.device,
+            )
+            return offsets, offsets + key.size(0)
+        offsets = inference_params.sequence_len_offsets[batch_start:batch_end]
+        return offsets, offsets + inference_params.num_new_tokens[batch_start:batch_end]
+
+    def _can_use_paged_attention(self, inference_params, key):
+        """Whether the attention can read the paged KV cache through the block tables"""
+        return (
+            flash_attn_with_kvcache is not None
+            and not self.training
+            # Decode steps, every request has one new token so there is no padding to mask
+            and key.size(0) == 1
+            and key.is_cuda
+            and key.dtype in (torch.float16, torch.bfloat16)
+            # flash-attn requires the paged KV cache block size to be a multiple of 256
+            and inference_params.paged_kv_cache.block_size % 256 == 0
+        )
+
+    def _paged_attention(self, query, inference_params):
+        """Attention of the queries over the paged KV cache, read through the block tables
+
+        Returns the attention output of shape [sq, b, np * hn]
+        """
+        key_blocks, value_blocks = inference_params.key_value_memory_dict[self.layer_number]
+        batch_start = inference_params.batch_size_offset
+        batch_end = batch_start + query.size(1)
+        _, sequence_ends = self._get_paged_sequence_ends(inference_params, query)
+        # [sq, b, np, hn] -> [b, sq, np, hn]
+        output = flash_attn_with_kvcache(
+            query.transpose(0, 1),
+            key_blocks,
+            value_blocks,
+            cache_seqlens=sequence_ends.int(),
+            block_table=inference_params.block_tables[batch_start:batch_end].int(),
+            causal=True,
+        )
+        # [b, sq, np, hn] -> [sq, b, np * hn]
+        return output.transpose(0, 1).reshape(query.size(0), query.size(1), -1)
+
     @abstractmethod
     def get_query_key_value_tensors(self, hidden_states, key_value_states):
         """
@@ -294,12 +438,14 @@ class Attention(MegatronModule, ABC):
                 config=self.config,
                 cu_seqlens=cu_seqlens_q,
             )
-            key = apply_rotary_pos_emb(
-                key,
-                k_pos_emb,
-                config=self.config,
-                cu_seqlens=cu_seqlens_kv,
-            )
+            # The keys of the paged KV cache are rotated before they are stored
+            if k_pos_emb is not None:
+                key = apply_rotary_pos_emb(
+                    key,
+                    k_pos_emb,
+                    config=self.config,
+                    cu_seqlens=cu_seqlens_kv,
+                )
 
             # TODO, can apply positional embedding to value_layer so it has
             # absolute positional embedding.
@@ -310,7 +456,10 @@ class Attention(MegatronModule, ABC):
         # core attention computation
         # ==================================
 
-        if self.checkpoint_core_attention and self.training:
+        if key is None:
+            # The keys and values are read through the block tables of the paged KV cache
+            core_attn_out = self._paged_attention(query, inference_params)
+        elif self.checkpoint_core_attention and self.training:
             core_attn_out = self._checkpointed_attention_forward(
                 query,
                 key,
@@ -18,8 +18,13 @@ class ForwardStep:
     We use a class here to hide the inference parameters
     from the outside caller."""
 
-    def __init__(self, model, max_batch_size, max_sequence_length):
-        """Set values so we don't need to do it multiple times."""
+    def __init__(self, model, max_batch_size, max_sequence_length,
+                 paged_kv_cache=None):
+        """Set values so we don't need to do it multiple times.
+
+        With a paged KV cache (mcore models only), the keys and values are
+        stored in blocks, which are shared instead of copied when the beams
+        are reordered."""
         # Make sure model is in eval mode.
         assert not isinstance(model, Iterable), \
             'interleaving schedule is not supported for inference'
@@ -27,7 +32,8 @@ class ForwardStep:
         self.model = model
         # Initialize inference parameters.
         self.inference_params = InferenceParams(max_batch_size,
-                                                max_sequence_length)
+                                                max_sequence_length,
+                                                paged_kv_cache=paged_kv_cache)
         # Pipelining arguments.
         args = get_args()
         self.pipeline_size_larger_than_one = (
@@ -42,6 +48,8 @@ class ForwardStep:
     def __call__(self, tokens, position_ids, attention_mask):
         """Invocation of the forward methods. Note that self.inference_params
         is being modified by the forward step."""
+        if self.inference_params.paged_kv_cache is not None:
+            self.inference_params.prepare_paged_step(tokens.size(1))
         # Pipelining case.
         if self.pipeline_size_larger_than_one:
             current_batch_x_seqlen = tokens.size(0) * tokens.size(1)
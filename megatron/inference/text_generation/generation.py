@@ -2,11 +2,15 @@
 
 """Generation utilities."""
 
+import math
+
 import torch
 import torch.nn.functional as F
 
 from megatron.training import get_args, get_tokenizer
 from megatron.core import mpu
+from megatron.core.inference.paged_kv_cache import PagedKVCache
+from megatron.core.tensor_parallel import target_log_probs
 from megatron.training.utils import get_ltor_masks_and_position_ids
 from .communication import (
     copy_from_last_to_first_pipeline_stage,
@@ -70,14 +74,12 @@ def score_and_return_on_first_stage(model, tokens, lengths):
         if mpu.is_pipeline_last_stage():
             # Always the last stage should have an output.
             assert logits is not None
-            log_probs = F.log_softmax(logits, dim=2)
 
             # Pick the tokens that we need to get the log
             # probabilities for. Note that next input token is
             # the token which we selected in the current logits,
             # so shift by 1.
-            indices = torch.unsqueeze(tokens[:, 1:], 2)
-            output_log_probs = torch.gather(log_probs, 2, indices).squeeze(2)
+            output_log_probs = target_log_probs(logits, tokens[:, 1:])
 
     # ======================================
     # Broadcast to the first pipeline stage.
@@ -221,20 +223,18 @@ def generate_tokens_probs_and_return_on_first_stage(
 
                 # Calculate the log probabilities.
                 if return_output_log_probs:
-                    log_probs = F.log_softmax(logits, dim=2)
-                    if return_output_log_probs:
-                        # Pick the tokens that we need to get the log
-                        # probabilities for. Note that next input token is
-                        # the token which we selected in the current logits,
-                        # so shift by 1.
-                        indices = torch.unsqueeze(
-                            tokens[
-                                :,
-                                (prev_context_length + 1):(context_length + 1)],
-                            2)
-                        output_log_probs[:,
-                                         prev_context_length:context_length] = \
-                            torch.gather(log_probs, 2, indices).squeeze(2)
+                    # Pick the tokens that we need to get the log
+                    # probabilities for. Note that next input token is
+                    # the token which we selected in the current logits,
+                    # so shift by 1. Only the log probabilities of these
+                    # tokens are computed, not the log softmax of the
+                    # whole vocabulary.
+                    indices = tokens[
+                        :,
+                        (prev_context_length + 1):(context_length + 1)]
+                    output_log_probs[:,
+                                     prev_context_length:context_length] = \
+                        target_log_probs(logits, indices)
 
             # Update the tokens on the first stage so the next input to
             # the network is correct.
@@ -308,7 +308,16 @@ def beam_search_and_return_on_first_stage(model, forward_step, tokens, lengths,
         raise ValueError("context length + tokens_to_generate too large")
 
     # forward step.
-    forward_step = forward_step(model, beam_size, final_sequence_length)
+    block_size = args.inference_kv_cache_block_size
+    if args.use_legacy_models or block_size is None:
+        forward_step = forward_step(model, beam_size, final_sequence_length)
+    else:
+        # The beams share the KV cache blocks of their common prefix
+        # instead of copying the cache when they are reordered.
+        paged_kv_cache = PagedKVCache(
+            beam_size * math.ceil(final_sequence_length / block_size), block_size)
+        forward_step = forward_step(model, beam_size, final_sequence_length,
+                                    paged_kv_cache=paged_kv_cache)
 
     beam_hyp = BeamHypotheses(beam_size, length_penalty)
     best_batches = None
@@ -9,6 +9,7 @@ import numpy as np
 from torch.utils.data import Dataset
 from megatron.training import get_args
 from megatron.core import mpu
+from megatron.core.datasets.data_loading_profiler import profiled_collate
 
 
 def build_pretraining_data_loader(dataset, consumed_samples):
@@ -35,6 +36,14 @@ def build_pretraining_data_loader(dataset, consumed_samples):
             data_parallel_rank=mpu.get_data_parallel_rank(),
             data_parallel_size=mpu.get_data_parallel_world_size(),
             data_sharding=args.data_sharding)
+    elif args.dataloader_type == 'resumable':
+        batch_sampler = MegatronPretrainingResumableSampler(
+            total_samples=len(dataset),
+            consumed_samples=consumed_samples,
+            micro_batch_size=args.micro_batch_size,
+            data_parallel_rank=mpu.get_data_parallel_rank(),
+            data_parallel_size=mpu.get_data_parallel_world_size(),
+            seed=args.seed if args.resumable_dataloader_shuffle else None)
     elif args.dataloader_type == "external":
         # External dataloaders are passed through. User is expected to provide a
         # torch-compatible dataloader and define samplers, if needed.
@@ -47,6 +56,7 @@ def build_pretraining_data_loader(dataset, consumed_samples):
     return torch.utils.data.DataLoader(dataset,
                                        batch_sampler=batch_sampler,
                                        num_workers=args.num_workers,
+                                       collate_fn=profiled_collate if args.profile_data_loading else None,
                                        pin_memory=True,
                                        persistent_workers=True if args.num_workers > 0 else False,
                                        )
@@ -190,3 +200,149 @@ class MegatronPretrainingRandomSampler:
                 self.consumed_samples += self.micro_batch_times_data_parallel_size
                 yield batch
                 batch = []
+
+
+def permute_index(index, size, seed):
+    """Map an index in [0, size) to its position in a seeded pseudo-random permutation.
+
+    The permutation is a 4-round Feistel network over the smallest domain of an even
+    number of bits which covers size, where indices outside [0, size) are walked back
+    into range. Any position of the permutation is thus computed in O(1), without
+    materializing the permutation.
+    """
+    assert 0 <= index < size
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    while True:
+        left, right = index >> half_bits, index & mask
+        for round_ in range(4):
+            left, right = right, left ^ (_feistel_round(right, seed, round_) & mask)
+        index = (left << half_bits) | right
+        if index < size:
+            return index
+
+
+def _feistel_round(value, seed, round_):
+    """SplitMix64 hash of the value, seed, and round."""
+    x = (value + (seed << 2) + round_ + 1) * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
+
+
+class MegatronPretrainingResumableSampler:
+    """Sampler over a global sample cursor which resumes in O(1) from any position.
+
+    Global sample position p reads dataset index p % total_samples, and epochs repeat
+    indefinitely. Each micro batch of a global batch takes the next micro_batch_size
+    positions of the cursor in data parallel rank order, so the samples are read in the
+    same order as MegatronPretrainingSampler, and the position a run resumes from depends
+    only on the number of samples consumed, not on the data parallel size or the batch
+    size which consumed them.
+
+    The datasets already shuffle their samples. When a seed is given, position p instead
+    reads dataset index permute_index(p % total_samples, total_samples, seed + epoch) for
+    epoch p // total_samples, which reshuffles each epoch.
+    """
+
+    def __init__(self, total_samples, consumed_samples, micro_batch_size,
+                 data_parallel_rank, data_parallel_size, seed=None):
+        # Keep a copy of input params for later use.
+        self.total_samples = total_samples
+        self.consumed_samples = consumed_samples
+        self.micro_batch_size = micro_batch_size
+        self.data_parallel_rank = data_parallel_rank
+        self.data_parallel_size = data_parallel_size
+        self.micro_batch_times_data_parallel_size = \
+            self.micro_batch_size * data_parallel_size
+        self.seed = seed
+
+        # Sanity checks.
+        assert self.total_samples > 0, \
+            'no sample to consume: {}'.format(self.total_samples)
+        assert self.consumed_samples >= 0
+        assert self.micro_batch_size > 0
+        assert data_parallel_size > 0
+        assert self.data_parallel_rank < data_parallel_size, \
+            'data_parallel_rank should be smaller than data size: {}, ' \
+            '{}'.format(self.data_parallel_rank, data_parallel_size)
+
+    def __len__(self):
+        return self.total_samples
+
+    def get_epoch_seed(self, epoch):
+        return None if self.seed is None else self.seed + epoch
+
+    def get_index(self, position):
+        """Return the dataset index at a global sample position."""
+        epoch, offset = divmod(position, self.total_samples)
+        if self.seed is None:
+            return offset
+        return permute_index(offset, self.total_samples, self.get_epoch_seed(epoch))
+
+    def state_dict(self, consumed_samples=None):
+        if consumed_samples is None:
+            consumed_samples = self.consumed_samples
+        epoch, offset = divmod(consumed_samples, self.total_samples)
+        return {
+            'consumed_samples': consumed_samples,
+            'total_samples': self.total_samples,
+            'epoch': epoch,
+            'epoch_offset': offset,
+            'epoch_seed': self.get_epoch_seed(epoch),
+            'seed': self.seed,
+        }
+
+    def load_state_dict(self, state_dict):
+        if state_dict['total_samples'] != self.total_samples or state_dict['seed'] != self.seed:
+            print('WARNING: resuming the data iterator with total samples {} and seed {} '
+                  'from a state with total samples {} and seed {}'.format(
+                      self.total_samples, self.seed,
+                      state_dict['total_samples'], state_dict['seed']), flush=True)
+        self.consumed_samples = state_dict['consumed_samples']
+
+    def __iter__(self):
+        position = self.consumed_samples + self.data_parallel_rank * self.micro_batch_size
+        while True:
+            yield [self.get_index(p) for p in range(position, position + self.micro_batch_size)]
+            position += self.micro_batch_times_data_parallel_size
+
+
+class ResumableDataIterator:
+    """Iterator over a dataloader with a MegatronPretrainingResumableSampler which tracks the
+    samples consumed by training, as opposed to those prefetched by the dataloader workers,
+    and which saves and restores that position.
+    """
+
+    def __init__(self, dataloader):
+        self.dataloader = dataloader
+        self.sampler = dataloader.batch_sampler
+        assert isinstance(self.sampler, MegatronPretrainingResumableSampler)
+        self.consumed_samples = self.sampler.consumed_samples
+        # The dataloader iterator, which starts the workers, is created on first use so that
+        # restoring the state beforehand does not start them twice
+        self._iterator = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = iter(self.dataloader)
+        batch = next(self._iterator)
+        self.consumed_samples += self.sampler.micro_batch_times_data_parallel_size
+        return batch
+
+    def save_state(self):
+        state_dict = self.sampler.state_dict(self.consumed_samples)
+        state_dict['dataset_hash'] = getattr(self.dataloader.dataset, 'unique_description_hash', None)
+        return state_dict
+
+    def restore_state(self, state_dict):
+        dataset_hash = getattr(self.dataloader.dataset, 'unique_description_hash', None)
+        if state_dict.get('dataset_hash') != dataset_hash:
+            print('WARNING: resuming the data iterator on a different dataset', flush=True)
+        self.sampler.load_state_dict(state_dict)
+        self.consumed_samples = self.sampler.consumed_samples
+        # Seek by restarting the dataloader, if it was started, at the restored cursor
+        self._iterator = None
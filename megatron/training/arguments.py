@@ -154,8 +154,11 @@ def load_retro_args(args):
 def validate_args(args, defaults={}):
 
     # Temporary
-    assert args.non_persistent_ckpt_type in ['global', None], \
-        'Currently only global checkpoints are supported'
+    assert args.non_persistent_ckpt_type in ['global', 'local', None], \
+        'Currently only global and local checkpoints are supported'
+    if args.non_persistent_ckpt_type == 'local':
+        assert args.non_persistent_local_ckpt_dir is not None, \
+            '--non-persistent-local-ckpt-dir is required for local non-persistent checkpoints'
 
     # Load saved args from Retro (if applicable).
     load_retro_args(args)
@@ -328,6 +331,7 @@ def validate_args(args, defaults={}):
 
     # data
     assert args.num_dataset_builder_threads > 0
+    assert args.num_dataset_builder_processes >= 0
 
     # Consumed tokens.
     args.consumed_train_samples = 0
@@ -408,6 +412,19 @@ def validate_args(args, defaults={}):
             'seq-length should be a multiple of 2 * context-parallel-size ' \
             'if context-parallel-size > 1.'
 
+    if args.sequence_packing:
+        assert not args.use_legacy_models, \
+            'sequence packing is not supported with legacy models.'
+        assert args.context_parallel_size == 1, \
+            'sequence packing is not supported with context parallelism.'
+        assert args.pipeline_model_parallel_size <= 2, \
+            'sequence packing requires every pipeline stage to be a first or last stage.'
+        if args.create_attention_mask_in_dataloader:
+            args.create_attention_mask_in_dataloader = False
+            if args.rank == 0:
+                print('WARNING: Setting args.create_attention_mask_in_dataloader to False '
+                      'since packed sequences are delimited by cu_seqlens.', flush=True)
+
     if args.seq_length is not None:
         assert args.encoder_seq_length is None
         args.encoder_seq_length = args.seq_length
@@ -602,6 +619,25 @@ def validate_args(args, defaults={}):
     if args.dist_ckpt_format_deprecated and args.rank == 0:
         print('--dist-ckpt-format is deprecated and has no effect.'
               ' Use --ckpt-format to select the checkpoint format.')
+    if args.ckpt_incremental:
+        assert args.ckpt_format == 'torch_dist', \
+            '--ckpt-incremental works only with the torch_dist checkpoint format'
+    if args.ckpt_pipelined_d2h:
+        assert args.ckpt_format == 'torch_dist', \
+            '--ckpt-pipelined-d2h works only with the torch_dist checkpoint format'
+    if args.ckpt_compression is not None:
+        assert args.ckpt_format in ('torch_dist', 'zarr'), \
+            '--ckpt-compression works only with the torch_dist and zarr checkpoint formats'
+    if args.ckpt_quantize_adam_moments:
+        assert args.ckpt_format == 'torch_dist', \
+            '--ckpt-quantize-adam-moments works only with the torch_dist checkpoint format'
+        # Otherwise the distributed optimizer stores the moments in a single object per DP group
+        assert not args.use_distributed_optimizer or args.ckpt_fully_parallel_save, \
+            '--ckpt-quantize-adam-moments with --use-distributed-optimizer requires the' \
+            ' fully parallel save (remove --no-ckpt-fully-parallel-save)'
+    if args.ckpt_checksums:
+        assert args.ckpt_format == 'torch_dist', \
+            '--ckpt-checksums works only with the torch_dist checkpoint format'
 
     # Print arguments.
     _print_args("arguments", args)
@@ -718,6 +754,13 @@ def _add_inference_args(parser):
                        choices=["megatron", "huggingface"],
                        help='Select either Megatron or Huggingface as the '
                        'Bert embedder.')
+    group.add_argument('--inference-kv-cache-block-size', type=int, default=None,
+                       help='Store the KV cache of beam search (mcore models) in a paged '
+                       'KV cache with blocks of this number of tokens, so that the beams '
+                       'share the blocks of their common prefix instead of copying the '
+                       'cache when they are reordered. The decode steps read the blocks in '
+                       'place only with flash-attn and a multiple of 256, otherwise they '
+                       'are gathered at every step. Defaults to a contiguous KV cache.')
 
     return parser
 
@@ -943,6 +986,12 @@ def _add_logging_args(parser):
                        'flush to disk.')
     group.add_argument('--log-timers-to-tensorboard', action='store_true',
                        help='If set, write timers to tensorboard.')
+    group.add_argument('--profile-data-loading', action='store_true',
+                       help='If set, time the data loading stages (bin file reads, '
+                       'mask and position id construction, collation, waiting for '
+                       'the dataloader, and the tensor parallel broadcast) in the '
+                       'main process and every dataloader worker, and report them '
+                       'with the timers every log interval.')
     group.add_argument('--no-log-loss-scale-to-tensorboard',
                        action='store_false',
                        help='Disable loss-scale logging to tensorboard.',
@@ -1181,8 +1230,16 @@ def _add_training_args(parser):
                        choices=['adam', 'sgd'],
                        help='Optimizer function')
     group.add_argument('--dataloader-type', type=str, default=None,
-                       choices=['single', 'cyclic', 'external'],
-                       help='Single pass vs multiple pass data loader')
+                       choices=['single', 'cyclic', 'resumable', 'external'],
+                       help='Single pass vs multiple pass data loader. The resumable '
+                       'data loader is a multiple pass data loader which saves its '
+                       'position with each checkpoint and resumes from it in constant '
+                       'time, including after a change of data parallel size.')
+    group.add_argument('--resumable-dataloader-shuffle', action='store_true',
+                       help='Visit the samples of each epoch of the resumable data loader '
+                       'in a seeded pseudo-random order. The datasets already shuffle their '
+                       'samples, so by default the resumable data loader reads them in the '
+                       'same order as the single data loader.')
     group.add_argument('--no-async-tensor-model-parallel-allreduce',
                        action='store_false',
                        help='DEPRECATED. This flag is ignored.',
@@ -1334,11 +1391,15 @@ def _add_checkpointing_args(parser):
                        choices=['global', 'local', 'in_memory', None],
                        help='Type of non-persistent model checkpoints. '
                            '"global" - Saved as a standard checkpoint (e.g., on Lustre) with old checkpoints being removed. '
-                           '"local" - [TBD] Each rank saves a portion of the checkpoint locally (e.g., on SSD/ramdisk). '
+                           '"local" - Each rank saves its portion of the checkpoint locally (e.g., on SSD/ramdisk) '
+                           'and replicates it to a rank on another node. '
                            '"in_memory" - [TBD] A special kind of local checkpoint that avoids serialization. '
                            'None - No non-persistent checkpointing (default option).')
     group.add_argument('--non-persistent-global-ckpt-dir', type=str, default=None,
                        help='Directory containing global non-persistent model checkpoints.')
+    group.add_argument('--non-persistent-local-ckpt-dir', type=str, default=None,
+                       help='Node-local directory containing local non-persistent model checkpoints, '
+                       'e.g. on an SSD or in /dev/shm to keep them in host RAM.')
     group.add_argument('--finetune', action='store_true',
                        help='Load model for finetuning. Do not load optimizer '
                        'or rng state from checkpoint and set iteration to 0. '
@@ -1397,10 +1458,59 @@ def _add_checkpointing_args(parser):
     group.add_argument('--ckpt-fully-parallel-load', action='store_true',
                        help='Apply full load parallelization across DP for'
                             ' distributed checkpoints.')
+    group.add_argument('--ckpt-topology-aware-load', action='store_true',
+                       help='With --ckpt-fully-parallel-load, read each checkpoint shard'
+                            ' once per node and exchange the loaded shards only within'
+                            ' the nodes. Reduces the cross-node traffic at the cost of'
+                            ' more storage reads.')
     group.add_argument('--ckpt-assume-constant-structure', action='store_true',
                        help='If the model and optimizer state dict structure is'
                             'constant throughout a *single training job*, it allows for'
                             'different checkpointing performance optimizations.')
+    group.add_argument('--ckpt-incremental', action='store_true',
+                       help='Save distributed checkpoints incrementally: only the shards which'
+                            ' changed since the previous persistent checkpoint of the job are'
+                            ' written, the unchanged ones are referenced from it. Referenced'
+                            ' checkpoints must be kept, or folded into a full checkpoint with'
+                            ' tools/checkpoint/compact_incremental.py. Works only with the'
+                            ' `torch_dist` distributed checkpoint format.')
+    group.add_argument('--ckpt-pipelined-d2h', action='store_true',
+                       help='Copy the checkpoint tensors to host in the background, through a'
+                            ' bounded pool of reusable pinned host buffers, while the already'
+                            ' copied data is being written. The training waits for the copy'
+                            ' only before the parameters are updated. Works only with the'
+                            ' `torch_dist` distributed checkpoint format.')
+    group.add_argument('--ckpt-host-buffer-size-mb', type=int, default=256,
+                       help='Size of a single host buffer used with --ckpt-pipelined-d2h.'
+                            ' The pool has two buffers per checkpoint writer process.')
+    group.add_argument('--ckpt-compression', type=str, default=None,
+                       choices=['zstd', 'lz4', 'zlib'],
+                       help='Compress the tensors of distributed checkpoints: the tensor bytes'
+                            ' are byte-shuffled and compressed in parallel chunks. The checkpoints'
+                            ' are decompressed transparently on load. Works only with the'
+                            ' `torch_dist` and `zarr` distributed checkpoint formats.')
+    group.add_argument('--ckpt-compression-level', type=int, default=None,
+                       help='Compression level for --ckpt-compression, codec default if not set.')
+    group.add_argument('--ckpt-quantize-adam-moments', action='store_true',
+                       help='Store the Adam moments quantized to 8 bits with a scale per block'
+                            ' of 256 elements: exp_avg to int8 and the square root of exp_avg_sq'
+                            ' to uint8, rounded up so that non-zero values are never restored as'
+                            ' zero. This is lossy: the maximum absolute error of each shard is'
+                            ' recorded in the checkpoint metadata. Works only with the'
+                            ' `torch_dist` distributed checkpoint format and, with'
+                            ' --use-distributed-optimizer, with fully parallel save.')
+    group.add_argument('--ckpt-checksums', action='store_true',
+                       help='Store a checksum of each item of distributed checkpoints, computed'
+                            ' while the item is written. The checkpoints can be verified with'
+                            ' tools/verify_dist_checkpoint.py or with --ckpt-verify-on-load.'
+                            ' Works only with the `torch_dist` distributed checkpoint format.')
+    group.add_argument('--ckpt-verify-on-load', action='store_true',
+                       help='Verify the distributed checkpoint files (sizes and checksums, if'
+                            ' stored) before loading, and fall back to the latest previous'
+                            ' checkpoint in the load directory which passes the verification.'
+                            ' Loading fails if no checkpoint passes the verification. The'
+                            ' verification needs torch.distributed, so --use-checkpoint-args'
+                            ' reads the arguments of the latest checkpoint unverified.')
     group.add_argument('--dist-ckpt-strictness', type=str, default='assume_ok_unexpected',
                        choices=[e.value for e in StrictHandling],
                        help='Determine handling of key mismatch during checkpoint load.'
@@ -1641,10 +1751,47 @@ def _add_data_args(parser):
     group.add_argument('--no-create-attention-mask-in-dataloader', action='store_false',
                        help='If set, do not create attention_masks in dataloader.',
                        dest='create_attention_mask_in_dataloader')
+    group.add_argument('--sequence-packing', action='store_true',
+                       help='Pack whole documents into each sample rather than concatenate '
+                       'documents across sample boundaries, with attention and position ids '
+                       'reset at document boundaries. Documents longer than a sample are '
+                       'truncated. Requires the transformer_engine implementation.')
+    group.add_argument('--sequence-packing-algorithm', type=str,
+                       default='best_fit_decreasing',
+                       choices=['best_fit_decreasing', 'first_fit'],
+                       help='Bin packing algorithm for --sequence-packing.')
     group.add_argument('--num-dataset-builder-threads', type=int, default=1,
                        help='Number of parallel threads per rank for dataset builder')
+    group.add_argument('--num-dataset-builder-processes', type=int, default=0,
+                       help='Number of processes per rank to fork for building the dataset '
+                       'indices on a cache miss. Requires --data-cache-path. '
+                       'Default 0 builds the indices in-process.')
+    group.add_argument('--distribute-dataset-builds', action='store_true',
+                       help='Spread the dataset index builds across all ranks rather than '
+                       'build every index on rank 0. Requires --data-cache-path on a file '
+                       'system shared by all ranks.')
+    group.add_argument('--shared-memory-dataset-indices', action='store_true',
+                       help='Read the dataset index files and the cached GPT dataset indices '
+                       'from shared memory created once per node, to which every rank '
+                       'and dataloader worker on the node attaches without copying. The shared '
+                       'memory files are created under the MEGATRON_SHARED_MEMORY_DIR environment '
+                       'variable, by default /dev/shm.')
+    group.add_argument('--blend-index-block-size', type=int, default=None,
+                       help='Number of samples per block of a streaming blended dataset index. '
+                       'When set, the blended dataset decodes its index one block at a time '
+                       'rather than materialize it in full. Default None materializes the '
+                       'full index.')
     group.add_argument('--s3-cache-path', type=str, default=None,
                        help='Path to cache index files when using s3 dataloader')
+    group.add_argument('--s3-bin-cache-nbytes', type=int, default=None,
+                       help='Maximum number of bytes of .bin data cached in memory per '
+                       'dataset when using s3 dataloader. Defaults to a single block.')
+    group.add_argument('--s3-prefetch-threads', type=int, default=0,
+                       help='Number of background threads per dataset reading .bin blocks '
+                       'ahead of time when using s3 dataloader.')
+    group.add_argument('--s3-prefetch-lookahead', type=int, default=0,
+                       help='Number of upcoming samples whose .bin blocks are read ahead of '
+                       'time when using s3 dataloader. Requires --s3-prefetch-threads > 0.')
     return parser
 
 
@@ -5,6 +5,7 @@
 from logging import getLogger
 import os
 import random
+import re
 import shutil
 import sys
 import threading
@@ -16,8 +17,15 @@ from time import time
 import torch
 
 from megatron.core import mpu, tensor_parallel, dist_checkpointing
+from megatron.core.dist_checkpointing.local import (
+    LocalCheckpointManager,
+    get_local_state_dict,
+    load_local_state_dict,
+)
 from megatron.core.dist_checkpointing.mapping import ShardedObject
 from megatron.core.dist_checkpointing.serialization import get_default_load_sharded_strategy
+from megatron.core.dist_checkpointing.strategies.compression import ADAM_MOMENTS_PATTERN, CompressionConfig
+from megatron.core.dist_checkpointing.strategies.integrity import DEFAULT_CHECKSUM_ALGORITHM, verify_checkpoint
 from megatron.core.dist_checkpointing.strategies.fully_parallel import \
     FullyParallelSaveStrategyWrapper, FullyParallelLoadStrategyWrapper
 from megatron.core.num_microbatches_calculator import update_num_microbatches
@@ -44,6 +52,9 @@ _CHECKPOINT_VERSION = None
 
 logger = getLogger(__name__)
 _NON_PERSISTENT_CKPT_SUBDIR = 'non_persistent'
+_LOCAL_CHECKPOINT_MANAGER = None
+# Verified iterations by (load directory, latest iteration), see `_get_latest_verified_iteration`
+_VERIFIED_ITERATIONS = {}
 
 def set_checkpoint_version(value):
     global _CHECKPOINT_VERSION
@@ -303,7 +314,8 @@ def save_checkpoint(iteration, model, optimizer, opt_param_scheduler, num_floati
     the checkpoint will be saved with special functionality for removing old checkpoints.
     There are several types of non-persistent checkpoints:
     "global" - Saved as a standard checkpoint (e.g., on Lustre) with old checkpoints being removed.
-    "local" - [TBD] Each rank saves a portion of the checkpoint locally (e.g., on SSD/ramdisk).
+    "local" - Each rank saves its portion of the checkpoint locally (e.g., on SSD/ramdisk)
+              and replicates it to a rank on another node.
     "in_memory" - [TBD] A special kind of local checkpoint that avoids serialization.
 
     Dataloader checkpoint is only saved if the dataloader supports it. Currently this applies only
@@ -321,8 +333,11 @@ def save_checkpoint(iteration, model, optimizer, opt_param_scheduler, num_floati
     # Handle non_persistent_ckpt flag. Besides overwriting `args.save` and
     # `args.use_dist_ckpt`, non-persistent global ckpt requires no additional logic
     use_dist_ckpt = args.use_dist_ckpt or non_persistent_ckpt
+    local_ckpt = non_persistent_ckpt and args.non_persistent_ckpt_type == 'local'
     save_dir = args.save
-    if non_persistent_ckpt:
+    if local_ckpt:
+        save_dir = args.non_persistent_local_ckpt_dir
+    elif non_persistent_ckpt:
         save_dir = (
             args.non_persistent_global_ckpt_dir
             if args.non_persistent_global_ckpt_dir
@@ -342,8 +357,12 @@ def save_checkpoint(iteration, model, optimizer, opt_param_scheduler, num_floati
     checkpoint_name = get_checkpoint_name(save_dir, iteration, release=False, pipeline_parallel=pipeline_parallel,
         tensor_rank=tensor_rank, pipeline_rank=pipeline_rank, expert_parallel=expert_parallel, expert_rank=expert_rank, return_base_dir=use_dist_ckpt)
 
-    # Save dataloader state if the dataloader supports it (currently only Megatron Energon).
-    save_dataloader_state(train_data_iterator, iteration, getattr(args, "dataloader_save", None))
+    # Save dataloader state if the dataloader supports it (Megatron Energon and the resumable
+    # dataloader, whose state is kept with the checkpoint by default unless it is node-local).
+    dataloader_save_path = getattr(args, "dataloader_save", None)
+    if dataloader_save_path is None and args.dataloader_type == 'resumable' and not local_ckpt:
+        dataloader_save_path = save_dir
+    save_dataloader_state(train_data_iterator, iteration, dataloader_save_path)
 
     # Save distributed optimizer's custom parameter state.
     if args.use_distributed_optimizer and not args.no_save_optim and optimizer is not None and not use_dist_ckpt:
@@ -375,10 +394,15 @@ def save_checkpoint(iteration, model, optimizer, opt_param_scheduler, num_floati
                                          use_dist_ckpt, iteration, optim_sd_kwargs=optim_sd_kwargs)
 
         state_dict['num_floating_point_operations_so_far'] = num_floating_point_operations_so_far
-        if use_dist_ckpt:
+        if local_ckpt:
+            local_state_dict = get_local_state_dict(state_dict)
+            end_ckpt = time()
+            logger.debug(f"rank: {rank}, takes {end_ckpt - start_ckpt} to prepare state dict for ckpt ")
+            get_local_checkpoint_manager(args).save(local_state_dict, iteration)
+        elif use_dist_ckpt:
             if non_persistent_ckpt and args.non_persistent_ckpt_type != 'global':
                 raise NotImplementedError(
-                    'Local and online checkpoints are not yet supported, please use global non-persistent checkpoints'
+                    'In-memory checkpoints are not yet supported, please use global or local non-persistent checkpoints'
                 )
             if not torch.distributed.is_initialized() or torch.distributed.get_rank() == 0:
                 # TODO Handle non-empty directories (e.g., after a crash during saving).
@@ -392,12 +416,37 @@ def save_checkpoint(iteration, model, optimizer, opt_param_scheduler, num_floati
                 save_strategy = get_default_save_sharded_strategy(args.ckpt_format)
                 if args.ckpt_assume_constant_structure and args.ckpt_format == 'torch_dist':
                     save_strategy.use_cached_ckpt_structure = args.ckpt_assume_constant_structure
+                if args.ckpt_incremental:
+                    save_strategy.incremental = True
+                if args.ckpt_pipelined_d2h:
+                    save_strategy.pipelined_d2h = True
+                    save_strategy.host_buffer_size = args.ckpt_host_buffer_size_mb * 1024 * 1024
+                if args.ckpt_compression is not None or args.ckpt_quantize_adam_moments:
+                    compression = CompressionConfig(
+                        codec=args.ckpt_compression or 'none',
+                        level=args.ckpt_compression_level,
+                        quantize_pattern=ADAM_MOMENTS_PATTERN if args.ckpt_quantize_adam_moments else None)
+                    if args.ckpt_format == 'zarr':
+                        from megatron.core.dist_checkpointing.strategies.zarr import ZarrSaveShardedStrategy
+                        save_strategy = ZarrSaveShardedStrategy('zarr', 1, compression=compression)
+                    else:
+                        save_strategy.compression = compression
+                if args.ckpt_checksums:
+                    save_strategy.checksum_algorithm = DEFAULT_CHECKSUM_ALGORITHM
                 if args.ckpt_fully_parallel_save:
                     save_strategy = FullyParallelSaveStrategyWrapper(save_strategy, mpu.get_data_parallel_group(with_context_parallel=True),
                                                                      args.ckpt_assume_constant_structure)
             # Store save strategy for future checkpoint saves
             if checkpointing_context is not None:
                 checkpointing_context['save_strategy'] = save_strategy
+            if args.ckpt_incremental:
+                # Reference the previous persistent checkpoint of this job. Non-persistent
+                # checkpoints are removed, so they are saved in full and never referenced.
+                base_checkpoint_dir = None
+                if not non_persistent_ckpt and checkpointing_context is not None:
+                    base_checkpoint_dir = checkpointing_context.get('incremental_base_checkpoint')
+                    checkpointing_context['incremental_base_checkpoint'] = checkpoint_name
+                getattr(save_strategy, 'base_strategy', save_strategy).base_checkpoint_dir = base_checkpoint_dir
             end_ckpt = time()
             logger.debug(f"rank: {rank}, takes {end_ckpt - start_ckpt} to prepare state dict for ckpt ")
             async_save_request = dist_checkpointing.save(state_dict, checkpoint_name, save_strategy,
@@ -415,6 +464,16 @@ def save_checkpoint(iteration, model, optimizer, opt_param_scheduler, num_floati
             ensure_directory_exists(checkpoint_name)
             torch.save(state_dict, checkpoint_name)
     start_misc = time()
+    if local_ckpt:
+        # Local checkpoints are saved synchronously and tracked by the local checkpoint manager
+        if not torch.distributed.is_initialized() or is_last_rank():
+            on_save_checkpoint_success(productive_metrics, False)
+        print_rank_0('  successfully saved local checkpoint from iteration {:7d} to {}'
+                     .format(iteration, save_dir))
+        end_misc = time()
+        logger.debug(f"rank: {rank}, takes {end_misc - start_misc} to finalize ckpt save ")
+        return
+
     if not args.async_save:
         assert async_save_request is None
         # Wait so everyone is done (necessary)
@@ -491,9 +550,10 @@ def cleanup_old_non_persistent_checkpoint(save_dir, leave_ckpt_num=1, do_async=F
 def save_dataloader_state(train_iterator, iteration, dataloader_save_path):
     """Saves dataloader state if the dataloader supports it.
 
-    Currently, this is only used by Megatron Energon dataloader (multimodal) to store its state at a
-    specific iteration. The Megatron built-in dataloader (text-only) creates index files upfront
-    to track its state.
+    This is used by Megatron Energon dataloader (multimodal) and by the resumable Megatron
+    built-in dataloader (text-only) to store their state at a specific iteration. The other
+    Megatron built-in dataloaders create index files upfront and track their state with the
+    consumed samples.
 
     If the provided dataloader has `save_state` method, then it is called to save the state.
     Otherwise, no state is saved.
@@ -536,6 +596,32 @@ def save_dataloader_state(train_iterator, iteration, dataloader_save_path):
     torch.save(dataloader_save_dict, data_state_save_path)
 
 
+def load_dataloader_state(train_iterator, iteration, dataloader_save_path):
+    """Restores dataloader state saved by `save_dataloader_state`, if any.
+
+    The state of the resumable dataloader is the global sample cursor, which is the same on
+    every data parallel rank, so the state of data parallel rank 0 is restored. This allows
+    resuming with a different data parallel size.
+
+    Args:
+        train_iterator (iterable): Train dataloader, with a `restore_state` method.
+        iteration (int): Iteration of the checkpoint being loaded.
+        dataloader_save_path (str): Path where the dataloader state was saved.
+    """
+    data_state_save_path = get_checkpoint_name(
+        dataloader_save_path, iteration,
+        basename='train_dataloader_dprank000.pt'
+    )
+    if not os.path.exists(data_state_save_path):
+        print_rank_0(f"no dataloader checkpoint found at {data_state_save_path}, "
+                     "resuming from the consumed samples")
+        return
+
+    dataloader_save_dict = torch.load(data_state_save_path, map_location='cpu')
+    train_iterator.restore_state(dataloader_save_dict['dataloader_state_dict'])
+    print_rank_0(f"restored dataloader state from {data_state_save_path}")
+
+
 def generate_state_dict(args, model, optimizer, opt_param_scheduler,
                         rng_state, use_dist_ckpt=False, iteration=None,
                         optim_sd_kwargs=None):
@@ -642,6 +728,24 @@ def fix_query_key_value_ordering(model, checkpoint_version):
                      " checkpoint version {}".format(checkpoint_version))
 
 
+def get_local_checkpoint_manager(args):
+    """Get the manager of the node-local non-persistent checkpoints.
+
+    Must be called by all ranks the first time, as it creates a gloo process group
+    for the replication of the checkpoints.
+    """
+    global _LOCAL_CHECKPOINT_MANAGER
+    if _LOCAL_CHECKPOINT_MANAGER is None:
+        # The ranks of a node are numbered consecutively
+        ranks_per_node = int(os.getenv('LOCAL_WORLD_SIZE', torch.cuda.device_count()))
+        _LOCAL_CHECKPOINT_MANAGER = LocalCheckpointManager(
+            args.non_persistent_local_ckpt_dir,
+            max(ranks_per_node, 1),
+            group=torch.distributed.new_group(backend='gloo'),
+        )
+    return _LOCAL_CHECKPOINT_MANAGER
+
+
 def _get_non_persistent_iteration(non_persistent_dir, args):
     if args.non_persistent_ckpt_type == "global":
         tracker_filename = get_checkpoint_tracker_filename(non_persistent_dir)
@@ -654,11 +758,17 @@ def _get_non_persistent_iteration(non_persistent_dir, args):
             print_rank_0('WARNING: could not find the metadata file {}'.format(tracker_filename))
             print_rank_0('    will not load any non-persistent checkpoint')
         return iteration
+    elif args.non_persistent_ckpt_type == "local":
+        # Finding the local checkpoints requires communication, so before initialization
+        # (e.g. when loading the checkpoint args) only the persistent checkpoint is used.
+        if not torch.distributed.is_initialized():
+            return -1
+        return get_local_checkpoint_manager(args).find_latest()
     elif args.non_persistent_ckpt_type is None:
         return -1
     else:
         raise NotImplementedError(
-            'Local and online checkpoints are not yet supported, please use global non-persistent checkpoints'
+            'In-memory checkpoints are not yet supported, please use global or local non-persistent checkpoints'
         )
 
 
@@ -683,12 +793,37 @@ def _load_non_persistent_base_checkpoint(
         return _load_global_dist_base_checkpoint(
             non_persistent_dir, args, rank0, sharded_state_dict, non_persistent_iteration, False
         )
+    elif args.non_persistent_ckpt_type == "local":
+        local_ckpt_manager = get_local_checkpoint_manager(args)
+        iteration, local_state_dict = local_ckpt_manager.load()
+        assert iteration == non_persistent_iteration, (iteration, non_persistent_iteration)
+        checkpoint_name = str(local_ckpt_manager.get_checkpoint_path(iteration, 0).parent)
+        if rank0:
+            return local_state_dict['common'], checkpoint_name, False
+        print_rank_0(
+            f'Loading from a local non-persistent checkpoint (non-persistent iter {non_persistent_iteration})'
+        )
+        if sharded_state_dict is None:
+            raise RuntimeError(
+                'Detected load from a local checkpoint, but neither --use-dist-ckpt nor --auto-detect-ckpt-format is set.'
+            )
+        state_dict = load_local_state_dict(sharded_state_dict, local_state_dict)
+        return state_dict, checkpoint_name, False
     else:
         raise NotImplementedError(
-            'Local and online checkpoints are not yet supported, please use global non-persistent checkpoints'
+            'In-memory checkpoints are not yet supported, please use global or local non-persistent checkpoints'
         )
 
 
+def _is_local_non_persistent_checkpoint(checkpoint_name, args):
+    """ Check if the checkpoint name returned by `_load_base_checkpoint` is a local checkpoint """
+    return (
+        args.non_persistent_ckpt_type == "local"
+        and bool(checkpoint_name)
+        and Path(checkpoint_name).parent == Path(args.non_persistent_local_ckpt_dir)
+    )
+
+
 def _load_global_dist_base_checkpoint(
     load_dir, args, rank0, sharded_state_dict, iteration, release
 ):
@@ -712,12 +847,48 @@ def _load_global_dist_base_checkpoint(
     # NOTE: `args.ckpt_fully_parallel_load` applies to both persistent and non-persistent checkpoints.
     if args.ckpt_fully_parallel_load:
         load_strategy = FullyParallelLoadStrategyWrapper(
-            load_strategy, mpu.get_data_parallel_group(with_context_parallel=True)
+            load_strategy, mpu.get_data_parallel_group(with_context_parallel=True),
+            topology_aware=args.ckpt_topology_aware_load
         )
     state_dict = dist_checkpointing.load(sharded_state_dict, checkpoint_name, load_strategy, strict=args.dist_ckpt_strictness)
     return state_dict, checkpoint_name, release
 
 
+def _get_latest_verified_iteration(load_dir, iteration):
+    """ Find the latest checkpoint not newer than `iteration` which passes the verification.
+
+    Only distributed checkpoints are verified (see `integrity.verify_checkpoint`).
+    The result is cached, so the rank 0 loads (of the arguments and the common state dict)
+    and the full load use the same checkpoint. Raises a RuntimeError if no checkpoint
+    passes the verification.
+    """
+    cache_key = (os.path.abspath(load_dir), iteration)
+    if cache_key not in _VERIFIED_ITERATIONS:
+        _VERIFIED_ITERATIONS[cache_key] = _find_latest_verified_iteration(load_dir, iteration)
+    return _VERIFIED_ITERATIONS[cache_key]
+
+
+def _find_latest_verified_iteration(load_dir, iteration):
+    iterations = sorted((int(match.group(1)) for match in map(
+        re.compile(r'iter_(\d{7})').fullmatch, os.listdir(load_dir)) if match is not None),
+        reverse=True)
+    for candidate in [it for it in iterations if it <= iteration]:
+        checkpoint_name = get_checkpoint_name(load_dir, candidate, return_base_dir=True)
+        if not dist_checkpointing.check_is_distributed_checkpoint(checkpoint_name):
+            return candidate
+        start = time()
+        report = verify_checkpoint(checkpoint_name)
+        if report.ok:
+            print_rank_0(f' verified checkpoint {checkpoint_name}: {report.verified_items} items'
+                         f' ({report.verified_bytes / 2**30:.2f} GiB) in {time() - start:.2f}s')
+            return candidate
+        print_rank_0(f'WARNING: checkpoint {checkpoint_name} is corrupted'
+                     f' ({len(report.errors)} errors, first: {report.errors[0]}),'
+                     f' trying the previous checkpoint')
+    raise RuntimeError(f'No checkpoint in {load_dir} up to iteration {iteration}'
+                       f' passes the verification')
+
+
 def _load_base_checkpoint(
     load_dir, args, rank0=False, sharded_state_dict=None
 ):
@@ -745,6 +916,16 @@ def _load_base_checkpoint(
         else:
             print_rank_0('WARNING: non-persistent checkpoints are older than persistent checkpoint')
 
+    # Before initialization (e.g. when loading the checkpoint args) every process would verify
+    # the whole checkpoint alone, so the verification is left to the load after initialization.
+    if (
+        iteration != -1
+        and not release
+        and args.ckpt_verify_on_load
+        and torch.distributed.is_initialized()
+    ):
+        iteration = _get_latest_verified_iteration(load_dir, iteration)
+
     # Otherwise we are dealing with global checkpoints
     # If no tracker file, return nothing
     if iteration == -1:
@@ -930,7 +1111,10 @@ def load_checkpoint(model, optimizer, opt_param_scheduler, load_arg='load', stri
         state_dict, checkpoint_name, release = _load_base_checkpoint(
             load_dir, args, rank0=True
         )
-        is_dist_ckpt = dist_checkpointing.check_is_distributed_checkpoint(checkpoint_name)
+        is_dist_ckpt = (
+            _is_local_non_persistent_checkpoint(checkpoint_name, args)
+            or dist_checkpointing.check_is_distributed_checkpoint(checkpoint_name)
+        )
         if is_dist_ckpt:
             ckpt_tp_pp = (
                 state_dict['args'].tensor_model_parallel_size,
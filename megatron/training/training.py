@@ -22,17 +22,27 @@ from megatron.core import mpu, tensor_parallel
 from megatron.core.utils import check_param_hashes_across_dp_replicas, get_model_config, StragglerDetector
 from megatron.training.checkpointing import load_checkpoint
 from megatron.training.checkpointing import save_checkpoint
+from megatron.training.checkpointing import load_dataloader_state
 from megatron.legacy.model import Float16Module
 from megatron.core.distributed import DistributedDataParallelConfig
 from megatron.core.distributed import DistributedDataParallel as DDP
 from megatron.core.distributed import finalize_model_grads
+from megatron.core.dist_checkpointing.strategies.filesystem_async import wait_for_pipelined_d2h_copies
 from megatron.core.enums import ModelType
 from megatron.core.optimizer import get_megatron_optimizer, OptimizerConfig
 from megatron.training.initialize import initialize_megatron
 from megatron.training.initialize import write_args_to_tensorboard
 from megatron.training.initialize import set_jit_fusion_options
 from megatron.training.optimizer_param_scheduler import OptimizerParamScheduler
-from megatron.legacy.data.data_samplers import build_pretraining_data_loader
+from megatron.legacy.data.data_samplers import (
+    ResumableDataIterator,
+    build_pretraining_data_loader,
+)
+from megatron.core.datasets.data_loading_profiler import (
+    DataLoadingProfiler,
+    enable_data_loading_profiler,
+    get_data_loading_profiler,
+)
 from megatron.core.transformer.moe.moe_utils import track_moe_metrics
 from megatron.core.pipeline_parallel import get_forward_backward_func
 from megatron.core.num_microbatches_calculator import (
@@ -616,6 +626,11 @@ def train_step(forward_step_func, data_iterator,
     args = get_args()
     timers = get_timers()
 
+    # The pipelined D2H copy of the last checkpoint reads the parameters and optimizer
+    # state, which are updated by the param all-gather (with overlap) or the optimizer step.
+    if args.ckpt_pipelined_d2h and args.overlap_param_gather:
+        wait_for_pipelined_d2h_copies()
+
     # Set grad to zero.
     for model_chunk in model:
         model_chunk.zero_grad_buffer()
@@ -644,6 +659,8 @@ def train_step(forward_step_func, data_iterator,
 
     # Update parameters.
     timers('optimizer', log_level=1).start(barrier=args.barrier_with_L1_time)
+    if args.ckpt_pipelined_d2h:
+        wait_for_pipelined_d2h_copies()
     update_successful, grad_norm, num_zeros_in_grad = optimizer.step()
     timers('optimizer').stop()
 
@@ -754,6 +771,9 @@ def training_log(loss_dict, total_loss_dict, learning_rate, decoupled_learning_r
         'optimizer-inner-step',
         'optimizer-copy-main-to-model-params',
         'optimizer']
+    if args.profile_data_loading:
+        get_data_loading_profiler().add_to_timers(timers)
+        timers_to_log += DataLoadingProfiler.get_timer_names()
 
     # Calculate batch size.
     batch_size = args.micro_batch_size * args.data_parallel_size * \
@@ -922,6 +942,8 @@ def training_log(loss_dict, total_loss_dict, learning_rate, decoupled_learning_r
             report_memory('(after {} iterations)'.format(iteration))
             report_memory_flag = False
         timers.log(timers_to_log, normalizer=args.log_interval)
+        if args.profile_data_loading:
+            print_rank_0(get_data_loading_profiler().get_statistics_string())
 
     return report_memory_flag
 
@@ -1517,6 +1539,10 @@ def build_train_valid_test_data_loaders(
 
     print_rank_0('> building train, validation, and test datasets ...')
 
+    # Enable the profiler before the dataloader workers are forked, so they share its histograms
+    if args.profile_data_loading:
+        enable_data_loading_profiler(args.num_workers)
+
     # Backward compatibility, assume fixed batch size.
     if args.iteration > 0 and args.consumed_train_samples == 0:
         assert args.train_samples is None, \
@@ -1578,7 +1604,7 @@ def build_train_valid_test_data_iterators(
 
     # Build iterators.
     dl_type = args.dataloader_type
-    assert dl_type in ['single', 'cyclic', 'external']
+    assert dl_type in ['single', 'cyclic', 'resumable', 'external']
 
     def _get_iterator(dataloader_type, dataloader):
         """Return dataset iterator."""
@@ -1586,6 +1612,8 @@ def build_train_valid_test_data_iterators(
             return iter(dataloader)
         elif dataloader_type == "cyclic":
             return iter(cyclic_iter(dataloader))
+        elif dataloader_type == "resumable":
+            return ResumableDataIterator(dataloader)
         elif dataloader_type == "external":
             # External dataloader is passed through. User is expected to define how to iterate.
             return dataloader
@@ -1594,6 +1622,9 @@ def build_train_valid_test_data_iterators(
 
     if train_dataloader is not None:
         train_data_iterator = _get_iterator(dl_type, train_dataloader)
+        if dl_type == "resumable" and args.load is not None and args.iteration > 0:
+            load_dataloader_state(train_data_iterator, args.iteration,
+                                  getattr(args, "dataloader_save", None) or args.load)
     else:
         train_data_iterator = None
 
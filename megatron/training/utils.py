@@ -36,6 +36,8 @@ from megatron.training import (
 )
 from megatron.core import DistributedDataParallel as DDP
 from megatron.core import mpu
+from megatron.core.datasets.data_loading_profiler import profile_data_loading_stage
+from megatron.core.packed_seq_params import PackedSeqParams
 from megatron.core.tensor_parallel import param_is_not_tensor_parallel_duplicate
 from megatron.legacy.model import Float16Module
 from megatron.legacy.model.module import param_is_not_shared
@@ -262,6 +264,38 @@ def get_batch_on_this_cp_rank(batch):
     return batch
 
 
+def get_packed_seq_params(batch):
+    """ Pop the packed sequence boundaries from the batch, if any, and flatten the
+        micro batch into a single packed sequence, since the thd format has no batch
+        dimension.
+    """
+    cu_seqlens = batch.pop('cu_seqlens', None)
+    max_seqlen = batch.pop('max_seqlen', None)
+    if cu_seqlens is None:
+        return None
+
+    # Offset the boundaries of each sample by its position in the micro batch, and
+    # drop the padding and the leading zero of every sample but the first.
+    seq_length = cu_seqlens.shape[1] - 1
+    offsets = torch.arange(cu_seqlens.shape[0], dtype=cu_seqlens.dtype,
+                           device=cu_seqlens.device) * seq_length
+    ends = cu_seqlens[:, 1:]
+    cu_seqlens = torch.cat([cu_seqlens[0, :1], (ends + offsets.unsqueeze(1))[ends >= 0]])
+    max_seqlen = max_seqlen.max().view(1)
+
+    for key, val in batch.items():
+        if val is not None:
+            batch[key] = val.view(1, -1)
+
+    return PackedSeqParams(
+        qkv_format='thd',
+        cu_seqlens_q=cu_seqlens,
+        cu_seqlens_kv=cu_seqlens,
+        max_seqlen_q=max_seqlen,
+        max_seqlen_kv=max_seqlen,
+    )
+
+
 def print_rank_0(message):
     """If distributed is initialized, print only on rank 0."""
     if torch.distributed.is_initialized():
@@ -305,12 +339,17 @@ def get_batch_on_this_tp_rank(data_iterator):
 
     def _broadcast(item):
        if item is not None:
-           torch.distributed.broadcast(item, mpu.get_tensor_model_parallel_src_rank(), group=mpu.get_tensor_model_parallel_group())
+           with profile_data_loading_stage("broadcast"):
+               torch.distributed.broadcast(item, mpu.get_tensor_model_parallel_src_rank(), group=mpu.get_tensor_model_parallel_group())
+               # Time the broadcast itself rather than its launch
+               if args.profile_data_loading:
+                   torch.cuda.synchronize()
 
     if mpu.get_tensor_model_parallel_rank() == 0:
 
        if data_iterator is not None:
-           data = next(data_iterator)
+           with profile_data_loading_stage("batch-wait"):
+               data = next(data_iterator)
        else:
            data = None
 
@@ -321,6 +360,9 @@ def get_batch_on_this_tp_rank(data_iterator):
            'attention_mask': None if "attention_mask" not in data else data["attention_mask"].cuda(non_blocking = True),
            'position_ids': data["position_ids"].cuda(non_blocking = True)
        }
+       if args.sequence_packing:
+           batch['cu_seqlens'] = data["cu_seqlens"].cuda(non_blocking = True)
+           batch['max_seqlen'] = data["max_seqlen"].cuda(non_blocking = True)
 
        if args.pipeline_model_parallel_size == 1:
            _broadcast(batch['tokens'])
@@ -339,6 +381,10 @@ def get_batch_on_this_tp_rank(data_iterator):
            _broadcast(batch['loss_mask'])
            _broadcast(batch['attention_mask'])
 
+       if args.sequence_packing:
+           _broadcast(batch['cu_seqlens'])
+           _broadcast(batch['max_seqlen'])
+
     else:
 
        tokens=torch.empty((args.micro_batch_size,args.seq_length), dtype = torch.int64 , device = torch.cuda.current_device())
@@ -383,6 +429,12 @@ def get_batch_on_this_tp_rank(data_iterator):
            'position_ids': position_ids
        }
 
+       if args.sequence_packing:
+           batch['cu_seqlens'] = torch.empty((args.micro_batch_size,args.seq_length+1), dtype = torch.int32 , device = torch.cuda.current_device())
+           batch['max_seqlen'] = torch.empty((args.micro_batch_size,), dtype = torch.int32 , device = torch.cuda.current_device())
+           _broadcast(batch['cu_seqlens'])
+           _broadcast(batch['max_seqlen'])
+
     return batch
 
 
@@ -24,6 +24,7 @@ from megatron.core.transformer.spec_utils import import_module
 from megatron.training.utils import (
     get_batch_on_this_cp_rank,
     get_batch_on_this_tp_rank,
+    get_packed_seq_params,
 )
 from megatron.training.arguments import core_transformer_config_from_args
 from megatron.training.yaml_arguments import core_transformer_config_from_yaml
@@ -98,15 +99,18 @@ def get_batch(data_iterator):
 
     # TODO: this is pretty hacky, find a better way
     if (not mpu.is_pipeline_first_stage()) and (not mpu.is_pipeline_last_stage()):
-        return None, None, None, None, None
+        return None, None, None, None, None, None
 
     # get batches based on the TP rank you are on
     batch = get_batch_on_this_tp_rank(data_iterator)
 
+    # pack the micro batch into a single sequence for sequence packing
+    packed_seq_params = get_packed_seq_params(batch)
+
     # slice batch along sequence dimension for context parallelism
     batch = get_batch_on_this_cp_rank(batch)
 
-    return batch.values()
+    return (*batch.values(), packed_seq_params)
 
 
 def loss_func(loss_mask: torch.Tensor, output_tensor: torch.Tensor):
@@ -166,13 +170,17 @@ def forward_step(data_iterator, model: GPTModel):
     timers('batch-generator', log_level=2).start()
     global stimer
     with stimer(bdata=True):
-        tokens, labels, loss_mask, attention_mask, position_ids = get_batch(
+        tokens, labels, loss_mask, attention_mask, position_ids, packed_seq_params = get_batch(
             data_iterator)
     timers('batch-generator').stop()
 
     with stimer:
-        output_tensor = model(tokens, position_ids, attention_mask,
-                              labels=labels)
+        if packed_seq_params is not None:
+            output_tensor = model(tokens, position_ids, attention_mask,
+                                  labels=labels, packed_seq_params=packed_seq_params)
+        else:
+            output_tensor = model(tokens, position_ids, attention_mask,
+                                  labels=labels)
 
     return output_tensor, partial(loss_func, loss_mask)
 
@@ -197,14 +205,25 @@ def core_gpt_dataset_config_from_args(args):
         ],
         split=args.split,
         num_dataset_builder_threads=args.num_dataset_builder_threads,
+        num_dataset_builder_processes=args.num_dataset_builder_processes,
+        distribute_dataset_builds=args.distribute_dataset_builds,
+        blend_index_block_size=args.blend_index_block_size,
         path_to_cache=args.data_cache_path,
         mmap_bin_files=args.mmap_bin_files,
+        shared_memory_indices=args.shared_memory_dataset_indices,
         tokenizer=tokenizer,
         reset_position_ids=args.reset_position_ids,
         reset_attention_mask=args.reset_attention_mask,
         eod_mask_loss=args.eod_mask_loss,
         create_attention_mask=args.create_attention_mask_in_dataloader,
-        s3_cache_path = args.s3_cache_path
+        s3_cache_path = args.s3_cache_path,
+        s3_bin_cache_nbytes=args.s3_bin_cache_nbytes,
+        s3_prefetch_threads=args.s3_prefetch_threads,
+        s3_prefetch_lookahead=args.s3_prefetch_lookahead,
+        s3_prefetch_micro_batch_size=args.micro_batch_size,
+        s3_prefetch_data_parallel_size=args.data_parallel_size,
+        sequence_packing=args.sequence_packing,
+        sequence_packing_algorithm=args.sequence_packing_algorithm,
     )
 
 
@@ -188,8 +188,12 @@ def core_gpt_dataset_config_from_args(args):
         ],
         split=args.split,
         num_dataset_builder_threads=args.num_dataset_builder_threads,
+        num_dataset_builder_processes=args.num_dataset_builder_processes,
+        distribute_dataset_builds=args.distribute_dataset_builds,
+        blend_index_block_size=args.blend_index_block_size,
         path_to_cache=args.data_cache_path,
         mmap_bin_files=args.mmap_bin_files,
+        shared_memory_indices=args.shared_memory_dataset_indices,
         tokenizer=tokenizer,
         reset_position_ids=args.reset_position_ids,
         reset_attention_mask=args.reset_attention_mask,
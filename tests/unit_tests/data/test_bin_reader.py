@@ -6,7 +6,9 @@ from types import ModuleType, SimpleNamespace
 from typing import Any, Dict
 
 import nltk
+import numpy
 import pytest
+import torch
 
 try:
     import boto3
@@ -19,6 +21,7 @@ except ModuleNotFoundError:
 
 from megatron.core.datasets.indexed_dataset import (
     IndexedDataset,
+    IndexedDatasetBuilder,
     S3Config,
     _FileBinReader,
     _MMapBinReader,
@@ -62,7 +65,8 @@ class _LocalClient(S3Client):
 
         with open(filename, mode='rb', buffering=0) as bin_buffer_file:
             bin_buffer_file.seek(_range_beg)
-            _bytes = bin_buffer_file.read(_range_end - _range_beg)
+            # The end of Range is inclusive
+            _bytes = bin_buffer_file.read(_range_end - _range_beg + 1)
 
         response = {"Body": SimpleNamespace(read=lambda: _bytes)}
 
@@ -160,5 +164,112 @@ def test_bin_reader():
                 assert (indexed_dataset_s3[idx] == indexed_dataset_mmap[idx]).all()
 
 
+class _CountingLocalClient(_LocalClient):
+    """Local test client which counts the number of requests"""
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.num_get_object = 0
+
+    def get_object(self, Bucket: str, Key: str, Range: str) -> Dict[str, Any]:
+        self.num_get_object += 1
+        return super().get_object(Bucket, Key, Range)
+
+
+@pytest.mark.parametrize("bin_prefetch_threads", [0, 2])
+def test_s3_bin_reader_cache(bin_prefetch_threads):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path_prefix = os.path.join(temp_dir, "sample_data")
+
+        rng = numpy.random.default_rng(seed=0)
+        builder = IndexedDatasetBuilder(path_prefix + ".bin", dtype=numpy.int32)
+        for length in rng.integers(low=1, high=256, size=256):
+            builder.add_item(torch.from_numpy(rng.integers(0, 1000, size=length, dtype=numpy.int32)))
+            builder.end_document()
+        builder.finalize(path_prefix + ".idx")
+
+        bin_chunk_nbytes = 4096
+        bin_cache_nbytes = 3 * bin_chunk_nbytes
+        indexed_dataset_file = IndexedDataset(path_prefix, multimodal=False, mmap=False)
+        indexed_dataset_s3 = IndexedDataset(
+            S3_PREFIX + path_prefix,
+            multimodal=False,
+            mmap=False,
+            s3_config=S3Config(
+                path_to_idx_cache=os.path.join(temp_dir, "s3_cache"),
+                bin_chunk_nbytes=bin_chunk_nbytes,
+                bin_cache_nbytes=bin_cache_nbytes,
+                bin_prefetch_threads=bin_prefetch_threads,
+            ),
+        )
+        bin_reader = indexed_dataset_s3.bin_reader
+        assert isinstance(bin_reader, _S3BinReader)
+        bin_reader._client = _CountingLocalClient()
+
+        indices = rng.permutation(len(indexed_dataset_s3))
+        for i, idx in enumerate(indices):
+            indexed_dataset_s3.prefetch(indices[i + 1 : i + 4])
+            assert (indexed_dataset_s3[idx] == indexed_dataset_file[idx]).all()
+            assert (
+                indexed_dataset_s3.get(idx, offset=0, length=1)
+                == indexed_dataset_file.get(idx, offset=0, length=1)
+            ).all()
+            assert bin_reader._cache_nbytes <= bin_cache_nbytes
+
+        # A block which is already cached is not requested again
+        num_get_object = bin_reader._client.num_get_object
+        indexed_dataset_s3.get(indices[-1], offset=0, length=1)
+        assert bin_reader._client.num_get_object == num_get_object
+
+        # Reads spanning block boundaries are served from multiple blocks
+        whole = indexed_dataset_file[0 : len(indexed_dataset_file)]
+        assert all(
+            (a == b).all() for a, b in zip(indexed_dataset_s3[0 : len(indexed_dataset_s3)], whole)
+        )
+
+
+def test_get_many():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path_prefix = os.path.join(temp_dir, "sample_data")
+
+        rng = numpy.random.default_rng(seed=0)
+        builder = IndexedDatasetBuilder(path_prefix + ".bin", dtype=numpy.uint16)
+        for length in rng.integers(low=1, high=64, size=128):
+            builder.add_item(torch.from_numpy(rng.integers(0, 1000, size=length, dtype=numpy.uint16)))
+            builder.end_document()
+        builder.finalize(path_prefix + ".idx")
+
+        indexed_datasets = [
+            IndexedDataset(path_prefix, multimodal=False, mmap=True),
+            IndexedDataset(path_prefix, multimodal=False, mmap=False),
+            IndexedDataset(
+                S3_PREFIX + path_prefix,
+                multimodal=False,
+                mmap=False,
+                s3_config=S3Config(
+                    path_to_idx_cache=os.path.join(temp_dir, "s3_cache"), bin_chunk_nbytes=256
+                ),
+            ),
+        ]
+
+        # Repeated, adjacent, overlapping, and disjoint spans, some of which are empty
+        indices = list(rng.integers(0, 128, size=64)) + [3, 4, 5, 5, 5, 100]
+        offsets = [0] * 64 + [0, 0, 0, 1, 0, 0]
+        lengths = [None] * 64 + [None, None, 1, None, 0, 1]
+        for indexed_dataset in indexed_datasets:
+            sequences = indexed_dataset.get_many(indices, offsets, lengths)
+            assert len(sequences) == len(indices)
+            for sequence, idx, offset, length in zip(sequences, indices, offsets, lengths):
+                expected = indexed_dataset.get(idx, offset=offset, length=length)
+                assert sequence.dtype == expected.dtype
+                assert (sequence == expected).all()
+
+            sequences = indexed_dataset.get_many(indices)
+            for sequence, idx in zip(sequences, indices):
+                assert (sequence == indexed_dataset[idx]).all()
+
+            assert indexed_dataset.get_many([]) == []
+
+
 if __name__ == "__main__":
     test_bin_reader()
@@ -354,6 +354,49 @@ def test_builder():
             )
             assert len(datasets[2]) == 0
 
+        # Streaming blending index
+        sizes = [10007, 101, 0]
+        datasets_full = BlendedMegatronDatasetBuilder(
+            TestDataset,
+            sizes,
+            lambda: True,
+            BlendedMegatronDatasetConfig(
+                random_seed=1234,
+                sequence_length=_SEQUENCE_LENGTH,
+                blend=blends[Split.train],
+                split="50,50,0",
+            ),
+        ).build()
+        for path_to_cache in [None, os.path.join(temp_dir, "cache")]:
+            config = BlendedMegatronDatasetConfig(
+                random_seed=1234,
+                sequence_length=_SEQUENCE_LENGTH,
+                blend=blends[Split.train],
+                split="50,50,0",
+                blend_index_block_size=64,
+                path_to_cache=path_to_cache,
+            )
+            datasets = BlendedMegatronDatasetBuilder(
+                TestDataset, sizes, lambda: True, config
+            ).build()
+            for dataset, dataset_full in zip(datasets[:2], datasets_full[:2]):
+                assert len(dataset) == len(dataset_full)
+                assert numpy.array_equal(
+                    numpy.asarray(dataset.dataset_index), dataset_full.dataset_index
+                )
+                assert numpy.array_equal(
+                    numpy.asarray(dataset.dataset_sample_index), dataset_full.dataset_sample_index
+                )
+                indices = numpy.random.randint(0, len(dataset), size=100)
+                assert numpy.array_equal(
+                    dataset.dataset_sample_index[indices],
+                    dataset_full.dataset_sample_index[indices],
+                )
+                assert dataset.dataset_index[-1] == dataset_full.dataset_index[-1]
+                assert numpy.array_equal(
+                    dataset.get_dataset_sample_counts(), dataset_full.get_dataset_sample_counts()
+                )
+
 
 if __name__ == "__main__":
     test_builder()
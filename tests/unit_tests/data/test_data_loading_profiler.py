@@ -0,0 +1,85 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import time
+
+import numpy
+import torch
+
+from megatron.core.datasets import data_loading_profiler
+from megatron.core.datasets.data_loading_profiler import (
+    DataLoadingProfiler,
+    enable_data_loading_profiler,
+    profile_data_loading_stage,
+    profiled_collate,
+)
+from megatron.core.timers import Timers
+
+
+class _SleepDataset(torch.utils.data.Dataset):
+    def __len__(self):
+        return 16
+
+    def __getitem__(self, idx):
+        with profile_data_loading_stage("bin-read"):
+            time.sleep(0.002)
+        return torch.tensor([idx])
+
+
+def test_data_loading_profiler():
+    assert profile_data_loading_stage("bin-read") is profile_data_loading_stage("collate")
+
+    profiler = enable_data_loading_profiler(num_workers=2)
+    try:
+        dataloader = torch.utils.data.DataLoader(
+            _SleepDataset(), batch_size=4, num_workers=2, collate_fn=profiled_collate
+        )
+        for _ in dataloader:
+            pass
+
+        # The workers record into the shared histograms, one row per worker
+        stage_id = profiler.stage_ids["bin-read"]
+        assert profiler.counts[0, stage_id].sum() == 0
+        assert sorted(profiler.counts[1:, stage_id].sum(axis=1).tolist()) == [0] * 5 + [8, 8]
+
+        timers = Timers(0, "max")
+        profiler.add_to_timers(timers)
+        assert timers("data-loading/bin-read").elapsed(reset=False) >= 16 * 0.002
+
+        statistics = profiler.get_statistics()
+        assert statistics["bin-read"]["count"] == 16
+        assert statistics["collate"]["count"] == 4
+        assert statistics["broadcast"]["count"] == 0
+        # 2 ms falls in the bucket [1024, 2048) or above
+        assert DataLoadingProfiler.get_percentile(statistics["bin-read"]["histogram"], 50) >= 2048
+
+        # The statistics are relative to the last call
+        assert profiler.get_statistics()["bin-read"]["count"] == 0
+    finally:
+        data_loading_profiler._DATA_LOADING_PROFILER = None
+
+
+def test_data_loading_profiler_concurrent_dataloaders():
+    profiler = enable_data_loading_profiler(num_workers=2, num_dataloaders=1)
+    try:
+        dataloaders = [
+            torch.utils.data.DataLoader(_SleepDataset(), batch_size=2, num_workers=2)
+            for _ in range(2)
+        ]
+        for _ in zip(*dataloaders):
+            pass
+
+        # The workers of both dataloaders have a row each, except the last two which share one
+        stage_id = profiler.stage_ids["bin-read"]
+        assert profiler.counts[1:3, stage_id].sum(axis=1).tolist() == [8, 8]
+        assert profiler.counts[3, stage_id].sum() == 16
+        assert profiler.get_statistics()["bin-read"]["count"] == 32
+    finally:
+        data_loading_profiler._DATA_LOADING_PROFILER = None
+
+
+def test_data_loading_profiler_percentile():
+    histogram = numpy.zeros(32, dtype=numpy.int64)
+    histogram[3] = 90
+    histogram[10] = 10
+    assert DataLoadingProfiler.get_percentile(histogram, 50) == 8
+    assert DataLoadingProfiler.get_percentile(histogram, 95) == 1024
@@ -0,0 +1,101 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import numpy
+import pytest
+import torch
+
+from megatron.legacy.data.data_samplers import (
+    MegatronPretrainingResumableSampler,
+    MegatronPretrainingSampler,
+    ResumableDataIterator,
+    permute_index,
+)
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 1000])
+def test_permute_index(size):
+    permutation = [permute_index(index, size, 1234) for index in range(size)]
+
+    # Check the permutation is a bijection
+    assert sorted(permutation) == list(range(size))
+
+    # Check the permutation depends on the seed
+    if size >= 64:
+        assert permutation != [permute_index(index, size, 5678) for index in range(size)]
+
+
+def _global_batches(
+    total_samples, consumed_samples, micro_batch_size, data_parallel_size, n, seed=1234
+):
+    iterators = [
+        iter(
+            MegatronPretrainingResumableSampler(
+                total_samples, consumed_samples, micro_batch_size, rank, data_parallel_size, seed
+            )
+        )
+        for rank in range(data_parallel_size)
+    ]
+    return [sum((next(iterator) for iterator in iterators), []) for _ in range(n)]
+
+
+def test_resumable_sampler():
+    total_samples = 100
+
+    # Check the sample order is independent of the data parallel size and micro batch size
+    samples_a = sum(_global_batches(total_samples, 0, 2, 4, 30), [])
+    samples_b = sum(_global_batches(total_samples, 0, 4, 1, 60), [])
+    assert samples_a == samples_b
+
+    # Check each epoch is a permutation with its own seed
+    assert sorted(samples_a[:total_samples]) == list(range(total_samples))
+    assert sorted(samples_a[total_samples : 2 * total_samples]) == list(range(total_samples))
+    assert samples_a[:total_samples] != samples_a[total_samples : 2 * total_samples]
+
+    # Check resuming with a different data parallel size continues the sample order
+    samples_c = sum(_global_batches(total_samples, 24, 3, 2, 20), [])
+    assert samples_a[24 : 24 + len(samples_c)] == samples_c
+
+
+def test_resumable_sampler_without_seed():
+    # Check the samples are read in the same order as the single data loader
+    for rank in range(2):
+        resumable = iter(MegatronPretrainingResumableSampler(100, 8, 3, rank, 2))
+        single = MegatronPretrainingSampler(100, 8, 3, rank, 2)
+        assert [next(resumable) for _ in range(15)] == list(single)
+
+    # Check the epochs repeat
+    samples = sum(_global_batches(100, 0, 2, 2, 50, seed=None), [])
+    assert samples == list(range(100)) * 2
+
+
+def test_resumable_data_iterator():
+    dataset = torch.utils.data.TensorDataset(torch.arange(100))
+
+    def build_iterator(consumed_samples, data_parallel_rank, data_parallel_size):
+        sampler = MegatronPretrainingResumableSampler(
+            len(dataset), consumed_samples, 2, data_parallel_rank, data_parallel_size, 1234
+        )
+        return ResumableDataIterator(
+            torch.utils.data.DataLoader(dataset, batch_sampler=sampler, num_workers=0)
+        )
+
+    reference = build_iterator(0, 0, 1)
+    samples = [next(reference)[0].tolist() for _ in range(10)]
+
+    # Consume some samples, save, and resume with another data parallel size
+    iterator = build_iterator(0, 0, 1)
+    for _ in range(3):
+        next(iterator)
+    state_dict = iterator.save_state()
+    assert state_dict["consumed_samples"] == 6
+
+    resumed = [build_iterator(0, rank, 2) for rank in range(2)]
+    for resumed_iterator in resumed:
+        resumed_iterator.restore_state(state_dict)
+        # The dataloader is started once, after the state is restored
+        assert resumed_iterator._iterator is None
+    for i in range(3):
+        assert (
+            next(resumed[0])[0].tolist() + next(resumed[1])[0].tolist()
+            == numpy.concatenate(samples[3 + 2 * i : 5 + 2 * i]).tolist()
+        )
@@ -2,13 +2,16 @@
 # Compile megatron.core.datasets.helpers dependencies before BlendedDataset import
 ##
 
+import os
 import random
+import tempfile
 
 import numpy
 import torch
 
 from megatron.core.datasets.blended_megatron_dataset_builder import BlendedMegatronDatasetBuilder
-from megatron.core.datasets.gpt_dataset import GPTDatasetConfig, MockGPTDataset
+from megatron.core.datasets.gpt_dataset import GPTDataset, GPTDatasetConfig, MockGPTDataset
+from megatron.core.datasets.indexed_dataset import IndexedDatasetBuilder
 from megatron.core.datasets.utils import compile_helpers
 from megatron.training.tokenizer.tokenizer import _NullTokenizer
 from tests.unit_tests.test_utilities import Utils
@@ -105,6 +108,217 @@ def test_mock_gpt_dataset():
     # Check handling of None index
     assert not torch.any(sample['loss_mask'])
 
+    # Check batched retrieval against iterative retrieval
+    indices = [random.randint(0, len(datasets[1]) - 1) for _ in range(N)] + [None]
+    for sample_a, sample_b in zip(
+        datasets[1].__getitems__(indices), [datasets[1][index] for index in indices]
+    ):
+        assert sample_a.keys() == sample_b.keys()
+        for key in sample_a:
+            assert torch.equal(sample_a[key], sample_b[key])
+
+
+def test_mock_gpt_dataset_sequence_packing():
+    if torch.distributed.is_available():
+        Utils.initialize_distributed()
+        if torch.distributed.get_rank() == 0:
+            compile_helpers()
+        torch.distributed.barrier()
+    else:
+        compile_helpers()
+
+    tokenizer = _NullTokenizer(vocab_size=_MOCK_VOCAB_SIZE)
+
+    for sequence_packing_algorithm in ["best_fit_decreasing", "first_fit"]:
+        config = GPTDatasetConfig(
+            random_seed=1234,
+            sequence_length=4096,
+            split="990,9,1",
+            reset_position_ids=False,
+            reset_attention_mask=False,
+            eod_mask_loss=False,
+            create_attention_mask=False,
+            tokenizer=tokenizer,
+            sequence_packing=True,
+            sequence_packing_algorithm=sequence_packing_algorithm,
+        )
+
+        datasets = BlendedMegatronDatasetBuilder(
+            MockGPTDataset, [100, 100, 100], lambda: True, config
+        ).build()
+
+        # Check every document is packed exactly once per epoch
+        dataset = datasets[0]
+        assert numpy.array_equal(numpy.sort(dataset.document_index), numpy.sort(dataset.indices))
+
+        for index in range(10):
+            sample = dataset[index]
+            cu_seqlens = sample["cu_seqlens"][sample["cu_seqlens"] >= 0]
+            seqlens = cu_seqlens[1:] - cu_seqlens[:-1]
+
+            # Check the sequence boundaries cover the sample
+            assert cu_seqlens[0] == 0 and cu_seqlens[-1] == config.sequence_length
+            assert torch.all(seqlens > 0)
+            assert sample["max_seqlen"] == seqlens.max()
+
+            # Check the position ids restart at each sequence
+            assert torch.equal(
+                sample["position_ids"],
+                torch.cat([torch.arange(seqlen) for seqlen in seqlens.tolist()]),
+            )
+
+            # Check no loss crosses a sequence boundary
+            assert torch.all(sample["loss_mask"][cu_seqlens[1:-1].long() - 1] == 0)
+
+        # Check batched retrieval against iterative retrieval
+        indices = list(range(10)) + [None]
+        for sample_a, sample_b in zip(
+            dataset.__getitems__(indices), [dataset[index] for index in indices]
+        ):
+            assert sample_a.keys() == sample_b.keys()
+            for key in sample_a:
+                assert torch.equal(sample_a[key], sample_b[key])
+
+
+def test_gpt_dataset_parallel_index_build():
+    if torch.distributed.is_available():
+        Utils.initialize_distributed()
+        if torch.distributed.get_rank() == 0:
+            compile_helpers()
+        torch.distributed.barrier()
+    else:
+        compile_helpers()
+
+    tokenizer = _NullTokenizer(vocab_size=_MOCK_VOCAB_SIZE)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if torch.distributed.is_initialized():
+            # Share the directory of rank 0
+            temp_dirs = [temp_dir]
+            torch.distributed.broadcast_object_list(temp_dirs, 0)
+            temp_dir = temp_dirs[0]
+
+        prefixes = [os.path.join(temp_dir, f"dataset_{i}") for i in range(4)]
+        if not torch.distributed.is_initialized() or torch.distributed.get_rank() == 0:
+            numpy_random_state = numpy.random.RandomState(1234)
+            for prefix in prefixes:
+                builder = IndexedDatasetBuilder(f"{prefix}.bin", dtype=numpy.int32)
+                for _ in range(100):
+                    length = numpy_random_state.randint(1, 64)
+                    builder.add_document(
+                        torch.from_numpy(numpy_random_state.randint(0, 1000, size=length)),
+                        [length],
+                    )
+                builder.finalize(f"{prefix}.idx")
+        if torch.distributed.is_initialized():
+            torch.distributed.barrier()
+
+        def build(path_to_cache, blend=(prefixes, [0.1, 0.2, 0.3, 0.4]), **kwargs):
+            config = GPTDatasetConfig(
+                random_seed=1234,
+                sequence_length=16,
+                blend=blend,
+                split="90,8,2",
+                reset_position_ids=True,
+                reset_attention_mask=True,
+                eod_mask_loss=True,
+                path_to_cache=path_to_cache,
+                tokenizer=tokenizer,
+                **kwargs,
+            )
+            return BlendedMegatronDatasetBuilder(
+                GPTDataset, [500, 50, 10], lambda: True, config
+            ).build()
+
+        # Check a blend of several prefixes and a single prefix
+        for name, blend in [
+            ("blend", (prefixes, [0.1, 0.2, 0.3, 0.4])),
+            ("single", (prefixes[:1], None)),
+        ]:
+            datasets_serial = build(os.path.join(temp_dir, f"cache_serial_{name}"), blend)
+            datasets_parallel = build(
+                os.path.join(temp_dir, f"cache_parallel_{name}"),
+                blend,
+                num_dataset_builder_processes=2,
+                distribute_dataset_builds=True,
+            )
+
+            # Check the cache files are identical
+            assert sorted(os.listdir(os.path.join(temp_dir, f"cache_serial_{name}"))) == sorted(
+                os.listdir(os.path.join(temp_dir, f"cache_parallel_{name}"))
+            )
+
+            # Check the samples are identical
+            for dataset_serial, dataset_parallel in zip(datasets_serial, datasets_parallel):
+                assert len(dataset_serial) == len(dataset_parallel)
+                for index in range(len(dataset_serial)):
+                    assert torch.equal(
+                        dataset_serial[index]["tokens"], dataset_parallel[index]["tokens"]
+                    )
+
+        if torch.distributed.is_initialized():
+            torch.distributed.barrier()
+
+
+def test_gpt_dataset_prefetch_stride():
+    if torch.distributed.is_available():
+        Utils.initialize_distributed()
+        if torch.distributed.get_rank() == 0:
+            compile_helpers()
+        torch.distributed.barrier()
+    else:
+        compile_helpers()
+
+    tokenizer = _NullTokenizer(vocab_size=_MOCK_VOCAB_SIZE)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        prefix = os.path.join(temp_dir, "dataset")
+        numpy_random_state = numpy.random.RandomState(1234)
+        builder = IndexedDatasetBuilder(f"{prefix}.bin", dtype=numpy.int32)
+        for _ in range(100):
+            length = numpy_random_state.randint(1, 64)
+            builder.add_document(
+                torch.from_numpy(numpy_random_state.randint(0, 1000, size=length)), [length]
+            )
+        builder.finalize(f"{prefix}.idx")
+
+        config = GPTDatasetConfig(
+            random_seed=1234,
+            sequence_length=16,
+            blend=([prefix], None),
+            split="100,0,0",
+            reset_position_ids=True,
+            reset_attention_mask=True,
+            eod_mask_loss=True,
+            tokenizer=tokenizer,
+            s3_prefetch_threads=1,
+            s3_prefetch_lookahead=3,
+            s3_prefetch_micro_batch_size=2,
+            s3_prefetch_data_parallel_size=2,
+        )
+        dataset = BlendedMegatronDatasetBuilder(
+            GPTDataset, [100, None, None], lambda: True, config
+        ).build()[0]
+
+        # Record the documents which are hinted to the low level dataset
+        hinted = []
+        dataset.dataset.prefetch = lambda document_ids, offsets, lengths: hinted.extend(
+            document_ids
+        )
+
+        def document_ids(indices):
+            return [i for idx in indices for i in dataset._get_document_spans(idx)[0]]
+
+        # The second data parallel rank reads samples [2, 3], [6, 7], [10, 11], ...
+        dataset.__getitems__([2, 3])
+        assert hinted == document_ids([6, 7, 10])
+        hinted.clear()
+        dataset.__getitems__([6, 7])
+        assert hinted == document_ids([11, 14]), "Samples which were hinted already are skipped"
+
 
 if __name__ == "__main__":
     test_mock_gpt_dataset()
+    test_mock_gpt_dataset_sequence_packing()
+    test_gpt_dataset_parallel_index_build()
+    test_gpt_dataset_prefetch_stride()
@@ -1,9 +1,12 @@
 # Copyright (c) 2022, NVIDIA CORPORATION. All rights reserved.
 
+import glob
+import gzip
 import json
 import os
 import sys
 import tempfile
+from unittest import mock
 
 import nltk
 import pytest
@@ -237,6 +240,73 @@ def test_preprocess_data_bert():
         do_test_preprocess_data(temp_dir, extra_args=bert_args)
 
 
+@pytest.mark.parametrize("compression", ["gz", "zst"])
+def test_preprocess_data_streaming(compression):
+    if compression == "gz":
+        open_compressed = gzip.open
+    else:
+        open_compressed = pytest.importorskip("zstandard").open
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path_to_raws = os.path.join(temp_dir, "sample_raws")
+        path_to_data = os.path.join(temp_dir, "sample_data")
+        os.mkdir(path_to_raws)
+        os.mkdir(path_to_data)
+
+        # numbers, one file of which is compressed
+        documents = []
+        for i, name in enumerate(["a.jsonl", f"b.jsonl.{compression}", "c.jsonl"]):
+            lines = []
+            for j in range(200):
+                document = [(i * 1000 + j * 7 + k) % 500 for k in range(j % 13 + 1)]
+                documents.append(document)
+                lines.append(json.dumps({"text": " ".join(map(str, document))}) + "\n")
+            with (open_compressed if name.endswith(compression) else open)(
+                os.path.join(path_to_raws, name), "wt"
+            ) as writer:
+                writer.writelines(lines)
+
+        output_prefix = os.path.join(path_to_data, "numbers")
+        sys.argv = [
+            sys.argv[0],
+            "--input",
+            os.path.join(path_to_raws, "*.jsonl*"),
+            "--output-prefix",
+            output_prefix,
+            "--tokenizer-type",
+            "NullTokenizer",
+            "--vocab-size",
+            "500",
+            "--append-eod",
+            "--workers",
+            "2",
+            "--streaming",
+            "--streaming-chunk-size",
+            "1024",
+            "--streaming-max-inflight-chunks",
+            "3",
+        ]
+
+        def check_output():
+            dataset = IndexedDataset(output_prefix + "_text_document")
+            assert len(dataset) == len(documents)
+            for i, document in enumerate(documents):
+                assert list(dataset[i]) == document + [500]
+
+        # Keep the chunk shards around to exercise resumption
+        with mock.patch("tools.preprocess_data.shutil.rmtree"):
+            build_main()
+        check_output()
+        shards = sorted(glob.glob(output_prefix + "_chunks/*.idx"))
+        assert len(shards) > 3
+        for shard in shards[1::2]:
+            os.remove(shard)
+
+        build_main()
+        check_output()
+        assert not os.path.exists(output_prefix + "_chunks")
+
+
 if __name__ == "__main__":
     test_preprocess_data_gpt()
     test_preprocess_data_bert()
\ No newline at end of file
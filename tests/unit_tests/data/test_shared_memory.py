@@ -0,0 +1,115 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import fcntl
+import multiprocessing
+import os
+import pickle
+import tempfile
+
+import numpy
+import torch
+
+from megatron.core.datasets.indexed_dataset import IndexedDataset, IndexedDatasetBuilder
+from megatron.core.datasets.utils import (
+    get_shared_memory_buffer,
+    load_shared_memory_array,
+)
+
+
+def _build_indexed_dataset(path_prefix):
+    builder = IndexedDatasetBuilder(f"{path_prefix}.bin", dtype=numpy.int32)
+    for length in [3, 17, 1, 42]:
+        builder.add_item(torch.arange(length, dtype=torch.int32))
+        builder.end_document()
+    builder.finalize(f"{path_prefix}.idx")
+
+
+def _sum_sequence_lengths(dataset):
+    return int(dataset.sequence_lengths.sum())
+
+
+def _read_shared_memory(path, crash):
+    assert bytes(get_shared_memory_buffer(path)) == b"0123456789"
+    if crash:
+        os._exit(0)
+
+
+def test_shared_memory_indexed_dataset():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path_prefix = os.path.join(temp_dir, "dataset")
+        _build_indexed_dataset(path_prefix)
+
+        dataset = IndexedDataset(path_prefix)
+        dataset_shared = IndexedDataset(path_prefix, shared_memory=True)
+        assert numpy.array_equal(dataset.sequence_lengths, dataset_shared.sequence_lengths)
+        assert numpy.array_equal(
+            dataset.index.sequence_pointers, dataset_shared.index.sequence_pointers
+        )
+        assert numpy.array_equal(
+            dataset.index.document_indices, dataset_shared.index.document_indices
+        )
+        for i in range(len(dataset)):
+            assert numpy.array_equal(dataset[i], dataset_shared[i])
+
+        # The same file maps to the same segment
+        buffer = get_shared_memory_buffer(f"{path_prefix}.idx")
+        assert buffer.readonly
+        assert bytes(buffer) == open(f"{path_prefix}.idx", "rb").read()
+
+        # The state carries the option, such that un-pickling attaches to the segment
+        dataset_unpickled = pickle.loads(pickle.dumps(dataset_shared))
+        assert dataset_unpickled.shared_memory
+        assert numpy.array_equal(dataset.sequence_lengths, dataset_unpickled.sequence_lengths)
+
+        # A spawned process attaches to the segment created by this process
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            assert pool.apply(_sum_sequence_lengths, (dataset_shared,)) == 63
+
+
+def test_load_shared_memory_array():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for i, array in enumerate(
+            [
+                numpy.arange(10, dtype=numpy.int64),
+                numpy.zeros(0, dtype=numpy.int32),
+                numpy.arange(12, dtype=numpy.int32).reshape(2, 6),
+                numpy.asfortranarray(numpy.arange(12, dtype=numpy.float32).reshape(3, 4)),
+            ]
+        ):
+            path = os.path.join(temp_dir, f"array_{i}.npy")
+            numpy.save(path, array)
+            array_shared = load_shared_memory_array(path)
+            assert array_shared.dtype == array.dtype
+            assert numpy.array_equal(array_shared, array)
+            assert not array_shared.flags.writeable
+
+
+def test_shared_memory_cleanup(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "file")
+        with open(path, "wb") as writer:
+            writer.write(b"0123456789")
+
+        shared_memory_dir = os.path.join(temp_dir, "shm")
+        # A job which crashed, and a job which is running
+        for job in ["megatron_shm_stale", "megatron_shm_running"]:
+            os.makedirs(os.path.join(shared_memory_dir, job))
+            open(os.path.join(shared_memory_dir, job, ".lock"), "wb").close()
+        fd = os.open(os.path.join(shared_memory_dir, "megatron_shm_running", ".lock"), os.O_RDONLY)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        monkeypatch.setenv("MEGATRON_SHARED_MEMORY_DIR", shared_memory_dir)
+
+        # Each job removes the stale job directories. A job which exits without running its exit
+        # handlers leaves its own job directory, and a job which exits normally removes it.
+        for job_id, crash in [("crashed", True), ("exited", False)]:
+            monkeypatch.setenv("MEGATRON_SHARED_MEMORY_JOB_ID", job_id)
+            process = multiprocessing.get_context("spawn").Process(
+                target=_read_shared_memory, args=(path, crash)
+            )
+            process.start()
+            process.join()
+            assert process.exitcode == 0
+            if crash:
+                assert len(os.listdir(shared_memory_dir)) == 2
+        assert os.listdir(shared_memory_dir) == ["megatron_shm_running"]
+        os.close(fd)
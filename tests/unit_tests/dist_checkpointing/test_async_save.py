@@ -7,21 +7,37 @@ import torch
 from megatron.core.dist_checkpointing import ShardedTensor, load, save
 from megatron.core.dist_checkpointing.dict_utils import diff
 from megatron.core.dist_checkpointing.strategies.async_utils import AsyncCallsQueue
-from megatron.core.dist_checkpointing.strategies.filesystem_async import FileSystemWriterAsync
+from megatron.core.dist_checkpointing.strategies import filesystem_async
+from megatron.core.dist_checkpointing.strategies.filesystem_async import (
+    FileSystemWriterAsync,
+    PipelinedD2HCopy,
+    _get_host_buffer_pool,
+    wait_for_pipelined_d2h_copies,
+)
 from megatron.core.dist_checkpointing.strategies.torch import TorchDistSaveShardedStrategy
 from tests.unit_tests.dist_checkpointing import TempNamedDir
 from tests.unit_tests.test_utilities import Utils
 
 
 
-def write_data_os_err_mock_fn(local_proc_idx, write_bucket, results_queue, count_queue, use_fsync):
+def write_data_os_err_mock_fn(
+    local_proc_idx,
+    write_bucket,
+    results_queue,
+    count_queue,
+    use_fsync,
+    base_items=None,
+    d2h_copy=None,
+    compression=None,
+    checksum_algorithm=None,
+):
     """Raises an error on worker #2 during storage save"""
     try:
         if local_proc_idx == 2:
             raise OSError('worker #2 critical failure')
-        output = (local_proc_idx, [])
+        output = (local_proc_idx, [], {}, {})
     except Exception as e:
-        output = (local_proc_idx, e)
+        output = (local_proc_idx, e, None, None)
     results_queue.put(output)
     count_queue.get()
     count_queue.task_done()
@@ -70,6 +86,89 @@ class TestAsyncSave:
 
         Utils.destroy_model_parallel()
 
+    def test_pipelined_d2h(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        sharded_state_dict = {
+            'sd_keyA': ShardedTensor.from_rank_offsets(
+                'keyA', torch.rand(4, 8), (0, Utils.rank, Utils.world_size)
+            ),
+            # Larger than a single host buffer
+            'sd_keyB': ShardedTensor.from_rank_offsets(
+                'keyB', torch.rand(3, 5, 7), (0, Utils.rank, Utils.world_size)
+            ),
+        }
+        expected_bytes = sum(
+            sh_ten.data.numel() * sh_ten.data.element_size()
+            for sh_ten in sharded_state_dict.values()
+        )
+
+        writers = []
+        orig_retrieve_write_results = FileSystemWriterAsync.retrieve_write_results
+
+        def retrieve_write_results(writer):
+            writers.append(writer)
+            return orig_retrieve_write_results(writer)
+
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_pipelined_d2h') as ckpt_dir, mock.patch.object(
+            FileSystemWriterAsync, 'retrieve_write_results', retrieve_write_results
+        ):
+            async_calls = AsyncCallsQueue()
+            save_strategy = TorchDistSaveShardedStrategy(
+                'torch_dist', 1, thread_count=2, pipelined_d2h=True, host_buffer_size=256
+            )
+            async_request = save(
+                sharded_state_dict, ckpt_dir, save_strategy, async_sharded_save=True
+            )
+            async_calls.schedule_async_request(async_request)
+            assert wait_for_pipelined_d2h_copies() >= 0
+            async_calls.maybe_finalize_async_calls(blocking=True)
+
+            (writer,) = writers
+            assert writer.d2h_stats['copied_bytes'] == expected_bytes
+            assert writer.d2h_stats['stall_time'] >= writer.d2h_stats['wait_time'] >= 0
+            assert writer.d2h_stats['background_time'] > 0
+            assert not writer.d2h_copy.pool.in_use
+
+            loaded_state_dict = load(sharded_state_dict, ckpt_dir)
+            expected_state_dict = {k: v.data for k, v in sharded_state_dict.items()}
+            diffs = diff(loaded_state_dict, expected_state_dict)
+            assert not any(map(bool, diffs)), diffs
+
+        Utils.destroy_model_parallel()
+
+    @pytest.mark.parametrize('abort', [False, True])
+    def test_pipelined_d2h_failure(self, abort):
+        # A single buffer, never returned by the writer
+        pool = _get_host_buffer_pool(1, 16)
+        d2h_copy = PipelinedD2HCopy([[torch.rand(4), torch.rand(4)]], pool, timeout=0.1)
+        if abort:
+            d2h_copy.abort(OSError('writer failure'))
+        d2h_copy.start()
+        d2h_copy.wait()
+        pool.release()
+        if abort:
+            assert isinstance(d2h_copy.exception, RuntimeError)
+            assert 'writer failure' in str(d2h_copy.exception)
+        else:
+            assert isinstance(d2h_copy.exception, TimeoutError)
+        # The writer receives the first tensor, then the failure
+        assert d2h_copy.data_queues[0].get(timeout=1) == (0, 16)
+        assert d2h_copy.data_queues[0].get(timeout=1) == (None, 0)
+
+    def test_host_buffer_pools_are_bounded(self):
+        with mock.patch.object(filesystem_async, '_host_buffer_pools', []) as cached_pools:
+            pools = [_get_host_buffer_pool(1, 16) for _ in range(3)]
+            assert cached_pools == pools[:2]
+            for pool in pools:
+                pool.release()
+            assert not pools[2].buffers
+            assert _get_host_buffer_pool(1, 16) is pools[0]
+            # The idle pools of other shapes are freed
+            pool = _get_host_buffer_pool(2, 16)
+            assert cached_pools == [pools[0], pool]
+            assert not pools[1].buffers
+
     @pytest.mark.parametrize('async_save', [False, True])
     @pytest.mark.parametrize('worker_fn', [write_data_os_err_mock_fn])
     def test_errors_are_reported(self, tmp_path_dist_ckpt, async_save, worker_fn):
@@ -0,0 +1,208 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import os
+import queue
+import sys
+from argparse import Namespace
+
+import torch
+
+from megatron.core.dist_checkpointing import ShardedTensor, load, load_common_state_dict
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.test_utilities import Utils
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir, os.path.pardir)
+)
+sys.path.insert(0, os.path.join(sys.path[0], 'tools', 'checkpoint'))
+
+import loader_mcore_parallel
+import saver_dist
+
+TP, PP = 2, 2
+NUM_LAYERS, HIDDEN, FFN, VOCAB = 4, 8, 16, 16
+
+
+def _get_checkpoint_args():
+    return Namespace(
+        tensor_model_parallel_size=TP,
+        pipeline_model_parallel_size=PP,
+        virtual_pipeline_model_parallel_size=None,
+        num_layers=NUM_LAYERS,
+        hidden_size=HIDDEN,
+        seq_length=16,
+        num_attention_heads=2,
+        max_position_embeddings=16,
+        tokenizer_type='NullTokenizer',
+        params_dtype=torch.float,
+        untie_embeddings_and_output_weights=True,
+        position_embedding_type='learned_absolute',
+        add_bias_linear=True,
+        normalization='LayerNorm',
+        swiglu=True,
+        make_vocab_size_divisible_by=4,
+        use_legacy_models=False,
+        num_experts=None,
+        consumed_train_samples=100,
+        consumed_valid_samples=10,
+    )
+
+
+def _get_weights():
+    """Full weights, with the layer keys of the distributed checkpoint."""
+    layer = 'decoder.layers.'
+    return {
+        'embedding.word_embeddings.weight': torch.randn(VOCAB, HIDDEN),
+        'embedding.position_embeddings.weight': torch.randn(16, HIDDEN),
+        f'{layer}self_attention.linear_qkv.layer_norm_weight': torch.randn(NUM_LAYERS, HIDDEN),
+        f'{layer}self_attention.linear_qkv.layer_norm_bias': torch.randn(NUM_LAYERS, HIDDEN),
+        f'{layer}self_attention.linear_qkv.weight': torch.randn(NUM_LAYERS, 3 * HIDDEN, HIDDEN),
+        f'{layer}self_attention.linear_qkv.bias': torch.randn(NUM_LAYERS, 3 * HIDDEN),
+        f'{layer}self_attention.linear_proj.weight': torch.randn(NUM_LAYERS, HIDDEN, HIDDEN),
+        f'{layer}self_attention.linear_proj.bias': torch.randn(NUM_LAYERS, HIDDEN),
+        f'{layer}mlp.linear_fc1.layer_norm_weight': torch.randn(NUM_LAYERS, HIDDEN),
+        f'{layer}mlp.linear_fc1.layer_norm_bias': torch.randn(NUM_LAYERS, HIDDEN),
+        # The W half followed by the V half
+        f'{layer}mlp.linear_fc1.weight': torch.randn(NUM_LAYERS, 2 * FFN, HIDDEN),
+        f'{layer}mlp.linear_fc1.bias': torch.randn(NUM_LAYERS, 2 * FFN),
+        f'{layer}mlp.linear_fc2.weight': torch.randn(NUM_LAYERS, HIDDEN, FFN),
+        f'{layer}mlp.linear_fc2.bias': torch.randn(NUM_LAYERS, HIDDEN),
+        'decoder.final_layernorm.weight': torch.randn(HIDDEN),
+        'decoder.final_layernorm.bias': torch.randn(HIDDEN),
+        'output_layer.weight': torch.randn(VOCAB, HIDDEN),
+    }
+
+
+# Tensor parallel axis of the weights, the SwiGLU fc1 weights are split in halves
+_TP_AXES = {
+    'embedding.word_embeddings.weight': 0,
+    'self_attention.linear_qkv.weight': 0,
+    'self_attention.linear_qkv.bias': 0,
+    'self_attention.linear_proj.weight': 1,
+    'mlp.linear_fc1.weight': 0,
+    'mlp.linear_fc1.bias': 0,
+    'mlp.linear_fc2.weight': 1,
+    'output_layer.weight': 0,
+}
+
+
+def _save_legacy_checkpoint(load_dir, weights):
+    """Save the weights as an M-Core checkpoint in the torch format with TP x PP ranks."""
+    layers_per_stage = NUM_LAYERS // PP
+    for pp_rank in range(PP):
+        for tp_rank in range(TP):
+            model = {}
+            for key, tensor in weights.items():
+                if key.startswith('decoder.layers.'):
+                    name = key[len('decoder.layers.') :]
+                    layers = range(pp_rank * layers_per_stage, (pp_rank + 1) * layers_per_stage)
+                    tensors = {
+                        f'decoder.layers.{layer_idx % layers_per_stage}.{name}': tensor[layer_idx]
+                        for layer_idx in layers
+                    }
+                else:
+                    name = key
+                    if key.startswith('embedding.') and pp_rank != 0:
+                        continue
+                    if not key.startswith('embedding.') and pp_rank != PP - 1:
+                        continue
+                    tensors = {key: tensor}
+                for local_key, local_tensor in tensors.items():
+                    if name in ('mlp.linear_fc1.weight', 'mlp.linear_fc1.bias'):
+                        halves = [half.chunk(TP)[tp_rank] for half in local_tensor.chunk(2)]
+                        local_tensor = torch.cat(halves)
+                    elif name in _TP_AXES:
+                        local_tensor = local_tensor.chunk(TP, dim=_TP_AXES[name])[tp_rank]
+                    model[local_key] = local_tensor.clone()
+                model['decoder.layers.0.self_attention.linear_qkv._extra_state'] = None
+            checkpoint_dir = os.path.join(
+                load_dir, 'iter_0000010', f'mp_rank_{tp_rank:02d}_{pp_rank:03d}'
+            )
+            os.makedirs(checkpoint_dir)
+            torch.save(
+                {
+                    'args': _get_checkpoint_args(),
+                    'checkpoint_version': 3.0,
+                    'iteration': 10,
+                    'model': model,
+                },
+                os.path.join(checkpoint_dir, 'model_optim_rng.pt'),
+            )
+    with open(os.path.join(load_dir, 'latest_checkpointed_iteration.txt'), 'w') as f:
+        f.write('10')
+
+
+class TestCheckpointConversion:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_parallel_loader_and_dist_saver(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(1, 1)
+
+        weights = _get_weights()
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_conversion', sync=True) as ckpt_dir:
+            load_dir, save_dir = str(ckpt_dir / 'legacy'), str(ckpt_dir / 'dist')
+            if Utils.rank == 0:
+                _save_legacy_checkpoint(load_dir, weights)
+                messages = queue.Queue()
+                loader_mcore_parallel.load_checkpoint(
+                    messages,
+                    Namespace(
+                        model_type='GPT',
+                        load_dir=load_dir,
+                        true_vocab_size=VOCAB,
+                        vocab_file=None,
+                        megatron_path=None,
+                        loader_num_workers=3,
+                        loader_max_pending_layers=2,
+                    ),
+                )
+                saver_dist.save_checkpoint(
+                    messages,
+                    Namespace(
+                        save_dir=save_dir,
+                        checking=True,
+                        megatron_path=None,
+                        saver_num_workers=2,
+                        saver_max_pending_layers=None,
+                        target_tensor_parallel_size=2,
+                    ),
+                )
+                assert messages.empty()
+            torch.distributed.barrier()
+
+            # Load the full tensors, each layer separately
+            sharded_state_dict = {}
+            for key, tensor in weights.items():
+                if key.startswith('decoder.layers.'):
+                    for layer_idx in range(NUM_LAYERS):
+                        sharded_state_dict[f'{key}.{layer_idx}'] = ShardedTensor.from_rank_offsets(
+                            key,
+                            torch.zeros_like(tensor[layer_idx]),
+                            (0, layer_idx, NUM_LAYERS),
+                            prepend_axis_num=1,
+                        )
+                else:
+                    sharded_state_dict[key] = ShardedTensor.from_rank_offsets(
+                        key, torch.zeros_like(tensor)
+                    )
+            checkpoint_dir = os.path.join(save_dir, 'iter_0000010')
+            loaded_state_dict = load(sharded_state_dict, checkpoint_dir)
+            for key, tensor in weights.items():
+                if key.startswith('decoder.layers.'):
+                    for layer_idx in range(NUM_LAYERS):
+                        assert torch.equal(
+                            loaded_state_dict[f'{key}.{layer_idx}'], tensor[layer_idx]
+                        ), (key, layer_idx)
+                else:
+                    assert torch.equal(loaded_state_dict[key], tensor), key
+
+            common_state_dict = load_common_state_dict(checkpoint_dir)
+            assert common_state_dict['iteration'] == 10
+            assert common_state_dict['args'].consumed_train_samples == 100
+            assert common_state_dict['args'].ckpt_format == 'torch_dist'
+
+        Utils.destroy_model_parallel()
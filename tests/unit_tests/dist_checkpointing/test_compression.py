@@ -0,0 +1,176 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import torch
+from torch.distributed.checkpoint import FileSystemReader
+
+from megatron.core.dist_checkpointing import ShardedTensor, load, save
+from megatron.core.dist_checkpointing.strategies.compression import (
+    ADAM_MOMENTS_PATTERN,
+    HAVE_LZ4,
+    HAVE_ZSTD,
+    CompressionConfig,
+    decode_tensor,
+    encode_tensor,
+    get_encoding_summary,
+)
+from megatron.core.dist_checkpointing.strategies.torch import TorchDistSaveShardedStrategy
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.test_utilities import Utils
+
+_CODECS = [
+    'zlib',
+    'none',
+    pytest.param('zstd', marks=pytest.mark.skipif(not HAVE_ZSTD, reason='zstandard required')),
+    pytest.param('lz4', marks=pytest.mark.skipif(not HAVE_LZ4, reason='lz4 required')),
+]
+
+
+class TestEncoding:
+    @pytest.mark.parametrize('codec', _CODECS)
+    @pytest.mark.parametrize('dtype', [torch.float32, torch.bfloat16, torch.int64])
+    def test_lossless_roundtrip(self, codec, dtype):
+        tensor = (torch.randn(37, 11) * 100).to(dtype)
+        # Small chunks, so that the tensor spans multiple chunks
+        config = CompressionConfig(codec=codec, chunk_size=100)
+        with ThreadPoolExecutor(2) as executor:
+            payload, codec_info = encode_tensor(tensor, 'key', config, executor)
+            decoded = decode_tensor(payload, codec_info, executor)
+        assert decoded.dtype == dtype
+        assert torch.equal(decoded, tensor)
+        assert 'quantization' not in codec_info
+
+    def test_compression_of_constant_data(self):
+        tensor = torch.ones(1024)
+        with ThreadPoolExecutor(1) as executor:
+            payload, _ = encode_tensor(tensor, 'key', CompressionConfig(codec='zlib'), executor)
+        assert len(payload) < tensor.numel() * tensor.element_size() // 10
+
+    @pytest.mark.parametrize('dtype', [torch.float32, torch.bfloat16])
+    def test_quantization(self, dtype):
+        config = CompressionConfig(
+            codec='zlib', quantize_pattern=ADAM_MOMENTS_PATTERN, quantize_block_size=64
+        )
+        tensor = torch.randn(50, 30).to(dtype)
+        with ThreadPoolExecutor(2) as executor:
+            # Keys not matching the pattern are not quantized
+            _, codec_info = encode_tensor(tensor, 'optimizer.state.fp32_param.a', config, executor)
+            assert 'quantization' not in codec_info
+
+            payload, codec_info = encode_tensor(
+                tensor, 'optimizer.state.exp_avg.a', config, executor
+            )
+            decoded = decode_tensor(payload, codec_info, executor)
+        assert codec_info['quantization'] == 'int8'
+        assert decoded.dtype == dtype and decoded.shape == tensor.shape
+        max_abs_error = (decoded.float() - tensor.float()).abs().max().item()
+        assert max_abs_error == pytest.approx(codec_info['max_abs_error'])
+        if dtype == torch.float32:
+            # The error is bounded by half of the largest block scale
+            assert max_abs_error <= tensor.abs().max().item() / 127 / 2 + 1e-6
+
+    def test_second_moments_quantization(self):
+        config = CompressionConfig(
+            codec='zlib', quantize_pattern=ADAM_MOMENTS_PATTERN, quantize_block_size=64
+        )
+        torch.manual_seed(0)
+        # Heavy-tailed second moments, spanning many orders of magnitude within each block
+        exp_avg_sq = torch.exp(torch.randn(64, 30) * 5) * 1e-10
+        exp_avg_sq[0, :5] = 0
+        exp_avg = torch.randn(64, 30) * exp_avg_sq.sqrt()
+        with ThreadPoolExecutor(2) as executor:
+            payload, codec_info = encode_tensor(
+                exp_avg_sq, 'optimizer.state.exp_avg_sq.a', config, executor
+            )
+            decoded = decode_tensor(payload, codec_info, executor)
+        assert codec_info['quantization'] == 'uint8_sqrt'
+        assert decoded.dtype == exp_avg_sq.dtype and decoded.shape == exp_avg_sq.shape
+        max_abs_error = (decoded - exp_avg_sq).abs().max().item()
+        assert max_abs_error == pytest.approx(codec_info['max_abs_error'])
+
+        # Non-zero values are not decoded as zero
+        assert torch.equal(decoded == 0, exp_avg_sq == 0)
+        # The square roots are rounded up, by at most the block scale
+        sqrt_error = (decoded.sqrt() - exp_avg_sq.sqrt()).reshape(-1, 64)
+        block_scales = exp_avg_sq.sqrt().reshape(-1, 64).amax(dim=1, keepdim=True) / 255
+        assert (sqrt_error >= -1e-6 * block_scales).all()
+        assert (sqrt_error <= block_scales * (1 + 1e-6)).all()
+        # So the Adam updates computed from the decoded state don't grow
+        eps = 1e-8
+        update = exp_avg / (exp_avg_sq.sqrt() + eps)
+        decoded_update = exp_avg / (decoded.sqrt() + eps)
+        assert (decoded_update.abs() <= update.abs() * (1 + 1e-5)).all()
+        # While symmetric quantization of the second moments rounds them to zero
+        symmetric_config = CompressionConfig(
+            codec='zlib',
+            quantize_pattern=ADAM_MOMENTS_PATTERN,
+            quantize_sqrt_pattern=None,
+            quantize_block_size=64,
+        )
+        with ThreadPoolExecutor(2) as executor:
+            payload, codec_info = encode_tensor(
+                exp_avg_sq, 'optimizer.state.exp_avg_sq.a', symmetric_config, executor
+            )
+            decoded_symmetric = decode_tensor(payload, codec_info, executor)
+        assert codec_info['quantization'] == 'int8'
+        symmetric_update = exp_avg / (decoded_symmetric.clamp(min=0).sqrt() + eps)
+        assert symmetric_update.abs().max() > 100 * update.abs().max()
+
+
+class TestCompressedSave:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_save_load_resharding(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        weight = torch.randn(8 * Utils.world_size, 64)
+        exp_avg = torch.randn(8 * Utils.world_size, 64)
+
+        def _get_sharded_state_dict(weight, exp_avg, axis):
+            def _shard(ten):
+                ten = ten.chunk(Utils.world_size, dim=axis)[Utils.rank].clone()
+                return ten, (axis, Utils.rank, Utils.world_size)
+
+            return {
+                'weight': ShardedTensor.from_rank_offsets('weight', *_shard(weight)),
+                'exp_avg': ShardedTensor.from_rank_offsets(
+                    'optimizer.state.exp_avg.weight', *_shard(exp_avg)
+                ),
+            }
+
+        save_strategy = TorchDistSaveShardedStrategy(
+            'torch_dist',
+            1,
+            compression=CompressionConfig(
+                codec='zlib', min_size=0, quantize_pattern=ADAM_MOMENTS_PATTERN
+            ),
+        )
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_compressed_save', sync=True) as ckpt_dir:
+            save(_get_sharded_state_dict(weight, exp_avg, 0), ckpt_dir, save_strategy)
+
+            summary = get_encoding_summary(FileSystemReader(ckpt_dir).read_metadata().storage_data)
+            assert summary['encoded_items'] == 2 * Utils.world_size
+            assert summary['quantized_items'] == Utils.world_size
+            assert 0 < summary['max_abs_error'] <= exp_avg.abs().max().item() / 127 / 2 + 1e-6
+
+            # Load with a different sharding
+            loaded_state_dict = load(
+                _get_sharded_state_dict(torch.zeros_like(weight), torch.zeros_like(exp_avg), 1),
+                ckpt_dir,
+            )
+            expected_state_dict = _get_sharded_state_dict(weight, exp_avg, 1)
+            assert torch.equal(loaded_state_dict['weight'], expected_state_dict['weight'].data)
+            assert torch.allclose(
+                loaded_state_dict['exp_avg'],
+                expected_state_dict['exp_avg'].data,
+                atol=summary['max_abs_error'],
+                rtol=0,
+            )
+
+        Utils.destroy_model_parallel()
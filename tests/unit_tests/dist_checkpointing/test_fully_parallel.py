@@ -191,7 +191,8 @@ class TestFullyParallelSaveAndLoad:
                                                          do_cache_distribution=True)
         with TempNamedDir(tmp_path_dist_ckpt / 'mock_dir') as ckpt_dir_A:
             loaded_state_dict = load_strategy.load(state_dict, ckpt_dir_A)
-        key_to_saving_rank = dict(map_reduce(load_strategy.cached_distribution.main_rank_for_shard.items(), lambda shard_rank: shard_rank[0][0], lambda shard_rank: shard_rank[1]))
+        cached_distribution, = load_strategy.distribution_cache.plans.values()
+        key_to_saving_rank = dict(map_reduce(cached_distribution.main_rank_for_shard.items(), lambda shard_rank: shard_rank[0][0], lambda shard_rank: shard_rank[1]))
         assert expected_key_to_saving_ranks == key_to_saving_rank
 
         assert mock_strategy.load_keys == expected_keys_saved_by_current_rank, (Utils.rank, mock_strategy.load_keys, expected_keys_saved_by_current_rank)
@@ -0,0 +1,92 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import os
+import shutil
+
+import torch
+
+from megatron.core.dist_checkpointing import ShardedTensor, load, save
+from megatron.core.dist_checkpointing.dict_utils import diff
+from megatron.core.dist_checkpointing.strategies.incremental import (
+    compact_incremental_checkpoint,
+    get_referenced_checkpoints,
+)
+from megatron.core.dist_checkpointing.strategies.torch import TorchDistSaveShardedStrategy
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.test_utilities import Utils
+
+
+def _get_sharded_state_dict(frozen, trained):
+    return {
+        'frozen': ShardedTensor.from_rank_offsets(
+            'frozen', frozen, (0, Utils.rank, Utils.world_size)
+        ),
+        'trained': ShardedTensor.from_rank_offsets(
+            'trained', trained, (0, Utils.rank, Utils.world_size)
+        ),
+    }
+
+
+def _get_data_files_size(ckpt_dir):
+    return sum(
+        os.path.getsize(ckpt_dir / name)
+        for name in os.listdir(ckpt_dir)
+        if name.endswith('.distcp')
+    )
+
+
+class TestIncrementalSave:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_incremental_save_and_compaction(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        frozen = torch.rand(1024, 16) + Utils.rank
+        save_strategy = TorchDistSaveShardedStrategy('torch_dist', 1, incremental=True)
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_incremental', sync=True) as root_dir:
+            ckpt_dirs = [root_dir / f'iter_{i}' for i in range(3)]
+            if Utils.rank == 0:
+                for ckpt_dir in ckpt_dirs:
+                    ckpt_dir.mkdir()
+            torch.distributed.barrier()
+
+            for i, ckpt_dir in enumerate(ckpt_dirs):
+                save_strategy.base_checkpoint_dir = ckpt_dirs[i - 1] if i > 0 else None
+                trained = torch.full((4, 16), float(i))
+                save(_get_sharded_state_dict(frozen, trained), ckpt_dir, save_strategy)
+
+            # Only the changed tensor is written after the first save
+            if Utils.rank == 0:
+                assert _get_data_files_size(ckpt_dirs[2]) < _get_data_files_size(ckpt_dirs[0])
+                # References point directly to the files with the data
+                assert get_referenced_checkpoints(ckpt_dirs[2]) == {ckpt_dirs[0]}
+                assert get_referenced_checkpoints(ckpt_dirs[0]) == set()
+            torch.distributed.barrier()
+
+            expected_state_dict = {'frozen': frozen, 'trained': torch.full((4, 16), 2.0)}
+            loaded_state_dict = load(
+                _get_sharded_state_dict(torch.zeros(1024, 16), torch.zeros(4, 16)), ckpt_dirs[2]
+            )
+            diffs = diff(loaded_state_dict, expected_state_dict)
+            assert not any(map(bool, diffs)), diffs
+
+            # After compaction, the referenced checkpoints can be removed
+            compacted_dir = root_dir / 'iter_2_compacted'
+            if Utils.rank == 0:
+                compact_incremental_checkpoint(ckpt_dirs[2], compacted_dir)
+                assert get_referenced_checkpoints(compacted_dir) == set()
+                for ckpt_dir in ckpt_dirs:
+                    shutil.rmtree(ckpt_dir)
+            torch.distributed.barrier()
+
+            loaded_state_dict = load(
+                _get_sharded_state_dict(torch.zeros(1024, 16), torch.zeros(4, 16)), compacted_dir
+            )
+            diffs = diff(loaded_state_dict, expected_state_dict)
+            assert not any(map(bool, diffs)), diffs
+
+        Utils.destroy_model_parallel()
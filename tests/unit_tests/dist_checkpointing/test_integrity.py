@@ -0,0 +1,172 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import io
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+import torch
+from torch.distributed.checkpoint import CheckpointException, FileSystemReader
+
+from megatron.core.dist_checkpointing import ShardedTensor, load, save
+from megatron.core.dist_checkpointing.strategies.compression import CompressionConfig
+from megatron.core.dist_checkpointing.strategies.integrity import (
+    ChecksumStream,
+    compute_checksum,
+    verify_checkpoint,
+)
+from megatron.core.dist_checkpointing.strategies.torch import (
+    TorchDistLoadShardedStrategy,
+    TorchDistSaveShardedStrategy,
+)
+from megatron.training import checkpointing
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.test_utilities import Utils
+
+
+def _get_sharded_state_dict(tensor):
+    return {
+        'weight': ShardedTensor.from_rank_offsets(
+            'weight', tensor, (0, Utils.rank, Utils.world_size)
+        ),
+        'bias': ShardedTensor.from_rank_offsets('bias', tensor[0].clone(), replica_id=Utils.rank),
+    }
+
+
+class TestIntegrity:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_checksum_stream(self):
+        buffer = io.BytesIO()
+        stream = ChecksumStream(buffer, 'crc32')
+        torch.save(torch.arange(10), stream)
+        assert stream.checksum() == compute_checksum(buffer.getvalue(), 'crc32')
+        assert stream.checksum() != compute_checksum(buffer.getvalue()[:-1], 'crc32')
+
+    @pytest.mark.parametrize('compression', [None, CompressionConfig(codec='zlib', min_size=0)])
+    def test_verify_checkpoint(self, tmp_path_dist_ckpt, compression):
+        Utils.initialize_model_parallel(2, 4)
+
+        save_strategy = TorchDistSaveShardedStrategy(
+            'torch_dist', 1, compression=compression, checksum_algorithm='crc32'
+        )
+        tensor = torch.randn(4, 8)
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_verify_checkpoint', sync=True) as ckpt_dir:
+            save(_get_sharded_state_dict(tensor), ckpt_dir, save_strategy)
+
+            report = verify_checkpoint(ckpt_dir)
+            assert report.ok, report.errors
+            assert report.verified_items == Utils.world_size + 1
+            assert report.unchecked_items == 0
+
+            load_strategy = TorchDistLoadShardedStrategy(verify_checksums=True)
+            loaded_state_dict = load(
+                _get_sharded_state_dict(torch.zeros(4, 8)), ckpt_dir, load_strategy
+            )
+            assert torch.equal(loaded_state_dict['weight'], tensor)
+
+            # Corrupt the last byte of the first item of each rank
+            torch.distributed.barrier()
+            storage_data = FileSystemReader(ckpt_dir).read_metadata().storage_data
+            storage_info = min(
+                (
+                    si
+                    for si in storage_data.values()
+                    if si.relative_path == f'__{Utils.rank}_0.distcp'
+                ),
+                key=lambda si: si.offset,
+            )
+            with open(ckpt_dir / storage_info.relative_path, 'r+b') as f:
+                f.seek(storage_info.offset + storage_info.length - 1)
+                last_byte = f.read(1)
+                f.seek(-1, io.SEEK_CUR)
+                f.write(bytes([last_byte[0] ^ 0xFF]))
+            torch.distributed.barrier()
+
+            report = verify_checkpoint(ckpt_dir)
+            assert not report.ok
+            assert len(report.errors) == Utils.world_size
+            assert 'checksum mismatch' in report.errors[0]
+            # The read errors are gathered from all ranks by PyT Distributed
+            with pytest.raises(CheckpointException, match='Checksum mismatch'):
+                load(_get_sharded_state_dict(torch.zeros(4, 8)), ckpt_dir, load_strategy)
+            torch.distributed.barrier()
+
+            # Truncated file
+            if Utils.rank == 0:
+                with open(ckpt_dir / storage_info.relative_path, 'r+b') as f:
+                    f.truncate(storage_info.offset)
+            torch.distributed.barrier()
+            report = verify_checkpoint(ckpt_dir)
+            assert any('truncated' in error for error in report.errors)
+
+        Utils.destroy_model_parallel()
+
+    def test_load_latest_verified_checkpoint(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        args = SimpleNamespace(
+            non_persistent_global_ckpt_dir=None,
+            non_persistent_ckpt_type=None,
+            ckpt_verify_on_load=True,
+            exit_on_missing_checkpoint=False,
+        )
+        tensor = torch.randn(4, 8)
+        with TempNamedDir(
+            tmp_path_dist_ckpt / 'test_load_latest_verified', sync=True
+        ) as load_dir, mock.patch.dict(checkpointing._VERIFIED_ITERATIONS, clear=True):
+            for iteration in (1, 2):
+                if Utils.rank == 0:
+                    (load_dir / f'iter_{iteration:07d}').mkdir()
+                torch.distributed.barrier()
+                save(
+                    {**_get_sharded_state_dict(tensor), 'iteration': iteration},
+                    load_dir / f'iter_{iteration:07d}',
+                )
+
+            def _truncate(iteration):
+                if Utils.rank == 0:
+                    (load_dir / f'iter_{iteration:07d}' / '__0_0.distcp').write_bytes(b'')
+                torch.distributed.barrier()
+
+            if Utils.rank == 0:
+                (load_dir / 'latest_checkpointed_iteration.txt').write_text('2')
+            _truncate(2)
+
+            # The checkpoint args are loaded before torch.distributed is initialized, without
+            # the verification, which is done collectively by the following loads
+            with mock.patch(
+                'megatron.training.checkpointing.verify_checkpoint', wraps=verify_checkpoint
+            ) as verify_checkpoint_mock, mock.patch(
+                'torch.distributed.is_initialized', return_value=False
+            ):
+                state_dict, _, _ = checkpointing._load_base_checkpoint(
+                    str(load_dir), args, rank0=True
+                )
+                assert state_dict['iteration'] == 2
+                assert verify_checkpoint_mock.call_count == 0
+            assert not checkpointing._VERIFIED_ITERATIONS
+
+            # The common state of the arguments and metadata loads comes from the verified
+            # checkpoint as well, the verification is done once
+            with mock.patch(
+                'megatron.training.checkpointing.verify_checkpoint', wraps=verify_checkpoint
+            ) as verify_checkpoint_mock:
+                for _ in range(2):
+                    state_dict, checkpoint_name, _ = checkpointing._load_base_checkpoint(
+                        str(load_dir), args, rank0=True
+                    )
+                    assert state_dict['iteration'] == 1
+                    assert checkpoint_name.endswith('iter_0000001')
+                assert verify_checkpoint_mock.call_count == 2
+
+            _truncate(1)
+            checkpointing._VERIFIED_ITERATIONS.clear()
+            with pytest.raises(RuntimeError, match='passes the verification'):
+                checkpointing._load_base_checkpoint(str(load_dir), args, rank0=True)
+
+        Utils.destroy_model_parallel()
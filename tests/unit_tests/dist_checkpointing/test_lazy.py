@@ -0,0 +1,103 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import torch
+
+from megatron.core.dist_checkpointing import ShardedTensor, save
+from megatron.core.dist_checkpointing.strategies.lazy import (
+    LazyCheckpointLoader,
+    LazyTensor,
+    materialize,
+)
+from megatron.core.dist_checkpointing.mapping import ShardedObject
+from megatron.core.models.gpt.gpt_layer_specs import get_gpt_layer_local_spec
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.dist_checkpointing.models.test_gpt_model import initialize_gpt_model
+from tests.unit_tests.test_utilities import Utils
+
+
+class TestLazyLoading:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_load_tensor_and_lazy_load(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        weight = torch.randn(4 * Utils.world_size, 6)
+        layers = torch.randn(Utils.world_size, 4, 6)
+
+        def _get_sharded_state_dict(weight, axis):
+            return {
+                'weight': ShardedTensor.from_rank_offsets(
+                    'weight',
+                    weight.chunk(Utils.world_size, dim=axis)[Utils.rank].clone(),
+                    (axis, Utils.rank, Utils.world_size),
+                ),
+                'step': 3,
+                'obj': ShardedObject('obj', {'step': 3}, (1,), (0,), replica_id=Utils.rank),
+            }
+
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_lazy_load', sync=True) as ckpt_dir:
+            sharded_state_dict = _get_sharded_state_dict(weight, 0)
+            sharded_state_dict['layers'] = ShardedTensor.from_rank_offsets(
+                'layers',
+                layers[Utils.rank].clone(),
+                (0, Utils.rank, Utils.world_size),
+                prepend_axis_num=1,
+            )
+            save(sharded_state_dict, ckpt_dir)
+
+            loader = LazyCheckpointLoader(ckpt_dir)
+            assert sorted(loader.keys()) == ['layers', 'weight']
+            assert torch.equal(loader.load_tensor('weight'), weight)
+
+            # Read with a different sharding
+            state_dict = loader.load(_get_sharded_state_dict(torch.zeros_like(weight), 1))
+            assert isinstance(state_dict['weight'], LazyTensor)
+            assert state_dict['step'] == 3
+            assert state_dict['obj'] == {'step': 3}
+            materialize(state_dict)
+            assert torch.equal(
+                state_dict['weight'], _get_sharded_state_dict(weight, 1)['weight'].data
+            )
+
+            # Read in place into a non-contiguous tensor
+            transposed = torch.zeros(6, 4).t()
+            loader.read_shard(
+                ShardedTensor.from_rank_offsets(
+                    'layers', transposed, (0, Utils.rank, Utils.world_size), prepend_axis_num=1
+                )
+            )
+            assert torch.equal(transposed, layers[Utils.rank])
+            loader.close()
+
+        Utils.destroy_model_parallel()
+
+    def test_attach_to_model(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 1)
+
+        gpt_model = initialize_gpt_model(1, get_gpt_layer_local_spec, gated_linear_unit=True)
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_lazy_attach', sync=True) as ckpt_dir:
+            save(gpt_model.sharded_state_dict(), ckpt_dir)
+
+            new_gpt_model = initialize_gpt_model(
+                2, get_gpt_layer_local_spec, gated_linear_unit=True
+            )
+            loader = LazyCheckpointLoader(ckpt_dir)
+            lazy_tensors = loader.attach(new_gpt_model)
+            # Each module waits for its own weights before the forward pass
+            assert len(new_gpt_model.decoder.layers[0].mlp.linear_fc1._forward_pre_hooks) == 1
+            for lazy_tensor in lazy_tensors.values():
+                lazy_tensor.materialize()
+            loader.close()
+            assert not new_gpt_model.decoder.layers[0].mlp.linear_fc1._forward_pre_hooks
+
+            for (key, expected), (_, loaded) in zip(
+                gpt_model.state_dict().items(), new_gpt_model.state_dict().items()
+            ):
+                if isinstance(expected, torch.Tensor):
+                    assert torch.equal(expected, loaded), key
+
+        Utils.destroy_model_parallel()
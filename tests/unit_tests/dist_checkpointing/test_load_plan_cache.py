@@ -0,0 +1,111 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+from unittest import mock
+
+import torch
+from torch.distributed.checkpoint.metadata import (
+    ChunkStorageMetadata,
+    Metadata,
+    TensorProperties,
+    TensorStorageMetadata,
+)
+
+from megatron.core.dist_checkpointing import ShardedTensor, load, save
+from megatron.core.dist_checkpointing.strategies.load_plan_cache import (
+    LoadPlanCache,
+    get_metadata_key,
+    get_structure_key,
+)
+from megatron.core.dist_checkpointing.strategies.torch import TorchDistLoadShardedStrategy
+from megatron.core.dist_checkpointing.validation import determine_global_metadata
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.test_utilities import Utils
+
+
+def _get_sharded_state_dict(tensor, key='weight'):
+    return {key: ShardedTensor.from_rank_offsets(key, tensor, (0, Utils.rank, Utils.world_size))}
+
+
+def _get_metadata(chunk_sizes, storage_data=None):
+    chunks, offset = [], 0
+    for size in chunk_sizes:
+        chunks.append(ChunkStorageMetadata(torch.Size([offset, 0]), torch.Size([size, 8])))
+        offset += size
+    tensor_md = TensorStorageMetadata(
+        TensorProperties(dtype=torch.float), torch.Size([offset, 8]), chunks
+    )
+    return Metadata({'weight': tensor_md}, storage_data=storage_data)
+
+
+class TestLoadPlanCache:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_cache(self):
+        Utils.initialize_model_parallel(1, 1)
+        cache = LoadPlanCache(max_size=2)
+        assert cache.get('a') is None
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        # 'b' is the least recently used
+        assert cache.get('b') is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+        assert get_structure_key(_get_sharded_state_dict(torch.ones(2, 4))) == get_structure_key(
+            _get_sharded_state_dict(torch.zeros(2, 4))
+        )
+        assert get_structure_key(_get_sharded_state_dict(torch.ones(2, 4))) != get_structure_key(
+            _get_sharded_state_dict(torch.ones(3, 4))
+        )
+
+        # The storage info is ignored, the chunks layout is not
+        assert get_metadata_key(_get_metadata([2, 2])) == get_metadata_key(
+            _get_metadata([2, 2], storage_data={'weight': 'file'})
+        )
+        assert get_metadata_key(_get_metadata([2, 2])) != get_metadata_key(_get_metadata([1, 3]))
+
+    def test_repeated_loads(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        with TempNamedDir(
+            tmp_path_dist_ckpt / 'test_repeated_loads_A', sync=True
+        ) as ckpt_dir_A, TempNamedDir(
+            tmp_path_dist_ckpt / 'test_repeated_loads_B', sync=True
+        ) as ckpt_dir_B:
+            save(_get_sharded_state_dict(torch.ones(4, 8)), ckpt_dir_A)
+            save(_get_sharded_state_dict(torch.full((4, 8), 2.0)), ckpt_dir_B)
+
+            load_strategy = TorchDistLoadShardedStrategy(cached_metadata=True)
+            with mock.patch(
+                'megatron.core.dist_checkpointing.serialization.determine_global_metadata',
+                wraps=determine_global_metadata,
+            ) as determine_global_metadata_mock:
+                for ckpt_dir, expected_value in [(ckpt_dir_A, 1.0), (ckpt_dir_B, 2.0)] * 2:
+                    loaded_state_dict = load(
+                        _get_sharded_state_dict(torch.zeros(4, 8)), ckpt_dir, load_strategy
+                    )
+                    assert torch.all(loaded_state_dict['weight'] == expected_value)
+                # Both checkpoints have the same layout, the sharding is validated once
+                assert determine_global_metadata_mock.call_count == 1
+            # One plan miss, three plan hits, one validation miss, three validation hits
+            assert (load_strategy.load_plan_cache.hits, load_strategy.load_plan_cache.misses) == (
+                6,
+                2,
+            )
+
+            # A different structure must not reuse the cached plan
+            replicated_state_dict = {
+                'weight': ShardedTensor.from_rank_offsets(
+                    'weight', torch.zeros(4 * Utils.world_size, 8), replica_id=(0, Utils.rank)
+                )
+            }
+            loaded_state_dict = load(replicated_state_dict, ckpt_dir_B, load_strategy)
+            assert torch.all(loaded_state_dict['weight'] == 2.0)
+            assert load_strategy.load_plan_cache.misses == 4
+
+        Utils.destroy_model_parallel()
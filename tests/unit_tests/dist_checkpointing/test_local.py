@@ -0,0 +1,131 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import os
+import shutil
+
+import pytest
+import torch
+import torch.multiprocessing as mp
+
+from megatron.core.dist_checkpointing import LocalNonpersistentObject, ShardedTensor
+from megatron.core.dist_checkpointing.dict_utils import diff
+from megatron.core.dist_checkpointing.local import (
+    LocalCheckpointManager,
+    get_local_state_dict,
+    load_local_state_dict,
+)
+from megatron.core.dist_checkpointing.mapping import (
+    CheckpointingException,
+    ShardedObject,
+    ShardedTensorFactory,
+)
+
+
+def _build_fn(key, tensor, replica_id, flattened_range):
+    assert flattened_range is None
+    return [
+        ShardedTensor.from_rank_offsets(key + 'part1', tensor, replica_id=replica_id),
+        ShardedTensor.from_rank_offsets(key + 'part2', tensor * 2, replica_id=replica_id),
+    ]
+
+
+def _get_sharded_state_dict(base=0, rank=0, world_size=1):
+    return {
+        'iteration': base,
+        'model': {
+            'A': ShardedTensor.from_rank_offsets(
+                'A', torch.arange(4) + base + rank, (0, rank, world_size)
+            ),
+            'B': ShardedTensor.from_rank_offsets('B', torch.arange(3) + base, replica_id=rank),
+            'C': ShardedTensor.from_rank_offsets_flat(
+                'C',
+                torch.arange(3) + base,
+                (2, 2),
+                flattened_range=slice(1, 4),
+            ),
+            'D': ShardedTensorFactory('D', torch.arange(5) + base, _build_fn, sum),
+        },
+        'rng': ShardedObject('rng', {'state': base + rank}, (world_size,), (rank,)),
+        'nonpersistent': LocalNonpersistentObject(base),
+    }
+
+
+def test_local_state_dict():
+    local_state_dict = get_local_state_dict(_get_sharded_state_dict(0))
+    assert local_state_dict['common'] == {'iteration': 0}
+    assert len(local_state_dict['shards']) == 6
+
+    loaded_state_dict = load_local_state_dict(_get_sharded_state_dict(10), local_state_dict)
+    expected_state_dict = {
+        'iteration': 0,
+        'model': {
+            'A': torch.arange(4),
+            'B': torch.arange(3),
+            'C': torch.arange(3),
+            'D': torch.arange(5) * 3,  # sum of the two parts, as specified in merge_fn
+        },
+        'rng': {'state': 0},
+        # Non-persistent objects are not stored
+        'nonpersistent': 10,
+    }
+    diffs = diff(loaded_state_dict, expected_state_dict)
+    assert not any(map(bool, diffs)), diffs
+
+    # A different sharding can't be loaded
+    with pytest.raises(CheckpointingException):
+        load_local_state_dict(_get_sharded_state_dict(10, 1, 2), local_state_dict)
+
+
+def _run_local_checkpoint_manager(rank, world_size, root_dir, port):
+    os.environ['MASTER_ADDR'] = 'localhost'
+    os.environ['MASTER_PORT'] = str(port)
+    torch.distributed.init_process_group('gloo', rank=rank, world_size=world_size)
+    # One rank per node, each with its own node-local directory
+    node_dirs = [os.path.join(root_dir, f'node{i}') for i in range(world_size)]
+
+    manager = LocalCheckpointManager(node_dirs[rank], ranks_per_node=1)
+    assert manager.find_latest() == -1
+    for iteration in (2, 4):
+        sharded_state_dict = _get_sharded_state_dict(iteration, rank, world_size)
+        manager.save(get_local_state_dict(sharded_state_dict), iteration)
+    # Only the latest iteration is kept, with the replica of the previous rank
+    assert sorted(os.listdir(node_dirs[rank])) == ['iter_0000004']
+    assert sorted(os.listdir(os.path.join(node_dirs[rank], 'iter_0000004'))) == sorted(
+        [f'rank_{rank:05d}.pt', f'rank_{(rank - 1) % world_size:05d}.pt']
+    )
+    torch.distributed.barrier()
+
+    # Lose a node
+    if rank == 1:
+        shutil.rmtree(node_dirs[rank])
+    torch.distributed.barrier()
+
+    manager = LocalCheckpointManager(node_dirs[rank], ranks_per_node=1)
+    assert manager.find_latest() == 4
+    iteration, local_state_dict = manager.load()
+    assert iteration == 4
+    loaded_state_dict = load_local_state_dict(
+        _get_sharded_state_dict(10, rank, world_size), local_state_dict
+    )
+    assert loaded_state_dict['iteration'] == 4
+    assert torch.equal(loaded_state_dict['model']['A'], torch.arange(4) + 4 + rank)
+    assert loaded_state_dict['rng'] == {'state': 4 + rank}
+
+    # Lose the replica as well
+    if rank == 0:
+        shutil.rmtree(node_dirs[rank])
+    torch.distributed.barrier()
+    manager = LocalCheckpointManager(node_dirs[rank], ranks_per_node=1)
+    assert manager.find_latest() == -1
+
+    torch.distributed.destroy_process_group()
+
+
+def test_local_checkpoint_manager(tmp_path):
+    world_size = 3
+    mp.spawn(
+        _run_local_checkpoint_manager,
+        args=(world_size, str(tmp_path), 29517),
+        nprocs=world_size,
+        join=True,
+    )
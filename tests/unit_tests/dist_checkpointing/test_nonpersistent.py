@@ -117,6 +117,69 @@ class TestNonPersistentSaveAndLoad:
                             ), [filename, ckpt_a, ckpt_b]
         Utils.destroy_model_parallel()
 
+    @pytest.mark.parametrize(
+        ('tp,pp'),
+        [
+            (2, 4),
+        ]
+    )
+    def test_local_save_load_scenarios(self, tmp_path_dist_ckpt, tp, pp):
+        Utils.initialize_model_parallel(tp, pp)
+        num_floating_point_operations_so_far = 0
+        model, optimizer = setup_model_and_optimizer(1, tp, pp)
+        opt_param_scheduler = None
+
+        mock_args = SimpleNamespace()
+        with TempNamedDir(
+            tmp_path_dist_ckpt / "test_non_persistent_local"
+        ) as ckpt_dir, TempNamedDir(
+            tmp_path_dist_ckpt / "test_non_persistent_local_node"
+        ) as local_ckpt_dir, mock.patch(
+            'megatron.training.checkpointing.get_args', new=lambda: mock_args
+        ), mock.patch(
+            "megatron.training.checkpointing.update_num_microbatches"
+        ), mock.patch(
+            "megatron.training.checkpointing._LOCAL_CHECKPOINT_MANAGER", new=None
+        ):
+            init_basic_mock_args(mock_args, tp, pp)
+            init_checkpointing_mock_args(mock_args, ckpt_dir)
+            mock_args.non_persistent_ckpt_type = "local"
+            mock_args.non_persistent_local_ckpt_dir = str(local_ckpt_dir)
+            mock_args.non_persistent_save_interval = 2
+
+            save_checkpoint(
+                2,
+                model,
+                optimizer,
+                opt_param_scheduler,
+                num_floating_point_operations_so_far,
+                {},
+                non_persistent_ckpt=True,
+            )
+            save_checkpoint(
+                3, model, optimizer, opt_param_scheduler, num_floating_point_operations_so_far, {},
+            )
+            save_checkpoint(
+                4,
+                model,
+                optimizer,
+                opt_param_scheduler,
+                num_floating_point_operations_so_far,
+                {},
+                non_persistent_ckpt=True,
+            )
+            iteration, _ = load_checkpoint(model, optimizer, opt_param_scheduler)
+            assert iteration == 4
+            save_checkpoint(
+                6, model, optimizer, opt_param_scheduler, num_floating_point_operations_so_far, {},
+            )
+            iteration, _ = load_checkpoint(model, optimizer, opt_param_scheduler)
+            assert iteration == 6
+            # Only the latest local checkpoint is kept and none is written to the shared directory
+            assert os.listdir(local_ckpt_dir) == ["iter_0000004"]
+            assert _NON_PERSISTENT_CKPT_SUBDIR not in os.listdir(ckpt_dir)
+        Utils.destroy_model_parallel()
+
 
 class TestLegacySaveAndLoad:
     @pytest.mark.parametrize(
@@ -0,0 +1,63 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import torch
+
+from megatron.core.dist_checkpointing import ShardedTensor, load, save
+from megatron.core.dist_checkpointing.strategies.profiling import (
+    profile_phases,
+    record_phase,
+    timed_phase,
+)
+from megatron.core.dist_checkpointing.strategies.torch import TorchDistSaveShardedStrategy
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.test_utilities import Utils
+
+
+class TestPhaseProfiling:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_profile_phases(self):
+        record_phase('write', 1.0)
+        with profile_phases() as phases:
+            record_phase('write', 1.0)
+            with profile_phases() as inner_phases:
+                with timed_phase('read'):
+                    pass
+            record_phase('write', 2.0)
+        record_phase('write', 1.0)
+        assert dict(phases) == {'write': 3.0}
+        assert list(inner_phases) == ['read']
+
+    def test_save_and_load_phases(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        def _get_sharded_state_dict(tensor):
+            return {
+                'weight': ShardedTensor.from_rank_offsets(
+                    'weight', tensor, (0, Utils.rank, Utils.world_size)
+                )
+            }
+
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_save_and_load_phases') as ckpt_dir:
+            with profile_phases() as save_phases:
+                save(
+                    _get_sharded_state_dict(torch.ones(4, 8)),
+                    ckpt_dir,
+                    TorchDistSaveShardedStrategy('torch_dist', 1, thread_count=2),
+                )
+            expected_phases = {'planning', 'metadata_exchange', 'd2h', 'write', 'fsync'}
+            if Utils.rank == 0:
+                expected_phases.add('finalize')
+            assert set(save_phases) == expected_phases
+
+            with profile_phases() as load_phases:
+                loaded_state_dict = load(_get_sharded_state_dict(torch.zeros(4, 8)), ckpt_dir)
+            assert torch.equal(loaded_state_dict['weight'], torch.ones(4, 8))
+            assert {'metadata_read', 'planning', 'read'} <= set(load_phases)
+            assert all(phase_time >= 0 for phase_time in load_phases.values())
+
+        Utils.destroy_model_parallel()
@@ -0,0 +1,136 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import pytest
+import torch
+
+from megatron.core.dist_checkpointing import ShardedTensor, load, load_common_state_dict
+from megatron.core.dist_checkpointing.core import CheckpointingException
+from megatron.core.dist_checkpointing.mapping import ShardedObject
+from megatron.core.dist_checkpointing.strategies.streaming import StreamingCheckpointWriter
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.test_utilities import Utils
+
+NUM_LAYERS = 3
+
+
+def _layer_offsets(layer_idx):
+    return (0, layer_idx, NUM_LAYERS)
+
+
+class TestStreamingCheckpointWriter:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_write_and_load_resharded(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        weights = torch.randn(NUM_LAYERS, 16, 8)
+        # Stored in two parts, like the W and V halves of a SwiGLU weight
+        fc1 = torch.randn(NUM_LAYERS, 32, 8)
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_streaming_writer', sync=True) as ckpt_dir:
+            if Utils.rank == 0:
+                writer = StreamingCheckpointWriter(ckpt_dir / 'ckpt', num_workers=2)
+                for layer_idx in range(NUM_LAYERS):
+                    fc1_parts = fc1[layer_idx].chunk(2)
+                    writer.write(
+                        [
+                            ShardedTensor.from_rank_offsets(
+                                'layers.weight',
+                                weights[layer_idx],
+                                _layer_offsets(layer_idx),
+                                prepend_axis_num=1,
+                            ),
+                            *(
+                                ShardedTensor.from_rank_offsets(
+                                    'layers.fc1',
+                                    part,
+                                    _layer_offsets(layer_idx),
+                                    (1, part_idx, 2),
+                                    prepend_axis_num=1,
+                                )
+                                for part_idx, part in enumerate(fc1_parts)
+                            ),
+                            ShardedObject(
+                                'layers.extra_state', layer_idx, (NUM_LAYERS,), (layer_idx,), 0
+                            ),
+                        ]
+                    )
+                writer.finalize({'iteration': 7})
+            torch.distributed.barrier()
+
+            # Load each layer sharded along the last axis on all ranks
+            def _get_sharded_state_dict(weights, fc1):
+                return {
+                    f'{name}.{layer_idx}': ShardedTensor.from_rank_offsets(
+                        f'layers.{name}',
+                        ten[layer_idx].chunk(Utils.world_size, dim=1)[Utils.rank].clone(),
+                        _layer_offsets(layer_idx),
+                        (2, Utils.rank, Utils.world_size),
+                        prepend_axis_num=1,
+                    )
+                    for name, ten in (('weight', weights), ('fc1', fc1))
+                    for layer_idx in range(NUM_LAYERS)
+                }
+
+            sharded_state_dict = _get_sharded_state_dict(
+                torch.zeros_like(weights), torch.zeros_like(fc1)
+            )
+            for layer_idx in range(NUM_LAYERS):
+                sharded_state_dict[f'extra_state.{layer_idx}'] = ShardedObject(
+                    'layers.extra_state', None, (NUM_LAYERS,), (layer_idx,), 0
+                )
+            loaded_state_dict = load(sharded_state_dict, ckpt_dir / 'ckpt')
+            expected_state_dict = _get_sharded_state_dict(weights, fc1)
+            for key, sh_ten in expected_state_dict.items():
+                assert torch.equal(loaded_state_dict[key], sh_ten.data), key
+            for layer_idx in range(NUM_LAYERS):
+                assert loaded_state_dict[f'extra_state.{layer_idx}'] == layer_idx
+            assert load_common_state_dict(ckpt_dir / 'ckpt') == {'iteration': 7}
+
+        Utils.destroy_model_parallel()
+
+    def test_incomplete_tensor(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(1, 1)
+
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_streaming_incomplete', sync=True) as ckpt_dir:
+            if Utils.rank == 0:
+                writer = StreamingCheckpointWriter(ckpt_dir / 'ckpt', num_workers=1)
+                writer.write(
+                    [
+                        ShardedTensor.from_rank_offsets(
+                            'layers.weight', torch.ones(4), _layer_offsets(0), prepend_axis_num=1
+                        )
+                    ]
+                )
+                with pytest.raises(CheckpointingException, match='do not cover'):
+                    writer.finalize()
+            torch.distributed.barrier()
+
+        Utils.destroy_model_parallel()
+
+    def test_overlapping_chunks(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(1, 1)
+
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_streaming_overlap', sync=True) as ckpt_dir:
+            if Utils.rank == 0:
+                writer = StreamingCheckpointWriter(ckpt_dir / 'ckpt', num_workers=1)
+                # As many elements as the global shape, but the first layer twice
+                writer.write(
+                    [
+                        ShardedTensor.from_rank_offsets(
+                            'layers.weight',
+                            torch.ones(4),
+                            _layer_offsets(layer_idx),
+                            prepend_axis_num=1,
+                        )
+                        for layer_idx in [0, 0, 2]
+                    ]
+                )
+                with pytest.raises(CheckpointingException, match='overlap'):
+                    writer.finalize()
+            torch.distributed.barrier()
+
+        Utils.destroy_model_parallel()
@@ -0,0 +1,74 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+import torch
+
+from megatron.core.dist_checkpointing import ShardedTensor, load, save
+from megatron.core.dist_checkpointing.strategies.fully_parallel import (
+    FullyParallelLoadStrategyWrapper,
+)
+from megatron.core.dist_checkpointing.strategies.topology import (
+    _node_ids_to_indices,
+    distribute_shards_to_ranks_by_node,
+    get_node_id,
+    simulate_load_exchange,
+)
+from megatron.core.dist_checkpointing.strategies.torch import TorchDistLoadShardedStrategy
+from tests.unit_tests.dist_checkpointing import TempNamedDir
+from tests.unit_tests.test_utilities import Utils
+
+
+class TestTopologyAwareDistribution:
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def test_node_id(self, monkeypatch):
+        monkeypatch.delenv('MCORE_NODE_ID', raising=False)
+        monkeypatch.setenv('GROUP_RANK', '3')
+        assert get_node_id() == 'GROUP_RANK=3'
+        monkeypatch.setenv('MCORE_NODE_ID', 'node-a')
+        assert get_node_id() == 'MCORE_NODE_ID=node-a'
+        assert _node_ids_to_indices(['b', 'b', 'a', 'c', 'a']) == [0, 0, 1, 2, 1]
+
+    def test_distribution_by_node(self):
+        # 2 nodes with 2 ranks each, 'A' and 'B' replicated on all ranks, 'C' only on rank 3
+        shard_to_ranks = {'A': [0, 1, 2, 3], 'B': [0, 1, 2, 3], 'C': [3]}
+        shard_to_size = {'A': 8, 'B': 4, 'C': 2}
+        rank_to_node = [0, 0, 1, 1]
+
+        distribution = distribute_shards_to_ranks_by_node(
+            shard_to_ranks, shard_to_size, rank_to_node
+        )
+        assert distribution == {0: {'A': 0, 'B': 1}, 1: {'C': 3, 'A': 2, 'B': 3}}
+
+        traffic = simulate_load_exchange(shard_to_ranks, shard_to_size, rank_to_node)
+        assert traffic['uniform'] == dict(read=14, cross_node=14, intra_node=28)
+        assert traffic['topology_aware'] == dict(read=26, cross_node=0, intra_node=26)
+
+    def test_topology_aware_load(self, tmp_path_dist_ckpt):
+        Utils.initialize_model_parallel(2, 4)
+
+        def _get_sharded_state_dict(tensor):
+            return {
+                'weight': ShardedTensor.from_rank_offsets('weight', tensor, replica_id=Utils.rank),
+            }
+
+        with TempNamedDir(tmp_path_dist_ckpt / 'test_topology_aware_load', sync=True) as ckpt_dir:
+            save(_get_sharded_state_dict(torch.arange(32.0).reshape(4, 8)), ckpt_dir)
+
+            load_strategy = FullyParallelLoadStrategyWrapper(
+                TorchDistLoadShardedStrategy(), topology_aware=True
+            )
+            loaded_state_dict = load(
+                _get_sharded_state_dict(torch.zeros(4, 8)), ckpt_dir, load_strategy
+            )
+            assert torch.equal(loaded_state_dict['weight'], torch.arange(32.0).reshape(4, 8))
+            # All test ranks are on the same node
+            assert (
+                torch.distributed.get_world_size(load_strategy.parallelization_group)
+                == torch.distributed.get_world_size()
+            )
+
+        Utils.destroy_model_parallel()
@@ -62,17 +62,25 @@ def init_basic_mock_args(args, tp, pp, bf16=True):
 def init_checkpointing_mock_args(args, ckpt_dir, fully_parallel=False):
     args.non_persistent_global_ckpt_dir = None
     args.non_persistent_ckpt_type = None
+    args.non_persistent_local_ckpt_dir = None
     args.save = ckpt_dir
     args.load = ckpt_dir
     args.pretrained_checkpoint = None
     args.ckpt_fully_parallel_save = fully_parallel
     args.ckpt_fully_parallel_load = fully_parallel
+    args.ckpt_topology_aware_load = False
     args.async_save = False
     args.use_dist_ckpt = True
     args.ckpt_format = 'torch_dist'
     args.no_save_optim = False
     args.no_save_rng = False
     args.ckpt_assume_constant_structure = False
+    args.ckpt_incremental = False
+    args.ckpt_pipelined_d2h = False
+    args.ckpt_compression = None
+    args.ckpt_quantize_adam_moments = False
+    args.ckpt_checksums = False
+    args.ckpt_verify_on_load = False
     args.log_progress = False
     args.auto_detect_ckpt_format = False
     args.exit_on_missing_checkpoint = False
@@ -1,8 +1,11 @@
+import asyncio
 from typing import List
 from megatron.core.inference.model_inference_wrappers.inference_wrapper_config import InferenceWrapperConfig
+import pytest
 import torch
 import random 
 import string
+import threading
 
 from megatron.core.inference.common_inference_params import CommonInferenceParams
 from megatron.core.inference.engines.mcore_engine import MCoreEngine
@@ -43,9 +46,9 @@ class TestMCoreEngine:
 
         inference_wrapped_model = GPTInferenceWrapper(gpt_model, inference_wrapper_config)
         self.mock_tokenizer = mock.Mock()
-        text_generation_controller = SimpleTextGenerationController(inference_wrapped_model=inference_wrapped_model, tokenizer=self.mock_tokenizer)       
+        self.text_generation_controller = SimpleTextGenerationController(inference_wrapped_model=inference_wrapped_model, tokenizer=self.mock_tokenizer)
 
-        self.mcore_engine = MCoreEngine(text_generation_controller=text_generation_controller, max_batch_size=4)
+        self.mcore_engine = MCoreEngine(text_generation_controller=self.text_generation_controller, max_batch_size=4)
         
     def teardown_method(self, method):
         Utils.destroy_model_parallel()
@@ -65,3 +68,205 @@ class TestMCoreEngine:
             assert result.status == Status.COMPLETED, f"Status should be completed but its {result.status}"
             assert result.generated_length > 0 , f"Generated length should be greater than zero"
             assert result.generated_text is not None , f'Generated text should not be None'
+
+    # With 12 blocks of 4 tokens the cache can't hold 4 requests of up to 30 tokens, so requests are preempted
+    @pytest.mark.parametrize("num_kv_cache_blocks", [None, 12])
+    def test_generate_dynamic_batch(self, num_kv_cache_blocks):
+        self.mcore_engine.num_kv_cache_blocks = num_kv_cache_blocks
+        self.mcore_engine.kv_cache_block_size = 4
+        self.mock_tokenizer.vocab_size = self.vocab_size
+        self.mock_tokenizer.eod = self.vocab_size - 1
+        self.mock_tokenizer.detokenize.return_value = ''.join(random.choices(string.ascii_letters, k=random.randint(4,10)))
+
+        # More prompts than the max batch size, so that requests join the batch while others are generating
+        prompt_tokens = {f"sample{i}": [random.randint(0, self.vocab_size - 2) for _ in range(random.randint(5, 20))] for i in range(10)}
+        self.mock_tokenizer.tokenize.side_effect = lambda prompt: list(prompt_tokens[prompt])
+        prompts = list(prompt_tokens.keys())
+
+        common_inference_params = CommonInferenceParams(top_k=1, num_tokens_to_generate=10, return_log_probs=True)
+        static_results : List[InferenceRequest] = self.mcore_engine.generate(prompts, common_inference_params=common_inference_params)
+        dynamic_results : List[InferenceRequest] = self.mcore_engine.generate(prompts, common_inference_params=common_inference_params, dynamic_generation=True)
+
+        assert len(dynamic_results) == len(prompts)
+        for static_result, dynamic_result in zip(static_results, dynamic_results):
+            assert dynamic_result.status == Status.COMPLETED, f"Status should be completed but its {dynamic_result.status}"
+            assert dynamic_result.prompt == static_result.prompt
+            assert dynamic_result.generated_length == len(dynamic_result.generated_tokens) == len(dynamic_result.generated_log_probs) == len(dynamic_result.generated_token_times)
+            # Greedy generations don't depend on the batching
+            assert torch.equal(dynamic_result.generated_tokens.cpu(), static_result.generated_tokens.cpu()), f"Dynamic batching generated {dynamic_result.generated_tokens} but static batching {static_result.generated_tokens}"
+        assert self.text_generation_controller.paged_kv_cache.num_used_blocks == 0, "All KV cache blocks should be freed"
+
+    def test_generate_dynamic_batch_with_prefix_caching(self):
+        # The cache is large enough for all the blocks of the requests, so that no cached block is evicted
+        self.mcore_engine.num_kv_cache_blocks = 64
+        self.mcore_engine.kv_cache_block_size = 4
+        self.mcore_engine.enable_prefix_caching = True
+        self.mock_tokenizer.vocab_size = self.vocab_size
+        self.mock_tokenizer.eod = self.vocab_size - 1
+        self.mock_tokenizer.detokenize.return_value = ''.join(random.choices(string.ascii_letters, k=random.randint(4,10)))
+
+        # The prompts share a system prompt of 4 blocks
+        system_prompt_tokens = [random.randint(0, self.vocab_size - 2) for _ in range(16)]
+        prompt_tokens = {f"sample{i}": system_prompt_tokens + [random.randint(0, self.vocab_size - 2) for _ in range(random.randint(1, 10))] for i in range(10)}
+        self.mock_tokenizer.tokenize.side_effect = lambda prompt: list(prompt_tokens[prompt])
+        prompts = list(prompt_tokens.keys())
+
+        common_inference_params = CommonInferenceParams(top_k=1, num_tokens_to_generate=10)
+        static_results : List[InferenceRequest] = self.mcore_engine.generate(prompts, common_inference_params=common_inference_params)
+        dynamic_results : List[InferenceRequest] = self.mcore_engine.generate(prompts, common_inference_params=common_inference_params, dynamic_generation=True)
+        for static_result, dynamic_result in zip(static_results, dynamic_results):
+            assert torch.equal(dynamic_result.generated_tokens.cpu(), static_result.generated_tokens.cpu()), f"Prefix caching generated {dynamic_result.generated_tokens} but static batching {static_result.generated_tokens}"
+
+        # The first batch of 4 requests computes the system prompt, the 6 next requests find it in the cache
+        stats = self.text_generation_controller.get_prefix_cache_stats()
+        assert stats['num_hit_tokens'] >= 6 * len(system_prompt_tokens)
+        assert stats['hit_rate'] == stats['num_hit_tokens'] / stats['num_prefill_tokens']
+        assert stats['saved_flops'] > 0
+        assert self.text_generation_controller.paged_kv_cache.num_used_blocks == 0, "All KV cache blocks should be freed"
+
+        # The cache is kept across the calls, the prompts and generated tokens of the full blocks are cached
+        self.text_generation_controller.reset_prefix_cache_stats()
+        cached_results : List[InferenceRequest] = self.mcore_engine.generate(prompts, common_inference_params=common_inference_params, dynamic_generation=True)
+        for static_result, cached_result in zip(static_results, cached_results):
+            assert torch.equal(cached_result.generated_tokens.cpu(), static_result.generated_tokens.cpu())
+        stats = self.text_generation_controller.get_prefix_cache_stats()
+        assert stats['num_hit_tokens'] == sum(4 * ((len(prompt_tokens[prompt]) - 1) // 4) for prompt in prompts)
+
+    def test_generate_stream(self):
+        self.mcore_engine.max_sequence_length = self.sequence_length
+        self.mock_tokenizer.vocab_size = self.vocab_size
+        self.mock_tokenizer.eod = self.vocab_size - 1
+        self.mock_tokenizer.detokenize.return_value = ''.join(random.choices(string.ascii_letters, k=random.randint(4,10)))
+
+        prompt_tokens = {f"sample{i}": [random.randint(0, self.vocab_size - 2) for _ in range(random.randint(5, 20))] for i in range(6)}
+        self.mock_tokenizer.tokenize.side_effect = lambda prompt: list(prompt_tokens[prompt])
+        prompts = list(prompt_tokens.keys())
+        common_inference_params = CommonInferenceParams(top_k=1, num_tokens_to_generate=10)
+        static_results : List[InferenceRequest] = self.mcore_engine.generate(prompts, common_inference_params=common_inference_params)
+        # The first stream is cancelled after two tokens, the streams of the requests generating an eod first don't yield any token
+        order = sorted(range(len(prompts)), key=lambda i: len(static_results[i].generated_tokens) <= 2)
+        order = [i for i in order if len(static_results[i].generated_tokens) > 0]
+        prompts = [prompts[i] for i in order]
+        static_results = [static_results[i] for i in order]
+
+        async def stream(prompt, max_tokens=None):
+            tokens, request = [], None
+            async for request, token in self.mcore_engine.generate_stream(prompt, common_inference_params):
+                tokens.append(token)
+                if len(tokens) == max_tokens:
+                    break
+            return tokens, request
+
+        async def run_streams():
+            # The last prompts arrive while the first ones are decoding, the first stream is cancelled
+            tasks = [asyncio.create_task(stream(prompts[0], max_tokens=2))]
+            tasks += [asyncio.create_task(stream(prompt)) for prompt in prompts[1:4]]
+            # The steps run in a worker thread, so the first requests are decoding once they have blocks
+            while self.text_generation_controller.paged_kv_cache is None or self.text_generation_controller.paged_kv_cache.num_used_blocks == 0:
+                await asyncio.sleep(0.01)
+            tasks += [asyncio.create_task(stream(prompt)) for prompt in prompts[4:]]
+            return await asyncio.gather(*tasks)
+
+        results = asyncio.run(run_streams())
+
+        cancelled_tokens, cancelled_request = results[0]
+        assert cancelled_tokens == static_results[0].generated_tokens.tolist()[:2]
+        assert cancelled_request.status == Status.CANCELLED
+        for (tokens, request), static_result in zip(results[1:], static_results[1:]):
+            # Greedy generations don't depend on the batching
+            assert tokens == static_result.generated_tokens.tolist(), f"Streamed {tokens} but static batching generated {static_result.generated_tokens}"
+            assert request.status == Status.COMPLETED
+            assert request.time_to_first_token > 0
+            assert len(request.inter_token_latencies) == len(tokens) - 1
+        assert not self.mcore_engine.scheduler.have_requests_pending()
+        assert self.text_generation_controller.paged_kv_cache.num_used_blocks == 0, "All KV cache blocks should be freed"
+
+    def test_generate_stream_during_step(self):
+        self.mcore_engine.max_sequence_length = self.sequence_length
+        self.mock_tokenizer.vocab_size = self.vocab_size
+        self.mock_tokenizer.eod = self.vocab_size - 1
+        self.mock_tokenizer.detokenize.return_value = ''.join(random.choices(string.ascii_letters, k=random.randint(4,10)))
+
+        prompt_tokens = {f"sample{i}": [random.randint(0, self.vocab_size - 2) for _ in range(random.randint(5, 20))] for i in range(6)}
+        self.mock_tokenizer.tokenize.side_effect = lambda prompt: list(prompt_tokens[prompt])
+        prompts = list(prompt_tokens.keys())
+        common_inference_params = CommonInferenceParams(top_k=1, num_tokens_to_generate=10)
+        static_results : List[InferenceRequest] = self.mcore_engine.generate(prompts, common_inference_params=common_inference_params)
+        # The streams of the requests generating an eod first don't yield any token
+        prompts, static_results = zip(*[(prompt, result) for prompt, result in zip(prompts, static_results) if len(result.generated_tokens) > 0])
+
+        generate_output_tokens = self.text_generation_controller.generate_output_tokens_dynamic_batch
+        step_started, step_released = threading.Event(), threading.Event()
+
+        def blocking_step(active_requests):
+            # The first step only completes if the event loop keeps running during the step
+            if not step_started.is_set():
+                step_started.set()
+                assert step_released.wait(timeout=60), "The event loop was blocked during the step"
+            return generate_output_tokens(active_requests)
+
+        async def stream(prompt):
+            tokens, request = [], None
+            async for request, token in self.mcore_engine.generate_stream(prompt, common_inference_params):
+                tokens.append(token)
+            return tokens, request
+
+        async def run_streams():
+            tasks = [asyncio.create_task(stream(prompt)) for prompt in prompts[:4]]
+            while not step_started.is_set():
+                await asyncio.sleep(0.01)
+            # A request cancelled during the step keeps its KV cache blocks until the step completes
+            tasks[0].cancel()
+            await asyncio.gather(tasks[0], return_exceptions=True)
+            assert len(self.mcore_engine.requests_cancelled_during_step) == 1
+            # A new request joins the request pools during the step
+            tasks += [asyncio.create_task(stream(prompt)) for prompt in prompts[4:]]
+            await asyncio.sleep(0)
+            assert self.mcore_engine.scheduler.have_requests_pending()
+            step_released.set()
+            return await asyncio.gather(*tasks[1:])
+
+        with mock.patch.object(self.text_generation_controller, 'generate_output_tokens_dynamic_batch', side_effect=blocking_step):
+            results = asyncio.run(run_streams())
+
+        for (tokens, request), static_result in zip(results, static_results[1:]):
+            assert tokens == static_result.generated_tokens.tolist(), f"Streamed {tokens} but static batching generated {static_result.generated_tokens}"
+            assert request.status == Status.COMPLETED
+        assert not self.mcore_engine.requests_cancelled_during_step
+        assert not self.mcore_engine.scheduler.have_requests_pending()
+        assert self.text_generation_controller.paged_kv_cache.num_used_blocks == 0, "All KV cache blocks should be freed"
+
+    def test_generate_stream_failure(self):
+        self.mcore_engine.max_sequence_length = self.sequence_length
+        self.mock_tokenizer.vocab_size = self.vocab_size
+        self.mock_tokenizer.eod = self.vocab_size - 1
+
+        prompt_tokens = {f"sample{i}": [random.randint(0, self.vocab_size - 2) for _ in range(random.randint(5, 20))] for i in range(6)}
+        self.mock_tokenizer.tokenize.side_effect = lambda prompt: list(prompt_tokens[prompt])
+        common_inference_params = CommonInferenceParams(top_k=1, num_tokens_to_generate=10)
+
+        generate_output_tokens = self.text_generation_controller.generate_output_tokens_dynamic_batch
+
+        def failing_step(active_requests):
+            # The step fails after allocating the KV cache blocks of the requests
+            generate_output_tokens(active_requests)
+            raise RuntimeError("Step failed")
+
+        async def stream(prompt):
+            async for _ in self.mcore_engine.generate_stream(prompt, common_inference_params):
+                pass
+
+        async def run_streams():
+            # Two requests are waiting when the step fails
+            tasks = [asyncio.create_task(stream(prompt)) for prompt in prompt_tokens]
+            await asyncio.sleep(0)
+            await self.mcore_engine.engine_loop_task
+            # The engine loop frees the requests before the streams are closed
+            assert not self.mcore_engine.scheduler.have_requests_pending()
+            assert self.text_generation_controller.paged_kv_cache.num_used_blocks == 0, "All KV cache blocks should be freed"
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        with mock.patch.object(self.text_generation_controller, 'generate_output_tokens_dynamic_batch', side_effect=failing_step):
+            results = asyncio.run(run_streams())
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert not self.mcore_engine.stream_queues
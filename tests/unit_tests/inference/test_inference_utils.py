@@ -1,4 +1,5 @@
-from megatron.core.inference.utils import Counter
+from megatron.core.inference.utils import Counter, num_prefill_floating_point_operations
+from megatron.core.transformer.transformer_config import TransformerConfig
 
 class TestInferenceUtils:
 
@@ -9,3 +10,9 @@ class TestInferenceUtils:
         assert counter.counter == 1, f'Counter should be 1 but it is {counter.counter}'
         counter.reset()
         assert counter.counter == 0, f'Counter should be 0 but it is {counter.counter}'
+
+    def test_num_prefill_floating_point_operations(self):
+        config = TransformerConfig(num_layers=1, hidden_size=4, num_attention_heads=2, use_cpu_initialization=True)
+        # Linear layers: 2 * 4 * (4 + 8 + 4 + 2 * 16) per token, attention: 2 * 2 * 4 * (1 + 2 + 3), output layer: 2 * 4 * 10 per token
+        flops = num_prefill_floating_point_operations(config, vocab_size=10, num_tokens=3)
+        assert flops == 3 * 384 + 96 + 3 * 80, f'Expected 1488 FLOPs but got {flops}'
@@ -0,0 +1,220 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+from unittest import mock
+
+import pytest
+import torch
+
+from megatron.core.inference.paged_kv_cache import BlockAllocator, PagedKVCache
+from megatron.core.inference_params import InferenceParams
+from megatron.core.models.gpt.gpt_layer_specs import get_gpt_layer_local_spec
+from megatron.core.models.gpt.gpt_model import GPTModel
+from megatron.core.tensor_parallel.random import model_parallel_cuda_manual_seed
+from megatron.core.transformer.attention import flash_attn_with_kvcache
+from megatron.core.transformer.transformer_config import TransformerConfig
+from tests.unit_tests.test_utilities import Utils
+
+
+class TestPagedKVCache:
+
+    def test_block_allocator(self):
+        allocator = BlockAllocator(num_blocks=2)
+        block = allocator.allocate()
+        allocator.incref(block)
+        allocator.allocate()
+        assert allocator.num_free_blocks == 0
+        with pytest.raises(RuntimeError):
+            allocator.allocate()
+        allocator.free(block)
+        assert allocator.num_free_blocks == 0, "The block is still referenced"
+        allocator.free(block)
+        assert allocator.num_free_blocks == 1
+
+    def test_append_and_free(self):
+        paged_kv_cache = PagedKVCache(num_blocks=8, block_size=4)
+        paged_kv_cache.append('a', 5)
+        assert paged_kv_cache.sequence_length('a') == 5
+        assert len(paged_kv_cache.block_tables['a']) == 2
+        paged_kv_cache.append('a', 3)
+        assert len(paged_kv_cache.block_tables['a']) == 2, "The last block had room for 3 tokens"
+        paged_kv_cache.append('b', 1)
+        assert paged_kv_cache.num_used_blocks == 3
+
+        block_tables = paged_kv_cache.get_block_tables(['b', 'a'])
+        assert block_tables.tolist() == [paged_kv_cache.block_tables['b'] + [0], paged_kv_cache.block_tables['a']]
+
+        assert not paged_kv_cache.can_append('b', 4 * 6)
+        with pytest.raises(RuntimeError):
+            paged_kv_cache.append('b', 4 * 6)
+        paged_kv_cache.free('a')
+        paged_kv_cache.free('b')
+        assert paged_kv_cache.num_used_blocks == 0
+
+    def test_fork_copy_on_write(self):
+        paged_kv_cache = PagedKVCache(num_blocks=8, block_size=4)
+        key_blocks = torch.randn(8, 4, 2, 3)
+        value_blocks = torch.randn(8, 4, 2, 3)
+        paged_kv_cache.key_value_memory_dict[1] = (key_blocks, value_blocks)
+
+        paged_kv_cache.append('parent', 6)
+        paged_kv_cache.fork('parent', 'child')
+        assert paged_kv_cache.block_tables['child'] == paged_kv_cache.block_tables['parent']
+        assert paged_kv_cache.num_used_blocks == 2, "The blocks should be shared"
+
+        # Appending to the shared last block copies it, the full block stays shared
+        assert paged_kv_cache.num_blocks_to_append('child', 1) == 1
+        paged_kv_cache.append('child', 1)
+        parent_blocks = paged_kv_cache.block_tables['parent']
+        child_blocks = paged_kv_cache.block_tables['child']
+        assert child_blocks[0] == parent_blocks[0]
+        assert child_blocks[1] != parent_blocks[1]
+        assert torch.equal(key_blocks[child_blocks[1]], key_blocks[parent_blocks[1]])
+        assert torch.equal(value_blocks[child_blocks[1]], value_blocks[parent_blocks[1]])
+        assert paged_kv_cache.num_used_blocks == 3
+
+        # The parent is the only owner of its last block now, so there is no copy
+        paged_kv_cache.append('parent', 1)
+        assert paged_kv_cache.block_tables['parent'] == parent_blocks
+
+        paged_kv_cache.free('parent')
+        assert paged_kv_cache.num_used_blocks == 2
+        paged_kv_cache.free('child')
+        assert paged_kv_cache.num_used_blocks == 0
+
+    def test_reorder(self):
+        paged_kv_cache = PagedKVCache(num_blocks=8, block_size=4)
+        for sequence_id in range(3):
+            paged_kv_cache.append(sequence_id, 6)
+        block_tables = dict(paged_kv_cache.block_tables)
+
+        paged_kv_cache.reorder([0, 1, 2], [2, 2, 0])
+        assert paged_kv_cache.block_tables == {0: block_tables[2], 1: block_tables[2], 2: block_tables[0]}
+        assert paged_kv_cache.num_used_blocks == 4, "The blocks of sequence 1 should be freed"
+
+    def test_prefix_caching(self):
+        paged_kv_cache = PagedKVCache(num_blocks=8, block_size=4, enable_prefix_caching=True)
+        prompt = list(range(10))
+        assert paged_kv_cache.match_prefix('a', prompt) == 0
+        paged_kv_cache.append('a', len(prompt), prompt)
+        # The 2 full blocks are cached
+        assert paged_kv_cache.num_cached_blocks == 2
+        paged_kv_cache.free('a')
+        assert paged_kv_cache.num_used_blocks == 0
+        assert paged_kv_cache.num_free_blocks == 8, "The cached blocks can be evicted"
+
+        # The prefix is cached, the last token is always computed
+        assert paged_kv_cache.match_prefix('b', prompt[:8] + [42]) == 8
+        assert paged_kv_cache.match_prefix('c', prompt[:8]) == 4
+        assert paged_kv_cache.match_prefix('d', [42] + prompt[1:]) == 0
+        assert paged_kv_cache.block_tables['c'] == paged_kv_cache.block_tables['b'][:1]
+        assert paged_kv_cache.sequence_length('b') == 8
+        assert paged_kv_cache.num_used_blocks == 2
+        for sequence_id in ['b', 'c', 'd']:
+            paged_kv_cache.free(sequence_id)
+
+        # The blocks are cached when they are full, including the generated tokens
+        assert paged_kv_cache.match_prefix('e', prompt) == 8
+        paged_kv_cache.append('e', 2, prompt[8:])
+        paged_kv_cache.append('e', 1, [10])
+        paged_kv_cache.append('e', 1, [11])
+        assert paged_kv_cache.num_cached_blocks == 3
+        paged_kv_cache.free('e')
+        assert paged_kv_cache.match_prefix('f', list(range(13))) == 12
+
+    def test_prefix_cache_eviction(self):
+        paged_kv_cache = PagedKVCache(
+            num_blocks=4, block_size=2, enable_prefix_caching=True, max_cached_blocks=2
+        )
+        for sequence_id, prompt in enumerate([[1, 2, 3, 4, 5], [6, 7, 8]]):
+            paged_kv_cache.match_prefix(sequence_id, prompt)
+            paged_kv_cache.append(sequence_id, len(prompt), prompt)
+            paged_kv_cache.free(sequence_id)
+        # Over the budget, the last block of the first prompt is evicted first
+        assert paged_kv_cache.num_cached_blocks == 2
+        assert paged_kv_cache.match_prefix('a', [1, 2, 3, 4, 5]) == 2
+        assert paged_kv_cache.match_prefix('b', [6, 7, 8]) == 2
+        paged_kv_cache.free('a')
+        paged_kv_cache.free('b')
+
+        # Allocating the 4 blocks evicts the cached blocks, the blocks in use are not evicted
+        paged_kv_cache.append('c', 8, list(range(10, 18)))
+        assert paged_kv_cache.num_free_blocks == 0
+        assert paged_kv_cache.num_cached_blocks == 4
+        assert paged_kv_cache.match_prefix('d', [1, 2, 3]) == 0
+        paged_kv_cache.free('c')
+        paged_kv_cache.free('d')
+        assert paged_kv_cache.num_cached_blocks == 2
+        assert paged_kv_cache.match_prefix('e', list(range(10, 15))) == 4
+
+
+class TestPagedAttention:
+
+    def setup_method(self, method):
+        Utils.initialize_model_parallel(tensor_model_parallel_size=1, pipeline_model_parallel_size=1)
+        model_parallel_cuda_manual_seed(123)
+        self.vocab_size = 100
+        self.sequence_length = 32
+        transformer_config = TransformerConfig(num_layers=2, hidden_size=16, num_attention_heads=4, use_cpu_initialization=True)
+        self.gpt_model = GPTModel(
+            config=transformer_config,
+            transformer_layer_spec=get_gpt_layer_local_spec(),
+            vocab_size=self.vocab_size,
+            max_sequence_length=self.sequence_length,
+            position_embedding_type='rope').cuda().eval()
+
+    def teardown_method(self, method):
+        Utils.destroy_model_parallel()
+
+    def _generate(self, inference_params, tokens, num_tokens_to_generate):
+        """Greedy generation which reorders the batch after every step, like beam search."""
+        batch_size, prompt_length = tokens.shape
+        attention_mask = torch.tril(torch.ones((1, 1, prompt_length, prompt_length), device=tokens.device)) < 0.5
+        position_ids = torch.arange(prompt_length, device=tokens.device).repeat(batch_size, 1)
+        all_logits = []
+        for step in range(num_tokens_to_generate):
+            if inference_params.paged_kv_cache is not None:
+                inference_params.prepare_paged_step(tokens.size(1))
+            logits = self.gpt_model(tokens, position_ids, attention_mask, inference_params=inference_params)
+            inference_params.sequence_len_offset += tokens.size(1)
+            all_logits.append(logits[:, -1])
+
+            # All the rows continue from the first one
+            inference_params.swap_key_value_dict(torch.zeros(batch_size, dtype=torch.long, device=tokens.device))
+            tokens = logits[:1, -1].argmax(dim=-1, keepdim=True).repeat(batch_size, 1)
+            position_ids = torch.full_like(tokens, prompt_length + step)
+            attention_mask = None
+        return torch.stack(all_logits)
+
+    def test_paged_static_batch(self):
+        batch_size = 3
+        tokens = torch.randint(0, self.vocab_size, (batch_size, 10)).cuda()
+        with torch.no_grad():
+            expected_logits = self._generate(InferenceParams(batch_size, self.sequence_length), tokens, 8)
+            paged_kv_cache = PagedKVCache(num_blocks=batch_size * self.sequence_length // 4, block_size=4)
+            paged_logits = self._generate(InferenceParams(batch_size, self.sequence_length, paged_kv_cache=paged_kv_cache), tokens, 8)
+
+        torch.testing.assert_close(paged_logits, expected_logits)
+        # After the last reordering all the rows share the 10 + 7 tokens of the first one
+        assert paged_kv_cache.num_used_blocks == 5
+
+    @pytest.mark.skipif(flash_attn_with_kvcache is None, reason="flash-attn is not installed")
+    def test_paged_attention_kernel(self):
+        # flash-attn needs half precision, head dims multiple of 8 and blocks of 256 tokens
+        transformer_config = TransformerConfig(num_layers=2, hidden_size=64, num_attention_heads=4, use_cpu_initialization=True, bf16=True, params_dtype=torch.bfloat16)
+        self.gpt_model = GPTModel(
+            config=transformer_config,
+            transformer_layer_spec=get_gpt_layer_local_spec(),
+            vocab_size=self.vocab_size,
+            max_sequence_length=self.sequence_length,
+            position_embedding_type='rope').cuda().eval()
+        batch_size = 3
+        tokens = torch.randint(0, self.vocab_size, (batch_size, 10)).cuda()
+        with torch.no_grad():
+            expected_logits = self._generate(InferenceParams(batch_size, self.sequence_length), tokens, 8)
+            paged_kv_cache = PagedKVCache(num_blocks=2 * batch_size, block_size=256)
+            with mock.patch('megatron.core.transformer.attention.flash_attn_with_kvcache', wraps=flash_attn_with_kvcache) as kernel_mock:
+                paged_logits = self._generate(InferenceParams(batch_size, self.sequence_length, paged_kv_cache=paged_kv_cache), tokens, 8)
+            # The decode steps read the blocks through the block tables, the prefill gathers them
+            assert kernel_mock.call_count == 7 * 2
+
+        torch.testing.assert_close(paged_logits, expected_logits, atol=5e-2, rtol=5e-2)
@@ -60,4 +60,22 @@ class TestScheduler:
 
 
         
-    
\ No newline at end of file
+    
+    def test_cancel_request(self):
+        prompt = "sample prompt"
+        prompt_tokens = torch.randn(5)
+        inference_parameters = CommonInferenceParams()
+
+        request_ids = [self.scheduler.add_request(prompt, prompt_tokens, inference_parameters) for _ in range(self.max_batch_size + 2)]
+
+        # Cancelling an active request moves the earliest waiting request to the active pool
+        cancelled_request = self.scheduler.cancel_request(request_ids[0])
+        assert cancelled_request.status == Status.CANCELLED, f"Status should be CANCELLED, but its {cancelled_request.status}"
+        assert list(self.scheduler.active_request_pool.keys()) == request_ids[1:self.max_batch_size + 1]
+        assert list(self.scheduler.waiting_request_pool.keys()) == request_ids[self.max_batch_size + 1:]
+
+        cancelled_request = self.scheduler.cancel_request(request_ids[-1])
+        assert cancelled_request.status == Status.CANCELLED, f"Status should be CANCELLED, but its {cancelled_request.status}"
+        assert len(self.scheduler.waiting_request_pool) == 0, f"Waiting request pool should be empty but it has {len(self.scheduler.waiting_request_pool)} requests"
+
+        assert self.scheduler.cancel_request(request_ids[0]) is None, "A request can only be cancelled once"
@@ -115,4 +115,41 @@ class TestTextGenerationController:
 
 
         
-    
\ No newline at end of file
+    
+    def test_generate_output_tokens_dynamic_batch(self):
+        self.mock_tokenizer.vocab_size = self.vocab_size
+        self.mock_tokenizer.eod = self.vocab_size - 1
+        self.mock_tokenizer.detokenize.return_value = ''.join(random.choices(string.ascii_letters, k=random.randint(4,10)))
+
+        self.text_generation_controller.prep_model_for_dynamic_batch(max_batch_size=self.batch_size, max_sequence_length=self.sequence_length)
+
+        active_requests: Dict[int, InferenceRequest] = OrderedDict()
+        for i in range(self.batch_size):
+            prompt = "sample" * (i+1)
+            inference_request = InferenceRequest(
+                request_id=i,
+                prompt=prompt,
+                # The requests of a dynamic batch can generate different numbers of tokens
+                inference_parameters=CommonInferenceParams(num_tokens_to_generate=2 * (i+1), return_log_probs=True),
+                arrival_time=time.time(),
+                prompt_tokens=torch.randint(low=0, high=self.vocab_size - 1, size=(len(prompt),)).tolist(),
+                status=Status.ACTIVE_BUT_NOT_GENERATING_TOKENS
+            )
+            active_requests[i] = inference_request
+
+        num_steps = 0
+        while active_requests:
+            requests = self.text_generation_controller.generate_output_tokens_dynamic_batch(active_requests)
+            num_steps += 1
+            for request_id, request in list(requests.items()):
+                if request.status == Status.COMPLETED:
+                    assert 0 < request.generated_length <= request.inference_parameters.num_tokens_to_generate
+                    assert len(request.generated_tokens) == len(request.generated_log_probs) == request.generated_length
+                    assert request.generated_text is not None, "Generated text should not be None"
+                    del active_requests[request_id]
+                else:
+                    assert request.status == Status.ACTIVE_AND_GENERATING_TOKENS, f"Status should be generating but its {request.status}"
+                    assert len(request.generated_tokens) == request.generated_length
+
+        assert num_steps <= 2 * self.batch_size, "The batch should take at most as many steps as the longest request"
+        assert self.text_generation_controller.paged_kv_cache.num_used_blocks == 0, "All KV cache blocks should be freed"
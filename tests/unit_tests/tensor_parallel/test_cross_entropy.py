@@ -1,4 +1,4 @@
-from megatron.core.tensor_parallel.cross_entropy import vocab_parallel_cross_entropy
+from megatron.core.tensor_parallel.cross_entropy import target_log_probs, vocab_parallel_cross_entropy
 import torch
 from tests.unit_tests.test_utilities import Utils
 import numpy as np
@@ -11,4 +11,13 @@ def test_vocab_parallel_cross_entropy():
     expected_output = torch.tensor([10.2309,  8.2309,  6.2309,  4.2309, 10.2309,  8.2309,  6.2309,  4.2309,
         10.2309,  8.2309,  6.2309,  4.2309, 10.2309,  8.2309,  6.2309,  4.2309]).cuda()
     assert(torch.equal(torch.round(expected_output), torch.round(output)))
-    Utils.destroy_model_parallel()
\ No newline at end of file
+    Utils.destroy_model_parallel()
+
+def test_target_log_probs():
+    logits = torch.randn(4, 3, 100).cuda()
+    target = torch.randint(0, 100, (4, 3)).cuda()
+    expected_output = torch.gather(torch.log_softmax(logits, dim=-1), 2, target.unsqueeze(2)).squeeze(2)
+    output = target_log_probs(logits, target, max_chunk_numel=500)
+    assert(torch.allclose(expected_output, output, atol=1e-5))
+    output = target_log_probs(logits.bfloat16(), target)
+    assert(torch.allclose(expected_output, output, atol=1e-1))
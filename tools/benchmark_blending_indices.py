@@ -0,0 +1,124 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Compare the full and the streaming BlendedDataset indices in memory and lookup latency."""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+import numpy
+
+from megatron.core.datasets.blended_dataset import BlockedBlendingIndex
+from megatron.core.datasets.utils import compile_helpers, normalize
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+
+    group = parser.add_argument_group(title="blend")
+    group.add_argument(
+        "--size", type=int, default=100_000_000, help="Number of samples in the blend"
+    )
+    group.add_argument("--num-datasets", type=int, default=16, help="Number of datasets to blend")
+    group.add_argument(
+        "--block-sizes",
+        type=int,
+        nargs="+",
+        default=[4096, 65536],
+        help="Streaming index block sizes to benchmark",
+    )
+
+    group = parser.add_argument_group(title="lookup")
+    group.add_argument(
+        "--num-lookups", type=int, default=100_000, help="Number of lookups per access pattern"
+    )
+    group.add_argument("--batch-size", type=int, default=256, help="Number of indices per lookup")
+    group.add_argument("--seed", type=int, default=1234, help="Random seed")
+
+    return parser.parse_args()
+
+
+def time_lookups(lookup, size, num_lookups, batch_size, rng):
+    """Time sequential and random batched lookups, in microseconds per batch"""
+    num_batches = max(num_lookups // batch_size, 1)
+    latencies = {}
+
+    t_beg = time.perf_counter()
+    for i in range(num_batches):
+        start = (i * batch_size) % max(size - batch_size, 1)
+        lookup(numpy.arange(start, start + batch_size))
+    latencies["sequential"] = (time.perf_counter() - t_beg) / num_batches * 1e6
+
+    t_beg = time.perf_counter()
+    for _ in range(num_batches):
+        lookup(rng.integers(0, size, size=batch_size))
+    latencies["random"] = (time.perf_counter() - t_beg) / num_batches * 1e6
+
+    return latencies
+
+
+def main():
+    args = get_args()
+
+    compile_helpers()
+    from megatron.core.datasets import helpers
+
+    rng = numpy.random.default_rng(args.seed)
+    weights = numpy.array(normalize(rng.random(args.num_datasets).tolist()))
+
+    results = []
+
+    t_beg = time.perf_counter()
+    dataset_index = numpy.zeros(args.size, dtype=numpy.int16)
+    dataset_sample_index = numpy.zeros(args.size, dtype=numpy.int64)
+    helpers.build_blending_indices(
+        dataset_index, dataset_sample_index, weights, args.num_datasets, args.size, False
+    )
+    build_time = time.perf_counter() - t_beg
+    latencies = time_lookups(
+        lambda indices: (dataset_index[indices], dataset_sample_index[indices]),
+        args.size,
+        args.num_lookups,
+        args.batch_size,
+        rng,
+    )
+    results.append(
+        ("full", dataset_index.nbytes + dataset_sample_index.nbytes, build_time, latencies)
+    )
+    counts = numpy.bincount(dataset_index, minlength=args.num_datasets)
+    del dataset_index, dataset_sample_index
+
+    for block_size in args.block_sizes:
+        t_beg = time.perf_counter()
+        checkpoints = helpers.build_blending_checkpoints(weights, args.size, block_size)
+        build_time = time.perf_counter() - t_beg
+        assert numpy.array_equal(checkpoints[-1], counts)
+        blending_index = BlockedBlendingIndex(checkpoints, weights, args.size, block_size)
+        latencies = time_lookups(
+            blending_index.lookup, args.size, args.num_lookups, args.batch_size, rng
+        )
+        # Count the decoded block cache at capacity
+        cache_nbytes = blending_index.num_cached_blocks * block_size * (2 + 8)
+        results.append(
+            (f"streaming {block_size}", checkpoints.nbytes + cache_nbytes, build_time, latencies)
+        )
+
+    print(
+        f"size {args.size}, datasets {args.num_datasets}, batch size {args.batch_size}, "
+        f"lookups {args.num_lookups}"
+    )
+    print(
+        f"{'index':>18} {'memory (MiB)':>14} {'build (s)':>10} "
+        f"{'sequential (us)':>16} {'random (us)':>12}"
+    )
+    for name, nbytes, build_time, latencies in results:
+        print(
+            f"{name:>18} {nbytes / 2**20:>14.2f} {build_time:>10.2f} "
+            f"{latencies['sequential']:>16.1f} {latencies['random']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
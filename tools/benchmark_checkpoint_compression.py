@@ -0,0 +1,174 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Compare the size, save time and load time of torch_dist checkpoints with different codecs.
+
+The state dict imitates the fp32 master weights and Adam moments of a model.
+Run on a single process or with torchrun (with a shared --checkpoint-dir).
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+import torch
+
+from megatron.core import dist_checkpointing
+from megatron.core.dist_checkpointing import ShardedTensor
+from megatron.core.dist_checkpointing.strategies.compression import (
+    ADAM_MOMENTS_PATTERN,
+    CODECS,
+    CompressionConfig,
+)
+from megatron.core.dist_checkpointing.strategies.torch import TorchDistSaveShardedStrategy
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--num-params", type=int, default=64 * 1024 * 1024, help="Parameters per rank"
+    )
+    parser.add_argument("--num-tensors", type=int, default=16, help="Parameter tensors per rank")
+    parser.add_argument(
+        "--codecs",
+        nargs="+",
+        default=["none", "zlib"],
+        choices=CODECS,
+        help="Codecs to compare with the uncompressed checkpoint",
+    )
+    parser.add_argument("--level", type=int, default=None, help="Compression level")
+    parser.add_argument(
+        "--quantize-adam-moments",
+        action="store_true",
+        help="Also compare the codecs with the Adam moments quantized to 8 bits",
+    )
+    parser.add_argument("--num-threads", type=int, default=4, help="Threads per writer")
+    parser.add_argument("--thread-count", type=int, default=2, help="Writer processes per rank")
+    parser.add_argument(
+        "--checkpoint-dir", type=str, default=None, help="Directory for the checkpoints"
+    )
+    return parser.parse_args()
+
+
+def get_sharded_state_dict(args, rank, world_size):
+    """Master weights and Adam moments, sharded along the first dimension."""
+    numel = args.num_params // args.num_tensors
+    sharded_state_dict = {}
+    for i in range(args.num_tensors):
+        weight = torch.randn(numel // 1024, 1024) * 0.02
+        # Gradients of the scale of the weights, decayed
+        grad = torch.randn_like(weight) * 1e-3
+        tensors = {
+            f"weight.{i}": weight,
+            f"optimizer.state.exp_avg.weight.{i}": grad * 0.1,
+            f"optimizer.state.exp_avg_sq.weight.{i}": grad.square() * 1e-3,
+        }
+        for key, tensor in tensors.items():
+            sharded_state_dict[key] = ShardedTensor.from_rank_offsets(
+                key, tensor, (0, rank, world_size)
+            )
+    return sharded_state_dict
+
+
+def get_dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def main():
+    args = get_args()
+    if not torch.distributed.is_initialized():
+        if "RANK" not in os.environ:
+            os.environ.update(RANK="0", WORLD_SIZE="1", MASTER_ADDR="localhost")
+            os.environ.setdefault("MASTER_PORT", "29500")
+        torch.distributed.init_process_group("gloo")
+    rank, world_size = torch.distributed.get_rank(), torch.distributed.get_world_size()
+
+    root_dir = args.checkpoint_dir
+    if root_dir is None:
+        assert world_size == 1, "--checkpoint-dir must be set for multiple ranks"
+        root_dir = tempfile.mkdtemp()
+
+    configs = {"uncompressed": None}
+    for codec in args.codecs:
+        quantize_patterns = [None, ADAM_MOMENTS_PATTERN] if args.quantize_adam_moments else [None]
+        for quantize_pattern in quantize_patterns:
+            name = codec if quantize_pattern is None else f"{codec}+8bit"
+            configs[name] = CompressionConfig(
+                codec=codec,
+                level=args.level,
+                num_threads=args.num_threads,
+                quantize_pattern=quantize_pattern,
+            )
+
+    state_dict = get_sharded_state_dict(args, rank, world_size)
+    raw_bytes = sum(sh_ten.data.numel() * 4 for sh_ten in state_dict.values()) * world_size
+    if rank == 0:
+        print(f"state dict: {raw_bytes / 2**20:.1f} MiB on {world_size} ranks")
+        print(
+            f"{'config':>16} {'MiB':>10} {'ratio':>7} {'save (s)':>9} {'load (s)':>9} "
+            f"{'max error':>10}"
+        )
+
+    # The first save starts the helper processes of the async writer, don't time it
+    warmup_dir = os.path.join(root_dir, "warmup")
+    if rank == 0:
+        os.makedirs(warmup_dir)
+    torch.distributed.barrier()
+    dist_checkpointing.save(
+        {key: state_dict[key] for key in list(state_dict)[:1]},
+        warmup_dir,
+        TorchDistSaveShardedStrategy("torch_dist", 1, thread_count=args.thread_count),
+    )
+    torch.distributed.barrier()
+    if rank == 0:
+        shutil.rmtree(warmup_dir)
+
+    for name, compression in configs.items():
+        checkpoint_dir = os.path.join(root_dir, name)
+        if rank == 0:
+            os.makedirs(checkpoint_dir)
+        torch.distributed.barrier()
+
+        save_strategy = TorchDistSaveShardedStrategy(
+            "torch_dist", 1, thread_count=args.thread_count, compression=compression
+        )
+        start = time.perf_counter()
+        dist_checkpointing.save(state_dict, checkpoint_dir, save_strategy)
+        torch.distributed.barrier()
+        save_time = time.perf_counter() - start
+
+        load_state_dict = {
+            key: replace(sh_ten, data=torch.empty_like(sh_ten.data))
+            for key, sh_ten in state_dict.items()
+        }
+        start = time.perf_counter()
+        loaded_state_dict = dist_checkpointing.load(load_state_dict, checkpoint_dir)
+        torch.distributed.barrier()
+        load_time = time.perf_counter() - start
+
+        max_error = max(
+            (loaded_state_dict[key] - sh_ten.data).abs().max().item()
+            for key, sh_ten in state_dict.items()
+        )
+        max_error = torch.tensor(max_error)
+        torch.distributed.all_reduce(max_error, op=torch.distributed.ReduceOp.MAX)
+        if rank == 0:
+            size = get_dir_size(checkpoint_dir)
+            print(
+                f"{name:>16} {size / 2**20:>10.1f} {raw_bytes / size:>7.2f} {save_time:>9.2f} "
+                f"{load_time:>9.2f} {max_error.item():>10.2e}"
+            )
+            shutil.rmtree(checkpoint_dir)
+        torch.distributed.barrier()
+
+
+if __name__ == "__main__":
+    main()
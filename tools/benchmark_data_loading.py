@@ -0,0 +1,165 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Replay a GPT dataset blend on CPU at a target rate and report the data loading bottleneck."""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+import torch
+
+from megatron.core.datasets.blended_megatron_dataset_builder import BlendedMegatronDatasetBuilder
+from megatron.core.datasets.data_loading_profiler import (
+    enable_data_loading_profiler,
+    profile_data_loading_stage,
+    profiled_collate,
+)
+from megatron.core.datasets.gpt_dataset import GPTDataset, GPTDatasetConfig
+from megatron.core.datasets.utils import compile_helpers, get_blend_from_list
+from megatron.training.tokenizer.tokenizer import _NullTokenizer
+
+# The stages which run in the dataloader workers, per sample or per batch
+_WORKER_STAGES = ("bin-read", "masks-and-position-ids", "collate")
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+
+    group = parser.add_argument_group(title="data")
+    group.add_argument(
+        "--data-path",
+        nargs="+",
+        required=True,
+        help="The blend, as for pretraining: either a list of dataset prefixes or a flattened, "
+        "zipped list of weights and dataset prefixes",
+    )
+    group.add_argument("--split", type=str, default="100,0,0", help="The split string")
+    group.add_argument("--seq-length", type=int, default=4096, help="Sequence length")
+    group.add_argument(
+        "--vocab-size",
+        type=int,
+        required=True,
+        help="Vocabulary size of the data, excluding the end of document token, which is "
+        "assumed to be the vocabulary size",
+    )
+    group.add_argument("--seed", type=int, default=1234, help="Random seed")
+    group.add_argument("--data-cache-path", type=str, default=None, help="Dataset index cache")
+    group.add_argument("--reset-position-ids", action="store_true")
+    group.add_argument("--reset-attention-mask", action="store_true")
+    group.add_argument("--eod-mask-loss", action="store_true")
+    group.add_argument("--create-attention-mask-in-dataloader", action="store_true")
+
+    group = parser.add_argument_group(title="replay")
+    group.add_argument("--micro-batch-size", type=int, default=1, help="Micro batch size")
+    group.add_argument("--num-workers", type=int, default=2, help="Dataloader workers")
+    group.add_argument(
+        "--target-samples-per-second",
+        type=float,
+        required=True,
+        help="The rate at which the training loop consumes samples",
+    )
+    group.add_argument("--num-samples", type=int, default=10000, help="Samples to replay")
+    group.add_argument(
+        "--warmup-samples", type=int, default=1000, help="Samples to replay before profiling"
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    compile_helpers()
+
+    config = GPTDatasetConfig(
+        random_seed=args.seed,
+        sequence_length=args.seq_length,
+        blend=get_blend_from_list(args.data_path),
+        split=args.split,
+        path_to_cache=args.data_cache_path,
+        tokenizer=_NullTokenizer(args.vocab_size),
+        reset_position_ids=args.reset_position_ids,
+        reset_attention_mask=args.reset_attention_mask,
+        eod_mask_loss=args.eod_mask_loss,
+        create_attention_mask=args.create_attention_mask_in_dataloader,
+    )
+    num_samples = args.warmup_samples + args.num_samples
+    train_ds, _, _ = BlendedMegatronDatasetBuilder(
+        GPTDataset, [num_samples, 0, 0], lambda: True, config
+    ).build()
+
+    # Enable the profiler before the dataloader workers are forked
+    profiler = enable_data_loading_profiler(args.num_workers)
+    # In order, as the pretraining sampler on a single data parallel rank
+    batch_sampler = torch.utils.data.BatchSampler(
+        torch.utils.data.SequentialSampler(train_ds), args.micro_batch_size, drop_last=True
+    )
+    dataloader = torch.utils.data.DataLoader(
+        train_ds,
+        batch_sampler=batch_sampler,
+        num_workers=args.num_workers,
+        collate_fn=profiled_collate,
+        persistent_workers=args.num_workers > 0,
+    )
+    data_iterator = iter(dataloader)
+
+    # Consume one micro batch per interval, as a training loop of the target rate would
+    interval = args.micro_batch_size / args.target_samples_per_second
+    num_warmup_batches = args.warmup_samples // args.micro_batch_size
+    num_batches = args.num_samples // args.micro_batch_size
+    for _ in range(num_warmup_batches):
+        next(data_iterator)
+    profiler.get_statistics()
+
+    t_beg = time.perf_counter()
+    deadline = t_beg
+    for _ in range(num_batches):
+        with profile_data_loading_stage("batch-wait"):
+            next(data_iterator)
+        deadline += interval
+        time.sleep(max(deadline - time.perf_counter(), 0.0))
+    elapsed = time.perf_counter() - t_beg
+
+    statistics = profiler.get_statistics()
+    achieved = num_batches * args.micro_batch_size / elapsed
+
+    print(
+        f"target {args.target_samples_per_second:.1f} samples/s, achieved {achieved:.1f} samples/s"
+    )
+    print(f"{'stage':>24} {'count':>8} {'mean (us)':>10} {'p50':>8} {'p90':>8} {'p99':>8}")
+    for stage, stage_statistics in statistics.items():
+        if stage_statistics["count"] == 0:
+            continue
+        histogram = stage_statistics["histogram"]
+        print(
+            f"{stage:>24} {stage_statistics['count']:>8} "
+            f"{stage_statistics['seconds'] / stage_statistics['count'] * 1e6:>10.1f} "
+            f"{profiler.get_percentile(histogram, 50):>8} "
+            f"{profiler.get_percentile(histogram, 90):>8} "
+            f"{profiler.get_percentile(histogram, 99):>8}"
+        )
+
+    # The worker time per sample bounds the rate at which the workers can produce samples
+    num_samples_replayed = num_batches * args.micro_batch_size
+    worker_seconds_per_sample = {
+        stage: statistics[stage]["seconds"] / num_samples_replayed for stage in _WORKER_STAGES
+    }
+    capacity = max(args.num_workers, 1) / max(sum(worker_seconds_per_sample.values()), 1e-9)
+    bottleneck = max(worker_seconds_per_sample, key=worker_seconds_per_sample.get)
+    print(f"profiled worker capacity {capacity:.1f} samples/s")
+    if achieved < 0.95 * args.target_samples_per_second:
+        print(
+            f"data loading is the bottleneck: the largest stage is '{bottleneck}' at "
+            f"{worker_seconds_per_sample[bottleneck] * 1e6:.1f} us per sample"
+        )
+    else:
+        print(
+            f"data loading keeps up with the target rate; the largest stage is '{bottleneck}' "
+            f"at {worker_seconds_per_sample[bottleneck] * 1e6:.1f} us per sample"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Benchmark the save and load of synthetic sharded state dicts with the dist_checkpointing strategies.
+
+Runs on CPU with the gloo backend, either with torchrun or with local processes spawned by this
+script (--num-processes). The tensors are sharded across the "tensor parallel" ranks and replicated
+across the "data parallel" ranks. Each save and load is timed end to end and per phase (planning,
+metadata exchange, D2H, write, fsync, finalize, read, ...), taking the slowest rank for each phase.
+The report is written as JSON to compare the strategies and catch regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+import torch
+
+from megatron.core import dist_checkpointing
+from megatron.core.dist_checkpointing import ShardedTensor
+from megatron.core.dist_checkpointing.core import CheckpointingException
+from megatron.core.dist_checkpointing.strategies.base import (
+    StrategyAction,
+    default_strategies,
+    get_default_strategy,
+)
+from megatron.core.dist_checkpointing.strategies.profiling import profile_phases
+
+# Strategies built on top of the registered backends
+_WRAPPED_STRATEGIES = ("torch_dist+fully_parallel", "zarr+two_stage")
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+
+    group = parser.add_argument_group(title="state dict")
+    group.add_argument(
+        "--num-params", type=int, default=64 * 1024 * 1024, help="Parameters of the state dict"
+    )
+    group.add_argument("--num-tensors", type=int, default=32, help="Tensors of the state dict")
+    group.add_argument(
+        "--tensor-parallel-size",
+        type=int,
+        default=None,
+        help="Number of ranks the tensors are sharded across, the tensors are replicated "
+        "across the remaining ranks. Defaults to the world size (no replication)",
+    )
+    group.add_argument("--dtype", choices=["float32", "bfloat16"], default="float32")
+
+    group = parser.add_argument_group(title="benchmark")
+    group.add_argument(
+        "--strategies",
+        nargs="+",
+        default=None,
+        help="Strategies to benchmark: the registered backends (e.g. torch_dist, zarr) "
+        f"and {', '.join(_WRAPPED_STRATEGIES)}. Defaults to all of them",
+    )
+    group.add_argument("--iterations", type=int, default=3, help="Saves and loads per strategy")
+    group.add_argument("--thread-count", type=int, default=2, help="torch_dist writers per rank")
+    group.add_argument(
+        "--num-processes",
+        type=int,
+        default=2,
+        help="Local processes to spawn if not launched with torchrun",
+    )
+    group.add_argument(
+        "--checkpoint-dir", type=str, default=None, help="Directory for the checkpoints"
+    )
+    group.add_argument("--output", type=str, default=None, help="Path of the JSON report")
+    return parser.parse_args()
+
+
+def get_registered_backends():
+    """Backends with a default save strategy and the error of the ones which can't be imported."""
+    backends = {}
+    for backend in ("torch_dist", "zarr"):
+        try:
+            get_default_strategy(StrategyAction.SAVE_SHARDED, backend, 1)
+            backends[backend] = None
+        except CheckpointingException as e:
+            backends[backend] = str(e)
+    # Strategies registered by other modules
+    for backend, _ in default_strategies[StrategyAction.SAVE_SHARDED.value]:
+        backends.setdefault(backend, None)
+    return backends
+
+
+def get_strategies(args, name, dp_group):
+    """Save and load strategies of a benchmarked strategy.
+
+    Returns:
+        Tuple: save strategy, load strategy (None for the default one) and the reason
+            for skipping the load (None if it can be benchmarked)
+    """
+    from megatron.core.dist_checkpointing.strategies.fully_parallel import (
+        FullyParallelLoadStrategyWrapper,
+        FullyParallelSaveStrategyWrapper,
+    )
+
+    backend, _, wrapper = name.partition("+")
+    if backend == "torch_dist":
+        from megatron.core.dist_checkpointing.strategies.torch import (
+            TorchDistSaveShardedStrategy,
+        )
+
+        save_strategy = TorchDistSaveShardedStrategy(
+            "torch_dist", 1, thread_count=args.thread_count
+        )
+    else:
+        save_strategy = get_default_strategy(StrategyAction.SAVE_SHARDED, backend, 1)
+
+    if not wrapper:
+        return save_strategy, None, None
+    if wrapper == "fully_parallel":
+        save_strategy = FullyParallelSaveStrategyWrapper(save_strategy, dp_group)
+        if not torch.cuda.is_available() and torch.distributed.get_world_size(dp_group) > 1:
+            # The loaded tensors are exchanged between the ranks on the GPU
+            return save_strategy, None, "the fully parallel load requires CUDA"
+        load_strategy = FullyParallelLoadStrategyWrapper(
+            get_default_strategy(StrategyAction.LOAD_SHARDED, backend, 1), dp_group
+        )
+        return save_strategy, load_strategy, None
+    if wrapper == "two_stage":
+        from megatron.core.dist_checkpointing.strategies.two_stage import (
+            TwoStageDataParallelLoadShardedStrategy,
+        )
+
+        return save_strategy, TwoStageDataParallelLoadShardedStrategy(dp_group), None
+    raise ValueError(f"Unknown strategy: {name}")
+
+
+def get_sharded_state_dict(args, tp_rank, tp_size, dp_rank):
+    """Tensors sharded along the first dimension across the TP ranks, replicated across DP."""
+    numel = args.num_params // args.num_tensors
+    rows = max(numel // 1024, tp_size) // tp_size * tp_size
+    generator = torch.Generator().manual_seed(tp_rank)
+    sharded_state_dict = {}
+    for i in range(args.num_tensors):
+        data = torch.randn(rows // tp_size, 1024, generator=generator).to(
+            getattr(torch, args.dtype)
+        )
+        sharded_state_dict[f"tensor.{i}"] = ShardedTensor.from_rank_offsets(
+            f"tensor.{i}", data, (0, tp_rank, tp_size), replica_id=dp_rank
+        )
+    return sharded_state_dict
+
+
+def gather_phases(phases):
+    """Time of each phase on the slowest rank."""
+    all_phases = [None] * torch.distributed.get_world_size()
+    torch.distributed.all_gather_object(all_phases, dict(phases))
+    max_phases = {}
+    for rank_phases in all_phases:
+        for phase, phase_time in rank_phases.items():
+            max_phases[phase] = max(max_phases.get(phase, 0.0), phase_time)
+    return dict(sorted(max_phases.items()))
+
+
+def run_strategy(args, name, state_dict, root_dir, dp_group):
+    rank = torch.distributed.get_rank()
+    save_strategy, load_strategy, skip_reason = get_strategies(args, name, dp_group)
+    result = {"iterations": []}
+    for iteration in range(args.iterations):
+        checkpoint_dir = os.path.join(root_dir, f"{name}.{iteration}")
+        if rank == 0:
+            os.makedirs(checkpoint_dir)
+        torch.distributed.barrier()
+
+        with profile_phases() as save_phases:
+            start = time.perf_counter()
+            dist_checkpointing.save(state_dict, checkpoint_dir, save_strategy)
+            torch.distributed.barrier()
+            save_time = time.perf_counter() - start
+        run = {"save": {"total": save_time, "phases": gather_phases(save_phases)}}
+
+        if skip_reason is None:
+            load_state_dict = {
+                key: replace(sh_ten, data=torch.empty_like(sh_ten.data))
+                for key, sh_ten in state_dict.items()
+            }
+            with profile_phases() as load_phases:
+                start = time.perf_counter()
+                loaded_state_dict = dist_checkpointing.load(
+                    load_state_dict, checkpoint_dir, load_strategy
+                )
+                torch.distributed.barrier()
+                load_time = time.perf_counter() - start
+            correct = torch.tensor(
+                all(
+                    torch.equal(loaded_state_dict[key], sh_ten.data)
+                    for key, sh_ten in state_dict.items()
+                ),
+                dtype=torch.int,
+            )
+            torch.distributed.all_reduce(correct, op=torch.distributed.ReduceOp.MIN)
+            run["load"] = {
+                "total": load_time,
+                "phases": gather_phases(load_phases),
+                "correct": bool(correct.item()),
+            }
+        result["iterations"].append(run)
+
+        torch.distributed.barrier()
+        if rank == 0:
+            shutil.rmtree(checkpoint_dir)
+    if skip_reason is not None:
+        result["load_skipped"] = skip_reason
+
+    for action in ("save", "load"):
+        totals = [run[action]["total"] for run in result["iterations"] if action in run]
+        if totals:
+            result[f"{action}_min"] = min(totals)
+            result[f"{action}_mean"] = sum(totals) / len(totals)
+    return result
+
+
+def benchmark(args):
+    rank, world_size = torch.distributed.get_rank(), torch.distributed.get_world_size()
+    tp_size = args.tensor_parallel_size or world_size
+    assert world_size % tp_size == 0, (world_size, tp_size)
+    tp_rank, dp_rank = rank % tp_size, rank // tp_size
+    # Ranks with the same TP rank hold the same shards
+    dp_group = None
+    for group_tp_rank in range(tp_size):
+        group = torch.distributed.new_group(list(range(group_tp_rank, world_size, tp_size)))
+        if group_tp_rank == tp_rank:
+            dp_group = group
+
+    root_dir = [args.checkpoint_dir or tempfile.mkdtemp() if rank == 0 else None]
+    torch.distributed.broadcast_object_list(root_dir)
+    root_dir = root_dir[0]
+
+    state_dict = get_sharded_state_dict(args, tp_rank, tp_size, dp_rank)
+    element_size = torch.finfo(getattr(torch, args.dtype)).bits // 8
+    state_dict_bytes = (
+        sum(sh_ten.data.numel() * element_size for sh_ten in state_dict.values()) * tp_size
+    )
+
+    backends = get_registered_backends()
+    strategies = args.strategies or list(backends) + list(_WRAPPED_STRATEGIES)
+
+    # The first torch_dist save starts the helper processes of the writers, don't time it
+    if backends.get("torch_dist", "") is None:
+        warmup_dir = os.path.join(root_dir, "warmup")
+        if rank == 0:
+            os.makedirs(warmup_dir)
+        torch.distributed.barrier()
+        save_strategy, _, _ = get_strategies(args, "torch_dist", dp_group)
+        dist_checkpointing.save(
+            {key: state_dict[key] for key in list(state_dict)[:1]}, warmup_dir, save_strategy
+        )
+        torch.distributed.barrier()
+        if rank == 0:
+            shutil.rmtree(warmup_dir)
+    report = {
+        "config": {
+            "world_size": world_size,
+            "tensor_parallel_size": tp_size,
+            "num_params": args.num_params,
+            "num_tensors": args.num_tensors,
+            "dtype": args.dtype,
+            "state_dict_bytes": state_dict_bytes,
+            "iterations": args.iterations,
+            "thread_count": args.thread_count,
+            "torch_version": torch.__version__,
+            "hostname": platform.node(),
+        },
+        "strategies": {},
+    }
+    for name in strategies:
+        import_error = backends.get(name.partition("+")[0], f"Unknown backend of {name}")
+        if import_error is not None:
+            report["strategies"][name] = {"skipped": import_error}
+            continue
+        report["strategies"][name] = run_strategy(args, name, state_dict, root_dir, dp_group)
+
+    if rank == 0:
+        print(
+            f"state dict: {state_dict_bytes / 2**20:.1f} MiB on {world_size} ranks"
+            f" (TP={tp_size}, DP={world_size // tp_size})"
+        )
+        for name, result in report["strategies"].items():
+            if "skipped" in result:
+                print(f"{name:>28}: skipped, {result['skipped']}")
+                continue
+            last_run = result["iterations"][-1]
+            for action in ("save", "load"):
+                if action not in last_run:
+                    print(f"{name:>28} {action}: skipped, {result['load_skipped']}")
+                    continue
+                phases = ", ".join(
+                    f"{phase} {phase_time:.3f}s"
+                    for phase, phase_time in last_run[action]["phases"].items()
+                )
+                print(
+                    f"{name:>28} {action}: {result[f'{action}_min']:.3f}s"
+                    f" ({state_dict_bytes / 2**30 / result[f'{action}_min']:.2f} GiB/s)"
+                    f" last run phases: {phases}"
+                )
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"report written to {args.output}")
+        if args.checkpoint_dir is None:
+            shutil.rmtree(root_dir)
+    return report
+
+
+def _spawned_main(local_rank, args, world_size, master_port):
+    os.environ.update(
+        RANK=str(local_rank),
+        LOCAL_RANK=str(local_rank),
+        WORLD_SIZE=str(world_size),
+        MASTER_ADDR="localhost",
+        MASTER_PORT=str(master_port),
+    )
+    torch.distributed.init_process_group("gloo")
+    try:
+        benchmark(args)
+    finally:
+        torch.distributed.destroy_process_group()
+
+
+def main():
+    args = get_args()
+    if "RANK" in os.environ:
+        torch.distributed.init_process_group("gloo")
+        benchmark(args)
+        return
+    master_port = int(os.environ.get("MASTER_PORT", 29500))
+    torch.multiprocessing.spawn(
+        _spawned_main, args=(args, args.num_processes, master_port), nprocs=args.num_processes
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Compare the static and the dynamic (continuous) batching of MCoreEngine on a synthetic workload.
+
+A tiny randomly initialized GPT model serves requests with random prompts and skewed generation
+lengths: most requests generate a few tokens and some generate many. All the requests arrive
+at once. The sampling is greedy, so both batching modes generate the same tokens.
+The report (JSON) has the throughput (generated tokens per second) and the request latency
+percentiles (from the arrival to the completion of the request) of each mode.
+
+With static batching a batch runs until its longest request completes, so the short requests
+wait for the long ones. With dynamic batching the completed requests are replaced by the waiting
+ones after every forward step.
+
+With --shared-prefix-length the prompts start with the same tokens (e.g. a system prompt), and
+--enable-prefix-caching lets the dynamic batching reuse the KV cache of the shared prefix. The
+report then has the prefix cache hit rate and the saved FLOPs.
+
+Example:
+    python tools/benchmark_inference_batching.py --num-requests 256 --max-batch-size 16
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+import torch
+
+from megatron.core import parallel_state
+from megatron.core.inference.common_inference_params import CommonInferenceParams
+from megatron.core.inference.engines.mcore_engine import MCoreEngine
+from megatron.core.inference.model_inference_wrappers.gpt.gpt_inference_wrapper import (
+    GPTInferenceWrapper,
+)
+from megatron.core.inference.model_inference_wrappers.inference_wrapper_config import (
+    InferenceWrapperConfig,
+)
+from megatron.core.inference.text_generation_controllers.simple_text_generation_controller import (
+    SimpleTextGenerationController,
+)
+from megatron.core.models.gpt.gpt_layer_specs import get_gpt_layer_local_spec
+from megatron.core.models.gpt.gpt_model import GPTModel
+from megatron.core.tensor_parallel.random import model_parallel_cuda_manual_seed
+from megatron.core.transformer.transformer_config import TransformerConfig
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+
+    group = parser.add_argument_group(title="model")
+    group.add_argument("--num-layers", type=int, default=2)
+    group.add_argument("--hidden-size", type=int, default=64)
+    group.add_argument("--num-attention-heads", type=int, default=4)
+    group.add_argument("--vocab-size", type=int, default=1024)
+
+    group = parser.add_argument_group(title="workload")
+    group.add_argument("--num-requests", type=int, default=128)
+    group.add_argument("--min-prompt-length", type=int, default=8)
+    group.add_argument("--max-prompt-length", type=int, default=64)
+    group.add_argument(
+        "--short-tokens-to-generate", type=int, default=8, help="Tokens generated by most requests"
+    )
+    group.add_argument(
+        "--long-tokens-to-generate", type=int, default=128, help="Tokens generated by long requests"
+    )
+    group.add_argument(
+        "--long-fraction", type=float, default=0.1, help="Fraction of the long requests"
+    )
+    group.add_argument(
+        "--shared-prefix-length", type=int, default=0, help="Tokens shared by all the prompts"
+    )
+    group.add_argument("--seed", type=int, default=1234)
+
+    group = parser.add_argument_group(title="benchmark")
+    group.add_argument("--max-batch-size", type=int, default=8)
+    group.add_argument(
+        "--modes", nargs="+", choices=["static", "dynamic"], default=["static", "dynamic"]
+    )
+    group.add_argument(
+        "--enable-prefix-caching",
+        action="store_true",
+        help="Cache the KV cache blocks of the prompts with dynamic batching",
+    )
+    group.add_argument("--output", type=str, default=None, help="Path of the JSON report")
+    return parser.parse_args()
+
+
+class _SyntheticTokenizer:
+    """The prompts are already token ids, the detokenized text is the ids."""
+
+    def __init__(self, vocab_size):
+        self.vocab_size = vocab_size
+        self.eod = vocab_size - 1
+
+    def tokenize(self, prompt):
+        return list(prompt)
+
+    def detokenize(self, tokens):
+        return " ".join(map(str, tokens))
+
+
+def build_engine(args):
+    config = TransformerConfig(
+        num_layers=args.num_layers,
+        hidden_size=args.hidden_size,
+        num_attention_heads=args.num_attention_heads,
+        use_cpu_initialization=True,
+    )
+    max_sequence_length = (
+        args.shared_prefix_length + args.max_prompt_length + args.long_tokens_to_generate
+    )
+    model = GPTModel(
+        config=config,
+        transformer_layer_spec=get_gpt_layer_local_spec(),
+        vocab_size=args.vocab_size,
+        max_sequence_length=max_sequence_length,
+    ).cuda()
+    inference_wrapper_config = InferenceWrapperConfig(
+        hidden_size=args.hidden_size,
+        inference_batch_times_seqlen_threshold=max_sequence_length * args.max_batch_size,
+        params_dtype=torch.float,
+        padded_vocab_size=args.vocab_size,
+    )
+    controller = SimpleTextGenerationController(
+        inference_wrapped_model=GPTInferenceWrapper(model, inference_wrapper_config),
+        tokenizer=_SyntheticTokenizer(args.vocab_size),
+    )
+    return MCoreEngine(
+        text_generation_controller=controller,
+        max_batch_size=args.max_batch_size,
+        max_sequence_length=max_sequence_length,
+        enable_prefix_caching=args.enable_prefix_caching,
+    )
+
+
+def get_workload(args):
+    """Random prompts and skewed generation lengths, the same for all the modes."""
+    rng = random.Random(args.seed)
+    shared_prefix = [rng.randrange(args.vocab_size - 1) for _ in range(args.shared_prefix_length)]
+    workload = []
+    for _ in range(args.num_requests):
+        prompt_length = rng.randint(args.min_prompt_length, args.max_prompt_length)
+        prompt = shared_prefix + [rng.randrange(args.vocab_size - 1) for _ in range(prompt_length)]
+        is_long = rng.random() < args.long_fraction
+        num_tokens_to_generate = (
+            args.long_tokens_to_generate if is_long else args.short_tokens_to_generate
+        )
+        workload.append((prompt, num_tokens_to_generate))
+    return workload
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(percentile / 100 * len(values)))]
+
+
+def run_workload(engine, workload, dynamic_generation):
+    scheduler = engine.scheduler
+    controller = engine.text_generation_controller
+    controller.reset_prefix_cache_stats()
+    # The requests of a static batch share the inference params, except the tokens to generate
+    inference_params = {
+        num_tokens_to_generate: CommonInferenceParams(
+            top_k=1, num_tokens_to_generate=num_tokens_to_generate
+        )
+        for num_tokens_to_generate in set(n for _, n in workload)
+    }
+    start = time.time()
+    request_ids = [
+        scheduler.add_request(
+            prompt=prompt,
+            prompt_tokens=list(prompt),
+            inference_parameters=inference_params[num_tokens_to_generate],
+            arrival_time=start,
+        )
+        for prompt, num_tokens_to_generate in workload
+    ]
+    engine.run_engine(dynamic_generation=dynamic_generation)
+    torch.cuda.synchronize()
+    elapsed = time.time() - start
+
+    requests = [scheduler.completed_request_pool.pop(request_id) for request_id in request_ids]
+    latencies = [request.completion_time - request.arrival_time for request in requests]
+    generated_tokens = sum(request.generated_length for request in requests)
+    report = {
+        "elapsed_s": elapsed,
+        "generated_tokens": generated_tokens,
+        "throughput_tokens_per_s": generated_tokens / elapsed,
+        "latency_mean_s": sum(latencies) / len(latencies),
+        "latency_p50_s": _percentile(latencies, 50),
+        "latency_p99_s": _percentile(latencies, 99),
+    }
+    if dynamic_generation and engine.enable_prefix_caching:
+        report["prefix_cache"] = controller.get_prefix_cache_stats()
+    return report, [request.generated_tokens.tolist() for request in requests]
+
+
+def main():
+    args = get_args()
+    os.environ.setdefault("MASTER_ADDR", "localhost")
+    os.environ.setdefault("MASTER_PORT", "29500")
+    torch.distributed.init_process_group("nccl", rank=0, world_size=1)
+    parallel_state.initialize_model_parallel(1, 1)
+    model_parallel_cuda_manual_seed(args.seed)
+
+    engine = build_engine(args)
+    workload = get_workload(args)
+    # Warmup
+    run_workload(engine, workload[: args.max_batch_size], dynamic_generation=False)
+
+    report = {"args": vars(args)}
+    generations = {}
+    for mode in args.modes:
+        report[mode], generations[mode] = run_workload(
+            engine, workload, dynamic_generation=(mode == "dynamic")
+        )
+    if len(generations) == 2:
+        report["same_generations"] = generations["static"] == generations["dynamic"]
+        report["throughput_speedup"] = (
+            report["dynamic"]["throughput_tokens_per_s"]
+            / report["static"]["throughput_tokens_per_s"]
+        )
+        report["latency_p99_reduction"] = (
+            report["static"]["latency_p99_s"] / report["dynamic"]["latency_p99_s"]
+        )
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    parallel_state.destroy_model_parallel()
+    torch.distributed.destroy_process_group()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Compare the memory and time of the log probabilities of the generated tokens.
+
+The inference returns the log probability of each token, which was computed with a log_softmax of
+the logits of the whole vocabulary followed by a gather of one value per position. The log_softmax
+output has the size of the logits ([batch, context, vocab] fp32 for a prefill), although a single
+value per position is used. target_log_probs (megatron/core/tensor_parallel/cross_entropy.py)
+computes the log_softmax in chunks of rows and only keeps the values of the tokens, so its
+temporary memory is bounded by the chunk size.
+
+For each vocabulary size, the report (JSON) has the peak memory allocated on top of the logits
+and the time of both implementations, for a prefill and a decode step, and the maximum difference
+of the log probabilities. On CUDA the peak memory is the peak allocated by the caching allocator,
+on CPU it is the peak resident set size of the process (Linux only).
+
+Example:
+    python tools/benchmark_log_probs.py --vocab-sizes 32000 128000 256000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+import torch
+import torch.nn.functional as F
+
+from megatron.core.tensor_parallel import target_log_probs
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument(
+        "--context-length", type=int, default=512, help="Number of positions of the prefill"
+    )
+    parser.add_argument("--vocab-sizes", type=int, nargs="+", default=[32000, 128000, 256000])
+    parser.add_argument("--dtype", choices=["float32", "bfloat16"], default="float32")
+    parser.add_argument("--max-chunk-numel", type=int, default=2**24)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--device", choices=["cuda", "cpu"], default="cuda")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", type=str, default=None, help="Path of the JSON report")
+    return parser.parse_args()
+
+
+def log_softmax_log_probs(logits, target):
+    """The log probabilities computed from the log softmax of the whole vocabulary."""
+    return torch.gather(F.log_softmax(logits, dim=-1), -1, target.unsqueeze(-1)).squeeze(-1)
+
+
+def read_process_status_mb(field):
+    """Returns a memory field (e.g. VmRSS) of /proc/self/status in MB."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 2**10
+    raise RuntimeError(f"{field} is not in /proc/self/status")
+
+
+def measure(fn, logits, target, args):
+    """Returns the output, the peak memory allocated by fn in MB and its mean time in ms."""
+    output = fn(logits, target)
+    del output
+    if args.device == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        memory_before = torch.cuda.memory_allocated()
+        output = fn(logits, target)
+        torch.cuda.synchronize()
+        peak_memory_mb = (torch.cuda.max_memory_allocated() - memory_before) / 2**20
+    else:
+        # Resets the peak resident set size of the process to its current size
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        memory_before = read_process_status_mb("VmRSS")
+        output = fn(logits, target)
+        peak_memory_mb = read_process_status_mb("VmHWM") - memory_before
+
+    start = time.time()
+    for _ in range(args.iterations):
+        fn(logits, target)
+    if args.device == "cuda":
+        torch.cuda.synchronize()
+    elapsed_ms = (time.time() - start) / args.iterations * 1000
+    return output, peak_memory_mb, elapsed_ms
+
+
+def run_shape(args, vocab_size, num_positions):
+    dtype = getattr(torch, args.dtype)
+    logits = torch.randn(
+        args.batch_size, num_positions, vocab_size, dtype=dtype, device=args.device
+    )
+    target = torch.randint(0, vocab_size, (args.batch_size, num_positions), device=args.device)
+
+    report = {"logits_mb": logits.numel() * logits.element_size() / 2**20}
+    expected, report["log_softmax_peak_mb"], report["log_softmax_ms"] = measure(
+        log_softmax_log_probs, logits, target, args
+    )
+    output, report["target_log_probs_peak_mb"], report["target_log_probs_ms"] = measure(
+        lambda logits, target: target_log_probs(
+            logits, target, max_chunk_numel=args.max_chunk_numel
+        ),
+        logits,
+        target,
+        args,
+    )
+    report["max_abs_diff"] = (output - expected.float()).abs().max().item()
+    report["memory_saved_mb"] = report["log_softmax_peak_mb"] - report["target_log_probs_peak_mb"]
+    return report
+
+
+def main():
+    args = get_args()
+    torch.manual_seed(args.seed)
+
+    report = {"args": vars(args)}
+    for vocab_size in args.vocab_sizes:
+        report[vocab_size] = {
+            "prefill": run_shape(args, vocab_size, args.context_length),
+            "decode": run_shape(args, vocab_size, 1),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Fold an incremental torch_dist checkpoint and the checkpoints it references into a full checkpoint.
+
+Checkpoints saved with --ckpt-incremental reference the unchanged shards from the previous
+checkpoints of the job. After compaction, the referenced checkpoints can be removed.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+from megatron.core.dist_checkpointing.strategies.incremental import (
+    compact_incremental_checkpoint,
+    get_referenced_checkpoints,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Megatron Incremental Checkpoint Compaction",
+                                     allow_abbrev=False)
+    parser.add_argument('--load-dir', type=str, required=True,
+                        help='Directory of the incremental checkpoint (e.g. <save>/iter_0001000)')
+    parser.add_argument('--save-dir', type=str, default=None,
+                        help='Directory to save the full checkpoint to. '
+                        'If not given, the incremental checkpoint is replaced in place.')
+    args = parser.parse_args()
+
+    load_dir = os.path.normpath(args.load_dir)
+    referenced = sorted(get_referenced_checkpoints(load_dir))
+    if not referenced:
+        print(f"{load_dir} does not reference other checkpoints, nothing to compact.")
+        return
+    print(f"{load_dir} references {len(referenced)} checkpoints:")
+    for path in referenced:
+        print(f"    {path}")
+
+    save_dir = args.save_dir if args.save_dir is not None else load_dir + '.compacted'
+    compact_incremental_checkpoint(load_dir, save_dir)
+    if args.save_dir is None:
+        shutil.rmtree(load_dir)
+        os.rename(save_dir, load_dir)
+        save_dir = load_dir
+    print(f"Saved the full checkpoint to {save_dir}. The referenced checkpoints can be removed "
+          f"once no other checkpoint references them.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Loader reading an M-Core checkpoint (`torch` format) in parallel, without building models.
+
+Unlike loader_mcore, which builds and loads a model for every TP rank of every PP stage one
+after the other, this loader memory-maps the state dicts of all TP/PP ranks at once and
+assembles the messages (concatenating the TP shards of each layer) in a pool of
+`--loader-num-workers` threads. The tensors are read from the files by the threads assembling
+the layers, so the reads of several layers proceed in parallel. At most
+`--loader-max-pending-layers` messages are assembled ahead of the queue, so the memory usage of
+the loader is bounded by a few layers. The messages are the same as those of loader_mcore.
+
+Pair it with saver_dist to convert a checkpoint with parallel reads and writes.
+"""
+
+import collections
+import json
+import os
+import sys
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from utils import get_mcore_transformer_block_key, print_memory_usage
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group(title='M-Core parallel loader')
+
+    group.add_argument('--true-vocab-size', type=int, default=None,
+                       help='original size of vocab, if specified will trim padding from embedding table.')
+    group.add_argument('--vocab-file', type=str, default=None,
+                       help='Path to the vocab file. If specified will use this to get vocab size and '
+                       'trim padding from the embedding table.')
+    group.add_argument('--megatron-path', type=str, default=None,
+                       help='Base directory of Megatron repository')
+    group.add_argument('--loader-num-workers', type=int, default=8,
+                       help='Number of threads reading the checkpoint files and assembling the layers')
+    group.add_argument('--loader-max-pending-layers', type=int, default=None,
+                       help='Number of layers assembled ahead of the saver, '
+                       'defaults to --loader-num-workers')
+
+
+def _get(state_dict, prefix, *names):
+    """Tensor with the first of the names present in the state dict, read into memory."""
+    for name in names:
+        if prefix + name in state_dict:
+            return state_dict[prefix + name].clone()
+    raise KeyError(f'None of {[prefix + name for name in names]} in the checkpoint')
+
+
+def _cat(state_dicts, prefix, name, dim):
+    return torch.cat([state_dict[prefix + name] for state_dict in state_dicts], dim=dim)
+
+
+def _layer_message(state_dicts, prefix, md):
+    """Message of a transformer layer, from the state dicts of all TP ranks."""
+    # The names of the norms differ between the transformer engine and the local layer specs
+    message = {
+        "input norm weight": _get(state_dicts[0], prefix, 'self_attention.linear_qkv.layer_norm_weight',
+                                  'input_layernorm.weight'),
+        "post norm weight": _get(state_dicts[0], prefix, 'mlp.linear_fc1.layer_norm_weight',
+                                 'pre_mlp_layernorm.weight'),
+    }
+    if md.norm_has_bias:
+        message["input norm bias"] = _get(state_dicts[0], prefix, 'self_attention.linear_qkv.layer_norm_bias',
+                                          'input_layernorm.bias')
+        message["post norm bias"] = _get(state_dicts[0], prefix, 'mlp.linear_fc1.layer_norm_bias',
+                                         'pre_mlp_layernorm.bias')
+    message["qkv weight"] = _cat(state_dicts, prefix, 'self_attention.linear_qkv.weight', 0)
+    message["dense weight"] = _cat(state_dicts, prefix, 'self_attention.linear_proj.weight', 1)
+    message["mlp l1 weight"] = _cat(state_dicts, prefix, 'mlp.linear_fc2.weight', 1)
+    if md.linear_bias:
+        message["qkv bias"] = _cat(state_dicts, prefix, 'self_attention.linear_qkv.bias', 0)
+        message["dense bias"] = _get(state_dicts[0], prefix, 'self_attention.linear_proj.bias')
+        message["mlp l1 bias"] = _get(state_dicts[0], prefix, 'mlp.linear_fc2.bias')
+
+    param_names = ['weight', 'bias'] if md.linear_bias else ['weight']
+    for param_name in param_names:
+        if md.swiglu:
+            # concat all the first halves ('W's) and all the second halves ('V's)
+            halves = [torch.chunk(state_dict[f'{prefix}mlp.linear_fc1.{param_name}'], 2, dim=0)
+                      for state_dict in state_dicts]
+            message[f"mlp l0 {param_name} W"] = torch.cat([half[0] for half in halves], dim=0)
+            message[f"mlp l0 {param_name} V"] = torch.cat([half[1] for half in halves], dim=0)
+        else:
+            message[f"mlp l0 {param_name}"] = _cat(state_dicts, prefix, f'mlp.linear_fc1.{param_name}', 0)
+    return message
+
+
+def _num_layers(state_dict, layer_prefix):
+    layer_indices = [int(key[len(layer_prefix):].split('.')[0])
+                     for key in state_dict if key.startswith(layer_prefix)]
+    return max(layer_indices) + 1 if layer_indices else 0
+
+
+def _load_checkpoint(queue, args):
+
+    # Search in directory above this
+    sys.path.append(os.path.abspath(
+        os.path.join(os.path.dirname(__file__),
+                     os.path.pardir,
+                     os.path.pardir)))
+    if args.megatron_path is not None:
+        sys.path.insert(0, args.megatron_path)
+
+    try:
+        from megatron.training.checkpointing import (
+            find_checkpoint_rank_0,
+            get_checkpoint_name,
+            get_checkpoint_tracker_filename,
+        )
+    except ModuleNotFoundError:
+        print("Unable to import Megatron, please specify the path to Megatron using --megatron-path. Exiting.")
+        queue.put("exit")
+        exit(1)
+
+    with open(get_checkpoint_tracker_filename(args.load_dir)) as f:
+        metastring = f.read().strip()
+    release = metastring == 'release'
+    iteration = 0 if release else int(metastring)
+    checkpoint_name = find_checkpoint_rank_0(args.load_dir, iteration, release)
+    if checkpoint_name is None or os.path.isdir(checkpoint_name):
+        print(f"No checkpoint in the torch format found in {args.load_dir}. Distributed checkpoints "
+              "are resharded on load and need no conversion to change the parallel sizes. Exiting.")
+        queue.put("exit")
+        exit(1)
+
+    def load_state_dict(checkpoint_name):
+        # Memory-mapped, the tensors are read on first access
+        return torch.load(checkpoint_name, map_location='cpu', mmap=True, weights_only=False)
+
+    state_dict = load_state_dict(checkpoint_name)
+    checkpoint_args = state_dict['args']
+    if getattr(checkpoint_args, 'use_legacy_models', False):
+        print("The checkpoint holds legacy models, use loader_megatron. Exiting.")
+        queue.put("exit")
+        exit(1)
+    if getattr(checkpoint_args, 'num_experts', None):
+        print("MoE checkpoints are not supported, use loader_mcore. Exiting.")
+        queue.put("exit")
+        exit(1)
+
+    # short aliases
+    tp_size = checkpoint_args.tensor_model_parallel_size
+    pp_size = checkpoint_args.pipeline_model_parallel_size
+    vp_size = getattr(checkpoint_args, 'virtual_pipeline_model_parallel_size', None) or 1
+
+    # Get true (non-padded) vocab size
+    if args.true_vocab_size is not None:
+        true_vocab_size = args.true_vocab_size
+    elif args.vocab_file is not None:
+        vocab = json.load(open(args.vocab_file))
+        true_vocab_size = len(vocab)
+    else:
+        true_vocab_size = None
+
+    # Layernorm has bias; RMSNorm does not.
+    norm_has_bias = getattr(checkpoint_args, 'normalization', 'LayerNorm') == "LayerNorm"
+
+    # metadata
+    md = types.SimpleNamespace()
+    md.model_type = args.model_type
+    md.num_layers = checkpoint_args.num_layers
+    md.hidden_size = checkpoint_args.hidden_size
+    md.seq_length = checkpoint_args.seq_length
+    md.num_attention_heads = checkpoint_args.num_attention_heads
+    md.max_position_embeddings = checkpoint_args.max_position_embeddings
+    md.tokenizer_type = checkpoint_args.tokenizer_type
+    md.iteration = state_dict.get('iteration', iteration)
+    md.params_dtype = checkpoint_args.params_dtype
+    md.bert_binary_head = getattr(checkpoint_args, 'bert_binary_head', False)
+    md.output_layer = checkpoint_args.untie_embeddings_and_output_weights
+    md.position_embedding_type = checkpoint_args.position_embedding_type
+    md.linear_bias = checkpoint_args.add_bias_linear
+    md.norm_has_bias = norm_has_bias
+    md.swiglu = getattr(checkpoint_args, 'swiglu', False)
+    md.previous_tensor_parallel_size = tp_size
+    md.previous_pipeline_parallel_size = pp_size
+    md.true_vocab_size = true_vocab_size
+    md.make_vocab_size_divisible_by = checkpoint_args.make_vocab_size_divisible_by
+    md.checkpoint_args = checkpoint_args
+    md.use_legacy_models = False
+    md.consumed_train_samples = getattr(checkpoint_args, 'consumed_train_samples', 0)
+    md.consumed_valid_samples = getattr(checkpoint_args, 'consumed_valid_samples', 0)
+
+    executor = ThreadPoolExecutor(args.loader_num_workers)
+    max_pending_layers = args.loader_max_pending_layers or args.loader_num_workers
+
+    # Model state dicts, indexed by [pp_rank][vp_rank][tp_rank]
+    checkpoint_names = [
+        get_checkpoint_name(args.load_dir, iteration, release, pipeline_parallel=pp_size > 1,
+                            tensor_rank=tp_rank, pipeline_rank=pp_rank,
+                            expert_parallel=False, expert_rank=0)
+        for pp_rank in range(pp_size) for tp_rank in range(tp_size)
+    ]
+    state_dicts = list(executor.map(load_state_dict, checkpoint_names))
+    models = [
+        [
+            [state_dicts[pp_rank * tp_size + tp_rank]['model' if vp_size == 1 else f'model{vp_rank}']
+             for tp_rank in range(tp_size)]
+            for vp_rank in range(vp_size)
+        ]
+        for pp_rank in range(pp_size)
+    ]
+    del state_dict, state_dicts
+    first_models, last_models = models[0][0], models[-1][-1]
+
+    transformer_block_key = get_mcore_transformer_block_key(md.model_type)
+    layer_prefix = f'{transformer_block_key}.layers.'
+
+    queue.put(md)
+
+    # The messages in the order of the queue protocol, assembled by the executor
+    def embeddings_message():
+        message = {"word embeddings": _cat(first_models, '', 'embedding.word_embeddings.weight', 0)}
+        if md.position_embedding_type == 'learned_absolute':
+            message["position embeddings"] = _get(first_models[0], '', 'embedding.position_embeddings.weight')
+        return message
+
+    def final_norm_message():
+        message = {"weight": _get(last_models[0], f'{transformer_block_key}.final_layernorm.', 'weight')}
+        if norm_has_bias:
+            message["bias"] = _get(last_models[0], f'{transformer_block_key}.final_layernorm.', 'bias')
+        return message
+
+    messages = [("embeddings", embeddings_message)]
+    total_layer_num = 0
+    for vp_rank in range(vp_size):
+        for pp_rank in range(pp_size):
+            tp_models = models[pp_rank][vp_rank]
+            for layer_num in range(_num_layers(tp_models[0], layer_prefix)):
+                messages.append((f"transformer layer {total_layer_num}",
+                                 lambda tp_models=tp_models, layer_num=layer_num: _layer_message(
+                                     tp_models, f'{layer_prefix}{layer_num}.', md)))
+                total_layer_num += 1
+    assert total_layer_num == md.num_layers, (total_layer_num, md.num_layers)
+    messages.append(("final norm", final_norm_message))
+    if md.output_layer:
+        messages.append(("output layer",
+                         lambda: {"weight": _cat(last_models, '', 'output_layer.weight', 0)}))
+
+    # Send BERT lm head and binary head if it exists
+    if md.model_type == 'BERT':
+        messages.append(("pooler", lambda: {
+            "weight": _get(last_models[0], 'pooler.dense.', 'weight'),
+            "bias": _get(last_models[0], 'pooler.dense.', 'bias'),
+        }))
+
+        def lm_head_message():
+            message = {
+                "dense weight": _get(last_models[0], 'lm_head.dense.', 'weight'),
+                "dense bias": _get(last_models[0], 'lm_head.dense.', 'bias'),
+                "norm weight": _get(last_models[0], 'lm_head.layer_norm.', 'weight'),
+            }
+            if norm_has_bias:
+                message["norm bias"] = _get(last_models[0], 'lm_head.layer_norm.', 'bias')
+            return message
+
+        messages.append(("lm head", lm_head_message))
+        if md.bert_binary_head:
+            messages.append(("binary head", lambda: {
+                "weight": _get(last_models[0], 'binary_head.', 'weight'),
+                "bias": _get(last_models[0], 'binary_head.', 'bias'),
+            }))
+
+    def queue_put(name, msg):
+        print(f"sending {name}")
+        msg["name"] = name
+        queue.put(msg)
+
+    pending = collections.deque()
+    for name, get_message in messages:
+        pending.append((name, executor.submit(get_message)))
+        if len(pending) > max_pending_layers:
+            name, future = pending.popleft()
+            queue_put(name, future.result())
+    while pending:
+        name, future = pending.popleft()
+        queue_put(name, future.result())
+    executor.shutdown()
+
+    print_memory_usage("loader", 0, 1)
+    queue.put("done")
+
+
+def load_checkpoint(queue, args):
+    try:
+        _load_checkpoint(queue, args)
+    except Exception:
+        queue.put("exit")
+        raise
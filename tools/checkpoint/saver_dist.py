@@ -0,0 +1,308 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Saver writing an M-Core torch_dist checkpoint without building the target models.
+
+The weights received from the loader are written directly as the sharded tensors of the
+M-Core GPT/BERT models, with the same keys and layer/expert axes as in their distributed
+checkpoints. The target TP/PP/EP sizes are chosen when the checkpoint is loaded, the
+resharding happens in `dist_checkpointing.load`.
+
+Each layer is written by a pool of writer processes while the next layers are received.
+At most `--saver-max-pending-layers` layers wait for a writer, so the memory usage of the
+saver is bounded by a few layers (plus `--max-queue-size` messages in the loader queue).
+"""
+
+import copy
+import os
+import sys
+import time
+
+import torch
+
+from utils import get_mcore_transformer_block_key, print_memory_usage
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group(title='M-Core distributed checkpoint saver')
+
+    group.add_argument('--megatron-path', type=str, default=None,
+                       help='Base directory of Megatron repository')
+    group.add_argument('--saver-num-workers', type=int, default=4,
+                       help='Number of processes writing the checkpoint files')
+    group.add_argument('--saver-max-pending-layers', type=int, default=None,
+                       help='Number of layers that can wait for a writer before receiving the '
+                       'next layer blocks, defaults to --saver-num-workers')
+    group.add_argument('--target-tensor-parallel-size', type=int, default=1,
+                       help='Tensor parallel size the checkpoint is expected to be loaded with. '
+                       'The checkpoint can be loaded with any size, the tensor parallel weights '
+                       'are only stored in this many chunks, so that loading with this size '
+                       'reads no unneeded data.')
+
+
+def _sharded_tensors(ShardedTensor, key, tensor, prepend_offsets, tp_axis=None, tp_size=1,
+                     part=0, num_parts=1):
+    """Sharded tensors of a tensor, split in `tp_size` chunks along `tp_axis`.
+
+    `prepend_offsets` are the (axis, offset, size) of the layer and expert axes.
+    The tensor can be the `part`-th of `num_parts` equal parts of the checkpoint tensor
+    along `tp_axis` (e.g. the W or V half of the SwiGLU fc1 weight).
+    """
+    prepend_axis_num = len(prepend_offsets)
+    if tp_axis is None:
+        assert num_parts == 1
+        return [ShardedTensor.from_rank_offsets(key, tensor, *prepend_offsets,
+                                                prepend_axis_num=prepend_axis_num)]
+
+    if tensor.shape[tp_axis] % tp_size != 0:
+        print(f"{key} of shape {tuple(tensor.shape)} cannot be split in {tp_size} chunks "
+              f"along axis {tp_axis}, storing it in one chunk.")
+        tp_size = 1
+    return [
+        ShardedTensor.from_rank_offsets(
+            key, chunk, *prepend_offsets,
+            (tp_axis + prepend_axis_num, part * tp_size + tp_rank, num_parts * tp_size),
+            prepend_axis_num=prepend_axis_num)
+        for tp_rank, chunk in enumerate(torch.chunk(tensor, tp_size, dim=tp_axis))
+    ]
+
+
+def save_checkpoint(queue, args):
+
+    # Search in directory above this
+    sys.path.append(os.path.abspath(
+        os.path.join(os.path.dirname(__file__),
+                     os.path.pardir,
+                     os.path.pardir)))
+    if args.megatron_path is not None:
+        sys.path.insert(0, args.megatron_path)
+
+    try:
+        from megatron.core.dist_checkpointing import ShardedTensor
+        from megatron.core.dist_checkpointing.mapping import ShardedObject
+        from megatron.core.dist_checkpointing.strategies.streaming import StreamingCheckpointWriter
+        from megatron.training.checkpointing import get_checkpoint_name, get_checkpoint_tracker_filename
+    except ModuleNotFoundError:
+        print("Unable to import Megatron, please specify the path to Megatron using --megatron-path. Exiting.")
+        exit(1)
+
+    def queue_get(name=None):
+        val = queue.get()
+        if val == "exit":
+            print("Loader exited, exiting saver")
+            exit(1)
+        if name is not None and args.checking and val["name"] != name:
+            val_name = val["name"]
+            print(f'Unexpected message. Expecting "{name}" but got "{val_name}". Exiting saver.')
+            exit(1)
+        if name is not None:
+            print(f"received {name}")
+        return val
+
+    def check_message(msg):
+        if not args.checking:
+            return
+        msg_name = msg.pop("name")
+        if len(msg.keys()) > 0:
+            print(f"Unexpected values in {msg_name}:")
+            for key in msg.keys():
+                print(f"   {key}")
+            print(f"Exiting. If you want to ignore this, use the argument --no-checking.")
+            exit(1)
+
+    md = queue_get()
+
+    num_layers = md.num_layers
+    num_experts = getattr(md, 'num_experts', None) or 0
+    tp_size = args.target_tensor_parallel_size
+    layer_prefix = f'{get_mcore_transformer_block_key(md.model_type)}.layers.'
+
+    checkpoint_dir = get_checkpoint_name(args.save_dir, md.iteration, return_base_dir=True)
+    writer = StreamingCheckpointWriter(checkpoint_dir, args.saver_num_workers,
+                                       args.saver_max_pending_layers)
+    start_time = time.time()
+
+    def sharded(key, tensor, prepend_offsets=(), tp_axis=None, part=0, num_parts=1):
+        return _sharded_tensors(ShardedTensor, key, tensor, prepend_offsets, tp_axis,
+                                tp_size, part, num_parts)
+
+    def extra_state(key, prepend_offsets=()):
+        # The (empty) extra state of linear layers, required when loading
+        if prepend_offsets:
+            _, offset, shape = zip(*prepend_offsets)
+        else:
+            offset, shape = (0,), (1,)
+        return ShardedObject(f'{key}._extra_state', None, shape, offset, replica_id=0)
+
+    def vocab_sharded(key, tensor):
+        # Padded for the target tensor parallel size, like in saver_mcore. Loading with
+        # other sizes relies on the allowed shape mismatch of the vocabulary tensors.
+        if md.true_vocab_size is not None and md.make_vocab_size_divisible_by is not None:
+            multiple = md.make_vocab_size_divisible_by * tp_size
+            padded_vocab_size = -(-md.true_vocab_size // multiple) * multiple
+            if tensor.shape[0] > padded_vocab_size:
+                tensor = tensor[:padded_vocab_size]
+            elif tensor.shape[0] < padded_vocab_size:
+                # Expanding embedding to larger size by replicating final entry
+                padding = tensor[-1].unsqueeze(0).expand(padded_vocab_size - tensor.shape[0], -1)
+                tensor = torch.cat((tensor, padding))
+        else:
+            print("Original vocab size not specified, leaving embedding table as-is. "
+                  "If you've changed the tensor parallel size this could cause problems.")
+        sh_tens = sharded(key, tensor, tp_axis=0)
+        for sh_ten in sh_tens:
+            sh_ten.allow_shape_mismatch = True
+        return sh_tens
+
+    # Embeddings
+    #-----------
+    embeddings_msg = queue_get("embeddings")
+    items = vocab_sharded('embedding.word_embeddings.weight', embeddings_msg.pop("word embeddings"))
+    if md.position_embedding_type == 'learned_absolute':
+        items += sharded('embedding.position_embeddings.weight', embeddings_msg.pop("position embeddings"))
+    check_message(embeddings_msg)
+    writer.write(items)
+
+    # Transformer layers.
+    # ------------------
+    for layer_idx in range(num_layers):
+        msg = queue_get(f"transformer layer {layer_idx}")
+        layer_offsets = ((0, layer_idx, num_layers),)
+        items = []
+
+        def add(name, tensor, tp_axis=None, part=0, num_parts=1):
+            items.extend(sharded(layer_prefix + name, tensor, layer_offsets, tp_axis, part, num_parts))
+
+        def add_experts(name, tensor, tp_axis=None, part=0, num_parts=1):
+            # One chunk per expert, so that any expert parallel size reads only its experts
+            for expert_idx, expert_tensor in enumerate(tensor):
+                expert_offsets = (*layer_offsets, (1, expert_idx, num_experts))
+                items.extend(sharded(layer_prefix + name, expert_tensor, expert_offsets,
+                                     tp_axis, part, num_parts))
+
+        # Attention. The layer norms are fused into the linear layers in the checkpoint keys,
+        # also for the local transformer implementation.
+        add('self_attention.linear_qkv.layer_norm_weight', msg.pop("input norm weight"))
+        if md.norm_has_bias:
+            add('self_attention.linear_qkv.layer_norm_bias', msg.pop("input norm bias"))
+        add('self_attention.linear_qkv.weight', msg.pop("qkv weight"), tp_axis=0)
+        add('self_attention.linear_proj.weight', msg.pop("dense weight"), tp_axis=1)
+        if md.linear_bias:
+            add('self_attention.linear_qkv.bias', msg.pop("qkv bias"), tp_axis=0)
+            add('self_attention.linear_proj.bias', msg.pop("dense bias"))
+        for name in ['self_attention.linear_qkv', 'self_attention.core_attention',
+                     'self_attention.linear_proj']:
+            items.append(extra_state(layer_prefix + name, layer_offsets))
+
+        # MLP. The fc1 weight of SwiGLU is stored as the W half followed by the V half.
+        if num_experts:
+            # The key of the MLP norm of MoE layers differs between the TE and the local
+            # layer specs, the norm is stored under both keys.
+            norm_prefixes = ['pre_mlp_layernorm.', 'mlp.linear_fc1.layer_norm_']
+            mlp_prefix, add_mlp = 'mlp.experts.experts.', add_experts
+            add('mlp.router.weight', msg.pop("router weight"))
+        else:
+            norm_prefixes = ['mlp.linear_fc1.layer_norm_']
+            mlp_prefix, add_mlp = 'mlp.', add
+        post_norm_weight = msg.pop("post norm weight")
+        post_norm_bias = msg.pop("post norm bias") if md.norm_has_bias else None
+        for norm_prefix in norm_prefixes:
+            add(norm_prefix + 'weight', post_norm_weight)
+            if post_norm_bias is not None:
+                add(norm_prefix + 'bias', post_norm_bias)
+
+        param_names = ['weight', 'bias'] if md.linear_bias else ['weight']
+        for param_name in param_names:
+            if md.swiglu:
+                add_mlp(f'{mlp_prefix}linear_fc1.{param_name}', msg.pop(f"mlp l0 {param_name} W"),
+                        tp_axis=0, part=0, num_parts=2)
+                add_mlp(f'{mlp_prefix}linear_fc1.{param_name}', msg.pop(f"mlp l0 {param_name} V"),
+                        tp_axis=0, part=1, num_parts=2)
+            else:
+                add_mlp(f'{mlp_prefix}linear_fc1.{param_name}', msg.pop(f"mlp l0 {param_name}"), tp_axis=0)
+        add_mlp(f'{mlp_prefix}linear_fc2.weight', msg.pop("mlp l1 weight"), tp_axis=1)
+        if md.linear_bias:
+            add_mlp(f'{mlp_prefix}linear_fc2.bias', msg.pop("mlp l1 bias"))
+
+        for name in ['linear_fc1', 'linear_fc2']:
+            if num_experts:
+                items.extend(extra_state(f'{layer_prefix}{mlp_prefix}{name}',
+                                         (*layer_offsets, (1, expert_idx, num_experts)))
+                             for expert_idx in range(num_experts))
+            else:
+                items.append(extra_state(f'{layer_prefix}{mlp_prefix}{name}', layer_offsets))
+
+        check_message(msg)
+        writer.write(items)
+        del items, msg
+
+    # Final norm, output layer and heads.
+    # ----------------------------------
+    msg = queue_get("final norm")
+    final_norm_prefix = f'{get_mcore_transformer_block_key(md.model_type)}.final_layernorm.'
+    items = sharded(final_norm_prefix + 'weight', msg.pop("weight"))
+    if md.norm_has_bias:
+        items += sharded(final_norm_prefix + 'bias', msg.pop("bias"))
+    check_message(msg)
+
+    # With tied embeddings, only the extra state of the output layer is stored
+    items.append(extra_state('output_layer'))
+    if md.output_layer:
+        msg = queue_get("output layer")
+        items += vocab_sharded('output_layer.weight', msg.pop("weight"))
+        check_message(msg)
+
+    msg = queue_get()
+    if msg != "done" and msg["name"] == "pooler":
+        print("received pooler")
+        items += sharded('pooler.dense.weight', msg.pop("weight"))
+        items += sharded('pooler.dense.bias', msg.pop("bias"))
+        check_message(msg)
+        msg = queue_get()
+
+    if msg != "done" and msg["name"] == "lm head":
+        print("received lm head")
+        items += sharded('lm_head.dense.weight', msg.pop("dense weight"))
+        items += sharded('lm_head.dense.bias', msg.pop("dense bias"))
+        items += sharded('lm_head.layer_norm.weight', msg.pop("norm weight"))
+        if md.norm_has_bias:
+            items += sharded('lm_head.layer_norm.bias', msg.pop("norm bias"))
+        check_message(msg)
+        msg = queue_get()
+
+    if msg != "done" and msg["name"] == "binary head":
+        print("received binary head")
+        items += sharded('binary_head.weight', msg.pop("weight"))
+        items += sharded('binary_head.bias', msg.pop("bias"))
+        check_message(msg)
+        msg = queue_get()
+
+    if msg != "done":
+        print("ERROR: got some more data but was expecting to be done")
+    writer.write(items)
+    del items
+
+    # Common state. The optimizer and RNG states are not saved, the checkpoint can be
+    # loaded with any parallel sizes.
+    margs = copy.deepcopy(md.checkpoint_args)
+    margs.use_legacy_models = False
+    margs.use_dist_ckpt = True
+    margs.ckpt_format = 'torch_dist'
+    margs.no_save_optim = True
+    margs.no_save_rng = True
+    if hasattr(md, 'consumed_train_samples'):
+        margs.consumed_train_samples = md.consumed_train_samples
+        margs.consumed_valid_samples = md.consumed_valid_samples
+    common_state_dict = {
+        'args': margs,
+        'checkpoint_version': 3.0,
+        'iteration': md.iteration,
+        'num_floating_point_operations_so_far': 0,
+    }
+    writer.finalize(common_state_dict)
+    with open(get_checkpoint_tracker_filename(args.save_dir), 'w') as f:
+        f.write(str(md.iteration))
+
+    print_memory_usage("saver", 0, 1)
+    print(f"Written {writer.written_bytes / 2**30:.2f} GiB to {checkpoint_dir} "
+          f"in {time.time() - start_time:.1f}s with {args.saver_num_workers} writers.")
+    print("Done!")
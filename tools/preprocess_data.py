@@ -2,9 +2,12 @@
 
 """Processing large data for pretraining."""
 import argparse
+import collections
+import io
 import math
 import json
 import os
+import shutil
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
                                              os.path.pardir)))
@@ -21,6 +24,11 @@ try:
 except ImportError:
     PunktLanguageVars = object  # Fallback to the built-in object class
     nltk_available = False
+try:
+    import zstandard
+    zstandard_available = True
+except ImportError:
+    zstandard_available = False
 
 from megatron.training.tokenizer import build_tokenizer
 from megatron.core.datasets import indexed_dataset
@@ -107,6 +115,74 @@ class Encoder(object):
             lens[key] = sentence_lens
         return ids, lens, len(json_line)
 
+    def encode_chunk(self, chunk):
+        """Tokenize a chunk of an input file into its own shard.
+
+        A chunk is either a byte range of an uncompressed input file, in which case
+        it holds every line which starts within the range, or a list of lines read
+        from a compressed input file. The shard index files are written last and
+        atomically, so that a shard is complete if and only if they exist.
+        """
+        chunk_id, shard_prefix, file_name, start, end, lines = chunk
+        if lines is None:
+            lines = read_lines(file_name, start, end)
+
+        level = "sentence" if self.args.split_sentences else "document"
+        builders = {}
+        for key in self.args.json_keys:
+            builders[key] = indexed_dataset.IndexedDatasetBuilder(
+                "{}_{}_{}.bin".format(shard_prefix, key, level),
+                dtype=indexed_dataset.DType.optimal_dtype(Encoder.tokenizer.vocab_size),
+            )
+
+        num_docs = 0
+        num_tokens = 0
+        num_bytes = 0
+        for line in lines:
+            json_line = line.decode('utf-8')
+            if self.args.split_sentences:
+                json_line, _ = self.split(json_line)
+            doc, sentence_lens, _ = self.encode(json_line)
+            for key in doc.keys():
+                builders[key].add_document(doc[key], sentence_lens[key])
+                num_tokens += len(doc[key])
+            num_docs += 1
+            num_bytes += len(line)
+
+        for key in self.args.json_keys:
+            idx_file = "{}_{}_{}.idx".format(shard_prefix, key, level)
+            builders[key].finalize(idx_file + ".tmp")
+            os.replace(idx_file + ".tmp", idx_file)
+
+        return chunk_id, num_docs, num_tokens, num_bytes
+
+
+def open_input_file(file_name):
+    """Open a .jsonl file, which may be gzip (.gz) or zstandard (.zst) compressed, in binary mode."""
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, 'rb')
+    if file_name.endswith(".zst"):
+        if not zstandard_available:
+            raise Exception(
+                "zstandard library required for .zst input files is not available.")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+            open(file_name, 'rb'), read_across_frames=True, closefd=True))
+    return open(file_name, 'rb')
+
+
+def read_lines(file_name, start, end):
+    """Yield the lines of an uncompressed file which start in the byte range [start, end)."""
+    with open(file_name, 'rb') as fin:
+        if start > 0:
+            # Skip the line which begins in the previous range, unless it ends just before start
+            fin.seek(start - 1)
+            fin.readline()
+        while fin.tell() < end:
+            line = fin.readline()
+            if not line:
+                break
+            yield line
+
 
 class Partition(object):
     def __init__(self, args, workers):
@@ -233,6 +309,20 @@ def get_args():
     group.add_argument('--keep-sequential-samples', action='store_true',
                        help='Ensure ordering of samples in .jsonl files is '
                             'preserved when using partitions>1.')
+    group.add_argument('--streaming', action='store_true',
+                       help='Tokenize the input files, which may be a glob and may be '
+                            '.gz or .zst compressed, in chunks of --streaming-chunk-size '
+                            'bytes with a single pool of --workers processes, without '
+                            'intermediate partition files. Each chunk is written to its '
+                            'own shard and the shards are merged in order at the end. An '
+                            'interrupted run resumes from the finished chunks. Ignores '
+                            '--partitions.')
+    group.add_argument('--streaming-chunk-size', type=int, default=64 * 1024 * 1024,
+                       help='Number of input bytes per chunk when using --streaming.')
+    group.add_argument('--streaming-max-inflight-chunks', type=int, default=None,
+                       help='Maximum number of chunks being tokenized or awaiting '
+                            'their turn in the output order when using --streaming. '
+                            'Defaults to twice the number of workers.')
     args = parser.parse_args()
     args.keep_empty = False
 
@@ -267,6 +357,144 @@ def check_files_exist(in_ss_out_names, key, num_partitions):
     return True
 
 
+def get_streaming_chunks(args, in_file_names, chunk_dir):
+    """Yield the chunks of the input files in order, see Encoder.encode_chunk."""
+    chunk_id = 0
+    for in_file_name in in_file_names:
+        if in_file_name.endswith((".gz", ".zst")):
+            # Compressed files cannot be read from an arbitrary offset, so read their lines here
+            with open_input_file(in_file_name) as fin:
+                lines = []
+                num_bytes = 0
+                for line in fin:
+                    lines.append(line)
+                    num_bytes += len(line)
+                    if num_bytes >= args.streaming_chunk_size:
+                        yield (chunk_id, os.path.join(chunk_dir, str(chunk_id)),
+                               in_file_name, None, None, lines)
+                        chunk_id += 1
+                        lines = []
+                        num_bytes = 0
+                if lines:
+                    yield (chunk_id, os.path.join(chunk_dir, str(chunk_id)),
+                           in_file_name, None, None, lines)
+                    chunk_id += 1
+        else:
+            file_size = os.path.getsize(in_file_name)
+            for start in range(0, file_size, args.streaming_chunk_size):
+                end = min(start + args.streaming_chunk_size, file_size)
+                yield (chunk_id, os.path.join(chunk_dir, str(chunk_id)),
+                       in_file_name, start, end, None)
+                chunk_id += 1
+
+
+def process_streaming(args):
+    """Tokenize the input files chunk by chunk and merge the chunk shards in order."""
+    in_file_names = sorted(glob.glob(args.input))
+    assert len(in_file_names) > 0, f"no input files match {args.input}"
+
+    level = "document"
+    if args.split_sentences:
+        level = "sentence"
+
+    # Chunks of a previous run are reused only if they were produced the same way
+    chunk_dir = args.output_prefix + "_chunks"
+    os.makedirs(chunk_dir, exist_ok=True)
+    description = json.dumps({
+        'input': in_file_names,
+        'json_keys': args.json_keys,
+        'split_sentences': args.split_sentences,
+        'keep_newlines': args.keep_newlines,
+        'tokenizer_type': args.tokenizer_type,
+        'tokenizer_model': args.tokenizer_model,
+        'vocab_file': args.vocab_file,
+        'vocab_size': args.vocab_size,
+        'merge_file': args.merge_file,
+        'append_eod': args.append_eod,
+        'lang': args.lang,
+        'streaming_chunk_size': args.streaming_chunk_size,
+    }, indent=4)
+    description_file = os.path.join(chunk_dir, "description.json")
+    if os.path.exists(description_file):
+        with open(description_file, 'r') as fin:
+            if fin.read() != description:
+                raise Exception(
+                    f"{chunk_dir} holds chunks of a different run, remove it to start over.")
+    else:
+        with open(description_file, 'w') as fout:
+            fout.write(description)
+
+    def is_finished(shard_prefix):
+        return all(os.path.exists("{}_{}_{}.idx".format(shard_prefix, key, level))
+                   for key in args.json_keys)
+
+    startup_start = time.time()
+    encoder = Encoder(args)
+    tokenizer = build_tokenizer(args)
+    pool = multiprocessing.Pool(args.workers, initializer=encoder.initializer)
+    max_inflight_chunks = args.streaming_max_inflight_chunks or 2 * args.workers
+    print("Time to startup:", time.time() - startup_start)
+
+    # Chunks are tokenized out of order but their results are consumed in order, which bounds
+    # the number of chunks which are submitted but not yet consumed
+    inflight = collections.deque()
+    shard_prefixes = []
+    num_skipped_chunks = 0
+    counts = {'docs': 0, 'tokens': 0, 'bytes': 0, 'logged_docs': 0}
+    proc_start = time.time()
+
+    def consume_next():
+        _, num_docs, num_tokens, num_bytes = inflight.popleft().get()
+        counts['docs'] += num_docs
+        counts['tokens'] += num_tokens
+        counts['bytes'] += num_bytes
+        if counts['docs'] - counts['logged_docs'] >= args.log_interval:
+            counts['logged_docs'] = counts['docs']
+            print_streaming_stats(counts, proc_start)
+
+    for chunk in get_streaming_chunks(args, in_file_names, chunk_dir):
+        shard_prefix = chunk[1]
+        shard_prefixes.append(shard_prefix)
+        if is_finished(shard_prefix):
+            num_skipped_chunks += 1
+            continue
+        while len(inflight) >= max_inflight_chunks:
+            consume_next()
+        inflight.append(pool.apply_async(encoder.encode_chunk, (chunk,)))
+    while inflight:
+        consume_next()
+    pool.close()
+    pool.join()
+
+    if num_skipped_chunks > 0:
+        print(f"Resumed from {num_skipped_chunks} of {len(shard_prefixes)} finished chunks.")
+    print_streaming_stats(counts, proc_start)
+
+    # merge the chunk shards
+    merge_start = time.time()
+    for key in args.json_keys:
+        builder = indexed_dataset.IndexedDatasetBuilder(
+            "{}_{}_{}.bin".format(args.output_prefix, key, level),
+            dtype=indexed_dataset.DType.optimal_dtype(tokenizer.vocab_size),
+        )
+        builder.add_indices(
+            ["{}_{}_{}".format(shard_prefix, key, level) for shard_prefix in shard_prefixes],
+            num_workers=args.workers,
+        )
+        builder.finalize("{}_{}_{}.idx".format(args.output_prefix, key, level))
+    print("Time to merge:", time.time() - merge_start)
+
+    shutil.rmtree(chunk_dir)
+
+
+def print_streaming_stats(counts, proc_start):
+    elapsed = time.time() - proc_start
+    print(f"Processed {counts['docs']} documents",
+          f"({counts['docs']/elapsed} docs/s, {counts['tokens']/elapsed} tokens/s,",
+          f"{counts['bytes']/elapsed/1024/1024} MB/s).",
+          file=sys.stderr)
+
+
 def main():
     args = get_args()
 
@@ -277,6 +505,10 @@ def main():
             raise Exception(
                 "nltk library required for sentence splitting is not available.")
 
+    if args.streaming:
+        process_streaming(args)
+        return
+
     in_ss_out_names = []
     if args.partitions == 1:
         file_name, extension = os.path.splitext(args.input)
@@ -0,0 +1,81 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Compare the uniform and the topology-aware fully parallel checkpoint load distributions.
+
+Simulates a single data parallel group of a model sharded with tensor and pipeline parallelism
+(the ranks are laid out TP-first like in `parallel_state`) and reports the bytes read
+from the storage and exchanged between and within the nodes with both distributions.
+No processes are started, the distributions are computed for the given topology only.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+from megatron.core.dist_checkpointing.strategies.topology import simulate_load_exchange
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-nodes", type=int, default=4)
+    parser.add_argument("--gpus-per-node", type=int, default=8)
+    parser.add_argument("--tensor-model-parallel-size", type=int, default=1)
+    parser.add_argument("--pipeline-model-parallel-size", type=int, default=1)
+    parser.add_argument(
+        "--num-params", type=int, default=1024**3, help="Parameters of the whole model"
+    )
+    parser.add_argument("--num-tensors", type=int, default=256, help="Tensors of the whole model")
+    parser.add_argument(
+        "--bytes-per-param",
+        type=int,
+        default=2,
+        help="Bytes of the model parameters replicated across DP",
+    )
+    parser.add_argument(
+        "--optimizer-bytes-per-param",
+        type=int,
+        default=12,
+        help="Bytes of the optimizer state per parameter, sharded across DP "
+        "(distributed optimizer). 0 to skip the optimizer state",
+    )
+    return parser.parse_args()
+
+
+def get_data_parallel_group_shards(args):
+    """Shards of the first data parallel group, with the DP ranks which have them."""
+    world_size = args.num_nodes * args.gpus_per_node
+    model_parallel_size = args.tensor_model_parallel_size * args.pipeline_model_parallel_size
+    assert world_size % model_parallel_size == 0, (world_size, model_parallel_size)
+    dp_size = world_size // model_parallel_size
+    # DP ranks are strided by the model parallel size
+    rank_to_node = [
+        dp_rank * model_parallel_size // args.gpus_per_node for dp_rank in range(dp_size)
+    ]
+
+    tensor_numel = args.num_params // args.num_tensors // model_parallel_size
+    shard_to_ranks, shard_to_size = {}, {}
+    for tensor_idx in range(args.num_tensors // args.pipeline_model_parallel_size):
+        shard_to_ranks[("param", tensor_idx)] = list(range(dp_size))
+        shard_to_size[("param", tensor_idx)] = tensor_numel * args.bytes_per_param
+        if args.optimizer_bytes_per_param:
+            for dp_rank in range(dp_size):
+                shard_to_ranks[("optim", tensor_idx, dp_rank)] = [dp_rank]
+                shard_to_size[("optim", tensor_idx, dp_rank)] = (
+                    tensor_numel * args.optimizer_bytes_per_param // dp_size
+                )
+    return shard_to_ranks, shard_to_size, rank_to_node
+
+
+def main():
+    args = get_args()
+    shard_to_ranks, shard_to_size, rank_to_node = get_data_parallel_group_shards(args)
+    report = simulate_load_exchange(shard_to_ranks, shard_to_size, rank_to_node)
+    report["data_parallel_size"] = len(rank_to_node)
+    report["data_parallel_nodes"] = len(set(rank_to_node))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
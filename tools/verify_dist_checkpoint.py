@@ -0,0 +1,66 @@
+# Copyright (c) 2024, NVIDIA CORPORATION. All rights reserved.
+
+"""Verify torch_dist checkpoints against the item checksums stored in their metadata.
+
+Detects missing and truncated data files and corrupted items without loading the checkpoint.
+The data files are verified in parallel with threads and, when run with torchrun,
+additionally split between the processes. Checkpoints saved without checksums are only
+checked for missing and truncated files. Exits with a non-zero status if any checkpoint
+is corrupted.
+
+Example:
+    python tools/verify_dist_checkpoint.py /checkpoints/gpt/iter_0001000 --num-threads 16
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+import torch
+
+from megatron.core.dist_checkpointing.strategies.integrity import verify_checkpoint
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("checkpoint_dirs", nargs="+", help="torch_dist checkpoint directories")
+    parser.add_argument(
+        "--num-threads", type=int, default=8, help="Files verified in parallel by each process"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    if "WORLD_SIZE" in os.environ:
+        torch.distributed.init_process_group("gloo")
+    is_main_process = not torch.distributed.is_initialized() or torch.distributed.get_rank() == 0
+
+    all_ok = True
+    reports = {}
+    for checkpoint_dir in args.checkpoint_dirs:
+        report = verify_checkpoint(checkpoint_dir, num_threads=args.num_threads)
+        all_ok &= report.ok
+        reports[checkpoint_dir] = dict(report._asdict(), ok=report.ok)
+        if is_main_process and not args.json:
+            status = "OK" if report.ok else f"CORRUPTED ({len(report.errors)} errors)"
+            print(
+                f"{checkpoint_dir}: {status}, {report.verified_items} items"
+                f" ({report.verified_bytes / 2**30:.2f} GiB) verified,"
+                f" {report.unchecked_items} items without checksum"
+            )
+            for error in report.errors:
+                print(f"  {error}")
+    if is_main_process and args.json:
+        print(json.dumps(reports, indent=2))
+
+    if torch.distributed.is_initialized():
+        torch.distributed.destroy_process_group()
+    sys.exit(0 if all_ok else 1)
+
+
+if __name__ == "__main__":
+    main()